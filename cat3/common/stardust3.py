@@ -11,6 +11,7 @@ import time
 import parse
 import os
 from collections import namedtuple
+from collections import OrderedDict
 
 
 # Apollo
@@ -22,6 +23,7 @@ from apollo.libs import lib as aplib
 # ------
 from apollo.scripts.entsw.libs.diags.stardust import Stardust as _Stardust
 import apollo.scripts.entsw.libs.utils.common_utils as common_utils
+import apollo.scripts.entsw.libs.utils.console_utils as console_utils
 
 __title__ = "Stardust Series3 Module"
 __version__ = '2.0.0'
@@ -41,6 +43,13 @@ func_details = common_utils.func_details
 func_retry = common_utils.func_retry
 
 class _Stardust3(_Stardust):
+    PRODUCT_COMPLETION_PROFILES = {
+        'sifserdeseye': console_utils.CompletionProfile(quiet=2.0, settle=0.5, poll=0.2, max_wait=None),
+        'kkmode': console_utils.CompletionProfile(quiet=0.5, settle=0.1, poll=0.05, max_wait=None),
+        'almanacmcuupgradeapplication': None,
+        'almanacmcuupgradebl': None,
+    }
+
     def __init__(self, mode_mgr, ud, **kwargs):
         super(_Stardust3, self).__init__(mode_mgr, ud, **kwargs)
         return
@@ -231,7 +240,7 @@ class _Stardust3(_Stardust):
             log.debug("Args = {0}".format(args))
             self._uut_conn.send('AlchemyProgram {0}\r'.format(args), expectphrase=self._uut_prompt, timeout=timeout,
                                 regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('AlchemyProgram')
 
             if 'PASSED' in self._uut_conn.recbuf:
                 log.debug("MCU ID programming PASSED.")
@@ -660,7 +669,7 @@ class _Stardust3(_Stardust):
         # Note: The version retrieval for all platforms use the legacy command (as of 08/01/2018).
         self._clear_recbuf()
         self._uut_conn.send('alchemy version\r', expectphrase=self._uut_prompt, timeout=30, regex=True)
-        time.sleep(self.RECBUF_TIME)
+        self._wait_recbuf('alchemy')
         rev_pattern = 'APPL {sw:0} ({swx:1}) {hw:2} ({hwx:3}) {bl:4} ({blx:5})'
         m1 = parse.search(rev_pattern, self._uut_conn.recbuf)
         m2 = parse.search(rev_pattern, revision[kkmode])
@@ -716,7 +725,7 @@ class _Stardust3(_Stardust):
         def __kkmode():
             self._clear_recbuf()
             self._uut_conn.send('kkmode\r', expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('kkmode')
             p = re.compile('MCU is in ([\S]+) [\S]')
             n = p.findall(self._uut_conn.recbuf)
             if not n and 'Command not found' in self._uut_conn.recbuf:
@@ -746,6 +755,7 @@ class _Stardust3(_Stardust):
         interfaces = kwargs.get('serdeseye_interfaces', self._ud.uut_config.get('serdeseye', {}).get('interfaces', []))
         sif_options = kwargs.get('serdeseye_sif_options', self._ud.uut_config.get('serdeseye', {}).get(area, {}).get('sif_options', ''))
         eye_version = kwargs.get('serdeseye_version', self._ud.uut_config.get('serdeseye', {}).get('version', '1'))
+        sif_limits = kwargs.get('serdeseye_sif_limits', self._ud.uut_config.get('serdeseye', {}).get(area, {}).get('sif_limits', None))
         asic_core_count = kwargs.get('asic_core_count', self._ud.uut_config.get('asic', {}).get('core_count', 0))
 
         # The stack cable must be installed and good for SIF.
@@ -770,7 +780,9 @@ class _Stardust3(_Stardust):
         log.info('-' * 40)
         if 'SIF' in interfaces:
             log.debug("Running SIF SerDesEye...")
-            current_sif = self._get_sif_serdeseye(asic_core_count, sif_options=sif_options, eye_version=eye_version)
+            current_sif = self._get_sif_serdeseye(asic_core_count, sif_options=sif_options, eye_version=eye_version,
+                                                  limits=sif_limits)
+            self._flush_measurements()
             if not current_sif:
                 return aplib.FAIL, 'SIF SerDesEye TEST: FAILED (no results collected).'
             result = self._check_sif_serdeseye(current_sif) if current_sif else None
@@ -812,6 +824,7 @@ class _Stardust3(_Stardust):
             self.sysinit() if uplink_test_card else None
 
             current_nif = self._get_nif_serdeseye(uplink_test_card, eye_option=nif_options)
+            self._flush_measurements()
             if not current_nif:
                 return aplib.FAIL, 'NIF SerDesEye TEST: FAILED (no results collected).'
 
@@ -829,51 +842,35 @@ class _Stardust3(_Stardust):
 
     # -----------
     @func_details
-    def _generate_sif_serdeseye(self, asic_core_count, sif_cmd_name, sif_pattern, Eye, sif_options='', eye_version=1):
+    def _generate_sif_serdeseye(self, asic_core_count, sif_cmd_name, sif_pattern, Eye, sif_options='', eye_version=1,
+                                limits=None):
         """ Generate SIF SerdesEye
+        All core x side cmds are pipelined (see Stardust._collect_serdeseye).
         :param asic_core_count:
         :param sif_cmd_name:
         :param sif_pattern:
         :param Eye:
         :param sif_options:
-        :return:
+        :param limits: Optional eye limits for per-lane margins, ex. {'Amin': 100.0} or {'HeightmV': (80.0, None)}
+        :return (EyeMatrix): {(core, side, lane, Sum|Min|Max): Eye, ...} or False
         """
         verbose = True if self._ud.verbose_level > 1 else False
         log.info('SIF Serdes Eye GENERATE (version {0})'.format(eye_version))
 
-        sif = {}
-        failures = []
-
-        # Regex for all entries: summary, min, and max
-        p = re.compile(sif_pattern)
-
         # Get and Check Serdes Eye
+        commands = OrderedDict()
         for core in xrange(asic_core_count):
             for side in ['e', 'w']:
-                common_utils.uut_comment(self._uut_conn, 'SIF', 'SerDesEye Metric ASIC {0}'.format(core))
-                self._clear_recbuf(force=True)
-                self._uut_conn.send('{0} {1} {2} -i:3 {3}\r'.format(sif_cmd_name, core, side, sif_options),
-                                    expectphrase=self._uut_prompt, regex=True, timeout=300)
-                time.sleep(self.RECBUF_TIME)
-                if 'ERR:' in self._uut_conn.recbuf:
-                    log.error("SIF SerDesEye error found.")
-                    failures.append(
-                        'Core{0}:({1}) - {2}'.format(core, side, re.findall('ERR:.*', self._uut_conn.recbuf)[0]))
-                if re.search('core-to-core so no SERDES.', self._uut_conn.recbuf):
-                    log.debug(re.findall('.*core-to-core.*', self._uut_conn.recbuf)[0])
-                elif re.search('[Nn]o support', self._uut_conn.recbuf):
-                    log.debug("SIF SerDesEye not supported for the ASIC.")
-                    sif[core, side, '0', 'Sum'] = Eye._make(
-                        [None if i != 'Result' else 'IGNORE' for i in Eye._fields])
-                else:
-                    m = p.findall(self._uut_conn.recbuf)
-                    log.debug("SIF SerDesEye {0} {1} {2}".format(core, side, 'ok' if m else '?'))
-                    for i in m:
-                        if eye_version == 1:
-                            tag = 'Sum' if not re.match('([(]?Max[)])|([(]?Min[)])', i[-3]) else i[-3][1:4]
-                        elif eye_version == 2:
-                            tag = 'Sum' if not re.match('([(]?Max[)])|([(]?Min[)])', i[-4]) else i[-4][1:4]
-                        sif[core, side, i[0], tag] = Eye._make(i)
+                commands[core, side] = '{0} {1} {2} -i:3 {3}\r'.format(sif_cmd_name, core, side, sif_options)
+        common_utils.uut_comment(self._uut_conn, 'SIF', 'SerDesEye Metric ASIC 0-{0}'.format(asic_core_count - 1))
+        self._clear_recbuf(force=True)
+        sif, failures = self._collect_serdeseye(commands, pattern=sif_pattern, Eye=Eye,
+                                                tag_index=-3 if eye_version == 1 else -4, limits=limits)
+
+        self._record_measurements('sif_eye_v{0}'.format(eye_version), [
+            ({'core': k[0], 'side': k[1], 'lane': k[2], 'stat': k[3], 'result': v.Result},
+             {f: getattr(v, f) for f in Eye._fields if f not in ['Channel', 'core', 'Result']})
+            for k, v in sif.items()])
 
         if failures or len(sif) == 0:
             for failure in failures:
@@ -1020,7 +1017,8 @@ class _Stardust3(_Stardust):
                                            sif_pattern=sif_pattern,
                                            Eye=Eye,
                                            sif_options=sif_options,
-                                           eye_version=1)
+                                           eye_version=1,
+                                           limits=kwargs.get('limits', None))
 
         return sif
 
@@ -1050,6 +1048,9 @@ class _Stardust3(_Stardust):
                 failed_channel = "SIF SerDesEye FAILED: {0:<24} = {1}".format(k, v)
                 log.error(failed_channel)
                 ret = False
+        for k, reason in getattr(current_sif, 'margin_failures', list)():
+            log.error("SIF SerDesEye MARGIN FAILED: {0:<24} {1}".format(k, reason))
+            ret = False
         if ret:
             log.info('SIF SerDesEye results are good.')
         else:
@@ -1086,6 +1087,9 @@ class _Stardust3(_Stardust):
             tag = 'Sum' if not re.match('([(]?Max[)])|([(]?Min[)])', i[-4]) else i[-4][1:4]
             nif[i[0], tag] = Eye._make(i)
 
+        self._record_measurements('nif_eye', [
+            ({'port': k[0], 'stat': k[1], 'result': v[-1]}, {f: getattr(v, f) for f in Eye._fields[1:-1]})
+            for k, v in nif.items()])
         common_utils.print_large_dict(nif, title='nif') if verbose else None
 
         if not nif:
@@ -1498,7 +1502,8 @@ class StardustC9300(_Stardust3):
                                            sif_pattern=sif_pattern,
                                            Eye=Eye,
                                            sif_options=sif_options,
-                                           eye_version=2)
+                                           eye_version=2,
+                                           limits=kwargs.get('limits', None))
 
         return sif
 
@@ -1533,7 +1538,7 @@ class StardustC9300L(StardustC9300):
         # Do the signing
         log.debug("Performing MCU id signing...")
         self._uut_conn.send('AlchemyProgram -eeprom\r', expectphrase=self._uut_prompt, timeout=timeout, regex=True)
-        time.sleep(self.RECBUF_TIME)
+        self._wait_recbuf('AlchemyProgram')
 
         if 'PASSED' in self._uut_conn.recbuf:
             log.debug("MCU ID programming PASSED.")
@@ -1677,7 +1682,7 @@ class StardustC9300L(StardustC9300):
             log.info("Performing MCU {0} {1}...".format(mcu_cmd, mcu_image))
             self._uut_conn.send('\r', expectphrase=self._uut_prompt, timeout=120, regex=True)
             self._uut_conn.send('{0} {1}\r'.format(mcu_cmd, mcu_image), expectphrase=self._uut_prompt, timeout=300, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf(mcu_cmd)
             if 'image upgrade successful' in self._uut_conn.recbuf:
                 log.info("MCU upgrade: PASSED!")
                 ret = True
@@ -50,6 +50,9 @@ from ..common import modes4 as _modes4
 from ..common import _common_def
 from ..common import _ios_manifest4
 from .product_definitions import _product_line_def
+from .chassis_scheduler import ChassisScheduler as _ChassisScheduler
+from .chassis_scheduler import CachedDataStore as _CachedDataStore
+from .chassis_scheduler import ChassisSchedulerError as _ChassisSchedulerError
 
 __title__ = "C9400 Product Module"
 __version__ = '2.0.0'
@@ -133,14 +136,15 @@ class _C9400(_Catalyst9400):
         Activating a linecard or Supervisor = start using it.
         Deactivating a linecard or Supervisor = done using it and no longer need to talk to the card.
 
-        This routine uses an "active card" list maintained in global cache to keep track of all linecards/Supervisors in use.
-        Also a 'remove from list' is performed on all non-running containers still in the 'active card list'
-        (could happen with abort or exception w/ no cleanup).
+        This routine uses a lease registry (common_utils.get_active_modular_registry) to keep track of all
+        linecards/Supervisors in use.  An active container renews its lease from a heartbeat; the lease of a container
+        that aborted or crashed w/ no cleanup expires and is reaped on the next access by any container.
+        The ordered list is still published as the "active card" list in global cache for the power driver.
 
         :param (str) action: 'deactivate', 'activate', 'show'
         :param (int) priority: lower number is higher priority
-        :param (bool) keep_last: Future feature (NOT USED); use to keep last container when deactivating to stay
-                          powered on for something else prior to cleanup.
+        :param (bool) keep_last: Keep the last container active when deactivating (e.g. the chassis needs to stay
+                                 powered on for something else prior to cleanup).
         :return: True|False
         """
         log.debug("Configuration Data")
@@ -152,75 +156,45 @@ class _C9400(_Catalyst9400):
             return False
         log.debug("Card config = {0}".format(card_config))
 
-        container_key = aplib.get_my_container_key()
-        container = container_key.split("|")[-1]
-        pl, ar, ts, _ = container_key.split("|", 3)
-        active_name = '_'.join([pl, ar, ts, 'ActiveModular'])
-        with locking.ContainerPriorityLock('__active_modular__', priority=priority):
-            log.debug("Lock    : {0}".format(active_name))
-            log.debug("Priority: {0}".format(priority))
-
-            active_cards = aplib.get_cached_data(active_name)
-            if active_cards:
-                idx = active_cards.index(container) if container in active_cards else -1
-            else:
-                active_cards = []
-
-            if action == 'activate':
-                log.debug("Active {0}.".format(card_name))
-                if not active_cards:
-                    log.debug("First {0} container to use: '{1}'".format(card_name.lower(), container))
-                    active_cards = [container]
-                    aplib.cache_data(active_name, active_cards)
-                else:
-                    if container not in active_cards:
-                        log.debug("Adding {0} container to the active list: {1}".format(card_name.lower(), container))
-                        active_cards.append(container)
-                        aplib.cache_data(active_name, active_cards)
-                    else:
-                        log.debug("{0} container already active: {1}".format(card_name, container))
-
-            elif action == 'deactivate':
-                log.debug("Deactive {0}.".format(card_name))
-                for c in active_cards:
-                    # Check & remove orphaned containers (not running but still in the active list due to no cleanup).
-                    status = aplib.get_container_status(c)
-                    log.debug("{0:<10} = {1}{2}".format(c, status, '*' if status != 'RUNNING' else ''))
-                    if status != 'RUNNING':
-                        idx = active_cards.index(c)
-                        active_cards.pop(idx)
-                if len(active_cards) > 1:
-                    if idx >= 0:
-                        log.info("Deactivating {0} container: '{1}'...".format(card_name.lower(), container))
-                        active_cards.pop(idx)
-                        aplib.cache_data(active_name, active_cards)
-                        log.info("{0} container deactivated.".format(card_name))
-                    else:
-                        log.info("{0} container already deactivated.".format(card_name))
-                elif len(active_cards) == 1:
-                    if not keep_last:
-                        log.info("Only one {0} container remains active and it will be deactivated.".format(
-                            card_name.lower()))
-                        aplib.cache_data(active_name, [])
-                    else:
-                        log.warning(
-                            "Only one {0} container remains active; deactivate is bypassed.".format(card_name.lower()))
-                        log.warning("This should only be done when the chassis needs to stay powered on.")
-                else:
-                    log.info("No {0} containers were activated; nothing to deactivate.".format(card_name.lower()))
-
-            elif action == 'show':
-                log.debug("Show {0}.".format(card_name))
+        container = aplib.get_my_container_key().split("|")[-1]
+        ttl = self.ud.uut_config.get('active_lease_ttl', common_utils.ACTIVE_MODULAR_TTL)
+        registry = common_utils.get_active_modular_registry(priority=priority, ttl=ttl)
+        log.debug("Registry: {0}".format(registry.name))
+        log.debug("Priority: {0}".format(priority))
 
+        if action == 'activate':
+            log.debug("Active {0}.".format(card_name))
+            if registry.activate(container, card=card_name, slot=card_config.get('physical_slot')):
+                log.debug("Added {0} container to the active list: {1}".format(card_name.lower(), container))
+            else:
+                log.debug("{0} container already active: {1}".format(card_name, container))
+            registry.start_heartbeat(container, alive=lambda: aplib.get_container_status(container) == 'RUNNING')
+
+        elif action == 'deactivate':
+            log.debug("Deactive {0}.".format(card_name))
+            active_cards = registry.members()
+            if keep_last and active_cards == [container]:
+                log.warning("Only one {0} container remains active; deactivate is bypassed.".format(card_name.lower()))
+                log.warning("This should only be done when the chassis needs to stay powered on.")
+            elif registry.deactivate(container):
+                log.info("{0} container deactivated: '{1}'".format(card_name, container))
             else:
-                log.error("Unknown action for {0} allocation.".format(card_name.lower()))
-                return False
+                log.info("{0} container already deactivated.".format(card_name))
 
-            msg = "Active {0}s".format(card_name)
-            log.info(msg)
-            log.info("-" * len(msg))
-            for lc in active_cards:
-                log.info("{0} {1}".format(lc, '*' if lc == container else ''))
+        elif action == 'show':
+            log.debug("Show {0}.".format(card_name))
+            for h in registry.history()[-10:]:
+                log.debug("{0:.0f} {1:<10} {2:<12} {3}".format(h['time'], h['member'], h['event'], h['detail'] or ''))
+
+        else:
+            log.error("Unknown action for {0} allocation.".format(card_name.lower()))
+            return False
+
+        msg = "Active {0}s".format(card_name)
+        log.info(msg)
+        log.info("-" * len(msg))
+        for lc in registry.members():
+            log.info("{0} {1}".format(lc, '*' if lc == container else ''))
 
         return True
 
@@ -527,6 +501,8 @@ class MacallanLinecard(_C9400):
         Use this for multi-linecards that share the sup as a resource.
         The lock timeouts must be calculated based on total possible linecard running.
         The rule here is wait_time = max runtime for one linecard container * number of containers * 2.1
+        With a 'phase' (or uut_config['chassis_scheduler']) only the chassis resources of that phase are leased
+        (see chassis_scheduler); otherwise the sup is locked for the whole run.
 
         :menu: (enable=True, name=ACQUIRE SUP RSC, section=Diags, num=1, args={})
 
@@ -550,8 +526,13 @@ class MacallanLinecard(_C9400):
         wait_timeout = kwargs.get('wait_timeout', wait_timeout_default)
         release_timeout = kwargs.get('release_timeout', release_timeout_default)
         priority = kwargs.get('priority', None)
+        phase = kwargs.get('phase', None)
 
-        ret, msg = self._linecard_sup_acquire(priority=priority, wait_timeout=wait_timeout, release_timeout=release_timeout, label=label)
+        if phase or self.ud.uut_config.get('chassis_scheduler'):
+            ret, msg = self._linecard_resource_acquire(phase=phase or 'all', priority=priority, wait_timeout=wait_timeout,
+                                                       release_timeout=release_timeout, label=label)
+        else:
+            ret, msg = self._linecard_sup_acquire(priority=priority, wait_timeout=wait_timeout, release_timeout=release_timeout, label=label)
 
         return (aplib.PASS, msg) if ret else (aplib.FAIL, msg)
 
@@ -569,8 +550,12 @@ class MacallanLinecard(_C9400):
 
         # Input
         label = kwargs.get('label', '')
+        phase = kwargs.get('phase', None)
 
-        self._linecard_sup_release(label=label)
+        if phase or self.ud.uut_config.get('chassis_scheduler'):
+            self._linecard_resource_release(phase=phase or 'all', label=label)
+        else:
+            self._linecard_sup_release(label=label)
 
         return aplib.PASS
 
@@ -747,7 +732,6 @@ class MacallanLinecard(_C9400):
 
         # Sup resource
         sup_resource_name = '_'.join([pl, ar, ts, 'SupLinecardResource_supslot{0}'.format(sup_num)])
-        active_name = '_'.join([pl, ar, ts, 'ActiveModular'])
         log.info("Linecard's Sup Lock Resource: {0} (for {1})".format(sup_resource_name, label))
 
         sup_lock = getattr(self.ud, 'sup_lock')
@@ -759,8 +743,7 @@ class MacallanLinecard(_C9400):
         else:
             try:
                 # Provide a status.
-                active_linecards = aplib.get_cached_data(active_name)
-                if active_linecards and container in active_linecards:
+                if common_utils.get_active_modular_registry().is_active(container):
                     log.info("This container is active.")
             except Exception as e:
                 log.warning(e)
@@ -769,3 +752,84 @@ class MacallanLinecard(_C9400):
             self.ud.sup_lock.release()
             log.info("*** SUP LOCK RELEASED! ***")
         return True
+
+    def _linecard_resource_acquire(self, phase, priority, wait_timeout, release_timeout, label=''):
+        """ Linecard Resource Acquire (INTERNAL)
+
+        Lease only the chassis resources needed for the phase (sup, slot, power domain, traffic generator) so that
+        linecard containers which do not contend overlap instead of queuing on the whole sup.
+        The sup is set to the linecard slot whenever the phase includes it.
+
+        :param (str) phase: 'power', 'diags', 'traffic', 'idpro', 'all' or a phase from uut_config['chassis_scheduler']
+        :param (int) priority: lower number is higher priority, or None
+        :param (int) wait_timeout:
+        :param (int) release_timeout: Lease expiry (reclaimed by other containers afterwards).
+        :return (tuple): (bool, msg)
+        """
+        if 'linecard' not in self.ud.uut_config:
+            log.error("Linecard config data has not been loaded.")
+            return False, 'No linecard config data.'
+        container = aplib.get_my_container_key().split("|")[-1]
+        scheduler = self._chassis_scheduler()
+        try:
+            resources = scheduler.resources(phase, self.ud.uut_config['linecard'])
+            log.info("Linecard's Chassis Resources: {0} (for {1}/{2})".format(resources, phase, label))
+            waited = scheduler.acquire(container, phase, resources, priority=priority, wait_timeout=wait_timeout,
+                                       lease_timeout=release_timeout)
+            log.info("*** CHASSIS RESOURCES ACQUIRED! *** (waited {0:.1f}s)".format(waited))
+
+            if 'sup{0}'.format(self.ud.uut_config['linecard'].get('sup_prime', 1)) in resources:
+                self.mode_mgr.auto_connect = False
+                mode = self.mode_mgr.current_mode
+                self.mode_mgr.auto_connect = True
+                if mode in ['STARDUST']:
+                    self.uut_conn.send("SetUserSlot {0}\r".format(self.ud.uut_config['linecard']['physical_slot']))
+
+        except _ChassisSchedulerError as e:
+            log.error(e)
+            return False, str(e)
+
+        except (apexceptions.AbortException, apexceptions.ScriptAbortException) as e:
+            log.error("Aborting...")
+            log.error(e)
+            scheduler.release(container, phase)
+            return False, str(e)
+
+        except Exception as e:
+            log.error("General exception during lease...")
+            log.error(e)
+            scheduler.release(container, phase)
+            return False, str(e)
+
+        return True, ''
+
+    def _linecard_resource_release(self, phase, label=''):
+        """ Linecard Resource Release (INTERNAL)
+        :param (str) phase: Phase to release; 'all' releases every lease held by the container.
+        :return:
+        """
+        container = aplib.get_my_container_key().split("|")[-1]
+        scheduler = self._chassis_scheduler()
+        released = scheduler.release(container, None if phase == 'all' else phase)
+        if not released:
+            log.warning("No chassis resources held for {0} (for {1}).".format(phase, label))
+            return False
+        log.info("*** CHASSIS RESOURCES RELEASED! *** {0}".format(released))
+        log.debug("Chassis resource stats: {0}".format(scheduler.stats().get(container)))
+        return True
+
+    def _chassis_scheduler(self):
+        """ Chassis resource scheduler shared by all containers of the chassis (station path). """
+        if not getattr(self, '_scheduler', None):
+            pl, ar, ts, _ = aplib.get_my_container_key().split("|", 3)
+            chassis = '_'.join([pl, ar, ts])
+            cfg = self.ud.uut_config.get('chassis_scheduler')
+            cfg = cfg if isinstance(cfg, dict) else {}
+            store = _CachedDataStore('{0}_ChassisResources'.format(chassis),
+                                     lock_factory=lambda: locking.FIFOLock('{0}_ChassisResourcesLock'.format(chassis)),
+                                     get_data=aplib.get_cached_data,
+                                     put_data=aplib.cache_data)
+            self._scheduler = _ChassisScheduler(chassis, store=store, phase_resources=cfg.get('phases'),
+                                                poll=cfg.get('poll', 5),
+                                                alive=lambda c: aplib.get_container_status(c) == 'RUNNING')
+        return self._scheduler
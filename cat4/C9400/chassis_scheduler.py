@@ -0,0 +1,383 @@
+"""
+Chassis Scheduler
+========================================================================================================================
+
+C9400 chassis-wide resource scheduler for Supervisor/Linecard containers.
+
+The chassis is modeled as separate resources instead of one lock per sup slot:
+    sup<N>      = Supervisor (console + SetUserSlot state) used to test the linecards,
+    slot<N>     = Linecard slot,
+    pwr<X>      = Power domain (default: one per slot unless the linecard config gives 'power_domain'),
+    trafgen<X>  = Traffic generator.
+Each test phase (power, diags, traffic, ...) leases only the resources it needs, all-or-nothing; linecard containers
+that do not contend for the same resources overlap.
+
+Grant policy: priority (lower number first) then arrival; a waiter is never passed by a later waiter that wants any of
+the same resources (no starvation), but non-contending waiters are granted immediately.
+Deadlock detection: containers can hold one phase lease while asking for another (hold-and-wait); the wait-for graph
+is checked on every poll and the youngest waiter in a cycle is refused (DeadlockError).
+Stale leases (expired, or the holder container is no longer running) are reclaimed.
+Wait time per container is accumulated in the stats.
+
+The state is kept in a store: LocalStore (threads; simulation) or any store that provides the same transaction()
+context (e.g. Apollo cached data under a container lock for real multi-container use).
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import time
+import logging
+import threading
+import copy
+
+__title__ = "C9400 Chassis Scheduler Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+# Phase -> symbolic resources; resolved per linecard by ChassisScheduler.resources().
+DEFAULT_PHASE_RESOURCES = {
+    'power': ['slot', 'power_domain'],
+    'diags': ['sup', 'slot'],
+    'traffic': ['sup', 'slot', 'trafgen'],
+    'idpro': ['sup', 'slot'],
+    'all': ['sup', 'slot', 'power_domain', 'trafgen'],  # Legacy: whole run on one lease.
+}
+DEFAULT_PRIORITY = 100
+
+
+class ChassisSchedulerError(Exception):
+    pass
+
+
+class SchedulerTimeout(ChassisSchedulerError):
+    pass
+
+
+class DeadlockError(ChassisSchedulerError):
+    pass
+
+
+class LocalStore(object):
+    """ In-process state store (threads). """
+    def __init__(self):
+        self.__state = {}
+        self.__lock = threading.RLock()
+
+    def transaction(self):
+        return _LocalTransaction(self)
+
+    def _enter(self):
+        self.__lock.acquire()
+        return self.__state
+
+    def _exit(self):
+        self.__lock.release()
+
+
+class _LocalTransaction(object):
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self.store._enter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.store._exit()
+        return False
+
+
+class CachedDataStore(object):
+    """ Cross-container state store: shared cached data guarded by a container lock.
+    (e.g. lock_factory=lambda: locking.FIFOLock(name), get_data=aplib.get_cached_data, put_data=aplib.cache_data)
+    """
+    def __init__(self, name, lock_factory, get_data, put_data):
+        self.name = name
+        self.lock_factory = lock_factory
+        self.get_data = get_data
+        self.put_data = put_data
+
+    def transaction(self):
+        return _CachedDataTransaction(self)
+
+
+class _CachedDataTransaction(object):
+    def __init__(self, store):
+        self.store = store
+        self.lock = None
+        self.state = None
+
+    def __enter__(self):
+        self.lock = self.store.lock_factory()
+        self.lock.acquire()
+        try:
+            self.state = copy.deepcopy(self.store.get_data(self.store.name) or {})
+        except Exception:
+            self.lock.release()
+            raise
+        return self.state
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Refusals (deadlock/timeout) also change the state (waiter removed, stats).
+            self.store.put_data(self.store.name, self.state)
+        finally:
+            self.lock.release()
+        return False
+
+
+class ChassisScheduler(object):
+    """ Chassis Scheduler
+    Fine grained resource leases per test phase for the containers of one chassis.
+    """
+    def __init__(self, chassis, store=None, phase_resources=None, poll=1.0, alive=None, clock=time.time):
+        """
+        :param (str) chassis: Chassis id (e.g. '<pl>_<ar>_<ts>'); all containers of the chassis must use the same id.
+        :param (obj) store: State store with transaction() (default LocalStore).
+        :param (dict) phase_resources: Phase -> symbolic resources (added to/overriding DEFAULT_PHASE_RESOURCES).
+        :param (float) poll: Secs between grant attempts while waiting.
+        :param (func) alive: alive(container) -> False if the container is gone (its leases are reclaimed).
+        :param (func) clock: Time source.
+        """
+        self.chassis = chassis
+        self.store = store if store else LocalStore()
+        self.phase_resources = dict(DEFAULT_PHASE_RESOURCES, **(phase_resources if phase_resources else {}))
+        self.poll = poll
+        self.alive = alive
+        self.clock = clock
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, self.chassis)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def resources(self, phase, linecard):
+        """ Resolve a phase to chassis resources for a linecard config.
+        :param (str) phase: Phase name (see phase_resources).
+        :param (dict) linecard: Linecard config: 'physical_slot', 'sup_prime', optional 'power_domain', 'trafgen'.
+        :return (list): Resource names.
+        """
+        if phase not in self.phase_resources:
+            raise ChassisSchedulerError("Unknown phase '{0}'; known: {1}".format(phase, sorted(self.phase_resources)))
+        slot = linecard.get('physical_slot')
+        names = {
+            'sup': 'sup{0}'.format(linecard.get('sup_prime', 1)),
+            'slot': 'slot{0}'.format(slot),
+            'power_domain': 'pwr{0}'.format(linecard.get('power_domain', slot)),
+            'trafgen': 'trafgen{0}'.format(linecard.get('trafgen', 1)),
+        }
+        return [names.get(r, r) for r in self.phase_resources[phase]]
+
+    def acquire(self, container, phase, resources, priority=None, wait_timeout=3600, lease_timeout=None):
+        """ Acquire (blocking)
+        :param (str) container: Requesting container.
+        :param (str) phase: Lease label; release(container, phase) frees exactly these resources.
+        :param (list) resources: Resource names (all-or-nothing).
+        :param (int) priority: Lower number is higher priority (None = default).
+        :param (int) wait_timeout: Secs.
+        :param (int) lease_timeout: Secs the lease is valid (None = until released or the container is gone).
+        :return (float): Secs waited.
+        """
+        priority = DEFAULT_PRIORITY if priority is None else priority
+        start = self.clock()
+        while True:
+            with self.store.transaction() as state:
+                self.__init_state(state)
+                self.__reclaim(state)
+                if self.__grant(state, container, phase, resources, priority, start, lease_timeout):
+                    waited = self.clock() - start
+                    self.__account(state, container, phase, waited)
+                    log.info("Lease {0}/{1} granted {2} after {3:.1f}s".format(container, phase, resources, waited))
+                    return waited
+                cycle = self.__deadlock(state)
+                if cycle and self.__victim(state, cycle) == container:
+                    state['waiting'].pop(container, None)
+                    state['stats'].setdefault(container, self.__new_stats())['deadlocks'] += 1
+                    raise DeadlockError("Deadlock {0}; {1} refused {2} for {3}.".format(
+                        ' -> '.join(cycle + [cycle[0]]), container, resources, phase))
+                if self.clock() - start > wait_timeout:
+                    state['waiting'].pop(container, None)
+                    raise SchedulerTimeout("{0} waited {1}s for {2} ({3}); held by {4}.".format(
+                        container, wait_timeout, resources, phase, self.__holders(state, resources)))
+            time.sleep(self.poll)
+
+    def release(self, container, phase=None):
+        """ Release the leases of a phase (or all phases) of a container.
+        :return (list): Resources released.
+        """
+        released = []
+        with self.store.transaction() as state:
+            self.__init_state(state)
+            for resource, lease in list(state['leases'].items()):
+                if lease['holder'] == container and (phase is None or lease['phase'] == phase):
+                    state['leases'].pop(resource)
+                    released.append(resource)
+                    self.__stats(state, container)['held'] += self.clock() - lease['since']
+            state['waiting'].pop(container, None)
+        log.info("Lease {0}/{1} released {2}".format(container, phase or 'ALL', sorted(released)))
+        return sorted(released)
+
+    def held(self, container=None):
+        """ Current leases: {resource: (holder, phase)} (optionally for one container). """
+        with self.store.transaction() as state:
+            self.__init_state(state)
+            return dict([(r, (l['holder'], l['phase'])) for r, l in state['leases'].items()
+                         if container is None or l['holder'] == container])
+
+    def stats(self):
+        """ Per container: {'wait': secs, 'held': secs, 'grants': n, 'deadlocks': n, 'phases': {phase: wait secs}} """
+        with self.store.transaction() as state:
+            self.__init_state(state)
+            return copy.deepcopy(state['stats'])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init_state(self, state):
+        for key in ['leases', 'waiting', 'stats']:
+            state.setdefault(key, {})
+
+    @staticmethod
+    def __new_stats():
+        return dict(wait=0.0, held=0.0, grants=0, deadlocks=0, phases={})
+
+    def __stats(self, state, container):
+        return state['stats'].setdefault(container, self.__new_stats())
+
+    def __account(self, state, container, phase, waited):
+        stats = self.__stats(state, container)
+        stats['wait'] += waited
+        stats['grants'] += 1
+        stats['phases'][phase] = stats['phases'].get(phase, 0.0) + waited
+
+    def __reclaim(self, state):
+        now = self.clock()
+        for resource, lease in list(state['leases'].items()):
+            expired = lease['expires'] and now > lease['expires']
+            gone = self.alive and not self.alive(lease['holder'])
+            if expired or gone:
+                log.warning("Reclaiming {0} from {1}/{2} ({3}).".format(resource, lease['holder'], lease['phase'],
+                                                                         'expired' if expired else 'container gone'))
+                state['leases'].pop(resource)
+        if self.alive:
+            for container in [c for c in state['waiting'] if not self.alive(c)]:
+                state['waiting'].pop(container)
+
+    def __grant(self, state, container, phase, resources, priority, start, lease_timeout):
+        wanted = [r for r in resources if state['leases'].get(r, {}).get('holder') != container]
+        waiting = state['waiting'].setdefault(container, dict(resources=wanted, priority=priority, since=start, phase=phase))
+        waiting['resources'] = wanted
+        busy = [r for r in wanted if r in state['leases']]
+        if busy or self.__ahead(state, container):
+            return False
+        now = self.clock()
+        for r in wanted:
+            state['leases'][r] = dict(holder=container, phase=phase, since=now,
+                                      expires=(now + lease_timeout) if lease_timeout else None)
+        state['waiting'].pop(container)
+        return True
+
+    def __wait_for(self, state):
+        """ Wait-for graph: waiter -> containers holding (or queued ahead for) what it wants. """
+        graph = {}
+        for container, w in state['waiting'].items():
+            holders = set([state['leases'][r]['holder'] for r in w['resources'] if r in state['leases']])
+            graph[container] = (holders | set(self.__ahead(state, container))) - set([container])
+        return graph
+
+    @staticmethod
+    def __ahead(state, container):
+        """ Waiters queued ahead of a waiter (higher priority, then earlier) for any of the same resources. """
+        me = state['waiting'][container]
+        return [c for c, w in state['waiting'].items()
+                if c != container and (w['priority'], w['since']) < (me['priority'], me['since']) and
+                set(w['resources']) & set(me['resources'])]
+
+    def __deadlock(self, state):
+        """ A cycle in the wait-for graph (list of containers) or None. """
+        graph = self.__wait_for(state)
+        visiting, done = [], set()
+
+        def __visit(node):
+            if node in visiting:
+                return visiting[visiting.index(node):]
+            if node in done or node not in graph:
+                return None
+            visiting.append(node)
+            for nxt in sorted(graph[node]):
+                cycle = __visit(nxt)
+                if cycle:
+                    return cycle
+            visiting.pop()
+            done.add(node)
+            return None
+
+        for node in sorted(graph):
+            cycle = __visit(node)
+            if cycle:
+                return cycle
+        return None
+
+    @staticmethod
+    def __victim(state, cycle):
+        """ Youngest (then lowest priority) waiter in the cycle gives up. """
+        return sorted(cycle, key=lambda c: (-state['waiting'][c]['since'], -state['waiting'][c]['priority'], c))[0]
+
+    @staticmethod
+    def __holders(state, resources):
+        return dict([(r, state['leases'][r]['holder']) for r in resources if r in state['leases']])
+
+
+# ======================================================================================================================
+# Simulation
+# ======================================================================================================================
+def simulate(linecards, phases, mode='scheduled', speed=1.0, phase_resources=None, poll=0.01):
+    """ Simulated multi-container chassis run.
+    :param (dict) linecards: {container: linecard config}
+    :param (list) phases: [(phase, secs), ...] run by every container in order.
+    :param (str) mode: 'legacy' = one sup lease for the whole run (as the per sup slot lock; nothing else modeled);
+                       'scheduled' = one lease per phase.
+    :param (float) speed: Time scale (secs are divided by speed).
+    :return (dict): {'makespan': secs, 'stats': scheduler stats, 'timeline': [(container, phase, start, end)]}
+    """
+    scheduler = ChassisScheduler('sim', phase_resources=phase_resources, poll=poll)
+    timeline = []
+    lock = threading.Lock()
+    errors = []
+
+    def __container(name, linecard):
+        try:
+            if mode == 'legacy':
+                scheduler.acquire(name, 'all', ['sup{0}'.format(linecard.get('sup_prime', 1))])
+            for phase, secs in phases:
+                if mode != 'legacy':
+                    scheduler.acquire(name, phase, scheduler.resources(phase, linecard))
+                start = time.time()
+                time.sleep(secs / float(speed))
+                with lock:
+                    timeline.append((name, phase, start, time.time()))
+                if mode != 'legacy':
+                    scheduler.release(name, phase)
+            if mode == 'legacy':
+                scheduler.release(name)
+        except Exception as e:
+            errors.append(e)
+
+    start = time.time()
+    threads = [threading.Thread(target=__container, args=(name, lc), name=name) for name, lc in sorted(linecards.items())]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return dict(makespan=(time.time() - start) * speed, stats=scheduler.stats(),
+                timeline=sorted([(c, p, (s - start) * speed, (e - start) * speed) for c, p, s, e in timeline], key=lambda x: x[2]))
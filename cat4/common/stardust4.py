@@ -9,6 +9,7 @@ import re
 import logging
 import time
 from collections import namedtuple
+from collections import OrderedDict
 
 
 # Apollo
@@ -20,6 +21,7 @@ from apollo.libs import lib as aplib
 # ------
 from apollo.scripts.entsw.libs.diags.stardust import Stardust as _Stardust
 import apollo.scripts.entsw.libs.utils.common_utils as common_utils
+import apollo.scripts.entsw.libs.utils.console_utils as console_utils
 
 __title__ = "Stardust Series4 Module"
 __version__ = '2.0.0'
@@ -46,6 +48,12 @@ func_retry = common_utils.func_retry
 # ______________________________________________________________________________________________________________________
 # ______________________________________________________________________________________________________________________
 class _Stardust4(_Stardust):
+    PRODUCT_COMPLETION_PROFILES = {
+        'sifserdeseye': console_utils.CompletionProfile(quiet=2.0, settle=0.5, poll=0.2, max_wait=None),
+        'writerawmmcflash': None,
+        'verifyrawmmcflash': None,
+    }
+
     def __init__(self, **kwargs):
         super(_Stardust4, self).__init__(**kwargs)
         return
@@ -469,14 +477,14 @@ class StardustC9400(_Stardust4):
             verbose = True if self._ud.verbose_level > 1 else False
             log.info('SUPDP Serdes Eye GENERATE (generic)')
 
-            supdp = {}
-            failures = []
-
-            # Regex for all entries: summary, min, and max
-            p = re.compile(supdp_pattern)
-
-            # Get and Check Serdes Eye
-            # TODO: put code here!
+            # Get and Check Serdes Eye (all core x side cmds pipelined)
+            commands = OrderedDict()
+            for core in range(asic_core_count):
+                for side in ['e', 'w']:
+                    commands[core, side] = '{0} {1} {2} -i:3 {3}\r'.format(supdp_cmd_name, core, side, supdp_options)
+            common_utils.uut_comment(self._uut_conn, 'SUPDP', 'SerDesEye Metric ASIC 0-{0}'.format(asic_core_count - 1))
+            self._clear_recbuf(force=True)
+            supdp, failures = self._collect_serdeseye(commands, pattern=supdp_pattern, Eye=Eye, tag_index=-3)
 
             if failures or len(supdp) == 0:
                 for failure in failures:
@@ -485,7 +493,7 @@ class StardustC9400(_Stardust4):
                 return False
 
             common_utils.print_large_dict(supdp, title='supdp') if verbose else None
-            return sif
+            return supdp
 
         log.info('SUPDP Serdes Eye START (generic)')
 
@@ -648,31 +656,18 @@ class StardustC9400(_Stardust4):
             verbose = True if self._ud.verbose_level > 1 else False
             log.info('NRU Serdes Eye GENERATE (generic)')
 
-            # Output
-            nru = {}
-
-            # Run command
+            # Run command (parsed as the output streams in; completed by the prompt)
             self._clear_recbuf(force=True)
             log.debug("prompt={0}".format(self._uut_prompt))
-            self._uut_conn.send(nru_cmd, expectphrase='.*', timeout=60, regex=True)
-            time.sleep(1.0)
             log.debug("Waiting for NIF completion...")
-            self._uut_conn.waitfor(self._uut_prompt, timeout=500, regex=True)
-            time.sleep(5.0)
-
-            # Parse output
-            p = re.compile(nru_pattern)
-            m = p.findall(self._uut_conn.recbuf)
-            for i in m:
-                tag = 'Sum' if not re.match('([(]?Max[)])|([(]?Min[)])', i[-4]) else i[-4][1:4]
-                nru[i[0], tag] = Eye._make(i)
+            nru, failures = self._collect_serdeseye(OrderedDict([((), nru_cmd)]), pattern=nru_pattern, Eye=Eye,
+                                                    tag_index=-4, timeout=500)
 
             common_utils.print_large_dict(nru, title='nru') if verbose else None
 
             if not nru:
                 log.error('FAILED. Failed to retrieve NRU result.')
-                m = re.search('\*\*\*ERR: .*?[\n\r]', self._uut_conn.recbuf)
-                log.debug(m.group(0)) if m else None
+                log.debug(failures[0]) if failures else None
                 return None
             return nru
 
@@ -0,0 +1,135 @@
+import threading
+import time
+import pytest
+
+from ..C9400 import chassis_scheduler
+
+
+__title__ = 'CATALYST Series4 Chassis Scheduler Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+# Two sups, linecards on separate slots/power domains; one traffic generator per sup.
+LINECARDS = {
+    'LC1': {'physical_slot': 1, 'sup_prime': 3, 'trafgen': 1},
+    'LC2': {'physical_slot': 2, 'sup_prime': 3, 'trafgen': 1},
+    'LC5': {'physical_slot': 5, 'sup_prime': 4, 'trafgen': 2},
+    'LC6': {'physical_slot': 6, 'sup_prime': 4, 'trafgen': 2},
+}
+PHASES = [('power', 0.3), ('diags', 0.2), ('traffic', 0.1), ('power', 0.1)]
+
+
+class TestChassisScheduler():
+    def test_resources(self):
+        cs = chassis_scheduler.ChassisScheduler('pl_ar_ts', phase_resources={'poe': ['slot', 'poe_loadbox']})
+        lc = {'physical_slot': 2, 'sup_prime': 3, 'power_domain': 'A'}
+        assert cs.resources('traffic', lc) == ['sup3', 'slot2', 'trafgen1']
+        assert cs.resources('power', lc) == ['slot2', 'pwrA']
+        assert cs.resources('poe', lc) == ['slot2', 'poe_loadbox']
+        with pytest.raises(chassis_scheduler.ChassisSchedulerError):
+            cs.resources('burnin', lc)
+
+    def test_simulated_throughput(self):
+        legacy = chassis_scheduler.simulate(LINECARDS, PHASES, mode='legacy', speed=2.0)
+        scheduled = chassis_scheduler.simulate(LINECARDS, PHASES, mode='scheduled', speed=2.0)
+        # Legacy: 2 containers per sup run back to back (2 x 0.7s); scheduled: power phases overlap.
+        assert legacy['makespan'] >= 1.4
+        assert scheduled['makespan'] < legacy['makespan'] * 0.8, (scheduled['makespan'], legacy['makespan'])
+        assert sorted(scheduled['stats'].keys()) == sorted(LINECARDS.keys())
+        assert sum([s['wait'] for s in scheduled['stats'].values()]) < sum([s['wait'] for s in legacy['stats'].values()])
+        assert all([s['grants'] == len(PHASES) for s in scheduled['stats'].values()])
+        # No two phases ever shared a sup at the same time.
+        for c1, p1, s1, e1 in scheduled['timeline']:
+            for c2, p2, s2, e2 in scheduled['timeline']:
+                if c1 < c2 and 'power' not in (p1, p2) and s1 < e2 - 0.02 and s2 < e1 - 0.02:
+                    assert LINECARDS[c1]['sup_prime'] != LINECARDS[c2]['sup_prime']
+
+    def test_priority_reclaim_and_timeout(self):
+        dead = set()
+        cs = chassis_scheduler.ChassisScheduler('pl_ar_ts', poll=0.01, alive=lambda c: c not in dead)
+        cs.acquire('LC1', 'diags', ['sup3', 'slot1'])
+        order = []
+
+        def __waiter(name, priority):
+            cs.acquire(name, 'diags', ['sup3'], priority=priority, wait_timeout=5)
+            order.append(name)
+            cs.release(name)
+
+        threads = [threading.Thread(target=__waiter, args=('LC2', 100)), threading.Thread(target=__waiter, args=('LC5', 1))]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        # LC1 container died without releasing: its leases are reclaimed; higher priority goes first.
+        dead.add('LC1')
+        for t in threads:
+            t.join()
+        assert order == ['LC5', 'LC2']
+        assert cs.held() == {}
+        assert cs.stats()['LC2']['phases']['diags'] > 0
+
+        cs.acquire('LC6', 'traffic', ['trafgen1'], lease_timeout=60)
+        with pytest.raises(chassis_scheduler.SchedulerTimeout):
+            cs.acquire('LC2', 'traffic', ['trafgen1'], wait_timeout=0.05)
+        assert cs.held('LC6') == {'trafgen1': ('LC6', 'traffic')}
+
+    def test_deadlock(self):
+        cs = chassis_scheduler.ChassisScheduler('pl_ar_ts', poll=0.01)
+        cs.acquire('LC1', 'power', ['slot1'])
+        cs.acquire('LC2', 'power', ['trafgen1'])
+        errors = []
+
+        def __hold_and_wait():
+            try:
+                cs.acquire('LC1', 'traffic', ['trafgen1'], wait_timeout=5)
+            except chassis_scheduler.ChassisSchedulerError as e:
+                errors.append(e)
+
+        t = threading.Thread(target=__hold_and_wait)
+        t.start()
+        time.sleep(0.05)
+        # LC2 is the youngest waiter in the cycle LC1 -> LC2 -> LC1: refused.
+        with pytest.raises(chassis_scheduler.DeadlockError):
+            cs.acquire('LC2', 'diags', ['slot1'], wait_timeout=5)
+        assert cs.stats()['LC2']['deadlocks'] == 1
+        cs.release('LC2')
+        t.join()
+        assert errors == []
+        assert cs.held('LC1') == {'slot1': ('LC1', 'power'), 'trafgen1': ('LC1', 'traffic')}
+
+    def test_deadlock_queued_ahead(self):
+        cs = chassis_scheduler.ChassisScheduler('pl_ar_ts', poll=0.01)
+        cs.acquire('LC1', 'power', ['slot1'])
+        errors = []
+
+        def __queue():
+            try:
+                cs.acquire('LC2', 'diags', ['slot1', 'sup3'], wait_timeout=5)
+            except chassis_scheduler.ChassisSchedulerError as e:
+                errors.append(e)
+
+        t = threading.Thread(target=__queue)
+        t.start()
+        time.sleep(0.05)
+        # sup3 is free but LC2 is queued ahead for it while waiting on LC1: LC1 -> LC2 -> LC1.
+        with pytest.raises(chassis_scheduler.DeadlockError):
+            cs.acquire('LC1', 'diags', ['sup3'], wait_timeout=5)
+        assert cs.stats()['LC1']['deadlocks'] == 1
+        cs.release('LC1')
+        t.join()
+        assert errors == []
+        assert sorted(cs.held('LC2').keys()) == ['slot1', 'sup3']
+
+    def test_cached_data_store(self):
+        cache, lock = {}, threading.Lock()
+        store = chassis_scheduler.CachedDataStore('pl_ar_ts_ChassisResources', lock_factory=lambda: lock,
+                                                  get_data=cache.get, put_data=cache.__setitem__)
+        # Each container has its own scheduler instance; the state is shared only via the cached data.
+        cs1 = chassis_scheduler.ChassisScheduler('pl_ar_ts', store=store, poll=0.01)
+        cs2 = chassis_scheduler.ChassisScheduler('pl_ar_ts', store=store, poll=0.01)
+        cs1.acquire('LC1', 'diags', ['sup3', 'slot1'])
+        with pytest.raises(chassis_scheduler.SchedulerTimeout):
+            cs2.acquire('LC2', 'diags', ['sup3', 'slot2'], wait_timeout=0.05)
+        assert sorted(cache['pl_ar_ts_ChassisResources']['leases'].keys()) == ['slot1', 'sup3']
+        assert cache['pl_ar_ts_ChassisResources']['waiting'] == {}
+        assert cs2.release('LC1') == ['slot1', 'sup3']
+        assert not lock.locked()
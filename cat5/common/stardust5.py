@@ -1,8 +1,13 @@
 
 from apollo.scripts.entsw.libs.diags.stardust import Stardust
+import apollo.scripts.entsw.libs.utils.console_utils as console_utils
 
 
 class StardustC9500(Stardust):
+    PRODUCT_COMPLETION_PROFILES = {
+        'sifserdeseye': console_utils.CompletionProfile(quiet=2.0, settle=0.5, poll=0.2, max_wait=None),
+    }
+
     def __init__(self, **kwargs):
         super(StardustC9500, self).__init__(**kwargs)
-        return
\ No newline at end of file
+        return
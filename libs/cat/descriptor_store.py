@@ -0,0 +1,258 @@
+"""
+Descriptor Store
+========================================================================================================================
+
+Redis hash persistence of the UutDescriptor with per-field change tracking.
+
+The legacy save serialized the whole descriptor dict (uut_config, product definition properties, and runtime state)
+into a single Redis string key on every save; retrieve read and deserialized all of it.  The store instead:
+    1. Keeps one Redis hash for the descriptor properties (one field per property) and one hash per tracked
+       section (ex. uut_config; one field per key) at '<key>:<section>'.
+    2. Writes only what changed since the last save/load:
+         - properties: the serialized value digest is compared against the last written/loaded digest,
+         - sections: only the keys marked dirty (CustomDict set/delete callback + mutable values read) are
+           serialized and compared; removed keys are deleted from the hash.
+       The first save of a store (no baseline) replaces the hashes entirely so stale fields of a previous UUT
+       cannot survive.
+    3. Reads only the fields requested (HMGET) and only the sections requested (HGETALL/HMGET).
+    4. Marks the data 'saved'/'retrieved' so that a retrieve never reloads data already consumed (same protection
+       as the legacy delete-on-retrieve) while the hash stays in place as the baseline for the next delta save.
+       Every save marks the data 'saved' and writes a new revision; a store whose baseline is not the Redis content
+       (ex. the PRE-SEQ and MAIN descriptors are different instances) falls back to a full save.
+
+All writes of one save go through a single transactional pipeline.
+
+Usage:
+    store = DescriptorStore('<container key>_uut_descriptor', rdb=redis.StrictRedis())
+    store.mark_dirty('uut_config', ['MODEL_NUM'])
+    store.save(fields={'product_selection': 'C9300-48UXM', ...}, sections={'uut_config': uut_config})
+    data = store.load(['product_selection', 'puid_keys'])
+    uut_config = store.load_section('uut_config')
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import uuid
+import hashlib
+import logging
+import pickle
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+__title__ = "Descriptor Store"
+__version__ = '2.0.0'
+__author__ = 'bborel'
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+STATE_FIELD = '__state__'
+REV_FIELD = '__rev__'
+META_FIELDS = [STATE_FIELD, REV_FIELD]
+SAVED, RETRIEVED = 'saved', 'retrieved'
+
+
+class DescriptorStore(object):
+    """ Descriptor Store
+    """
+    def __init__(self, key, rdb=None, serializer=None, deserializer=None):
+        """
+        :param (str) key: Redis key of the descriptor hash (sections use '<key>:<section>').
+        :param (obj) rdb: Redis client (StrictRedis API: pipeline, hset, hdel, hmget, hgetall, hkeys, delete).
+        :param (func) serializer: Value --> str; default = pickle (protocol 2).
+        :param (func) deserializer: str --> Value
+        """
+        self.key = key
+        self._rdb = rdb if rdb is not None else redis.StrictRedis()
+        self._serialize = serializer if serializer else lambda v: pickle.dumps(v, 2)
+        self._deserialize = deserializer if deserializer else pickle.loads
+        self._digests = {}    # {(<section>, <field>): <digest>, ...}  section=None for the properties hash
+        self._fields = {}     # {<section>: set(<fields in Redis>), ...}
+        self._dirty = {}      # {<section>: set(<keys>), ...}
+        self._mappings = {}   # {<section>: <dict object last saved/bound>, ...}
+        self._state = None
+        self._rev = None
+        self._stats = dict(saves=0, writes=0, deletes=0, unchanged=0, bytes=0, reads=0)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def baseline(self):
+        """ True when the Redis properties hash is known (saved or loaded) so that a save can be a delta. """
+        return None in self._fields
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def mark_dirty(self, section, keys):
+        """ Mark Dirty
+        :param (str) section: Section name (ex. 'uut_config')
+        :param (list) keys: Keys set, deleted, or possibly mutated in place.
+        :return:
+        """
+        self._dirty.setdefault(section, set()).update(keys)
+        return
+
+    def bind(self, section, mapping):
+        """ Bind
+        Declare the dict object that holds the section content (ex. after a load_section into a new dict) so that
+        the next save remains a delta.  A section dict that is replaced (not bound) is rewritten entirely.
+        """
+        self._mappings[section] = mapping
+        return
+
+    def save(self, fields, sections=None, full=False):
+        """ Save
+        :param (dict) fields: {<property>: <value>, ...}; all properties (those not given are removed).
+        :param (dict) sections: {<section>: <dict>, ...}; only the dirty keys are checked unless full.
+        :param (bool) full: Rewrite everything.
+        :return (int): Number of fields written (incl. deletes).
+        """
+        sections = sections if sections else {}
+        full = full or not self.baseline
+        if not full and self.__meta() != (self._state, self._rev):
+            # Saved or retrieved by another store (descriptor instance) since this baseline; the digests are stale.
+            log.debug("Descriptor store: {0} changed by another store; full save.".format(self.key))
+            full = True
+        pipe = self._rdb.pipeline(transaction=True)
+        if full:
+            pipe.delete(self.key, *[self.__section_key(s) for s in sections])
+            self._digests, self._fields = {}, {}
+        count = 0
+        for name, value in fields.items():
+            count += self.__stage(pipe, None, name, value)
+        for name in self._fields.get(None, set()) - set(fields.keys()) - set(META_FIELDS):
+            count += self.__unstage(pipe, None, name)
+        for section, mapping in sections.items():
+            dirty = self._dirty.pop(section, set())
+            if self._mappings.get(section) is not mapping:
+                self._fields.pop(section, None)
+                self._mappings[section] = mapping
+            keys = mapping.keys() if section not in self._fields else dirty
+            if section not in self._fields and not full:
+                pipe.delete(self.__section_key(section))
+            self._fields.setdefault(section, set())
+            for k in keys:
+                count += self.__stage(pipe, section, k, mapping[k]) if k in mapping else self.__unstage(pipe, section, k)
+        rev = uuid.uuid4().hex
+        pipe.hset(self.key, STATE_FIELD, SAVED)
+        pipe.hset(self.key, REV_FIELD, rev)
+        self._state, self._rev = SAVED, rev
+        self._fields.setdefault(None, set())
+        pipe.execute()
+        self._stats['saves'] += 1
+        log.debug("Descriptor store: saved {0} field(s) at {1}{2}.".format(count, self.key, ' (full)' if full else ''))
+        return count
+
+    def load(self, fields=None):
+        """ Load
+        :param (list) fields: Property names; None = all.
+        :return (dict): {<property>: <value>, ...}; properties not in Redis are absent.
+        """
+        return self.__load(None, fields)
+
+    def load_section(self, section, keys=None):
+        """ Load Section
+        :param (str) section:
+        :param (list) keys: None = all.
+        :return (dict):
+        """
+        return self.__load(section, keys)
+
+    def state(self):
+        """ State
+        The Redis state (the baseline of this store is not changed).
+        :return (str): 'saved', 'retrieved', or None if no data.
+        """
+        return self.__meta()[0]
+
+    def consume(self):
+        """ Consume
+        Mark the saved data as retrieved; the next retrieve requires a new save.
+        """
+        self._rdb.hset(self.key, STATE_FIELD, RETRIEVED)
+        self._state = RETRIEVED
+        return
+
+    def delete(self, sections=None):
+        self._rdb.delete(self.key, *[self.__section_key(s) for s in (sections if sections else [])])
+        self._digests, self._fields, self._dirty, self._mappings, self._state, self._rev = {}, {}, {}, {}, None, None
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __meta(self):
+        """ (INTERNAL) (<state>, <revision>) in Redis. """
+        return tuple([self.__text(v) if v is not None else None for v in self._rdb.hmget(self.key, META_FIELDS)])
+
+    def __section_key(self, section):
+        return self.key if section is None else '{0}:{1}'.format(self.key, section)
+
+    def __stage(self, pipe, section, name, value):
+        """ (INTERNAL) Queue a field write if its serialized value changed.
+        :return (int): 1 if queued
+        """
+        data = self._serialize(value)
+        digest = self.__digest(data)
+        if self._digests.get((section, name)) == digest and name in self._fields.get(section, set()):
+            self._stats['unchanged'] += 1
+            return 0
+        pipe.hset(self.__section_key(section), name, data)
+        self._digests[(section, name)] = digest
+        self._fields.setdefault(section, set()).add(name)
+        self._stats['writes'] += 1
+        self._stats['bytes'] += len(data)
+        return 1
+
+    def __unstage(self, pipe, section, name):
+        if name not in self._fields.get(section, set()):
+            return 0
+        pipe.hdel(self.__section_key(section), name)
+        self._digests.pop((section, name), None)
+        self._fields[section].discard(name)
+        self._stats['deletes'] += 1
+        return 1
+
+    def __load(self, section, names):
+        key = self.__section_key(section)
+        if names is None:
+            raw = dict([(self.__text(k), v) for k, v in self._rdb.hgetall(key).items()])
+            existing = set(raw.keys())
+        else:
+            names = list(names) + (META_FIELDS if section is None else [])
+            raw = dict([(n, v) for n, v in zip(names, self._rdb.hmget(key, names) if names else []) if v is not None])
+            existing = set([self.__text(k) for k in self._rdb.hkeys(key)])
+        if section is None:
+            self._state, self._rev = [self.__text(raw.pop(f)) if f in raw else None for f in META_FIELDS]
+            existing.difference_update(META_FIELDS)
+        # The Redis content becomes the baseline for the next delta save.
+        self._fields[section] = existing
+        data = {}
+        for name, value in raw.items():
+            data[name] = self._deserialize(value)
+            self._digests[(section, name)] = self.__digest(value)
+        self._dirty.pop(section, None)
+        self._stats['reads'] += len(raw)
+        return data
+
+    @staticmethod
+    def __digest(data):
+        return hashlib.md5(data if isinstance(data, bytes) else data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def __text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) and not isinstance(value, str) else value
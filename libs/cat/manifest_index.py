@@ -0,0 +1,236 @@
+"""
+Product Manifest Index
+========================================================================================================================
+
+Persistent index of the product definition files used to build the UutDescriptor product manifest.
+
+Each 'product_definitions/*.py' file is recorded by path, mtime, and size along with the extracted '__family__'
+name and the string-valued parameters of every product in the 'family' dict.  Only files that are new or have
+changed (mtime or size) since the last scan are read and parsed; all others are served from the on-disk index.
+The index is shared by all containers on the server and is written atomically (temp file + rename).
+
+Lookups by codename, PID, CPN (revision suffix ignored), and family are hashed via the ManifestLookup class.
+
+Usage:
+    pmi = ProductManifestIndex()
+    entries = pmi.scan(pd_dir, line_filter='.*')
+    lookup = ManifestLookup(product_manifest)
+    lookup.by_pid('C9300-48UN')
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import ast
+import json
+import hashlib
+import logging
+import tempfile
+
+
+__title__ = "Product Manifest Index"
+__version__ = '2.0.0'
+__author__ = 'bborel'
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIR = os.path.join(tempfile.gettempdir(), 'entsw_manifest_index')
+FAMILY_START_PATTERN = re.compile(r'^family[ \t]+=[ \t]+({)', re.MULTILINE)
+FAMILY_END_PATTERN = re.compile(r'^(})[ \t]+#[ \t]+family_end', re.MULTILINE)
+FAMILY_NAME_PATTERN = re.compile(r"""^__family__[ \t]*=[ \t]*['"](.*?)['"]""", re.MULTILINE)
+
+
+class ProductManifestIndex(object):
+    """ Product Manifest Index
+    On-disk, mtime+size keyed cache of the product definition file content required for a product manifest.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, verbose_level=1):
+        """
+        :param (str) index_dir: Directory for the index files (one index per product definitions base dir).
+        :param (int) verbose_level:
+        """
+        self.index_dir = index_dir
+        self.verbose_level = verbose_level
+        self.parsed_files = []
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def get_index_file(self, pd_dir):
+        """ Get Index File
+        :param (str) pd_dir: Product definitions base directory.
+        :return (str): Full path of the index file for the given base directory.
+        """
+        key = hashlib.md5(os.path.realpath(pd_dir).encode('utf-8')).hexdigest()
+        return os.path.join(self.index_dir, 'manifest_{0}.json'.format(key))
+
+    def scan(self, pd_dir, line_filter='.*'):
+        """ Scan
+        Walk the product definitions base dir and return the index entries for all product definition files.
+        Only new or changed files are parsed; the on-disk index is updated if anything changed.
+        :param (str) pd_dir: Product definitions base directory.
+        :param (str) line_filter: Regex filter for the directory path.
+        :return (list): List of tuples [(<dir path>, <file name>, <entry dict>), ...] in walk order.
+        """
+        index_file = self.get_index_file(pd_dir)
+        index = self.__load(index_file)
+        new_index = {}
+        entries = []
+        self.parsed_files = []
+        for path, dirs, files in os.walk(pd_dir, followlinks=True):
+            if not re.search(line_filter, path):
+                continue
+            if os.path.basename(path) != 'product_definitions':
+                continue
+            mfiles = [f for f in files if os.path.splitext(f)[1] == '.py' and f[0] != '_']
+            for mfile in mfiles:
+                filepath = os.path.join(path, mfile)
+                try:
+                    st = os.stat(filepath)
+                except OSError:
+                    continue
+                entry = index.get(filepath)
+                if not entry or entry.get('mtime') != st.st_mtime or entry.get('size') != st.st_size:
+                    entry = self.parse_file(filepath)
+                    entry['mtime'] = st.st_mtime
+                    entry['size'] = st.st_size
+                    self.parsed_files.append(filepath)
+                new_index[filepath] = entry
+                entries.append((path, mfile, entry))
+
+        if self.parsed_files or set(new_index.keys()) != set(index.keys()):
+            log.debug("  Manifest index updated for {0} file(s).".format(len(self.parsed_files))) if self.verbose_level >= 2 else None
+            self.__save(index_file, new_index)
+        return entries
+
+    @staticmethod
+    def parse_file(filepath):
+        """ Parse File
+        Extract the family name and the products (string-valued params only) from a product definition file.
+        Converting the family string to a dict with ast has strict rules (see product definition header comments).
+        :param (str) filepath:
+        :return (dict): {'family_name': <str|None>, 'products': {<codename>: {<param>: <str|list>, ...}, ...}}
+        """
+        entry = {'family_name': None, 'products': {}}
+        try:
+            with open(filepath, 'r') as fp:
+                content = fp.read()
+        except (IOError, OSError) as e:
+            log.warning("Cannot read {0}: {1}".format(filepath, e))
+            return entry
+
+        m = FAMILY_NAME_PATTERN.search(content)
+        entry['family_name'] = m.group(1) if m else None
+
+        # Capture from the family start marker up to the end marker (or EOF when the end marker is absent).
+        family = None
+        m = FAMILY_START_PATTERN.search(content)
+        if m:
+            m2 = FAMILY_END_PATTERN.search(content, m.end())
+            try:
+                family = ast.literal_eval(content[m.start(1):m2.end(1) if m2 else len(content)])
+            except (ValueError, SyntaxError):
+                family = None
+        if not isinstance(family, dict):
+            return entry
+
+        for product, params in family.items():
+            if not isinstance(params, dict):
+                continue
+            entry['products'][product] = {k: v for k, v in params.items() if ProductManifestIndex.__is_indexable(v)}
+        return entry
+
+    def clear(self, pd_dir):
+        """ Clear
+        Remove the index file for the given product definitions base directory.
+        :param (str) pd_dir:
+        :return:
+        """
+        index_file = self.get_index_file(pd_dir)
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def __is_indexable(value):
+        if isinstance(value, str) or type(value).__name__ == 'unicode':
+            return True
+        if isinstance(value, (list, tuple)):
+            return all([isinstance(i, str) or type(i).__name__ == 'unicode' for i in value])
+        return False
+
+    @staticmethod
+    def __load(index_file):
+        if not os.path.isfile(index_file):
+            return {}
+        try:
+            with open(index_file, 'r') as fp:
+                data = json.load(fp)
+            if data.get('version') != INDEX_VERSION:
+                return {}
+            return data.get('files', {})
+        except (IOError, OSError, ValueError) as e:
+            log.debug("Manifest index unusable ({0}); rebuilding.".format(e))
+            return {}
+
+    def __save(self, index_file, index):
+        try:
+            if not os.path.isdir(self.index_dir):
+                os.makedirs(self.index_dir)
+            fd, tmp_file = tempfile.mkstemp(prefix='.manifest_', dir=self.index_dir)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump({'version': INDEX_VERSION, 'files': index}, fp)
+            os.rename(tmp_file, index_file)
+        except (IOError, OSError) as e:
+            log.warning("Cannot save manifest index {0}: {1}".format(index_file, e))
+        return
+
+
+class ManifestLookup(object):
+    """ Manifest Lookup
+    Hashed lookups of a product manifest {<codename>: Manifest(module, pid, cpns), ...}.
+    """
+    def __init__(self, product_manifest, families=None):
+        """
+        :param (dict) product_manifest: {<codename>: Manifest(module, pid, cpns), ...}
+        :param (dict) families: Optional {<codename>: <family name>, ...}
+        """
+        self._codenames = {}
+        self._pids = {}
+        self._cpns = {}
+        self._families = {}
+        for codename, mani in product_manifest.items():
+            self._codenames[codename] = mani
+            self._pids.setdefault(mani.pid, []).append(codename)
+            for cpn in mani.cpns:
+                self._cpns.setdefault(self.cpn_base(cpn), []).append(codename)
+        for codename, family_name in (families or {}).items():
+            self._families.setdefault(family_name, []).append(codename)
+        return
+
+    @staticmethod
+    def cpn_base(cpn):
+        """ CPN without the revision suffix (ex. '73-18506-01' --> '73-18506'). """
+        return cpn[:-3]
+
+    def by_codename(self, codename):
+        return self._codenames.get(codename)
+
+    def by_pid(self, pid):
+        return list(self._pids.get(pid, []))
+
+    def by_cpn(self, cpn):
+        return list(self._cpns.get(self.cpn_base(cpn), []))
+
+    def by_family(self, family_name):
+        return list(self._families.get(family_name, []))
@@ -0,0 +1,154 @@
+import logging
+
+from .. import descriptor_store
+
+__title__ = 'EntSw Descriptor Store Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class FakeRedis(object):
+    """ Local stand-in for the StrictRedis hash commands (values are returned as stored). """
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hset(self, name, key, value):
+        self.commands.append(('hset', name, key))
+        self.data.setdefault(name, {})[key] = value
+        return 1
+
+    def hdel(self, name, *keys):
+        self.commands.append(('hdel', name) + keys)
+        return len([self.data.get(name, {}).pop(k) for k in keys if k in self.data.get(name, {})])
+
+    def hmget(self, name, keys):
+        self.commands.append(('hmget', name) + tuple(keys))
+        return [self.data.get(name, {}).get(k) for k in keys]
+
+    def hgetall(self, name):
+        self.commands.append(('hgetall', name))
+        return dict(self.data.get(name, {}))
+
+    def hkeys(self, name):
+        return list(self.data.get(name, {}).keys())
+
+    def delete(self, *names):
+        self.commands.append(('delete',) + names)
+        return len([self.data.pop(n) for n in names if n in self.data])
+
+
+class FakePipeline(object):
+    def __init__(self, rdb):
+        self.rdb = rdb
+        self.queued = []
+
+    def __getattr__(self, item):
+        return lambda *args: self.queued.append((item, args))
+
+    def execute(self):
+        return [getattr(self.rdb, cmd)(*args) for cmd, args in self.queued]
+
+
+class TestDescriptorStore(object):
+
+    def setup_method(self, method):
+        self.rdb = FakeRedis()
+        self.key = 'PROD|UUT01_uut_descriptor'
+        self.uut_config = {'MODEL_NUM': 'C9300-48UXM', 'SERIAL_NUM': 'FOC12345678', 'poe': {'type': 'UPOE'},
+                           'prod_seq': ['a', 'b']}
+        self.fields = {'product_selection': 'C9300-48UXM', 'product_family': 'C9300', 'puid_keys': ['MODEL_NUM'],
+                       'uut_status': {}}
+
+    def __writes(self):
+        writes = [c for c in self.rdb.commands if c[0] in ['hset', 'hdel', 'delete']
+                  and c[-1] not in descriptor_store.META_FIELDS]
+        self.rdb.commands = []
+        return writes
+
+    def test_delta_save(self):
+        store = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        assert store.save(self.fields, {'uut_config': self.uut_config}) == 8
+        assert len(self.__writes()) == 9  # delete + 8 fields
+        assert store.save(self.fields, {'uut_config': self.uut_config}) == 0
+        assert self.__writes() == []
+
+        # Set one key, delete one key, mutate one nested value in place, and change one property.
+        self.uut_config['SERIAL_NUM'] = 'FOC87654321'
+        self.uut_config.pop('prod_seq')
+        self.uut_config['poe']['type'] = 'POE+'
+        self.fields['uut_status'] = {'vmargin': 'PASS'}
+        store.mark_dirty('uut_config', ['SERIAL_NUM', 'prod_seq', 'poe', 'MODEL_NUM'])
+        assert store.save(self.fields, {'uut_config': self.uut_config}) == 4
+        assert sorted(self.__writes()) == sorted([('hset', self.key + ':uut_config', 'SERIAL_NUM'),
+                                                  ('hdel', self.key + ':uut_config', 'prod_seq'),
+                                                  ('hset', self.key + ':uut_config', 'poe'),
+                                                  ('hset', self.key, 'uut_status')])
+        assert store.stats['unchanged'] >= 1
+
+    def test_lazy_retrieve(self):
+        descriptor_store.DescriptorStore(self.key, rdb=self.rdb).save(self.fields, {'uut_config': self.uut_config})
+        store = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        assert store.state() == descriptor_store.SAVED
+        self.rdb.commands = []
+        data = store.load(['product_selection', 'puid_keys', 'unknown'])
+        assert data == {'product_selection': 'C9300-48UXM', 'puid_keys': ['MODEL_NUM']}
+        assert self.rdb.commands == [('hmget', self.key, 'product_selection', 'puid_keys', 'unknown', '__state__', '__rev__')]
+        assert store.load_section('uut_config', ['poe']) == {'poe': {'type': 'UPOE'}}
+        uut_config = store.load_section('uut_config')
+        assert uut_config == self.uut_config
+        store.consume()
+        assert store.state() == descriptor_store.RETRIEVED
+
+        # The loaded content is the baseline; a bound section stays a delta.
+        store.bind('uut_config', uut_config)
+        self.__writes()
+        uut_config['MODEL_NUM'] = 'C9300-24UXM'
+        store.mark_dirty('uut_config', ['MODEL_NUM'])
+        store.save(self.fields, {'uut_config': uut_config})
+        assert [c for c in self.__writes() if c[1].endswith('uut_config')] == [('hset', self.key + ':uut_config', 'MODEL_NUM')]
+        assert store.state() == descriptor_store.SAVED
+
+    def test_replaced_section_and_new_store(self):
+        store = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        store.save(self.fields, {'uut_config': self.uut_config})
+        # A replaced (unbound) dict is rewritten entirely; stale keys are gone.
+        store.save(self.fields, {'uut_config': {'MODEL_NUM': 'C9300-24P'}})
+        assert self.rdb.data[self.key + ':uut_config'].keys() == {'MODEL_NUM': None}.keys()
+        # A new store (next UUT in the container) starts with a full rewrite.
+        store = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        store.save({'product_selection': 'C9300-24P'}, {'uut_config': {'SERIAL_NUM': 'FOC0'}})
+        assert sorted(self.rdb.data[self.key].keys()) == ['__rev__', '__state__', 'product_selection']
+        assert list(self.rdb.data[self.key + ':uut_config'].keys()) == ['SERIAL_NUM']
+        store.delete(sections=['uut_config'])
+        assert self.rdb.data == {}
+        assert store.state() is None
+
+    def test_two_instances(self):
+        # PRE-SEQ and MAIN descriptors are different instances sharing the same key.
+        pre = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        main = descriptor_store.DescriptorStore(self.key, rdb=self.rdb)
+        for _ in range(2):
+            pre.save(self.fields, {'uut_config': self.uut_config})
+            assert main.state() == descriptor_store.SAVED
+            assert main.load(['product_selection']) == {'product_selection': 'C9300-48UXM'}
+            uut_config = main.load_section('uut_config')
+            main.consume()
+            assert uut_config == self.uut_config and pre.state() == descriptor_store.RETRIEVED
+
+        # MAIN changes a key; the next PRE-SEQ save is a full save (its digests are stale), not a skipped write.
+        main.bind('uut_config', uut_config)
+        uut_config['SERIAL_NUM'] = 'FOC87654321'
+        main.mark_dirty('uut_config', ['SERIAL_NUM'])
+        main.save(self.fields, {'uut_config': uut_config})
+        self.__writes()
+        pre.save(self.fields, {'uut_config': self.uut_config})
+        assert ('delete', self.key, self.key + ':uut_config') in self.__writes()
+        assert main.load_section('uut_config') == self.uut_config
+        # Unchanged owner: still a delta save.
+        assert pre.save(self.fields, {'uut_config': self.uut_config}) == 0
@@ -0,0 +1,78 @@
+import logging
+import os
+import collections
+
+from .. import manifest_index
+
+__title__ = 'EntSw Product Manifest Index Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+PD_TEMPLATE = '''"""
+  family = {{
+  }} # family_end
+"""
+__family__ = "{family}"
+
+family = {{
+    'COMMON': {{
+        'MODEL_NUM': None,
+    }},
+    '{codename}': {{
+        'MODEL_NUM': '{pid}',
+        'MOTHERBOARD_ASSEMBLY_NUM': '{cpn}',
+        'poe': {{'type': 'UPOE'}},
+    }},
+}}  # family_end
+'''
+
+Manifest = collections.namedtuple('Manifest', 'module pid cpns')
+
+
+def write_pd(pd_dir, filename, **kwargs):
+    with open(os.path.join(pd_dir, filename), 'w') as fp:
+        fp.write(PD_TEMPLATE.format(**kwargs))
+
+
+class TestManifestIndex(object):
+
+    def test_scan_and_rescan(self, tmpdir):
+        pd_dir = tmpdir.mkdir('C9300').mkdir('product_definitions')
+        write_pd(str(pd_dir), 'nyquist_def.py', family='nyquist', codename='NYQUISTCR48', pid='C9300-48P', cpn='73-17956-05')
+        write_pd(str(pd_dir), 'gladiator_def.py', family='gladiator', codename='GLADIATOR24', pid='C9300-24T', cpn='73-17959-06')
+        pmi = manifest_index.ProductManifestIndex(index_dir=str(tmpdir.mkdir('index')))
+
+        entries = pmi.scan(str(tmpdir))
+        assert len(entries) == 2
+        assert len(pmi.parsed_files) == 2
+        products = dict([(e[1], e[2]) for e in entries])
+        assert products['nyquist_def.py']['family_name'] == 'nyquist'
+        assert products['nyquist_def.py']['products']['NYQUISTCR48']['MODEL_NUM'] == 'C9300-48P'
+        assert 'poe' not in products['nyquist_def.py']['products']['NYQUISTCR48']
+
+        # Unchanged files come from the on-disk index.
+        pmi2 = manifest_index.ProductManifestIndex(index_dir=pmi.index_dir)
+        assert len(pmi2.scan(str(tmpdir))) == 2
+        assert pmi2.parsed_files == []
+
+        # Only the changed file is parsed.
+        write_pd(str(pd_dir), 'gladiator_def.py', family='gladiator', codename='GLADIATOR24', pid='C9300-24UX', cpn='73-17959-06')
+        entries = pmi2.scan(str(tmpdir))
+        assert [os.path.basename(f) for f in pmi2.parsed_files] == ['gladiator_def.py']
+        products = dict([(e[1], e[2]) for e in entries])
+        assert products['gladiator_def.py']['products']['GLADIATOR24']['MODEL_NUM'] == 'C9300-24UX'
+
+    def test_lookup(self):
+        manifest = {
+            'NYQUISTCR48': Manifest('a.nyquist_def', 'C9300-48P', ['73-17956-05', '68-101195-01']),
+            'NYQUISTCSR48': Manifest('a.nyquistcsr_def', 'C9300-48P', ['73-18506-01']),
+        }
+        lookup = manifest_index.ManifestLookup(manifest, families={'NYQUISTCR48': 'nyquist', 'NYQUISTCSR48': 'nyquist'})
+        assert lookup.by_codename('NYQUISTCR48').pid == 'C9300-48P'
+        assert sorted(lookup.by_pid('C9300-48P')) == ['NYQUISTCR48', 'NYQUISTCSR48']
+        assert lookup.by_cpn('73-17956-01') == ['NYQUISTCR48']
+        assert lookup.by_cpn('68-101195-02') == ['NYQUISTCR48']
+        assert sorted(lookup.by_family('nyquist')) == ['NYQUISTCR48', 'NYQUISTCSR48']
+        assert lookup.by_pid('C9300-24T') == []
@@ -8,6 +8,7 @@ import sys
 import os
 import re
 import collections
+import copy
 import importlib
 import logging
 import redis
@@ -22,6 +23,9 @@ from toolbox.utils import deserialize
 # BU Lib
 # ------
 import apollo.scripts.entsw.libs.utils.common_utils as common_utils
+from apollo.scripts.entsw.libs.cat import manifest_index
+from apollo.scripts.entsw.libs.cat import descriptor_store
+from apollo.scripts.entsw.libs.utils import layered_config
 
 __title__ = "UUT Descriptor"
 __version__ = '2.0.0'
@@ -40,19 +44,55 @@ func_details = common_utils.func_details
 apollo_step = common_utils.apollo_step
 
 class CustomDict(dict):
+    """ Custom Dict
+    Runs a specified function with the list of keys that are set or deleted.
+    Keys of mutable values (dict, list, set) that are read are recorded as 'touched' since the value can be changed
+    in place (ex. uut_config['poe']['type'] = ...) without a set.
+    """
+    MUTABLE_TYPES = (dict, list, set)
 
     def __init__(self, func=None, **kwargs):
         self.__func = func
+        self.__touched = set()
         super(CustomDict, self).__init__(**kwargs)
 
     def __getitem__(self, k):
-        return super(CustomDict, self).__getitem__(k)
+        v = super(CustomDict, self).__getitem__(k)
+        self.__touched.add(k) if isinstance(v, self.MUTABLE_TYPES) else None
+        return v
 
     def __setitem__(self, k, v):
         ret = super(CustomDict, self).__setitem__(k, v)
         self.__func([k]) if self.__func else None
         return ret
 
+    def __delitem__(self, k):
+        ret = super(CustomDict, self).__delitem__(k)
+        self.__func([k]) if self.__func else None
+        return ret
+
+    @property
+    def touched(self):
+        return self.__touched
+
+    def clear_touched(self):
+        self.__touched = set()
+        return
+
+    def get(self, k, d=None):
+        return self[k] if k in self else d
+
+    def setdefault(self, k, d=None):
+        if k not in self:
+            self[k] = d
+        return self[k]
+
+    def pop(self, k, *args):
+        present = k in self
+        ret = super(CustomDict, self).pop(k, *args)
+        self.__func([k]) if self.__func and present else None
+        return ret
+
     def update(self, *args, **kwargs):
         """ update
         Do normal dict.update() then run a specified function using the keys from the update.
@@ -180,7 +220,7 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
     UDParams = collections.namedtuple('UDParams', 'pm_type pm_key_pairs pm_locator_module uut_config_assem_section '
                                                   'remote_server_key eco_key')
     DEFAULT_PROPERTIES = ['product_line', 'product_family', 'product_codename', 'product_selection', 'puid_keys', 'puid', 'consumer',
-                          'uut_index', 'container_key', 'container_name', 'test_area', 'apollo_mode']
+                          'uut_index', 'container_key', 'container_name', 'test_area', 'apollo_mode', 'last_known_mode']
     DEFAULT_REVISION_MAP = {
         'MOTHERBOARD_ASSEMBLY_NUM': 'MOTHERBOARD_REVISION_NUM',
         'TAN_NUM': 'TAN_REVISION_NUMBER',
@@ -197,12 +237,16 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             log.debug("  This instance of UutDescriptor is in STANDALONE mode.")
         self._callback = None
         self.__uut_conn = uut_conn
+        common_utils.STEP_TELEMETRY.instrument(uut_conn)
         # data
-        self.uut_config = CustomDict(func=self.__source_puid)
+        self.__stores = dict()
+        self.uut_config = CustomDict(func=self.__uut_config_changed)
         self.uut_status = dict()
+        self.__last_known_mode = None                   # Runtime: last known UUT mode hint (see ModeManager)
         self.ios_manifest = getattr(kwargs.get('ios_manifest', None), 'ios_manifest', {})
         # definitions + paths ----------------------------------
         self.__product_specific_def = None
+        self.__product_definition = None
         self.__product_line_def = product_line_def
         self.__common_def = common_def
         self.__pd_modulepath = None
@@ -237,6 +281,10 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
         self.__max_attempts = 3
         self.__keep_connected = False
         self.__cof = False
+        self.__manifest_index = manifest_index.ProductManifestIndex(
+            index_dir=kwargs.get('manifest_index_dir', manifest_index.DEFAULT_INDEX_DIR),
+            verbose_level=self.__verbose_level)
+        self.__manifest_lookup = None
         # data assembly ------------------------------------------
         self.__get_product_manifest()
         self.__assemble_uut_network()
@@ -301,10 +349,19 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
     def products_available(self):
         return sorted(self.__product_manifest.keys())
 
+    @property
+    def manifest_lookup(self):
+        return self.__manifest_lookup
+
     @property
     def product_codename(self):
         return self.__product_codename
 
+    @property
+    def product_definition(self):
+        """ Layered view of the assembled product definition (see .provenance(<key>) for the source sections). """
+        return self.__product_definition
+
     @property
     def consumer(self):
         return self.__consumer
@@ -333,6 +390,15 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
     def uut_conn(self):
         return self.__uut_conn
 
+    @property
+    def last_known_mode(self):
+        """ Runtime (not product config): {'mode': <mode>, 'prompt': <actual prompt>} from the mode manager. """
+        return self.__last_known_mode
+
+    @last_known_mode.setter
+    def last_known_mode(self, newvalue):
+        self.__last_known_mode = newvalue
+
     @property
     def puid(self):
         return self.__puid
@@ -570,27 +636,46 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
         return aplib.PASS
 
     @apollo_step
-    def save(self, manual_key=None):
-        rdb = redis.StrictRedis()
+    def save(self, manual_key=None, full=False):
+        """ Save
+        Only the descriptor properties and uut_config keys that changed since the last save/retrieve are written.
+        :param (str) manual_key:
+        :param (bool) full: Rewrite the entire descriptor.
+        :return:
+        """
         key = "{0}_uut_descriptor".format(self.container_key) if not manual_key else manual_key
-        saved_dict = self.convert_to_dict()
+        store = self.__get_store(key)
         log.debug("Saving at key={0}".format(key))
-        if not rdb.set(key, serialize(saved_dict)):
+        store.mark_dirty('uut_config', self.uut_config.touched)
+        try:
+            store.save(fields=self.__descriptor_fields(), sections={'uut_config': self.uut_config}, full=full)
+        except redis.RedisError as e:
+            log.error(e)
             raise UutDescriptorException("Cannot save UUT Descriptor.")
+        finally:
+            self.uut_config.clear_touched()
+        log.debug("Store stats: {0}".format(store.stats)) if self.__verbose_level > 1 else None
         return aplib.PASS
 
     @apollo_step
     def retrieve(self, manual_key=None):
-        rdb = redis.StrictRedis()
+        """ Retrieve
+        Only the properties needed to rebuild the descriptor and the uut_config are read.
+        :param (str) manual_key:
+        :return:
+        """
         key = "{0}_uut_descriptor".format(self.container_key) if not manual_key else manual_key
+        store = self.__get_store(key)
         log.debug("Retrieving at key={0}".format(key))
-        serdes_data = rdb.get(key)
-        if not serdes_data:
+        if store.state() != descriptor_store.SAVED:
             raise UutDescriptorException("No UUT data in Redis for the container.")
-        retrieved_dict = deserialize(serdes_data)
-        rdb.delete(key)
-        if not retrieved_dict:
+        try:
+            retrieved_dict = store.load(['product_family', 'product_selection', 'puid_keys', 'last_known_mode'])
+            retrieved_dict['uut_config'] = store.load_section('uut_config')
+        except Exception as e:
+            log.error(e)
             raise UutDescriptorException("Cannot deserialize UUT Descriptor.")
+        store.consume()
         if not retrieved_dict.get('uut_config'):
             raise UutDescriptorException("No uut_config available for UUT Descriptor init.")
         if not retrieved_dict.get('product_selection'):
@@ -603,8 +688,10 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             # Load the previously selected product (from PRE-SEQ)
             self.product_selection = retrieved_dict.get('product_selection')
         # Override with previous PRE-SEQ data
-        self.uut_config = CustomDict(func=self.__source_puid, **retrieved_dict.get('uut_config'))
+        self.uut_config = CustomDict(func=self.__uut_config_changed, **retrieved_dict.get('uut_config'))
+        store.bind('uut_config', self.uut_config)
         self.puid_keys = list(retrieved_dict.get('puid_keys'))
+        self.last_known_mode = retrieved_dict.get('last_known_mode')
         return aplib.PASS
 
     @apollo_step
@@ -693,9 +780,8 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
     # ==================================================================================================================
     def convert_to_dict(self):
         log.debug("Convert to dict...")
-        ud_dict = dict()
-        for prop in self.DEFAULT_PROPERTIES + self._dynamic_properties:
-            ud_dict[prop] = getattr(self, prop)
+        ud_dict = self.__descriptor_fields()
+        for prop in sorted(ud_dict.keys()):
             if len(str(ud_dict[prop])) < 100:
                 log.debug("  {0} = {1}".format(prop, ud_dict[prop])) if self.__verbose_level > 2 else None
             else:
@@ -803,6 +889,31 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
 
     # INTERNAL Methods -------------------------------------------------------------------------------------------------
     #
+    def __descriptor_fields(self):
+        """ Descriptor Fields (INTERNAL)
+        All descriptor properties except uut_config (saved per key as a separate section).
+        :return (dict):
+        """
+        return {prop: getattr(self, prop) for prop in self.DEFAULT_PROPERTIES + self._dynamic_properties
+                if prop != 'uut_config'}
+
+    def __get_store(self, key):
+        if key not in self.__stores:
+            self.__stores[key] = descriptor_store.DescriptorStore(key, rdb=redis.StrictRedis(),
+                                                                  serializer=serialize, deserializer=deserialize)
+        return self.__stores[key]
+
+    def __uut_config_changed(self, keys):
+        """ UUT Config Changed (INTERNAL)
+        CustomDict callback for the uut_config keys set or deleted.
+        :param (list) keys:
+        :return:
+        """
+        self.__source_puid(keys)
+        for store in self.__stores.values():
+            store.mark_dirty('uut_config', keys)
+        return
+
     def __save_to_userdict(self):
         if self.__standalone:
             log.debug("  Standalone; not allowed in userdict.")
@@ -841,11 +952,12 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
         return c
 
     def __clear_selection(self):
-        self.uut_config = CustomDict(func=self.__source_puid)
+        self.uut_config = CustomDict(func=self.__uut_config_changed)
         self.__product_selection = None
         self.__product_codename = None
         self.__product_family = None
         self.__product_specific_def = None
+        self.__product_definition = None
         for p in self._dynamic_properties:
             try:
                 delattr(self, p, None)
@@ -1054,45 +1166,35 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             :return: Ordered Dict of tuples (fully qualified module, BasePID, CPN)
             """
 
-            def __extract_pd_pids(_mfiles, _pd_dir, _module_path):
-                log.debug("  filtering...") if self.__verbose_level >= 3 else None
-                for mfile in _mfiles:
-                    modulename = os.path.splitext(mfile)[0]
-                    # Get family data without loading all the modules.
-                    # Converting string to dict with ast has strict rules (see product definition header comments).
-                    try:
-                        family = common_utils.readfiledata(os.path.join(_pd_dir, mfile),
-                                                           ast_flag=True,
-                                                           start_pattern='^family[ \t]+=[ \t]+({)',
-                                                           end_pattern='^(})[ \t]+#[ \t]+family_end')
-                    except Exception:
-                        family = None
-
-                    # Check for data structure
-                    if not family:
-                        log.warning("No family definition found in {0}".format(mfile))
-                        continue
-
-                    log.debug("  family def captured.") if self.__verbose_level >= 3 else None
-                    # Check for family filter
-                    file_content = common_utils.readfiledata(os.path.join(_pd_dir, mfile), raw=True)
-                    if not re.search("""__family__[ \t]*=[ \t]*['"]({0}).*?['"]""".format(self.__family_filter), file_content):
-                        log.warning("  Prod Def '{0}' does not have a __family__ property!".format(mfile))
-                        continue
-
-                    # Get PIDs in Product Definition
-                    for product in family.keys():
-                        log.debug("    product={0}".format(product)) if self.__verbose_level >= 3 else None
-                        if product.upper() != "COMMON":
-                            pid = family.get(product, {}).get(pid_param, None)
-                            cpns = []
-                            for cpn_param in cpn_params:
-                                cpn = family.get(product, {}).get(cpn_param, None)
-                                cpns.append(cpn) if cpn else None
-                            if pid and cpns:
-                                # MUST have BOTH PID and CPN defined or it does NOT go in the manifest!!
-                                qualified_module = '{0}.{1}'.format(_module_path, modulename)
-                                product_mainfest[product] = UutDescriptor.Manifest(qualified_module, pid, cpns)
+            def __extract_pd_pids(_entry, _mfile, _module_path):
+                modulename = os.path.splitext(_mfile)[0]
+                family = _entry.get('products')
+
+                # Check for data structure
+                if not family:
+                    log.warning("No family definition found in {0}".format(_mfile))
+                    return
+
+                log.debug("  family def captured.") if self.__verbose_level >= 3 else None
+                # Check for family filter
+                if not _entry.get('family_name') or not re.match('({0})'.format(self.__family_filter), _entry['family_name']):
+                    log.warning("  Prod Def '{0}' does not have a __family__ property!".format(_mfile))
+                    return
+
+                # Get PIDs in Product Definition
+                for product in family.keys():
+                    log.debug("    product={0}".format(product)) if self.__verbose_level >= 3 else None
+                    if product.upper() != "COMMON":
+                        pid = family.get(product, {}).get(pid_param, None)
+                        cpns = []
+                        for cpn_param in cpn_params:
+                            cpn = family.get(product, {}).get(cpn_param, None)
+                            cpns.append(cpn) if cpn else None
+                        if pid and cpns:
+                            # MUST have BOTH PID and CPN defined or it does NOT go in the manifest!!
+                            qualified_module = '{0}.{1}'.format(_module_path, modulename)
+                            product_mainfest[product] = UutDescriptor.Manifest(qualified_module, pid, cpns)
+                            product_families[product] = _entry['family_name']
                 return
 
             # deep debug: log.debug("Product Definition dir = {0}".format(pd_dir))
@@ -1106,20 +1208,14 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             product_mainfest = collections.OrderedDict()
 
             self.__extract_pd_base_location()
-            for path, dirs, files in os.walk(self.__pd_dir, followlinks=True):
-                if not re.search(self.__line_filter, path):
-                    log.debug("  filtering...") if self.__verbose_level >= 3 else None
-                    continue
-                if os.path.basename(path) == 'product_definitions':
-                    mfiles = [f for f in files if os.path.splitext(f)[1] == '.py' and f[0] != '_']
-                    log.debug("  mfiles = {0}".format(mfiles)) if self.__verbose_level >= 3 else None
-                    if '.common' in self.__pd_modulepath:
-                        module_path = '.'.join(self.__pd_modulepath.split('.')[:-1] + path.split('/')[-2:])
-                    elif '.cat' not in self.__pd_modulepath:
-                        module_path = '.'.join(self.__pd_modulepath.split('.') + path.split('/')[-3:])
-                    else:
-                        module_path = self.__pd_modulepath
-                    __extract_pd_pids(mfiles, path, module_path)
+            for path, mfile, entry in __manifest_index_entries(self.__pd_dir):
+                if '.common' in self.__pd_modulepath:
+                    module_path = '.'.join(self.__pd_modulepath.split('.')[:-1] + path.split('/')[-2:])
+                elif '.cat' not in self.__pd_modulepath:
+                    module_path = '.'.join(self.__pd_modulepath.split('.') + path.split('/')[-3:])
+                else:
+                    module_path = self.__pd_modulepath
+                __extract_pd_pids(entry, mfile, module_path)
 
             return product_mainfest
 
@@ -1132,8 +1228,17 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
         elif not isinstance(mani_types, list):
             mani_types = [mani_types]
 
+        def __manifest_index_entries(pd_dir):
+            # All manifest types share one scan (unchanged files are served from the on-disk index).
+            if pd_dir not in index_entries:
+                index_entries[pd_dir] = self.__manifest_index.scan(pd_dir, line_filter=self.__line_filter)
+                log.debug("  Manifest index parsed {0} changed file(s).".format(len(self.__manifest_index.parsed_files)))
+            return index_entries[pd_dir]
+
         # Generate a complete product list (a.k.a manifest)
         log.debug("  Generating Product Manifest...")
+        index_entries = dict()
+        product_families = dict()
         product_manifest = dict()
         for mani_type in mani_types:
             cpn_params, pid_param = key_pairs.get(mani_type, (None, None))
@@ -1141,6 +1246,7 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             product_manifest.update(__generate_manifest(pid_param=pid_param, cpn_params=cpn_params))
 
         self.__product_manifest = product_manifest
+        self.__manifest_lookup = manifest_index.ManifestLookup(product_manifest, families=product_families)
         return
 
     def __search_codename(self, product_selection, title=None):
@@ -1173,18 +1279,17 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             # All 68-level CPNs are expected to be unique.
             # Product selection and manifest build
             log.debug("Product selection is a CPN.")
-            cnames_frm_cpns = [k for k, v in self.__product_manifest.items() if
-                               any([cpn[:-3] == product_selection[:-3] for cpn in v.cpns])]
+            cnames_frm_cpns = self.__manifest_lookup.by_cpn(product_selection)
 
         elif common_utils.validate_pid(product_selection, silent=True):
             # It is a PID or a codename.
             # Multiple codenames are possible since the same PID can show up on multi NPI programs (i.e. CR, CSR, etc.)
-            if product_selection in self.__product_manifest.keys():
+            if self.__manifest_lookup.by_codename(product_selection):
                 log.debug("Product selection is a codename.")
                 product_codename = product_selection
             else:
                 log.debug("Product selection is a PID.")
-                cnames_frm_pids = [k for k, v in self.__product_manifest.items() if v.pid == product_selection]
+                cnames_frm_pids = self.__manifest_lookup.by_pid(product_selection)
         else:
             log.error("Product selection not recognized as a PID/Codename or CPN!")
             log.error("Cannot continue. Please check the data entry when prompted for CPN/PID.")
@@ -1347,10 +1452,12 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             uut_config_pid_specific = self.__product_specific_def.family[self.__product_codename]
             # Do some extra loading of pcamaps if a peripheral
             if self.__category in ['PERIPH']:
+                pcamaps = {}
                 if 'pcamaps' in self.__product_specific_def.family['COMMON']:
                     pcamaps = self.__product_specific_def.family['COMMON'].get('pcamaps', {})
                 if 'pcamaps' in self.__product_specific_def.family[self.__product_codename]:
                     pcamaps = self.__product_specific_def.family[self.__product_codename].get('pcamaps', {})
+                pcamaps = copy.deepcopy(pcamaps)  # the product definition is shared; do not change it
                 log.debug("  Selection is a Perihperal: {0}".format(self.__category))
                 replace_list = True
                 log.debug(" (Note: COMMON keys that have list values will be replaced if the keys are in the product section. Periphs only.)")
@@ -1362,7 +1469,7 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
                         log.debug("  Items: {0}".format(keys))
                         for k in keys:
                             pcamaps[dev_inst][k] = self.__product_specific_def.family[self.__product_codename][k.upper()]
-                uut_config_pid_specific.update({'pcamaps': pcamaps})
+                uut_config_pid_specific = dict(uut_config_pid_specific, pcamaps=pcamaps)
 
         # Add-in (another module not considered the UUT)
         # ----------------------------------------------
@@ -1376,12 +1483,17 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             log.debug("Add-in Selection: {0}".format(self.__product_codename))
             uut_config_addin = {'add-in': {self.__product_codename: self.__product_specific_def.family[self.__product_codename]}}
 
-        # Combine recursively
-        # -------------------
-        uut_config = dict()
-        common_utils.update_dict_recursively(uut_config, uut_config_common, verbose=verbose)
-        common_utils.update_dict_recursively(uut_config, uut_config_pid_specific, list_replace=replace_list, verbose=verbose)
-        common_utils.update_dict_recursively(uut_config, uut_config_addin, list_replace=False, verbose=verbose)
+        # Combine as layers (the product definition sections are not changed)
+        # -------------------------------------------------------------------
+        definition = layered_config.LayeredConfig()
+        definition = definition.new_child(uut_config_common, name='COMMON')
+        definition = definition.new_child(uut_config_pid_specific, name=self.__product_codename, list_replace=replace_list)
+        definition = definition.new_child(uut_config_addin, name='ADD-IN', list_replace=False)
+        self.__product_definition = definition
+        uut_config = definition.to_dict()
+        if verbose:
+            for k, layers in definition.provenance_map().items():
+                log.debug("  {0:<30} <-- {1}".format(k, ' + '.join(layers)))
 
         # Special PID-specific updates for list replacement (i.e. no append)
         # ------------------------------------------------------------------
@@ -1390,7 +1502,7 @@ class UutDescriptor(ServerDescriptor, ApolloAddon):
             pid_replace_lists.append(uut_config['pid_replace_lists'])
         for target_list in pid_replace_lists:
             if uut_config_pid_specific.get(target_list):
-                uut_config[target_list] = uut_config_pid_specific[target_list]
+                uut_config[target_list] = copy.deepcopy(uut_config_pid_specific[target_list])
 
         # Save the results
         # ----------------
@@ -0,0 +1,252 @@
+r""" SerDes Eye Module
+========================================================================================================================
+
+Pipelined SerDes eye collection for the Stardust diags (SIF, SupDP, NRU, ...).
+
+The legacy collection looped over every core x side: clear recbuf (sleep), send the eye cmd, wait RECBUF_TIME, then
+regex-parse the whole recbuf before the next cmd.  The collector instead:
+    1. Types the next cmd(s) ahead while the current measurement runs (pipeline depth); the diags read the next cmd
+       as soon as the prompt returns so there is no round-trip or settle gap between cmds.  Depth 1 = one cmd at a
+       time but still completed by prompt detection (no fixed sleep).
+    2. Parses the console stream incrementally; each cmd's section (echo + output up to the next line-start prompt)
+       is parsed as soon as it completes and handed to an optional callback while later cmds are still running.
+    3. On a timeout, stops sending; the cmds still running (incl. typed ahead) are drained (bounded wait for their
+       prompts, else a break) and the recbuf is cleared so that nothing stale is left for the next user.
+    4. Builds a per-lane eye matrix (EyeMatrix) keyed as {(<cmd key>..., <lane>, <Sum|Min|Max>): Eye, ...};
+       optional limits give per-lane pass/fail margins.
+
+Usage:
+    commands = OrderedDict([((core, side), 'SifSerdesEye {0} {1} -i:3\r'.format(core, side)) for ...])
+    collector = SerdesEyeCollector(uut_conn, prompt=uut_prompt, pattern=sif_pattern, depth=2)
+    sections = collector.collect(commands, on_section=callback)
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import time
+import logging
+from collections import namedtuple
+from collections import OrderedDict
+
+# BU Specific
+# -----------
+from ..utils.measurement_store import to_float
+from ..utils import step_telemetry
+
+
+__title__ = "SerDes Eye Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 2
+DEFAULT_TIMEOUT = 300
+DEFAULT_POLL = 0.2
+
+# rows = regex findall() results of the section; errors = diag 'ERR:' lines
+EyeSection = namedtuple('EyeSection', 'key cmd text rows errors secs')
+
+
+class EyeMatrix(OrderedDict):
+    """ Eye Matrix
+    {(<cmd key>..., <lane>, <tag>): Eye, ...} where tag = 'Sum', 'Min', or 'Max'.
+    Limits are of the form {<Eye field>: <min>, ...} or {<Eye field>: (<min>, <max>), ...}; a margin is the distance
+    of the 'Sum' reading inside the limit (negative = outside).
+    """
+    def __init__(self, *args, **kwargs):
+        self.limits = kwargs.pop('limits', None) or {}
+        super(EyeMatrix, self).__init__(*args, **kwargs)
+
+    def lanes(self):
+        """ All lane keys (cmd key + lane) in collection order. """
+        return list(OrderedDict([(k[:-1], None) for k in self.keys()]).keys())
+
+    def margins(self, tag='Sum'):
+        """ Margins
+        :param (str) tag: Row type to check against the limits.
+        :return (OrderedDict): {<lane key>: {<field>: <margin>, ...}, ...}
+        """
+        margins = OrderedDict()
+        for key, eye in self.items():
+            if key[-1] != tag or not self.limits:
+                continue
+            margins[key[:-1]] = {}
+            for field, limit in self.limits.items():
+                lower, upper = limit if isinstance(limit, (list, tuple)) else (limit, None)
+                value = to_float(getattr(eye, field, None))
+                margin = value - lower if lower is not None else float('inf')
+                margin = min(margin, upper - value) if upper is not None else margin
+                margins[key[:-1]][field] = margin
+        return margins
+
+    def failures(self):
+        """ Failures
+        :return (list): [(<key>, <reason>), ...] for diag result failures and negative (or missing) margins.
+        """
+        failures = []
+        for key, eye in self.items():
+            result = str(getattr(eye, 'Result', '')).upper()
+            if result not in ['PASS', 'IGNORE']:
+                failures.append((key, 'Result={0}'.format(getattr(eye, 'Result', None))))
+        return failures + self.margin_failures()
+
+    def margin_failures(self):
+        """ Margin Failures
+        :return (list): [(<key>, <reason>), ...] for negative (or missing) margins; IGNORE lanes are skipped.
+        """
+        failures = []
+        for lane, margins in self.margins().items():
+            if self.get(lane + ('Sum',)) is not None and str(self[lane + ('Sum',)].Result).upper() == 'IGNORE':
+                continue
+            for field, margin in sorted(margins.items()):
+                if not margin >= 0:
+                    failures.append((lane + ('Sum',), '{0} margin={1:.3f}'.format(field, margin)))
+        return failures
+
+    def print_matrix(self):
+        fields = sorted(self.limits.keys())
+        margins = self.margins()
+        log.debug("-" * 100)
+        log.debug("{0:<30} {1:<8} {2}".format('Lane', 'Result', '  '.join(['{0:>10}'.format(f) for f in fields])))
+        log.debug("-" * 100)
+        for lane in self.lanes():
+            eye = self.get(lane + ('Sum',))
+            log.debug("{0:<30} {1:<8} {2}".format(
+                lane, getattr(eye, 'Result', '?'),
+                '  '.join(['{0:>10.3f}'.format(margins.get(lane, {}).get(f, float('nan'))) for f in fields])))
+        log.debug("-" * 100)
+        return
+
+
+class SerdesEyeCollector(object):
+    """ SerDes Eye Collector
+    """
+    BREAK = '\x03'
+
+    def __init__(self, uut_conn, prompt, pattern, depth=DEFAULT_DEPTH, timeout=DEFAULT_TIMEOUT, poll=DEFAULT_POLL,
+                 drain_timeout=None):
+        """
+        :param (obj) uut_conn: UUT connection (send() and the 'recbuf' attribute)
+        :param (str) prompt: Regex of the diag prompt
+        :param (str) pattern: Regex for the eye rows (summary, min, and max)
+        :param (int) depth: Max cmds outstanding (typed ahead); 1 = one at a time.
+        :param (int) timeout: Max time (secs) for one cmd to complete.
+        :param (float) poll: Recbuf poll interval (secs)
+        :param (int) drain_timeout: Max time (secs) to wait for the cmds still running after a timeout before a
+                                    break is sent; default = timeout.
+        """
+        self._uut_conn = uut_conn
+        self._prompt_re = re.compile(r'(?:^|(?<=[\r\n]))(?:{0})'.format(prompt))
+        self._pattern_re = re.compile(pattern)
+        self.depth = max(1, int(depth))
+        self.timeout = timeout
+        self.poll = poll
+        self.drain_timeout = timeout if drain_timeout is None else drain_timeout
+        self._stats = dict(commands=0, secs=0.0, timeouts=0)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def stats(self):
+        return self._stats
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def collect(self, commands, on_section=None):
+        """ Collect
+        :param (OrderedDict) commands: {<key>: <cmd incl. CR>, ...}
+        :param (func) on_section: Called as on_section(EyeSection) as soon as each cmd completes.
+        :return (OrderedDict): {<key>: EyeSection, ...}; a cmd that timed out has errors=['TIMEOUT'], the typed
+                               ahead cmds are drained (no section), and the remaining cmds are not sent.
+        """
+        start = time.time()
+        pending = list(commands.items())
+        outstanding = []
+        sections = OrderedDict()
+        stream = ''
+        offset = len(self._uut_conn.recbuf or '')
+        head_since = time.time()
+        while pending or outstanding:
+            while pending and len(outstanding) < self.depth:
+                key, cmd = pending.pop(0)
+                self._uut_conn.send(cmd, expectphrase=None, timeout=30, regex=True)
+                outstanding.append((key, cmd, time.time()))
+            buf = self._uut_conn.recbuf or ''
+            if len(buf) < offset:
+                log.debug("SerDes eye: recbuf was reset; continuing from the start.")
+                offset = 0
+            stream += buf[offset:]
+            offset = len(buf)
+
+            m = self._prompt_re.search(stream)
+            while m and outstanding:
+                key, cmd, sent = outstanding.pop(0)
+                section = self.__make_section(key, cmd, stream[:m.end()], max(sent, head_since))
+                stream = stream[m.end():]
+                head_since = time.time()
+                sections[key] = section
+                on_section(section) if on_section else None
+                m = self._prompt_re.search(stream)
+
+            if outstanding and time.time() - max(outstanding[0][2], head_since) > self.timeout:
+                key, cmd, sent = outstanding.pop(0)
+                log.error("SerDes eye: {0} did not complete within {1} secs.".format(cmd.strip(), self.timeout))
+                self._stats['timeouts'] += 1
+                sections[key] = EyeSection(key, cmd, stream, [], ['TIMEOUT'], self.timeout)
+                on_section(sections[key]) if on_section else None
+                self.__drain(stream, offset, 1 + len(outstanding))
+                break
+            if pending or outstanding:
+                with step_telemetry.DEFAULT.console_wait():
+                    time.sleep(self.poll)
+
+        self._stats['commands'] += len(sections)
+        self._stats['secs'] += time.time() - start
+        log.debug("SerDes eye: {0}/{1} cmd(s) in {2:.1f} secs (depth={3}).".format(
+            len(sections), len(commands), time.time() - start, self.depth))
+        return sections
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __drain(self, stream, offset, count):
+        """ (INTERNAL) Wait (bounded) for the prompts of the cmds still running; if they do not all complete, send
+        a break.  The recbuf is then cleared.
+        """
+        if not self.__wait_prompts(stream, offset, count):
+            log.warning("SerDes eye: {0} cmd(s) still running; sending a break.".format(count))
+            offset = len(self._uut_conn.recbuf or '')
+            self._uut_conn.send(self.BREAK, expectphrase=None, timeout=30, regex=True)
+            if not self.__wait_prompts('', offset, count):
+                log.error("SerDes eye: cmd(s) still running after the break.")
+        self._uut_conn.clear_recbuf()
+        return
+
+    def __wait_prompts(self, stream, offset, count):
+        deadline = time.time() + self.drain_timeout
+        while True:
+            buf = self._uut_conn.recbuf or ''
+            offset = 0 if len(buf) < offset else offset
+            stream, offset = stream + buf[offset:], len(buf)
+            if len(self._prompt_re.findall(stream)) >= count:
+                return True
+            if time.time() > deadline:
+                return False
+            with step_telemetry.DEFAULT.console_wait():
+                time.sleep(self.poll)
+
+    def __make_section(self, key, cmd, text, started):
+        rows = self._pattern_re.findall(text)
+        errors = re.findall('ERR:.*', text)
+        log.debug("SerDes eye: {0} {1} ({2} rows{3}).".format(key, 'ok' if rows else '?', len(rows),
+                                                             ', errors' if errors else ''))
+        return EyeSection(key, cmd, text, rows, errors, time.time() - started)
@@ -22,6 +22,9 @@ from apollo.libs import lib as aplib
 # BU Lib
 # ------
 from apollo.scripts.entsw.libs.utils import common_utils
+from apollo.scripts.entsw.libs.utils import console_utils
+from apollo.scripts.entsw.libs.utils import measurement_store
+from apollo.scripts.entsw.libs.diags import serdes_eye
 from apollo.scripts.entsw.libs.equip_drivers.poe_loadbox import handle_no_poe_equip
 
 
@@ -47,10 +50,29 @@ class Stardust(object):
     RECBUF_TIME = 5.0
     RECBUF_CLEAR_TIME = 2.0
     USE_CLEAR_RECBUF = False
+    USE_COMPLETION_ENGINE = True
+    # Per command completion timing profiles (first word of cmd, case insensitive); None = legacy RECBUF_TIME wait.
+    # Product subclasses can extend/override via the PRODUCT_COMPLETION_PROFILES class attribute.
+    COMPLETION_PROFILES = {
+        'sysinit': console_utils.CompletionProfile(quiet=3.0, settle=1.0, poll=0.2, max_wait=None),
+        'run': console_utils.CompletionProfile(quiet=2.0, settle=0.5, poll=0.2, max_wait=None),
+        'pwd': console_utils.CompletionProfile(quiet=0.5, settle=0.1, poll=0.05, max_wait=None),
+        'dir': console_utils.CompletionProfile(quiet=1.0, settle=0.2, poll=0.1, max_wait=None),
+        'getsystemstatus': console_utils.CompletionProfile(quiet=1.5, settle=0.3, poll=0.1, max_wait=None),
+        'portstat': console_utils.CompletionProfile(quiet=1.5, settle=0.3, poll=0.1, max_wait=None),
+        'alchemy': console_utils.CompletionProfile(quiet=1.5, settle=0.3, poll=0.1, max_wait=None),
+        'alchemyprogram': None,
+        'sendredearthframe': None,
+    }
+    PRODUCT_COMPLETION_PROFILES = {}
+    # Max SerDes eye cmds typed ahead (see serdes_eye); set to 1 for diags that cannot take typeahead.
+    SERDES_EYE_PIPELINE_DEPTH = 2
 
     FPGA_NAMES = ['bell', 'morse', 'morseg', 'proximo', 'pseudaria', 'hypatia', 'strutt', 'bifocal']
     OSC_ACCURACY = 1.44  # 0.72
     ASIC_ECID_LOG_PATH = '/tftpboot/logs/ecid/'
+    MEASUREMENT_LOG_PATH = '/tftpboot/logs/measurements/'
+    MEASUREMENT_FLUSH_ROWS = 5000
 
     def __init__(self, mode_mgr, ud, **kwargs):
         log.info(self.__repr__())
@@ -62,11 +84,28 @@ class Stardust(object):
         self._equip = kwargs.get('equip', None)
         self._power = kwargs.get('power', None)
         self.__check_dependencies()
+        profiles = dict(self.COMPLETION_PROFILES)
+        profiles.update(self.PRODUCT_COMPLETION_PROFILES)
+        self._completion = console_utils.ResponseCompletion(self._uut_conn,
+                                                            prompt=self._uut_prompt,
+                                                            fallback_time=self.RECBUF_TIME,
+                                                            profiles=profiles,
+                                                            enabled=self.USE_COMPLETION_ENGINE)
+        self._measurements = None
         return
 
     def __repr__(self):
         return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
 
+    @property
+    def measurements(self):
+        """ Measurement store for the UUT run (serdes eye, temperature, voltage readings). """
+        if self._measurements is None:
+            run_id = '{0}_{1}'.format(self._ud.puid.sernum or 'UNKNOWN', time.strftime('%Y%m%d%H%M%S'))
+            self._measurements = measurement_store.MeasurementStore(self.MEASUREMENT_LOG_PATH, run_id=run_id)
+            log.debug("Measurement store = {0}".format(self._measurements.path))
+        return self._measurements
+
     # ==================================================================================================================
     # APOLLO STEP Methods
     # ==================================================================================================================
@@ -146,7 +185,7 @@ class Stardust(object):
                 def __chk_pass_pattern():
                     log.debug("Sysinit now checking for pass patterns...")
                     result = True
-                    time.sleep(self.RECBUF_TIME)
+                    self._wait_recbuf('sysinit')
                     for pass_pattern_composite in pass_pattern_compsite_list:
                         pass_pattern, pass_pattern_count = pass_pattern_composite if pass_pattern_composite and len(pass_pattern_composite) == 2 else (None, None)
                         if pass_pattern and pass_pattern_count:
@@ -174,7 +213,7 @@ class Stardust(object):
 
                 # Perform the sysinit
                 self._uut_conn.send('sysinit {0}\r'.format(level), expectphrase=self._uut_prompt, timeout=timeout, regex=True)
-                time.sleep(self.RECBUF_TIME * 2)
+                self._wait_recbuf('sysinit', factor=2)
 
                 # Check for SYSINIT fail patterns
                 if not __chk_fail_pattern():
@@ -255,7 +294,7 @@ class Stardust(object):
                 return True
             self._clear_recbuf()
             self._uut_conn.send('run {0} {1}\r'.format(test_name, params), expectphrase=self._uut_prompt, timeout=timeout, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('run')
             if 'PASSED' in self._uut_conn.recbuf:
                 # TODO: Need mechanism to check certain failures even when a PASS!  Why? Diag bug? (4/23/2018)
                 log.info("DIAG TEST: {0} = PASSED.".format(test_name))
@@ -410,6 +449,7 @@ class Stardust(object):
                                           area=testarea,
                                           temp_corner=temperature_corner,
                                           uut_state=operational_state)
+        self._flush_measurements()
         return aplib.PASS if result else aplib.FAIL
 
     @apollo_step
@@ -479,6 +519,11 @@ class Stardust(object):
             return self._check_voltages(margin_level=margin_level, voltages=voltages, limit_table=margin_table, asic_bin=0)
 
         result = __validate_voltages()
+        # Only the readings of the last attempt are recorded (once per margin).
+        voltages = self._ud.uut_status.get('voltages', {}).get(margin_level, {})
+        self._record_measurements('voltage', [({'device': device_instance, 'margin': margin_level, 'rail': rail},
+                                               {'volt': volt}) for rail, volt in voltages.items()])
+        self._flush_measurements()
 
         return aplib.PASS if result else (aplib.FAIL, "Voltage Margin problem (see log).")
 
@@ -1384,7 +1429,7 @@ class Stardust(object):
         """
         self._clear_recbuf()
         self._uut_conn.send('pwd\r', expectphrase=self._uut_prompt, timeout=30, regex=True)
-        time.sleep(self.RECBUF_TIME)
+        self._wait_recbuf('pwd')
         m = parse.search('{dev:0}:{cwd:1S}', self._uut_conn.recbuf)
         log.debug("CWD = {0}".format(m['cwd']))
         return m['cwd']
@@ -1472,7 +1517,7 @@ class Stardust(object):
             def __dir():
                 self._clear_recbuf()
                 self._uut_conn.send('dir {0}\r'.format(sub_dir), expectphrase=self._uut_prompt, timeout=30, regex=True)
-                time.sleep(self.RECBUF_TIME)
+                self._wait_recbuf('dir')
                 attrib_filter = '[{0}][-rwx]'.format(attrib_flags) + '{3}'
                 p = re.compile(
                     r'[ \t]*[0-9]+[ \t]+{1}[ \t]+[0-9]+[ \t]+({0})[\r\n]+'.format(file_filter, attrib_filter))
@@ -1632,7 +1677,7 @@ class Stardust(object):
         def __volt():
             self._clear_recbuf()
             self._uut_conn.send('GetVoltMarg\r', expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('GetVoltMarg')
             p = re.compile('\|(.*?)\|(.*?)\|(.*?)\|([ \-.0-9]+|[ NAna]+)\|(.*?)\|(.*?)\|')
             return p.findall(self._uut_conn.recbuf)
 
@@ -1780,7 +1825,7 @@ class Stardust(object):
         def __systemp():
             self._clear_recbuf()
             self._uut_conn.send('GetSystemStatus\r', expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('GetSystemStatus')
             p = re.compile('[ \t]*([ \-_a-zA-Z0-9]+) (?:Thermal|Temperature).*?: ([\-+.0-9]+)C')
             return p.findall(self._uut_conn.recbuf)
 
@@ -1838,7 +1883,7 @@ class Stardust(object):
         def __doptemps():
             self._clear_recbuf()
             self._uut_conn.send('DopChipInfo\r', expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('DopChipInfo')
             pats = [re.compile('{0} #([0-9]+)'.format(asic_name)), re.compile('Temp[ \t]* = ([\-+.0-9]+)')]
             matches = []
             try:
@@ -1878,7 +1923,7 @@ class Stardust(object):
         def __cputemp():
             self._clear_recbuf()
             self._uut_conn.send('{0}\r'.format(cmd), expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf(cmd)
             p = re.compile('[\S].*:[ \t]*([\-+0-9]*)')
             return p.findall(self._uut_conn.recbuf)
 
@@ -1932,7 +1977,7 @@ class Stardust(object):
             self._clear_recbuf()
             self._uut_conn.send('sbccmd all {0} -f:{1}\r'.format(sbc['temperature_reg'], device_instance), expectphrase=self._uut_prompt,
                           regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('sbccmd')
             p = re.compile('\|(.*?)\|([ \-.0-9]+|[ NAna]+)\|(.*?)\|')
             return p.findall(self._uut_conn.recbuf)
 
@@ -2014,6 +2059,11 @@ class Stardust(object):
                 tresults[t_index] = {'upper': 'NA', 'lower': 'NA', 'actual': '{0}_NOT_IN_UUT'.format(t_index),
                                      'status': True}
 
+        self._record_measurements('temperature', [
+            ({'area': area, 'corner': temp_corner, 'state': uut_state, 'sensor': t},
+             {'temp': v, 'upper': tresults.get(t, {}).get('upper'), 'lower': tresults.get(t, {}).get('lower')})
+            for t, v in temperatures[area][temp_corner][uut_state].items()])
+
         log.debug("Temperature Status:")
         log.debug(" Table index: {0}|{1}|{2}".format(area, temp_corner, uut_state))
         for t in tresults:
@@ -2147,7 +2197,7 @@ class Stardust(object):
             #     '(?m)^[ \t]*([\d]+):[ \t]*([0-9A-Za-z]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*')
             p = re.compile('(?m)^[ \t]*([\d]+):[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*([\S]+)[ \t]*')
             self._uut_conn.send('PortStat{0}\r'.format(args), expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('PortStat')
             if 'ERR' in self._uut_conn.recbuf:
                 err_target_ports = [True if e in self._uut_conn.recbuf else False for e in err_filter]
                 if any(err_target_ports):
@@ -2278,7 +2328,7 @@ class Stardust(object):
                 '(?m)^[ \t]*([\S]+)[ \t]*([\d]+)[ \t]*([\d]+)[ \t]*([\d]+)'
                 '[ \t]*([\d]+)[ \t]*([\d]+)[ \t]*([\d]+)[ \t]*')
             self._uut_conn.send('StackRAC\r', expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('StackRAC')
             return p.findall(self._uut_conn.recbuf)
 
         m = __stackrac()
@@ -2534,7 +2584,7 @@ class Stardust(object):
         def __fpgard():
             self._clear_recbuf()
             self._uut_conn.send('rd {0}\r'.format(name), expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('rd')
             p = re.compile('[\t ]*[0-9a-fA-F]{5,8}[\t ]*([0-9a-fA-F]{4,8})[\t ]+([\S]+)')
             return p.findall(self._uut_conn.recbuf)
 
@@ -2658,7 +2708,7 @@ class Stardust(object):
             self._clear_recbuf()
             self._uut_conn.send('sbccmd all MFR_ID -f:{0}\r'.format(device_instance), expectphrase=self._uut_prompt, regex=True,
                           timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('sbccmd')
             p = re.compile('\|(.*?)\|(.*?)\|(.*?)\|')
             return p.findall(self._uut_conn.recbuf)
 
@@ -2946,7 +2996,7 @@ class Stardust(object):
             p = re.compile(pattern)
             self._clear_recbuf()
             self._uut_conn.send("Alchemy POEGET {0}\r".format(upoe_param), expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('Alchemy')
             m = p.findall(self._uut_conn.recbuf)
             if m:
                 # Ex. [('1', 'PWRG', '96', '5.3'), ('12', 'PWRG', '104', '5.8'), ...]
@@ -2965,11 +3015,11 @@ class Stardust(object):
             p = re.compile('(?m)^[ \t]*([\S]+/[0-9]+) (.*)[ \t\r\n]+')
             self._clear_recbuf()
             self._uut_conn.send("Alchemy POEBASICREGS\r", expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('Alchemy')
             m1 = p.findall(self._uut_conn.recbuf)
             self._clear_recbuf()
             self._uut_conn.send("Alchemy POEEXTREGS\r", expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('Alchemy')
             m2 = p.findall(self._uut_conn.recbuf)
             return dict(POEBASICREGS=dict(m1), POEEXTREGS=dict(m2))
 
@@ -2977,7 +3027,7 @@ class Stardust(object):
             p = re.compile('(?m)^[ \t]*([\S]+/[0-9]+) (.*)[ \t\r\n]+')
             self._clear_recbuf()
             self._uut_conn.send("Alchemy POEEVENTS\r", expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('Alchemy')
             m1 = p.findall(self._uut_conn.recbuf)
             return dict(POEEVENTS=dict(m1))
 
@@ -3176,12 +3226,12 @@ class Stardust(object):
         """
         if command == 'PoeDetTest':
             self._uut_conn.send("run {0}\r".format(command), expectphrase=self._uut_prompt, timeout=300, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('run')
             ret = False if 'PASS' not in self._uut_conn.recbuf else True
 
         elif command == 'PoeClassTest':
             self._uut_conn.send("run {0}\r".format(command), expectphrase=self._uut_prompt, timeout=300, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('run')
             ret = False if 'PASS' not in self._uut_conn.recbuf else True
 
         elif command == 'PoePowerTest':
@@ -3195,7 +3245,7 @@ class Stardust(object):
                 self._uut_conn.waitfor(self._uut_prompt, timeout=300, regex=True)
             else:
                 self._equip.poe_loadbox.disconnect()
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('run')
             ret = False if 'PASS' not in self._uut_conn.recbuf else True
 
         else:
@@ -3358,7 +3408,7 @@ class Stardust(object):
         def __psee(psid):
             self._clear_recbuf()
             self._uut_conn.send("PSEEprom {0}\r".format(psid), expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('PSEEprom')
             m = p1.findall(self._uut_conn.recbuf)
             return dict(m) if m else {}
 
@@ -3366,7 +3416,7 @@ class Stardust(object):
         def __psstat(psid):
             self._clear_recbuf()
             self._uut_conn.send("PSStatus {0}\r".format(psid), expectphrase=self._uut_prompt, timeout=30, regex=True)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('PSStatus')
             m = p2.findall(self._uut_conn.recbuf)
             return dict(m) if m else {}
 
@@ -3417,7 +3467,7 @@ class Stardust(object):
         for offset in offsets:
             self._uut_conn.send('kirch fpgaread -offset:{}\r'.format(offset), expectphrase=self._uut_prompt, regex=True,
                           timeout=120)
-        time.sleep(self.RECBUF_TIME)
+        self._wait_recbuf('kirch')
         p = re.compile('read value=([\S]+)')
         m = p.findall(self._uut_conn.recbuf)
 
@@ -3467,7 +3517,7 @@ class Stardust(object):
         common_utils.uut_comment(self._uut_conn, 'FanTest', 'Speed={}'.format(speed_name))
         self._uut_conn.send('sendredearthframe 0 0x11.{} -e -c\r'.format(fan_speed), expectphrase=self._uut_prompt, regex=True,
                       timeout=120)
-        time.sleep(self.RECBUF_TIME)
+        self._wait_recbuf('sendredearthframe')
         retry_cnt = 0
         result = False
         while not result and retry_cnt < max_attempts:
@@ -3565,7 +3615,7 @@ class Stardust(object):
         def __dopchipinfo():
             self._clear_recbuf()
             self._uut_conn.send('dopchipinfo {}\r'.format(instance_number), expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('dopchipinfo')
             p = re.compile(
                 r'(?ms)Type = ([0-9xa-fA-F]+).*?Version = ([0-9xa-fA-F]+).*?Die ID = ([0-9a-fA-F ]+).*?'
                 r'(?:Core frequency = ([0-9]+))?')
@@ -3706,7 +3756,7 @@ class Stardust(object):
             self._clear_recbuf()
             server_time, server_mktime = common_utils.getservertime(time_zone)
             self._uut_conn.send('getrtc\r', expectphrase=self._uut_prompt, regex=True, timeout=120)
-            time.sleep(self.RECBUF_TIME)
+            self._wait_recbuf('getrtc')
             p = re.compile('([0-9]{2})-([0-9]{2})-([0-9]{2})[ \n\r]+([0-9]{2}):([0-9]{2}):([0-9]{2})')
             m = p.findall(self._uut_conn.recbuf)
             if m and m[0]:
@@ -3859,6 +3909,85 @@ class Stardust(object):
             time.sleep(self.RECBUF_CLEAR_TIME)
         return
 
+    def _wait_recbuf(self, cmd=None, factor=1.0):
+        """ Wait for RecBuf
+        Wait for the response of the last command to be complete (prompt or quiescence) instead of a fixed
+        RECBUF_TIME sleep.  The legacy fixed wait is the upper bound and also the fallback (USE_COMPLETION_ENGINE).
+        :param (str) cmd: Command sent (selects the timing profile).
+        :param (float) factor: Multiplier of RECBUF_TIME for the max wait.
+        :return (str): Completion reason
+        """
+        self._completion.enabled = self.USE_COMPLETION_ENGINE
+        self._completion.fallback_time = self.RECBUF_TIME
+        return self._completion.wait(cmd=cmd, prompt=self._uut_prompt, factor=factor)
+
+    def _collect_serdeseye(self, commands, pattern, Eye, tag_index, limits=None, timeout=300):
+        """ Collect SerdesEye
+        Pipelined eye cmds w/ incremental parsing (see serdes_eye).
+        Per cmd section: 'ERR:' = failure, 'core-to-core so no SERDES.' = no lanes, 'no support' = IGNORE entry.
+        :param (OrderedDict) commands: {<key tuple>: <cmd>, ...}
+        :param (str) pattern: Regex for the eye rows (summary, min, and max); group 1 = lane.
+        :param (namedtuple) Eye: Eye row definition
+        :param (int) tag_index: Row index of the '(Min)'/'(Max)' marker
+        :param (dict) limits: Optional eye limits for the lane margins (see serdes_eye.EyeMatrix)
+        :param (int) timeout: Max time (secs) for one cmd
+        :return (tuple): (EyeMatrix, failures list)
+        """
+        eyes = serdes_eye.EyeMatrix(limits=limits)
+        failures = []
+
+        def __section(section):
+            if section.errors:
+                log.error("SerDesEye error found.")
+                failures.append('{0} - {1}'.format(section.key, section.errors[0]))
+            if re.search('core-to-core so no SERDES.', section.text):
+                log.debug(re.findall('.*core-to-core.*', section.text)[0])
+            elif re.search('[Nn]o support', section.text):
+                log.debug("SerDesEye not supported for {0}.".format(section.key))
+                eyes[section.key + ('0', 'Sum')] = Eye._make([None if i != 'Result' else 'IGNORE' for i in Eye._fields])
+            else:
+                for i in section.rows:
+                    tag = 'Sum' if not re.match('([(]?Max[)])|([(]?Min[)])', i[tag_index]) else i[tag_index][1:4]
+                    eyes[section.key + (i[0], tag)] = Eye._make(i)
+
+        collector = serdes_eye.SerdesEyeCollector(self._uut_conn, prompt=self._uut_prompt, pattern=pattern,
+                                                  depth=self.SERDES_EYE_PIPELINE_DEPTH, timeout=timeout)
+        collector.collect(commands, on_section=__section)
+        eyes.print_matrix() if limits else None
+        return eyes, failures
+
+    def _record_measurements(self, kind, rows):
+        """ Record Measurements
+        Append readings to the UUT run measurement store; a store problem never fails the test.
+        The rows are committed by _flush_measurements() at the end of the step (or once MEASUREMENT_FLUSH_ROWS rows
+        are pending), not on every record.
+        :param (str) kind: Measurement kind (ex. 'temperature', 'voltage', 'sif_eye')
+        :param (list) rows: [(<tags dict>, <values dict>), ...]
+        :return (bool): True if recorded
+        """
+        if not rows:
+            return False
+        try:
+            self.measurements.extend(kind, rows)
+            self.measurements.flush() if self.measurements.pending() >= self.MEASUREMENT_FLUSH_ROWS else None
+        except (IOError, OSError, ValueError) as e:
+            log.warning("Measurements ({0}) not recorded: {1}".format(kind, e))
+            return False
+        return True
+
+    def _flush_measurements(self):
+        """ Flush Measurements
+        Commit the pending rows of the UUT run measurement store; a store problem never fails the test.
+        :return (int): Rows committed
+        """
+        if self._measurements is None:
+            return 0
+        try:
+            return self._measurements.flush()
+        except (IOError, OSError) as e:
+            log.warning("Measurements not flushed: {0}".format(e))
+            return 0
+
     def __check_dependencies(self):
         if not self._linux:
             msg = "Missing the Linux driver."
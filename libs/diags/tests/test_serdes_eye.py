@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from collections import OrderedDict
+
+from .. import serdes_eye
+
+__title__ = 'EntSw SerDes Eye Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+PROMPT = r'(?:Stardust> )|(?:[A-Z][\S]*> )'
+SIF_PATTERN = r'(?m)([A-Z][0-9])[ \t]+([\d.]+)[ \t]+([\d.]+)[ \t]+([\d.]+)[ \t]+([\d.]+)[ \t]+([\d.]+)[ \t]+([\d]+)' \
+              r'[ \t]+([\d]+)[ \t]+([\d\S]+)[ \t]+([\d\S]+)[ \t]+([\d]?)[ \t]*([\S]+)[\r\n]+'
+Eye = namedtuple('Eye', 'Channel Amin AminP AminN Ap An EScan LScan EL SyncCnt ErrCnt Result')
+
+SIF_OUTPUT = """
+Eye measurement of Doppler #{core} {side} side rx:
+Amin(mV) AminP  AminN  Ap(mV) An(mV) EScan  LScan   E+L SyncCnt ErrCnt P/F
+================================================================================
+A0  {amin}   172.5  182.5  220.0  237.5   12     6      18   10      0     Pass
+A0  177.5   177.5  187.5  222.5  240.0   13     7      20     (Max)       Pass
+A0  170.0   170.0  182.5  220.0  237.5   12     6      18     (Min)       Pass
+C1  200.0   205.0  200.0  232.5  227.5   12     8      20   10      0     Pass
+C1  205.0   207.5  205.0  235.0  230.0   12     8      20     (Max)       Pass
+C1  197.5   202.5  197.5  232.5  227.5   12     8      20     (Min)       Pass
+"""
+
+
+class FakeDiagConn(object):
+    """ Diag console w/ typeahead; cmds are processed in order by a background 'diag' thread. """
+    def __init__(self, cmd_time=0.2, prompt='Shannon24U> '):
+        self.recbuf = ''
+        self.cmd_time = cmd_time
+        self.prompt = prompt
+        self.sent = []
+        self.max_busy = 0
+        self.done = 0
+        self.idle = 0
+        self.breaks = 0
+        self._lock = threading.Lock()
+        self._break = threading.Event()
+        self._queue = []
+        self._event = threading.Event()
+        t = threading.Thread(target=self.__diag)
+        t.daemon = True
+        t.start()
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False, **kwargs):
+        if text == serdes_eye.SerdesEyeCollector.BREAK:
+            self.breaks += 1
+            self._break.set()
+            return
+        with self._lock:
+            self.sent.append(text)
+            self._queue.append(text)
+            self.max_busy = max(self.max_busy, len(self._queue))
+        self._event.set()
+
+    def __diag(self):
+        while True:
+            self._event.wait()
+            with self._lock:
+                cmd = self._queue[0] if self._queue else None
+            if cmd is None:
+                # Ran dry: waiting on the collector for the next cmd.
+                self.idle += 1
+                self._event.clear()
+                continue
+            self.recbuf += cmd.strip() + '\r\n'
+            words = cmd.split()
+            core, side = int(words[1]), words[2]
+            if core == 9:
+                # Hung until a break.
+                self._break.wait()
+                self._break.clear()
+                output = "^C\r\n"
+            elif self._break.wait(self.cmd_time):
+                self._break.clear()
+                output = "^C\r\n"
+            elif core == 3:
+                output = "\r\n*** ERR: SifSerdesEye: no support for the ASIC\r\n"
+            else:
+                output = SIF_OUTPUT.format(core=core, side=side, amin='90.0' if (core, side) == (1, 'w') else '172.5')
+            self.recbuf += output.replace('\n', '\r\n') + self.prompt
+            with self._lock:
+                self._queue.pop(0)
+                self.done += 1
+
+    def clear_recbuf(self):
+        self.recbuf = ''
+
+
+class TestSerdesEye(object):
+
+    def __commands(self, cores):
+        commands = OrderedDict()
+        for core in range(cores):
+            for side in ['e', 'w']:
+                commands[core, side] = 'SifSerdesEye {0} {1} -i:3\r'.format(core, side)
+        return commands
+
+    def test_pipelined_collect(self):
+        conn = FakeDiagConn(cmd_time=0.2)
+        collector = serdes_eye.SerdesEyeCollector(conn, prompt=PROMPT, pattern=SIF_PATTERN, depth=2, poll=0.02)
+        seen = []
+        sections = collector.collect(self.__commands(3), on_section=lambda s: seen.append((s.key, conn.done)))
+        assert list(sections.keys()) == [(0, 'e'), (0, 'w'), (1, 'e'), (1, 'w'), (2, 'e'), (2, 'w')]
+        assert all([len(s.rows) == 6 and not s.errors for s in sections.values()])
+        assert sections[1, 'w'].rows[0][1] == '90.0'
+        # Incremental: each section is handed over while later cmds are still to run.
+        assert [done for _, done in seen][:3] == [1, 2, 3]
+        # Typed ahead: the diag never waited on the collector between cmds (only once at the end).
+        assert conn.max_busy == 2
+        assert conn.idle == 1
+
+    def test_matrix_and_margins(self):
+        conn = FakeDiagConn(cmd_time=0.05)
+        collector = serdes_eye.SerdesEyeCollector(conn, prompt=PROMPT, pattern=SIF_PATTERN, depth=3, poll=0.02)
+        eyes = serdes_eye.EyeMatrix(limits={'Amin': 100.0, 'EScan': (10, 20)})
+
+        def __section(section):
+            for i in section.rows:
+                tag = 'Sum' if not i[-3].startswith('(') else i[-3][1:4]
+                eyes[section.key + (i[0], tag)] = Eye._make(i)
+
+        sections = collector.collect(self.__commands(4), on_section=__section)
+        assert sections[3, 'e'].errors and not sections[3, 'e'].rows
+        assert len(eyes.lanes()) == 3 * 2 * 2
+        assert eyes.margins()[0, 'e', 'A0'] == {'Amin': 72.5, 'EScan': 2.0}
+        assert eyes.margin_failures() == [((1, 'w', 'A0', 'Sum'), 'Amin margin=-10.000')]
+        assert eyes.failures() == eyes.margin_failures()
+        assert eyes[0, 'e', 'C1', 'Max'].Amin == '205.0'
+
+    def test_timeout(self):
+        conn = FakeDiagConn(cmd_time=0.5)
+        collector = serdes_eye.SerdesEyeCollector(conn, prompt=PROMPT, pattern=SIF_PATTERN, depth=1, timeout=0.2,
+                                                  poll=0.02, drain_timeout=5)
+        sections = collector.collect(self.__commands(2))
+        assert list(sections.keys()) == [(0, 'e')]
+        assert sections[0, 'e'].errors == ['TIMEOUT']
+        assert len(conn.sent) == 1
+        # Drained: the timed-out cmd completed (no break needed) and the recbuf was cleared.
+        assert conn.done == 1 and conn.breaks == 0
+        assert conn.recbuf == ''
+
+    def test_timeout_typed_ahead_and_break(self):
+        conn = FakeDiagConn(cmd_time=0.05)
+        collector = serdes_eye.SerdesEyeCollector(conn, prompt=PROMPT, pattern=SIF_PATTERN, depth=2, timeout=0.2,
+                                                  poll=0.02)
+        commands = OrderedDict([(9, 'SifSerdesEye 9 e -i:3\r'), (0, 'SifSerdesEye 0 e -i:3\r'),
+                                (1, 'SifSerdesEye 1 e -i:3\r')])
+        sections = collector.collect(commands)
+        assert list(sections.keys()) == [9]
+        assert sections[9].errors == ['TIMEOUT']
+        # Hung cmd broken out of; the typed-ahead cmd ran to its prompt; nothing else was sent.
+        assert len(conn.sent) == 2
+        assert conn.breaks == 1 and conn.done == 2
+        assert conn.recbuf == ''
@@ -186,6 +186,7 @@ import sys
 import re
 import logging
 import time
+from contextlib import contextmanager
 
 # Apollo
 # ------
@@ -197,6 +198,7 @@ from apollo.engine import apexceptions
 # ------
 from ..bases.poe_loadbox_base import PoE_Loadbox_Base
 from ..utils import common_utils
+from . import poe_poller
 
 __title__ = "PoE Loadbox Driver Module"
 __version__ = '0.7.4'
@@ -672,6 +674,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
     MAX_PORTS = 24
     DEFAULT_CURRENT_LIMITS = {'IEEE': 200, 'poe': 300, 'POE': 280, 'POE+': 540, 'UPOE': 1120}
     LOAD_CLASSES = {None: 0, 'poe1': 1, 'poe2': 2, 'POE': 3, 'POE+': 4, 'UPOE': 4}
+    INSTRUMENT_KEYS = []
 
     def __init__(self, poe_equip, uut_poe_ports, **kwargs):
         """ Init
@@ -695,6 +698,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         self._port_lookup = {}
         self._full_ports = False
         self._shareports = 0
+        self._poller = None
 
         # Sanity check
         if not isinstance(self._poe_equip, dict):
@@ -742,6 +746,15 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         # Regex prompt to be used for all PoE devices connected to a single UUT.
         return self._prompt
 
+    @property
+    def poller(self):
+        # Concurrent per-box instrument poller; subscribers may use poller.subscribe() or poller.wait_for_update().
+        if not self._poller or self._poller.tag != self.uut_poe_type:
+            boxes = {self._box_name(k): self.__box_reader(k) for k in self.conn_names}
+            self._poller = poe_poller.PoEPoller(boxes=boxes, tag=self.uut_poe_type,
+                                                lock_factory=lambda name: locking.named_priority_lock('__poe_equip__' + name))
+        return self._poller
+
     # Rd/Wr Properties ---
     @property
     def uut_poe_ports(self):
@@ -919,7 +932,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         This will only reset the respective PoE Equipment ports used by the UUT.
         :return:
         """
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} Reset for {1} ports {2}...".format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -945,7 +958,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         cisco = kwargs.get('cisco', 'off')
         use_full_ports = self._full_ports
 
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} {1}Connect for {2} ports {3}...".format(k, 'IEEE ' if ieee else '', self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -970,7 +983,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         """ Disconnect
         :return:
         """
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} Disconnect for {1} ports {2}...".format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -994,7 +1007,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
             load_class = 2
         log.debug("PoE Load Class = {0}".format(load_class))
 
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} IEEE Class for {1} ports {2}...".format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -1028,7 +1041,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
             use_global_command = False
 
         log.debug("Power Load Current Limit: {0} mA{1}".format(self._power_load_current_limit, default_msg))
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} Current Limit for {1} ports {2}...".format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -1084,7 +1097,7 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
         if not any([state.lower() == s for s in ['on', 'off']]):
             log.error("PoE Load operation not recognized.")
             return
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} Load {1} for {2} ports {3}...".format(k, state.upper(), self.uut_poe_type, self._poe_equip[k]['portmap']))
                 conn = self._poe_equip[k]['conn']
@@ -1095,14 +1108,76 @@ class PoEedgarGeneric(PoE_Loadbox_Base):
 
     def echo_msg(self, msg):
         log.debug("Sending msg to PoE Equip: {0}".format(msg))
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+        with self._equip_lock():
             for k in self.conn_names:
                 log.debug("{0} Msg...".format(k))
                 conn = self._poe_equip[k]['conn']
                 conn.send('*echo {0}\r'.format(msg), expectphrase=self.prompt, regex=True)
 
-    def get_instrument_data(self):
-        return None
+    def get_instrument_data(self, verbose=False, max_age=None):
+        """ Get Instrument Data
+        All PoE Equipment connections are read concurrently (per-box locks); readings taken by another container
+        on a shared box while waiting on its lock are used instead of re-polling.
+        :param (bool) verbose:
+        :param (float) max_age: Accept a shared box reading up to this old (secs); None = only fresh readings.
+        :return (dict) data: Form of {<uut port>: {'volt': <v>, 'power': <p>, 'temp': <t>, 'time': <epoch>}, ...}
+        """
+        if not self.INSTRUMENT_KEYS:
+            return None
+        log.debug("Get Instrument ({0})".format(self.__class__.__name__))
+        snapshots = self.poller.poll(max_age=max_age)
+        data = {}
+        for key in self.INSTRUMENT_KEYS:
+            raw_data = {k: snapshots[self._box_name(k)].data.get(key, {}) for k in self.conn_names}
+            data = self._map_data(raw_data, data, key=key)
+        for p in self.uut_poe_ports:
+            data[p]['time'] = min([snapshots[self._box_name(k)].time for k in self._port_lookup[p][1::2]])
+
+        log.debug("Instrument data acquisition done.")
+        if verbose:
+            log.debug("Acquired data:")
+            for i in data:
+                log.debug("{0}: {1}".format(i, data[i]))
+        return data
+
+    def _read_box(self, conn):
+        """ Read Box
+        Read all instrument data from ONE PoE Equipment connection (called from a poller thread under the box lock).
+        :param (obj) conn: PoE Equipment connection
+        :return (dict): Form of {<key>: {<poe equip port>: <value>, ...}, ...} for the INSTRUMENT_KEYS.
+        """
+        return {}
+
+    def _box_name(self, k):
+        """ Box Name
+        Unique name of the physical box behind a connection (shared connections in the syncgroup have the same name).
+        """
+        conn = self._poe_equip[k]['conn']
+        return '{0}.{1}.{2}:{3}'.format(self.syncgroup, k, getattr(conn, 'host', ''), getattr(conn, 'port', ''))
+
+    def _box_lock(self, k):
+        return locking.named_priority_lock('__poe_equip__' + self._box_name(k))
+
+    @contextmanager
+    def _equip_lock(self):
+        """ Equipment Lock
+        Syncgroup lock plus ALL box locks (sorted order) so that settings never interleave with a poller reading.
+        """
+        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
+            locks = [self._box_lock(k) for k in self.conn_names]
+            for lock in locks:
+                lock.__enter__()
+            try:
+                yield
+            finally:
+                for lock in reversed(locks):
+                    lock.__exit__(None, None, None)
+
+    def __box_reader(self, k):
+        def __read():
+            log.debug("{0} Instrument Data for {1} ports {2}...".format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
+            return self._read_box(self._poe_equip[k]['conn'])
+        return __read
 
     def _clear_recbuf(self, uut_conn, force=False):
         if self.USE_CLEAR_RECBUF or force:
@@ -1119,13 +1194,14 @@ class PoEedgar3(PoEedgarGeneric):
     """
     MODELS = ['Edgar', 'Edgar3A', 'Edgar3B', 'RT-PoE3', 'RT-PoE3+', 'RT-PoE3A', 'RT-PoE3B', 'RT-PoE3/24']
     MAX_PORTS = 24
+    INSTRUMENT_KEYS = ['volt', 'power', 'temp']
     DEFAULT_CURRENT_LIMITS = {'IEEE': 200, 'poe1': 20, 'poe2': 30, 'POE': 280, 'POE+': 540, 'UPOE': 540}
 
     def __init__(self, poe_equip, uut_poe_ports, **kwargs):
         super(PoEedgar3, self).__init__(poe_equip, uut_poe_ports, **kwargs)
         return
 
-    def get_instrument_data(self, verbose=False):
+    def _read_box(self, conn):
         """
         Samples:
         measure
@@ -1136,51 +1212,27 @@ class PoEedgar3(PoEedgarGeneric):
         :p18 PWR 0
         :p19 PWR 0
         ...
-        temperature
-        :p13  25 C
-        :p14  26 C
+        temperature (not supported)
 
-        :param (bool) verbose:
-        :return (dict) data: Form of {<uut port>: <value1>, ...}
+        :param (obj) conn:
+        :return (dict) raw_data: Form of {'volt': {<poe equip port>: <value1>, ...}, 'power': {...}, 'temp': {}}
         """
-        log.debug("Get Instrument (Edgar3)")
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
-            raw_data = {}
-            data = {}
-            for k in self.conn_names:
-                log.debug("{0} Voltage Data for {1} ports {2}...".
-                          format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                conn = self._poe_equip[k]['conn']
-                self._clear_recbuf(conn)
-                conn.sende('measure\r', expectphrase=self.prompt, regex=True)
-                pat = re.compile(':p([0-9]{1,2}) ([\S]+)V')
-                m = pat.findall(conn.recbuf)
-                raw_data[k] = {int(p): float(v1) for p, v1 in m} if m else {}
-            data = self._map_data(raw_data, data, key='volt')
+        raw_data = {}
+        self._clear_recbuf(conn)
+        conn.sende('measure\r', expectphrase=self.prompt, regex=True)
+        pat = re.compile(':p([0-9]{1,2}) ([\S]+)V')
+        m = pat.findall(conn.recbuf)
+        raw_data['volt'] = {int(p): float(v1) for p, v1 in m} if m else {}
 
-            for k in self.conn_names:
-                log.debug("{0} Power Data for {1} ports {2}...".
-                          format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                conn = self._poe_equip[k]['conn']
-                self._clear_recbuf(conn)
-                conn.sende('status\r', expectphrase=self.prompt, regex=True)
-                pat = re.compile(':p([0-9]{1,2}) PWR ([\d]+)')
-                m = pat.findall(conn.recbuf)
-                raw_data[k] = {int(p): float(v1) for p, v1 in m} if m else {}
-            data = self._map_data(raw_data, data, key='power')
+        self._clear_recbuf(conn)
+        conn.sende('status\r', expectphrase=self.prompt, regex=True)
+        pat = re.compile(':p([0-9]{1,2}) PWR ([\d]+)')
+        m = pat.findall(conn.recbuf)
+        raw_data['power'] = {int(p): float(v1) for p, v1 in m} if m else {}
 
-            for k in self.conn_names:
-                log.debug("{0} NO Temperature Data for {1} ports {2} (not supported).".
-                          format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                raw_data[k] = {}
-            data = self._map_data(raw_data, data, key='temp')
-
-        log.debug("Instrument data acquisition done.")
-        if verbose:
-            log.debug("Acquired data:")
-            for i in data:
-                log.debug("{0}: {1}".format(i, data[i]))
-        return data
+        # NO Temperature Data (not supported).
+        raw_data['temp'] = {}
+        return raw_data
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -1225,13 +1277,14 @@ class PoEedgar4(PoEedgarGeneric):
     """
     MODELS = ['Edgar4', 'RT-PoE4/24', 'RT-PoE4/10G/24']
     MAX_PORTS = 24
+    INSTRUMENT_KEYS = ['volt', 'power', 'temp']
     DEFAULT_CURRENT_LIMITS = {'IEEE': 200, 'poe1': 20, 'poe2': 30, 'POE': 280, 'POE+': 540, 'UPOE': 1120}
 
     def __init__(self, poe_equip, uut_poe_ports, **kwargs):
         super(PoEedgar4, self).__init__(poe_equip, uut_poe_ports, **kwargs)
         return
 
-    def get_instrument_data(self, verbose=False):
+    def _read_box(self, conn):
         """
         Samples:
         measure
@@ -1246,60 +1299,38 @@ class PoEedgar4(PoEedgarGeneric):
         :p18 PWR 0,0
         :p19 PWR 0,0
         ...
+        temperature
+        :p13  25 C
+        :p14  26 C
 
-        :param (bool) verbose:
-        :return (dict):
+        :param (obj) conn:
+        :return (dict) raw_data: Form of {'volt': {<poe equip port>: <value1>, ...}, 'power': {...}, 'temp': {...}}
         """
-        log.debug("Get Instrument (Edgar4)")
-        with locking.named_priority_lock('__poe_equip__' + self.syncgroup):
-            raw_data = {}
-            data = {}
-            log.debug("")
-            for k in self.conn_names:
-                log.debug("{0} Instrument Data for {1} ports {2}...".
-                          format(k, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                conn = self._poe_equip[k]['conn']
-                self._clear_recbuf(conn)
-                if self.uut_poe_type == 'UPOE':
-                    conn.sende('measure2\r', expectphrase=self.prompt, regex=True)
-                    pat = re.compile(':p([0-9]{1,2}) ([\S]+)V, ([\S]+)V')
-                    m = pat.findall(conn.recbuf)
-                    raw_data[k] = {int(p): (float(v1), float(v2)) for p, v1, v2 in m} if m else {}
-                else:
-                    conn.sende('measure\r', expectphrase=self.prompt, regex=True)
-                    pat = re.compile(':p([0-9]{1,2}) ([\S]+)V')
-                    m = pat.findall(conn.recbuf)
-                    raw_data[k] = {int(p): float(v1) for p, v1 in m} if m else {}
-            data = self._map_data(raw_data, data, key='volt')
-
-            for x in self.conn_names:
-                log.debug("{0} Power Data for {1} ports {2}...".
-                          format(x, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                conn = self._poe_equip[x]['conn']
-                self._clear_recbuf(conn)
-                conn.sende('status\r', expectphrase=self.prompt, regex=True)
-                pat = re.compile(':p([0-9]{1,2}) PWR ([\d]+),([\d]+)')
-                m = pat.findall(conn.recbuf)
-                raw_data[x] = {int(p): (float(v1), float(v2)) for p, v1, v2 in m} if m else {}
-            data = self._map_data(raw_data, data, key='power')
-
-            for x in self.conn_names:
-                log.debug("{0} Temperature Data for {1} ports {2}...".
-                          format(x, self.uut_poe_type, self._poe_equip[k]['portmap']))
-                conn = self._poe_equip[x]['conn']
-                self._clear_recbuf(conn)
-                conn.sende('temperature\r', expectphrase=self.prompt, regex=True)
-                pat = re.compile(':p([0-9]{1,2})[ \t]+([\d]+) C')
-                m = pat.findall(conn.recbuf)
-                raw_data[x] = {int(p): float(v1) for p, v1 in m} if m else {}
-            data = self._map_data(raw_data, data, key='temp')
-
-        log.debug("Instrument data acquisition done.")
-        if verbose:
-            log.debug("Acquired data:")
-            for i in data:
-                log.debug("{0}: {1}".format(i, data[i]))
-        return data
+        raw_data = {}
+        self._clear_recbuf(conn)
+        if self.uut_poe_type == 'UPOE':
+            conn.sende('measure2\r', expectphrase=self.prompt, regex=True)
+            pat = re.compile(':p([0-9]{1,2}) ([\S]+)V, ([\S]+)V')
+            m = pat.findall(conn.recbuf)
+            raw_data['volt'] = {int(p): (float(v1), float(v2)) for p, v1, v2 in m} if m else {}
+        else:
+            conn.sende('measure\r', expectphrase=self.prompt, regex=True)
+            pat = re.compile(':p([0-9]{1,2}) ([\S]+)V')
+            m = pat.findall(conn.recbuf)
+            raw_data['volt'] = {int(p): float(v1) for p, v1 in m} if m else {}
+
+        self._clear_recbuf(conn)
+        conn.sende('status\r', expectphrase=self.prompt, regex=True)
+        pat = re.compile(':p([0-9]{1,2}) PWR ([\d]+),([\d]+)')
+        m = pat.findall(conn.recbuf)
+        raw_data['power'] = {int(p): (float(v1), float(v2)) for p, v1, v2 in m} if m else {}
+
+        self._clear_recbuf(conn)
+        conn.sende('temperature\r', expectphrase=self.prompt, regex=True)
+        pat = re.compile(':p([0-9]{1,2})[ \t]+([\d]+) C')
+        m = pat.findall(conn.recbuf)
+        raw_data['temp'] = {int(p): float(v1) for p, v1 in m} if m else {}
+        return raw_data
 
 
 # ----------------------------------------------------------------------------------------------------------------------
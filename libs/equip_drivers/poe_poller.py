@@ -0,0 +1,229 @@
+""" PoE Poller Module
+========================================================================================================================
+
+Concurrent instrument polling for PoE loadboxes (used by poe_loadbox.PoEedgarGeneric.get_instrument_data).
+
+The legacy polling read every loadbox connection serially (one command type at a time) under a single syncgroup lock;
+every container sharing the syncgroup waited behind every other container's readings.  This poller instead:
+    1. Polls each loadbox (connection) in its own thread; each box is guarded by its OWN lock so independent boxes
+       are read concurrently and only containers sharing a physical box serialize.
+    2. Publishes a per-box snapshot {<key>: {<box port>: <value>}} with the time of the reading to a shared dir.
+    3. Coalesces: a container that waited on a box lock uses the snapshot published by the holder if the reading
+       was taken AFTER the waiter's request started (i.e. no re-poll of the same box).
+       A caller may also accept an older snapshot by giving a 'max_age'.
+    4. Subscribers can be registered for new snapshots (in-process callbacks) or can block on the shared snapshot
+       of a box until a newer reading is published by any container (wait_for_update).
+
+IMPORTANT: The box reader functions and the lock factory are provided by the driver; no Apollo dependencies.
+
+Usage:
+    poller = PoEPoller(boxes={'POELB1': read_func1, 'POELB2': read_func2}, tag='UPOE')
+    snapshots = poller.poll()
+    # snapshots = {'POELB1': BoxSnapshot(time=1500000000.0, data={'volt': {1: 53.9, ...}, ...}, source='POLLED'), ...}
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import time
+import json
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+from collections import OrderedDict
+
+# BU Specific
+# -----------
+from ..utils.file_lock import FileLock
+
+
+__title__ = "PoE Poller Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), 'poe_poller')
+DEFAULT_LOCK_TIMEOUT = 300
+
+# source = 'POLLED' (read from the box by this poller) or 'SHARED' (published by another poller/container).
+BoxSnapshot = namedtuple('BoxSnapshot', 'time data source')
+
+
+class PoEPoller(object):
+    """ PoE Poller
+    """
+    def __init__(self, boxes, tag='', lock_factory=None, shared_dir=DEFAULT_SHARED_DIR,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        """
+        :param (dict) boxes: Form of {<box name>: <read func>, ...}
+                             The box name MUST be unique for the physical box (ex. syncgroup + conn name + host:port).
+                             The read func takes no params and returns {<key>: {<box port>: <value>, ...}, ...}.
+        :param (str) tag: Snapshot variant (ex. UPOE vs POE readings); only snapshots of the same tag are shared.
+        :param (func) lock_factory: Returns a lock context manager for a box name; default = file lock in shared_dir.
+        :param (str) shared_dir: Directory for published snapshots (and default box locks).
+        :param (int) lock_timeout: Max wait (secs) for a box lock (default file lock only).
+        """
+        self.boxes = OrderedDict(sorted(boxes.items()))
+        self.tag = tag
+        self.shared_dir = shared_dir
+        self.lock_timeout = lock_timeout
+        self._lock_factory = lock_factory if lock_factory else self.__file_lock
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.snapshots = OrderedDict()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def poll(self, names=None, max_age=None):
+        """ Poll
+        Read all boxes concurrently (one thread per box, each under its own box lock).
+        :param (list) names: Box names to poll; default = all.
+        :param (float) max_age: Accept a shared snapshot up to this old (secs); None = only readings taken after
+                                this request started.
+        :return (dict): {<box name>: BoxSnapshot, ...}
+        """
+        names = names if names else list(self.boxes.keys())
+        requested = time.time()
+        results = {}
+        errors = {}
+
+        def __worker(name):
+            try:
+                results[name] = self.__poll_box(name, requested, max_age)
+            except Exception as e:
+                log.error("PoE Poller: {0} poll failed: {1}".format(name, e))
+                errors[name] = e
+
+        threads = [threading.Thread(target=__worker, args=(name,), name='PoEPoller-{0}'.format(name))
+                   for name in names]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[sorted(errors.keys())[0]]
+
+        snapshots = OrderedDict([(name, results[name]) for name in names])
+        with self._lock:
+            self.snapshots.update(snapshots)
+        log.debug("PoE Poller: {0} box(es) in {1:.2f} secs ({2}).".format(
+            len(names), time.time() - requested, ', '.join(['{0}={1}'.format(n, s.source) for n, s in snapshots.items()])))
+        return snapshots
+
+    def subscribe(self, callback):
+        """ Subscribe
+        :param (func) callback: Called as callback(<box name>, <BoxSnapshot>) for every snapshot this poller
+                                produces or adopts.
+        :return:
+        """
+        with self._lock:
+            self._subscribers.append(callback) if callback not in self._subscribers else None
+        return
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback) if callback in self._subscribers else None
+        return
+
+    def read_shared(self, name):
+        """ Read Shared
+        :param (str) name: Box name
+        :return (BoxSnapshot): Last published snapshot of the box (any container) or None.
+        """
+        try:
+            with open(self.__snapshot_file(name), 'r') as fp:
+                published = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        data = {}
+        for key, values in published.get('data', {}).items():
+            data[key] = {int(p): tuple(v) if isinstance(v, list) else v for p, v in values.items()}
+        return BoxSnapshot(published['time'], data, 'SHARED')
+
+    def wait_for_update(self, name, since=0.0, timeout=30.0, poll=0.1):
+        """ Wait For Update
+        Block on the shared snapshot of a box until a reading newer than 'since' is published (by any container).
+        :param (str) name: Box name
+        :param (float) since: Epoch time of the last reading the caller has.
+        :param (float) timeout:
+        :param (float) poll:
+        :return (BoxSnapshot): New snapshot or None on timeout.
+        """
+        start = time.time()
+        while True:
+            snapshot = self.read_shared(name)
+            if snapshot and snapshot.time > since:
+                self.__notify(name, snapshot)
+                return snapshot
+            if time.time() - start > timeout:
+                return None
+            time.sleep(poll)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __poll_box(self, name, requested, max_age):
+        with self._lock_factory(name):
+            snapshot = self.read_shared(name)
+            if snapshot and (snapshot.time >= requested or (max_age and time.time() - snapshot.time <= max_age)):
+                log.debug("PoE Poller: {0} using shared snapshot ({1:.2f} secs old).".format(name, time.time() - snapshot.time))
+            else:
+                reading_time = time.time()
+                snapshot = BoxSnapshot(reading_time, self.boxes[name](), 'POLLED')
+                self.__publish(name, snapshot)
+        self.__notify(name, snapshot)
+        return snapshot
+
+    def __notify(self, name, snapshot):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(name, snapshot)
+            except Exception as e:
+                log.warning("PoE Poller: subscriber {0} failed: {1}".format(callback, e))
+        return
+
+    def __snapshot_file(self, name):
+        return os.path.join(self.shared_dir, '{0}.json'.format(self.__safe_name('{0}.{1}'.format(name, self.tag))))
+
+    @staticmethod
+    def __safe_name(name):
+        return re.sub(r'[^A-Za-z0-9_.\-]', '_', name)
+
+    def __file_lock(self, name):
+        self.__make_shared_dir()
+        return FileLock(os.path.join(self.shared_dir, '{0}.lock'.format(self.__safe_name(name))),
+                        timeout=self.lock_timeout, poll=0.05)
+
+    def __make_shared_dir(self):
+        if not os.path.isdir(self.shared_dir):
+            try:
+                os.makedirs(self.shared_dir)
+            except OSError:
+                pass
+        return
+
+    def __publish(self, name, snapshot):
+        try:
+            self.__make_shared_dir()
+            data = json.dumps(dict(time=snapshot.time, data=snapshot.data))
+            fd, tmp_file = tempfile.mkstemp(prefix='.snapshot_', dir=self.shared_dir)
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(data)
+            os.rename(tmp_file, self.__snapshot_file(name))
+        except (IOError, OSError, TypeError, ValueError) as e:
+            log.warning("PoE Poller: {0} snapshot not published ({1}).".format(name, e))
+        return
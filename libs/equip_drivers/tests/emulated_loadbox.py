@@ -0,0 +1,68 @@
+"""
+---------------------------------------------------------------------
+Emulated PoE loadbox for apollo.scripts.entsw.libs.equip_drivers.tests
+---------------------------------------------------------------------
+Console stand-in for a Reach Edgar loadbox (measure, measure2, status, temperature) with a per-command delay;
+every command is recorded and interleaved access (two commands in flight on one box) is flagged.
+"""
+# Python Imports
+# --------------
+import re
+import time
+import threading
+
+
+class EmulatedLoadbox(object):
+    def __init__(self, name, ports=24, delay=0.1, volt=53.5, upoe=False):
+        self.name = name
+        self.recbuf = ''
+        self.ports = ports
+        self.delay = delay
+        self.volt = volt
+        self.upoe = upoe
+        self.commands = []
+        self.active = 0
+        self.interleaved = False
+        self._lock = threading.Lock()
+
+    def clear_recbuf(self):
+        self.recbuf = ''
+
+    def sende(self, text, expectphrase=None, timeout=30, regex=False, **kwargs):
+        cmd = text.strip()
+        with self._lock:
+            self.active += 1
+            self.interleaved = self.interleaved or self.active > 1
+            self.commands.append(cmd)
+        time.sleep(self.delay)
+        self.recbuf = '{0}\n{1}\n{2}> '.format(cmd, self.__run(cmd), self.name)
+        with self._lock:
+            self.active -= 1
+
+    def count(self, cmd):
+        return len([c for c in self.commands if c == cmd])
+
+    def __run(self, cmd):
+        lines = []
+        for p in range(1, self.ports + 1):
+            if cmd == 'measure':
+                lines.append(':p{0} {1}V'.format(p, self.volt))
+            elif cmd == 'measure2':
+                lines.append(':p{0} {1}V, {1}V'.format(p, self.volt))
+            elif cmd == 'status':
+                lines.append(':p{0} PWR {1}'.format(p, '1,1' if self.upoe else '1'))
+            elif cmd == 'temperature':
+                lines.append(':p{0}  {1} C'.format(p, 25 + p % 3))
+        return '\n'.join(lines)
+
+
+def read_box(conn):
+    """ Box reader in the form used by the Edgar drivers (measure + status + temperature). """
+    raw_data = {}
+    conn.sende('measure\r', expectphrase='> ', regex=True)
+    raw_data['volt'] = {int(p): float(v) for p, v in re.findall(r':p([0-9]{1,2}) ([\S]+)V', conn.recbuf)}
+    conn.sende('status\r', expectphrase='> ', regex=True)
+    raw_data['power'] = {int(p): float(v) for p, v in re.findall(r':p([0-9]{1,2}) PWR ([\d]+)', conn.recbuf)}
+    conn.sende('temperature\r', expectphrase='> ', regex=True)
+    raw_data['temp'] = {int(p): float(v) for p, v in re.findall(r':p([0-9]{1,2})[ \t]+([\d]+) C', conn.recbuf)}
+    return raw_data
@@ -0,0 +1,90 @@
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+from .. import poe_poller
+from . import emulated_loadbox
+
+__title__ = 'EntSw PoE Poller Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestPoEPoller(object):
+
+    def setup_method(self, method):
+        self.shared_dir = tempfile.mkdtemp()
+        self.boxes = [emulated_loadbox.EmulatedLoadbox('POELB{0}'.format(i), delay=0.05) for i in range(1, 3)]
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.shared_dir)
+
+    def __poller(self, boxes=None, **kwargs):
+        boxes = boxes if boxes else self.boxes
+        readers = {box.name: (lambda b=box: emulated_loadbox.read_box(b)) for box in boxes}
+        return poe_poller.PoEPoller(readers, tag='POE+', shared_dir=self.shared_dir, **kwargs)
+
+    def test_concurrent_boxes(self):
+        poller = self.__poller()
+        start = time.time()
+        snapshots = poller.poll()
+        # 3 commands x 0.05 secs per box; serial reading of 2 boxes would be >= 0.3 secs
+        assert time.time() - start < 0.25
+        assert list(snapshots.keys()) == ['POELB1', 'POELB2']
+        for box in self.boxes:
+            s = snapshots[box.name]
+            assert s.source == 'POLLED' and start <= s.time <= time.time()
+            assert s.data['volt'][24] == 53.5 and s.data['power'][1] == 1.0 and s.data['temp'][2] == 27.0
+            assert box.count('measure') == 1 and not box.interleaved
+
+    def test_shared_box_coalesced(self):
+        box_lock = threading.Lock()
+        results = {}
+
+        def __container(n):
+            poller = self.__poller(boxes=self.boxes[:1], lock_factory=lambda name: box_lock)
+            results[n] = poller.poll()['POELB1']
+
+        box_lock.acquire()
+        threads = [threading.Thread(target=__container, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        box_lock.release()
+        for t in threads:
+            t.join()
+        assert self.boxes[0].count('measure') == 1 and not self.boxes[0].interleaved
+        assert sorted([s.source for s in results.values()]) == ['POLLED', 'SHARED', 'SHARED', 'SHARED']
+        assert len(set([s.time for s in results.values()])) == 1
+        assert results[0].data == results[3].data
+
+    def test_max_age(self):
+        self.__poller().poll()
+        assert self.__poller().poll(max_age=30)['POELB1'].source == 'SHARED'
+        assert self.boxes[0].count('measure') == 1
+        assert self.__poller().poll()['POELB1'].source == 'POLLED'
+        assert self.boxes[0].count('measure') == 2
+
+    def test_subscribe(self):
+        poller = self.__poller()
+        received = []
+        poller.subscribe(lambda name, snapshot: received.append((name, snapshot.source)))
+        waiter = self.__poller()
+        updates = {}
+        since = time.time()
+
+        def __wait():
+            updates['POELB2'] = waiter.wait_for_update('POELB2', since=since, timeout=5.0, poll=0.01)
+
+        t = threading.Thread(target=__wait)
+        t.start()
+        snapshots = poller.poll()
+        t.join()
+        assert sorted(received) == [('POELB1', 'POLLED'), ('POELB2', 'POLLED')]
+        assert updates['POELB2'].time == snapshots['POELB2'].time
+        assert updates['POELB2'].data == snapshots['POELB2'].data
+        assert waiter.wait_for_update('POELB2', since=snapshots['POELB2'].time, timeout=0.05, poll=0.01) is None
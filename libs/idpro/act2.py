@@ -95,6 +95,7 @@ from ..utils.common_utils import writefiledata
 from ..utils.common_utils import shellcmd
 from ..utils.common_utils import print_large_dict
 from ..utils.common_utils import read_apollo_registry
+from ..utils import console_utils
 
 
 __title__ = "ACT2 General Module"
@@ -128,7 +129,10 @@ class ACT2(object):
     CHIP_FW_MIN = "49.0.0"
     CHIP_FW_MAX = "81.0.0"
     CONSOLE_SEND_SIZE = 16
+    CONSOLE_SEND_MAX_SIZE = 64             # Only used w/ a CONSOLE_LINE_KILL (data that can be resent)
+    CONSOLE_LINE_KILL = None               # Diag input line kill sequence (ex. '\x15'); None = no resend
     BLOCK_SEND_SLEEP = 0.3
+    ECHO_TIMEOUT = 5
     MAX_SERVICE_ATTEMPTS = 5
 
     ATOM_PATH = "/usr/auto/ATOM"             # Path to atom utilities
@@ -201,6 +205,14 @@ class ACT2(object):
         self.act2_data['signature_segments'] = kwargs.get('signature_segments', 1)
         self.act2_data['cliip_segments'] = kwargs.get('cliip_segments', 3)
 
+        # Console block streamer (echo paced; see console_utils).
+        self._streamer = console_utils.BlockStreamer(
+            self._uut_conn,
+            profile=console_utils.StreamProfile(min_size=ACT2.CONSOLE_SEND_SIZE, max_size=ACT2.CONSOLE_SEND_MAX_SIZE,
+                                                echo_timeout=ACT2.ECHO_TIMEOUT, legacy_sleep=ACT2.BLOCK_SEND_SLEEP),
+            timeout_exceptions=(apexceptions.TimeoutException,),
+            line_kill=ACT2.CONSOLE_LINE_KILL)
+
         self.act2_mfg_session_file = os.path.join(ACT2.ATOM_LOG_PATH, "act2mfgsession_{uid}.id".format(uid=self._uut_conn.uid))
 
         m = parse.search('Apollo-{maj:0}-{min:1}', shellcmd("apollo version").strip('\n'))
@@ -211,11 +223,11 @@ class ACT2(object):
         return
 
     def __str__(self):
-        doc = "{0},  Lib Ver:{1}-{2},  Chip FW Ver:{3}-{4},  ConSndSize:{5}".\
+        doc = "{0},  Lib Ver:{1}-{2},  Chip FW Ver:{3}-{4},  ConSndSize:{5}-{6}".\
             format(self.__repr__(),
                    ACT2.LIB_VER_MIN, ACT2.LIB_VER_MAX,
                    ACT2.CHIP_FW_MIN, ACT2.CHIP_FW_MAX,
-                   ACT2.CONSOLE_SEND_SIZE)
+                   ACT2.CONSOLE_SEND_SIZE, ACT2.CONSOLE_SEND_MAX_SIZE)
         return doc
 
     def __repr__(self):
@@ -1332,8 +1344,10 @@ class ACT2(object):
         Send ASCII Hex data to the UUT via the console when prompted by diag interface..
         Some diags breaks up the input into segments (typically 2 or 3); this funtion provides a means to
         divide the input accordingly.
-        Some diags also can only handle small bursts of data so the console sendsize is set as a class parameter
-        and used by this function.
+        Some diags also can only handle small bursts of data; the blocks are paced by the console echo at the
+        console sendsize (class parameter); with a line kill the size grows up to the max sendsize while the echo is
+        intact (a garbled segment is killed and resent).
+        A console that does not echo falls back to the fixed sendsize w/ the block sleep.
         :param data: Data to send to the UUT.
         :param segments: Total number of divided segments in the data corresponding to prompting diag interface.
         :param interim_expectphrase: Response between segments.
@@ -1342,67 +1356,18 @@ class ACT2(object):
                                    Must comply w/ regex expression rules
         :param join: Flag to allow more data for append (no carriage return at end)
         :param verbose:
-        :return:
+        :return (bool): False if the echo checksum did not match the data; otherwise True.
+        :raises BlockStreamError: Garbled echo (the diag did not receive the data intact).
         """
-        def __send_block(s_data, s_blocks, s_size, s_offset, noexpectphrase=True):
-            """
-            Internal helper function for sending small blocks of data to the UUT.
-            :param s_data: Data to send to the UUT.
-            :param s_blocks: Total number of 'sendsize' blocks in the data segment.
-            :param s_size: Amount of chars to send to UUT console.
-            :param s_offset: Slice start point of ASCII hex char index in the data.
-            :param noexpectphrase: Just what it means.
-            :return:
-            """
-            j = s_offset
-            for block in range(0, s_blocks):
-                i = block * s_size + offset
-                j = (block + 1) * s_size + s_offset
-                if verbose:
-                    log.debug("{0}:{1}".format(i, s_data[i:j]))
-                if noexpectphrase:
-                    self._uut_conn.send(s_data[i:j], expectphrase=None, timeout=120, idle_timeout=90, regex=True)
-                else:
-                    self._uut_conn.send(s_data[i:j], expectphrase='.*', timeout=90, regex=True)
-                time.sleep(ACT2.BLOCK_SEND_SLEEP)
-            return j
-
         log.debug("send_uut_data...")
-        # Init operating varsACT2Sign
-        sendsize = ACT2.CONSOLE_SEND_SIZE
-        data_len = len(data)
-        blocks = data_len / (sendsize * segments)
-        current_index = 0
-        remaining_data = data_len % (sendsize * segments)
-        log.debug("Data Length={0}".format(data_len))
-        log.debug("Blocks={0}".format(blocks))
-
-        # Process data per the segments requested.
-        # Deep debug: log.debug("interim = '{0}'".format(interim_expectphrase))
-        # Deep debug: log.debug("final   = '{0}'".format(final_expectphrase))
-        for segment in range(0, segments):
-            offset = segment * blocks * sendsize
-            log.debug("Segment = {0}   (offset:{1})".format(segment, offset))
-            current_index = __send_block(data, blocks, sendsize, offset)
-            if segment != segments - 1:
-                # Send a carriage return if this is NOT the last segment.
-                self._uut_conn.send("\r", expectphrase=interim_expectphrase, timeout=120, regex=True)
-
-        if remaining_data > 0:
-            remaining_blocks = (data_len - current_index) / sendsize
-            offset = current_index
-            log.debug("Remaining Blocks={0}".format(remaining_blocks))
-            last = __send_block(data, remaining_blocks, sendsize, offset)
-            if last < data_len:
-                sendsize = data_len - last
-                log.debug("Remaining Data Length={0}".format(sendsize))
-                __send_block(data, 1, sendsize, last)
-
-        if not join:
-            # Send final carriage return if no other data will join the 'send session' to the UUT.
-            self._uut_conn.send("\r", expectphrase=final_expectphrase, timeout=120, regex=True)
-
-        return
+        log.debug("Data Length={0}".format(len(data)))
+        verified = self._streamer.stream(data, segments=segments,
+                                         interim_expectphrase=interim_expectphrase,
+                                         final_expectphrase=final_expectphrase,
+                                         join=join, verbose=verbose)
+        if verified is False:
+            raise console_utils.BlockStreamError("ACT2 data echo checksum mismatch.")
+        return True
 
     def __data_sanity_check(self, keylist):
         """ (INTERNAL) Data Sanity Check
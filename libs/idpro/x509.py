@@ -81,6 +81,7 @@ from ..utils.common_utils import func_details
 from ..utils.common_utils import print_large_dict
 from ..utils.common_utils import cesium_srvc_retry
 from ..utils.common_utils import apollo_step
+from ..utils import console_utils
 
 
 # Apollo
@@ -108,6 +109,10 @@ class X509Sudi(object):
 
     X509_LOG_PATH = "/tmp"
     X509_CONSOLE_SEND_SIZE = 64
+    X509_CONSOLE_SEND_MAX_SIZE = 256        # Only used w/ a X509_CONSOLE_LINE_KILL (data that can be resent)
+    X509_CONSOLE_LINE_KILL = None           # Diag input line kill sequence (ex. '\x15'); None = no resend
+    X509_BLOCK_SEND_SLEEP = 0.10
+    X509_ECHO_TIMEOUT = 5
     X509_MAX_SERVICE_ATTEMPTS = 5
 
     X509_REQUEST_TYPES = ['PROD', 'TEST']
@@ -204,6 +209,14 @@ class X509Sudi(object):
         self._uut_conn = self._mode_mgr.uut_conn                                   # Connection to UUT
         self._uut_prompt = self._mode_mgr.uut_prompt_map.get('STARDUST', '> ')     # UUT prompt
         self._ud = ud
+        self._streamer = console_utils.BlockStreamer(
+            self._uut_conn,
+            profile=console_utils.StreamProfile(min_size=X509Sudi.X509_CONSOLE_SEND_SIZE,
+                                                max_size=X509Sudi.X509_CONSOLE_SEND_MAX_SIZE,
+                                                echo_timeout=X509Sudi.X509_ECHO_TIMEOUT,
+                                                legacy_sleep=X509Sudi.X509_BLOCK_SEND_SLEEP),
+            timeout_exceptions=(apexceptions.TimeoutException,),
+            line_kill=X509Sudi.X509_CONSOLE_LINE_KILL)
         self._linux = kwargs.get('linux', None)
         self.__unittest = kwargs.get('unittest', False)
         self.__verbose = kwargs.get('verbose', True)
@@ -625,8 +638,9 @@ class X509Sudi(object):
 
         # 2. Program the Key!
         self._uut_conn.send("SCCProgramSudiKey {0}\r".format(cmd_params), expectphrase='Enter SUDI', timeout=30)
-        self.__send_uut_data(sudi_data['private_key'], join=True)
-        result, error = self.__send_uut_data('ENDOFKEY', join=False, final_expectphrase=self._uut_prompt)
+        result, error = self.__send_uut_data(sudi_data['private_key'], join=True)
+        if result:
+            result, error = self.__send_uut_data('ENDOFKEY', join=False, final_expectphrase=self._uut_prompt)
         if not result:
             log.error("Cannot continue.")
             return False
@@ -637,9 +651,13 @@ class X509Sudi(object):
             log.error("SUDI programming sequence unknown!")
             return False
         self._uut_conn.send("SCCProgramSudiCert {0}\r".format(cmd_params), expectphrase='Enter SUDI', timeout=30)
+        result = True
         for cert_item in X509Sudi.SUDI_SEQUENCE[self.x509_data['uut_cert_sequence']]:
-            self.__send_uut_data(sudi_data[cert_item], join=True)
-        result, error = self.__send_uut_data('ENDOFCERT', join=False)
+            result, error = self.__send_uut_data(sudi_data[cert_item], join=True)
+            if not result:
+                break
+        if result:
+            result, error = self.__send_uut_data('ENDOFCERT', join=False)
         if not result:
             log.error("Cannot continue.")
             return False
@@ -719,8 +737,9 @@ class X509Sudi(object):
         Send ASCII Hex data to the UUT via the console when prompted by diag interface..
         Some diags breaks up the input into segments (typically 2 or 3); this funtion provides a means to
         divide the input accordingly.
-        Some diags also can only handle small bursts of data so the console sendsize is set as a class parameter
-        and used by this function.
+        Some diags also can only handle small bursts of data; the blocks are paced by the console echo at the
+        console sendsize (class parameter); with a line kill the size grows up to the max sendsize while the echo is
+        intact (a garbled segment is killed and resent).
         :param data: Data to send to the UUT.
         :param segments: Total number of divided segments in the data corresponding to prompting diag interface.
         :param interim_expectphrase: Response between segments.
@@ -729,67 +748,21 @@ class X509Sudi(object):
                                    Must comply w/ regex expression rules
         :param join: Flag to allow more data for append (no carriage return at end)
         :param verbose:
-        :return:
+        :return (tuple): (result, errors); a garbled echo is a failure.
         """
-        def __send_block(s_data, s_blocks, s_size, s_offset, noexpectphrase=True):
-            """
-            Internal helper function for sending small blocks of data to the UUT.
-            :param s_data: Data to send to the UUT.
-            :param s_blocks: Total number of 'sendsize' blocks in the data segment.
-            :param s_size: Amount of chars to send to UUT console.
-            :param s_offset: Slice start point of ASCII hex char index in the data.
-            :param noexpectphrase: Just what it means.
-            :return:
-            """
-            j = s_offset
-            for block in range(0, s_blocks):
-                i = block * s_size + s_offset
-                j = (block + 1) * s_size + s_offset
-                if verbose:
-                    log.debug("{0}:{1}".format(i, s_data[i:j]))
-                if not noexpectphrase:
-                    self._uut_conn.send(s_data[i:j], expectphrase='.*', timeout=90, regex=True)
-                else:
-                    self._uut_conn.send(s_data[i:j], expectphrase=None, timeout=120, idle_timeout=90, regex=True)
-                time.sleep(0.10)
-            return j
-
-        # Init operating vars
-        sendsize = X509Sudi.X509_CONSOLE_SEND_SIZE
-        data_len = len(data)
-        blocks = data_len / (sendsize * segments)
-        current_index = 0
-        remaining_data = data_len % (sendsize * segments)
-        log.debug("Data Length={0}".format(data_len))
-        log.debug("Blocks={0}".format(blocks))
-
-        # Process data per the segments requested.
-        # Deep debug: log.debug("interim = '{0}'".format(interim_expectphrase))
-        # Deep debug: log.debug("final   = '{0}'".format(final_expectphrase))
-        for segment in range(0, segments):
-            log.debug('Segment = {0}'.format(segment))
-            offset = segment * blocks * sendsize
-            current_index = __send_block(data, blocks, sendsize, offset)
-            if segment != segments - 1:
-                # Send a carriage return if this is NOT the last segment.
-                self._uut_conn.send("\r", expectphrase=interim_expectphrase, timeout=120, regex=True)
-
-        if remaining_data > 0:
-            remaining_blocks = (data_len - current_index) / sendsize
-            offset = current_index
-            log.debug("Remaining Blocks={0}".format(remaining_blocks))
-            last = __send_block(data, remaining_blocks, sendsize, offset)
-            if last < data_len:
-                sendsize = data_len - last
-                log.debug("Remaining Data Length={0}".format(sendsize))
-                __send_block(data, 1, sendsize, last)
-
-        if not join:
-            # Send final carriage return if no other data will join the 'send session' to the UUT.
-            self._uut_conn.send("\r", expectphrase=final_expectphrase, timeout=120, regex=True)
+        log.debug("Data Length={0}".format(len(data)))
+        try:
+            verified = self._streamer.stream(data, segments=segments,
+                                             interim_expectphrase=interim_expectphrase,
+                                             final_expectphrase=final_expectphrase,
+                                             join=join, verbose=verbose)
+        except console_utils.BlockStreamError as e:
+            log.error(e)
+            return False, [str(e)]
 
         log.debug("Send data done.")
         errors = re.findall('\*\*\*ERR:.*', self._uut_conn.recbuf)
+        errors += ['Console echo checksum mismatch.'] if verified is False else []
         if errors:
             log.error("SEND DATA Failure: {0}".format(errors))
 
@@ -583,7 +583,7 @@ class Process(object):
                               level (int): Optional level (up to 10).
         :return (str): aplib.PASS/FAIL
         """
-        @cesium_srvc_retry
+        @cesium_srvc_retry(cache_ttl=common_utils.CESIUM_CACHE_TTL)
         def get_genealogy(parent_serial_number, parent_product_id, level=1):
             log.debug("Parent SN, PID       : {0}, {1}".format(parent_serial_number, parent_product_id))
             return cesiumlib.get_genealogy(serial_number=parent_serial_number,
@@ -1347,7 +1347,7 @@ class Process(object):
 
         # 3. Get the LID config
         try:
-            line_id_cfg = cesiumlib.get_lineid_config(major_line_id=line_id)
+            line_id_cfg = common_utils.get_lineid_config(major_line_id=line_id)
         except (apexceptions.ServiceFailure, apexceptions.ResultFailure) as err:
             log.debug(err)
             return aplib.FAIL, err.message
@@ -1389,7 +1389,7 @@ class Process(object):
             log.error('No valid line ID info input')
             return aplib.FAIL
         elif not major_line_id_cfg and major_line_id and not order_cfg:
-            major_line_id_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id).get('config_data')
+            major_line_id_cfg = common_utils.get_lineid_config(major_line_id=major_line_id).get('config_data')
             if not major_line_id_cfg:
                 log.error('No valid line ID config_data for {0}'.format(major_line_id))
                 return aplib.FAIL
@@ -1430,7 +1430,7 @@ class Process(object):
         # Get the LID config
         if not major_line_id_cfg:
             try:
-                major_line_id_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id)
+                major_line_id_cfg = common_utils.get_lineid_config(major_line_id=major_line_id)
             except (apexceptions.ServiceFailure, apexceptions.ResultFailure) as err:
                 log.debug(err)
                 return aplib.FAIL, err.message
@@ -1630,7 +1630,7 @@ class Process(object):
             log.error('No valid line ID info input')
             return aplib.FAIL
         elif not major_line_id_cfg and major_line_id and not order_cfg:
-            major_line_id_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id).get('config_data')
+            major_line_id_cfg = common_utils.get_lineid_config(major_line_id=major_line_id).get('config_data')
             if not major_line_id_cfg:
                 log.error('No valid line ID config_data for {0}'.format(major_line_id))
                 return aplib.FAIL
@@ -1956,7 +1956,7 @@ class Process(object):
         for major_line_id in major_line_ids:
             log.debug("=" * 100)
             try:
-                lineid_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id)
+                lineid_cfg = common_utils.get_lineid_config(major_line_id=major_line_id)
                 common_utils.print_large_dict(lineid_cfg, exploded=print_exploded)
             except apexceptions.ServiceFailure as e:
                 log.debug(e)
@@ -2094,7 +2094,7 @@ class Process(object):
                                = 'cat4k' is used for C4K/C9400
         :return:
         """
-        @cesium_srvc_retry
+        @cesium_srvc_retry(cache_ttl=common_utils.CESIUM_CACHE_TTL)
         def get_cmpd(cmpd_description, uut_type, part_number, part_revision, area, test_site, eco_deviation_number,
                      password_family):
             return cesiumlib.get_cmpd(cmpd_description=cmpd_description,
@@ -0,0 +1,300 @@
+"""
+========================================================================================================================
+Boot Phase Tracker
+========================================================================================================================
+
+Streaming boot milestone tracker with a per-product history of the phase durations.
+
+The generic ModeManager boot wait looped on the console with fixed sleeps (2 secs + RECBUF_TIME per loop) and only
+knew "prompt found" or "timed out" at the end.  The tracker:
+    1. Scans the console buffer incrementally (new bytes only) for the boot milestones
+       (rommon banner, image load, kernel, IOS ready, ...); each milestone gets the elapsed time it was first seen.
+       The milestone patterns are also part of the console wait pattern so that each one is seen as it arrives.
+    2. Keeps a history of the milestone times of past boots per product and boot target (JSON file per key,
+       last N boots); a rommon-only wait does not share the history of a full IOS boot (see history_key()).
+       The history file is shared by all containers on the server: finish() re-reads it and appends under a file
+       lock so that concurrent boots do not overwrite each other's entries.
+    3. Flags a slow boot as soon as a milestone is overdue (p95 x slow factor) instead of waiting for the full
+       timeout.  The adaptive boot timeout from the history (p95 of the total boot time x margin; never more than
+       the caller's timeout) is opt-in; by default the caller's timeout is never shortened.
+
+Usage:
+    tracker = BootPhaseTracker(product=history_key('C9300.Nyquist', boot_mode=['IOS'], boot_msg='Booting'))
+    tracker.start()
+    while ...:
+        uut_conn.waitfor('|'.join([active_pattern, tracker.pattern()]), timeout=tracker.timeout(600), ...)
+        new = tracker.scan(uut_conn.recbuf)
+        tracker.overdue()
+    tracker.mark('prompt')
+    tracker.finish(success=True)
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import json
+import time
+import math
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+
+# BU Lib
+# ------
+from ..utils.step_telemetry import percentile
+from ..utils.file_lock import FileLock
+
+
+__title__ = "Boot Phase Tracker"
+__version__ = '2.0.0'
+__author__ = 'bborel'
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_DIR = os.path.join(tempfile.gettempdir(), 'entsw_boot_history')
+DEFAULT_MILESTONES = OrderedDict([
+    ('rommon', r'(?:System Bootstrap)|(?:ROM: )'),
+    ('image_load', r'(?:Loading ")|(?:boot: attempting to boot)|(?:Reading full image)|(?:Booting )'),
+    ('kernel', r'(?:Linux version)|(?:Starting kernel)|(?:Restricted Rights Legend)'),
+    ('ios_ready', r'(?:Press RETURN)'),
+])
+HISTORY_SIZE = 50
+MIN_HISTORY = 3
+TAIL_OVERLAP = 256
+
+
+class BootPhaseTracker(object):
+    """ Boot Phase Tracker
+    """
+    def __init__(self, product, milestones=None, history_dir=DEFAULT_HISTORY_DIR, history_size=HISTORY_SIZE,
+                 margin=2.0, slow_factor=1.5, min_timeout=120, adaptive_timeout=False):
+        """
+        :param (str) product: History key (see history_key()).
+        :param (OrderedDict) milestones: {<name>: <regex>, ...} in boot order; default = DEFAULT_MILESTONES.
+        :param (str) history_dir: None = no history.
+        :param (int) history_size: Number of past boots kept.
+        :param (float) margin: Adaptive timeout = p95 of the total boot time x margin.
+        :param (float) slow_factor: A milestone later than its p95 x slow_factor is flagged as slow.
+        :param (int) min_timeout: Lower bound of the adaptive timeout (secs).
+        :param (bool) adaptive_timeout: True = timeout() may be shorter than the caller's timeout (from the history).
+        """
+        self.product = product
+        self.milestones = OrderedDict(milestones if milestones else DEFAULT_MILESTONES)
+        self.history_dir = history_dir
+        self.history_size = history_size
+        self.margin = margin
+        self.slow_factor = slow_factor
+        self.min_timeout = min_timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.slow = []
+        self._compiled = OrderedDict([(k, re.compile(v)) for k, v in self.milestones.items()])
+        self._seen = OrderedDict()
+        self._offset = 0
+        self._floor = 0
+        self._start = None
+        self.last_text = ''
+        self._history = self.__load_history()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def seen(self):
+        """ {<milestone>: <elapsed secs>, ...} in the order seen. """
+        return self._seen
+
+    @property
+    def elapsed(self):
+        return time.time() - self._start if self._start else 0.0
+
+    @property
+    def history(self):
+        return self._history
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def start(self, recbuf=None):
+        """ Start
+        :param (str) recbuf: Current console buffer; content already present is not scanned.
+        """
+        self._start = time.time()
+        self._seen = OrderedDict()
+        self._offset = len(recbuf) if recbuf else 0
+        self._floor = self._offset
+        self.last_text = ''
+        self.slow = []
+        return
+
+    def pattern(self):
+        """ Pattern
+        :return (str): Regex of the milestones not yet seen; None when all are seen.
+        """
+        remaining = [self.milestones[k] for k in self.milestones if k not in self._seen]
+        return '|'.join(['(?:{0})'.format(p) for p in remaining]) if remaining else None
+
+    def scan(self, recbuf):
+        """ Scan
+        Only the new part of the buffer (plus a small overlap) is searched; a cleared buffer restarts at 0.
+        The new part is kept in last_text.
+        :param (str) recbuf: Console buffer
+        :return (list): Milestones newly seen
+        """
+        recbuf = recbuf if recbuf else ''
+        if len(recbuf) < self._offset:
+            self._offset, self._floor = 0, 0
+        self.last_text = recbuf[self._offset:]
+        text = recbuf[max(self._floor, self._offset - TAIL_OVERLAP):]
+        self._offset = len(recbuf)
+        new = []
+        for name, pattern_re in self._compiled.items():
+            if name not in self._seen and pattern_re.search(text):
+                new.append(name)
+                self.mark(name)
+        return new
+
+    def mark(self, name):
+        """ Mark
+        Record a milestone (ex. 'prompt' when the boot prompt is confirmed).
+        """
+        if name in self._seen:
+            return
+        self._seen[name] = self.elapsed
+        log.debug("Boot milestone: {0:<12} at {1:>7.1f} secs".format(name, self._seen[name]))
+        expected = self.expected(name)
+        if expected and self._seen[name] > expected * self.slow_factor and name not in [s[0] for s in self.slow]:
+            self.__flag_slow(name, self._seen[name], expected)
+        return
+
+    def expected(self, name):
+        """ Expected
+        :param (str) name: Milestone or 'total'
+        :return (float): p95 of the elapsed time of the milestone in the history; None if too few samples.
+        """
+        values = [h['phases'][name] if name != 'total' else h['total']
+                  for h in self._history if h.get('ok') and (name == 'total' or name in h.get('phases', {}))]
+        return percentile(values, 95) if len(values) >= MIN_HISTORY else None
+
+    def timeout(self, default):
+        """ Timeout
+        :param (int) default: Caller's boot timeout (upper bound).
+        :return (int): Remaining time (secs) of the adaptive boot timeout;
+                       the default if not adaptive_timeout or if there is no history.
+        """
+        expected = self.expected('total') if self.adaptive_timeout else None
+        if not expected:
+            return default
+        limit = min(default, max(self.min_timeout, expected * self.margin))
+        return max(1, int(math.ceil(limit - self.elapsed)))
+
+    def overdue(self):
+        """ Overdue
+        Flag (once) the next milestones that are later than expected.
+        :return (list): Milestones overdue
+        """
+        overdue = []
+        for name in self.milestones:
+            expected = self.expected(name)
+            if name in self._seen or not expected or name in [s[0] for s in self.slow]:
+                continue
+            if self.elapsed > expected * self.slow_factor:
+                self.__flag_slow(name, self.elapsed, expected)
+                overdue.append(name)
+        return overdue
+
+    def phases(self):
+        """ Phases
+        :return (OrderedDict): {<milestone>: <secs since the previous milestone>, ...}
+        """
+        phases, last = OrderedDict(), 0.0
+        for name, at in self._seen.items():
+            phases[name] = at - last
+            last = at
+        return phases
+
+    def finish(self, success):
+        """ Finish
+        Add this boot to the product history (only successful boots are used for the expected times).
+        :param (bool) success:
+        :return (dict): History entry
+        """
+        entry = dict(ts=time.time(), ok=bool(success), total=self.elapsed, phases=dict(self._seen),
+                     slow=[s[0] for s in self.slow])
+        self.__append_history(entry)
+        self.print_phases()
+        return entry
+
+    def print_phases(self):
+        log.debug("-" * 60)
+        log.debug("Boot phases: {0}  (total={1:.1f} secs)".format(self.product, self.elapsed))
+        for name, secs in self.phases().items():
+            expected = self.expected(name)
+            log.debug("  {0:<12} {1:>7.1f} secs  (at {2:>7.1f}, p95={3})".format(
+                name, secs, self._seen[name], '{0:.1f}'.format(expected) if expected else '--'))
+        log.debug("-" * 60)
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __flag_slow(self, name, at, expected):
+        self.slow.append((name, at, expected))
+        log.warning("Slow boot: '{0}' at {1:.1f} secs (p95={2:.1f} secs) for {3}.".format(name, at, expected,
+                                                                                         self.product))
+        return
+
+    def __history_file(self):
+        return os.path.join(self.history_dir, '{0}.json'.format(re.sub(r'[^A-Za-z0-9_.\-]', '_', self.product)))
+
+    def __load_history(self):
+        if not self.history_dir:
+            return []
+        try:
+            with open(self.__history_file(), 'r') as fp:
+                history = json.load(fp)
+            return history if isinstance(history, list) else []
+        except (IOError, OSError, ValueError):
+            return []
+
+    def __append_history(self, entry):
+        """ Append History
+        Re-read the shared history file and append the entry under the file lock (other containers may have added
+        their boots since this tracker loaded it); the file is replaced atomically.
+        """
+        if not self.history_dir:
+            self._history = (self._history + [entry])[-self.history_size:]
+            return
+        try:
+            if not os.path.isdir(self.history_dir):
+                os.makedirs(self.history_dir)
+            with FileLock('{0}.lock'.format(self.__history_file()), timeout=30, poll=0.01):
+                self._history = (self.__load_history() + [entry])[-self.history_size:]
+                fd, tmp_file = tempfile.mkstemp(prefix='.history_', dir=self.history_dir)
+                with os.fdopen(fd, 'w') as fp:
+                    json.dump(self._history, fp)
+                os.rename(tmp_file, self.__history_file())
+        except (IOError, OSError) as e:
+            self._history = (self._history + [entry])[-self.history_size:]
+            log.debug("Boot history not saved ({0}).".format(e))
+        return
+
+
+def history_key(product, boot_mode=None, boot_msg=None):
+    """ History Key
+    Boots of one product to different targets (ex. rommon only vs. a full IOS boot) have very different times;
+    each target gets its own history.
+    :param (str) product: Product family + codename or the mode module name.
+    :param (list|str) boot_mode: Target boot mode(s).
+    :param (str) boot_msg: Start boot message pattern.
+    :return (str):
+    """
+    modes = boot_mode if isinstance(boot_mode, list) else [boot_mode] if boot_mode else []
+    key = '.'.join([product] + sorted(modes))
+    return '{0}.{1}'.format(key, hashlib.sha1(boot_msg.encode('utf-8')).hexdigest()[:8]) if boot_msg else key
@@ -27,6 +27,11 @@ import argparse
 # ------
 from ..utils.common_utils import func_details
 from pathfinder import PathFinder
+from boot_tracker import BootPhaseTracker
+from boot_tracker import history_key
+from boot_tracker import DEFAULT_HISTORY_DIR
+from prompt_discovery import PromptAutomaton
+from prompt_discovery import PromptDiscovery
 
 # Apollo
 # ------
@@ -82,6 +87,7 @@ class ModeManager(PathFinder):
     MODE_RETRY_COUNT = 2
     RECBUF_TIME = 5.0
     RECBUF_CLEAR_TIME = 3.0
+    BOOT_SETTLE_TIME = 1.0
     USE_CLEAR_RECBUF = False
     DEFAULT_PROMPT_MAP = [
         ('BTLDR', 'switch:'),
@@ -130,6 +136,11 @@ class ModeManager(PathFinder):
         self.__trans_func_args = kwargs.get('trans_func_args', None)      # (Option) args for each trans func
         self.__wait_for_boot_custom = kwargs.get('wait_for_boot', None)   # (Option) custom 'wait_for_boot'
         self.__uut_mode_output = dict()                                   # Output of UUT console keyed by trans funcs
+        self.__boot_history_key = kwargs.get('boot_history_key', None)    # Boot phase history key (default=mode module)
+        self.__boot_history_dir = kwargs.get('boot_history_dir', DEFAULT_HISTORY_DIR)  # None = no boot history
+        self.__adaptive_boot_timeout = kwargs.get('adaptive_boot_timeout', False)  # True = history may cut timeout
+        self.__boot_tracker = None                                        # Boot phase tracker of the last boot
+        self.__mode_hint = None                                           # Last known (mode, prompt); also in ud
         ModeManager.USE_CLEAR_RECBUF = kwargs.get('use_clear_recbuf', False)
         ModeManager.MODE_RETRY_COUNT = kwargs.get('mode_retry_count', 2)
 
@@ -182,6 +193,14 @@ class ModeManager(PathFinder):
     def uut_conn(self):
         return self.__uut_conn
 
+    @property
+    def boot_tracker(self):
+        return self.__boot_tracker
+
+    @property
+    def mode_hint(self):
+        return self.__get_mode_hint()
+
     @property
     def current_mode(self):
         return self.__get_current_mode()
@@ -203,6 +222,7 @@ class ModeManager(PathFinder):
     def uut_prompt_map(self, newvalue):
         self.__uut_prompt_map_raw = newvalue
         self.__uut_prompt_map = collections.OrderedDict(self.__reduce_uut_prompt_map())
+        self.__prompt_automaton = PromptAutomaton(self.__uut_prompt_map_raw)
         self.__reset_active_uut_prompt_map()
         self.__available_modes = self.__uut_prompt_map.keys()
 
@@ -637,41 +657,41 @@ class ModeManager(PathFinder):
         """
         ret_mode = None
         extension_flag = False
+        extension_modes = []
         log.debug("Prompt to match = '{0}'".format(prompt)) if self.verbose_level > 1 else None
-        # Find pattern match(es)
-        for item_set in self.__uut_prompt_map_raw:
-            log.debug("PM Item = {0}".format(item_set)) if self.verbose_level > 1 else None
-            mode, pattern, extension = item_set if len(item_set) == 3 else (item_set[0], item_set[1], None)
+        # Find pattern match(es); the automaton yields only the matching items (in prompt map order).
+        for mode, pattern, extension in self.__prompt_automaton.matches(prompt):
             log.debug("mode={0}  pattern={1},  extension={2}".
                       format(mode, pattern, extension)) if self.verbose_level > 1 else None
-            try:
-                re.match(pattern, prompt).group()
-                ret_mode = mode
-                # Dynamically update the prompt repository used by the transistion functions
-                self.__uut_active_prompts[mode] = prompt
-                log.debug("Match.") if self.verbose_level > 1 else None
-                if not extension:
-                    # Exit on first match if no extension command.
+            ret_mode = mode
+            # Dynamically update the prompt repository used by the transistion functions
+            self.__uut_active_prompts[mode] = prompt
+            log.debug("Match.") if self.verbose_level > 1 else None
+            if not extension:
+                # Exit on first match if no extension command.
+                break
+            else:
+                # Extension command allows different mode determination when the prompt is the same
+                # for multiple modes.
+                log.debug("Extension.") if self.verbose_level > 0 else None
+                extension_flag = True
+                extension_modes.append(mode)
+                if len(extension) != 2:
+                    log.warning("Prompt map extension element MUST be of the form: ('<command>', '<pattern>').")
+                    continue
+                self.__uut_conn.send('{0}\r'.format(extension[0]), expectphrase=prompt, timeout=30, regex=True)
+                if re.search(extension[1], self.__uut_conn.recbuf):
+                    log.debug("Extension match.") if self.verbose_level > 0 else None
                     break
-                else:
-                    # Extension command allows different mode determination when the prompt is the same
-                    # for multiple modes.
-                    log.debug("Extension.") if self.verbose_level > 0 else None
-                    extension_flag = True
-                    if len(extension) != 2:
-                        log.warning("Prompt map extension element MUST be of the form: ('<command>', '<pattern>').")
-                        continue
-                    self.__uut_conn.send('{0}\r'.format(extension[0]), expectphrase=prompt, timeout=30, regex=True)
-                    if re.search(extension[1], self.__uut_conn.recbuf):
-                        log.debug("Extension match.") if self.verbose_level > 0 else None
-                        break
-            except AttributeError:
-                # Catch regex group() that are null items to allow iteration.
-                log.debug("No match.") if self.verbose_level > 2 else None
         else:
             # Iterated thru all items and no match (i.e. did not catch a break).
+            hint_mode, _ = self.__get_mode_hint()
             if not extension_flag:
                 log.warning("Cannot find a matching prompt.")
+            elif hint_mode in extension_modes:
+                log.warning("Prompt match(s) found but no extension match. The last known mode will be used.")
+                ret_mode = hint_mode
+                self.__uut_active_prompts[ret_mode] = prompt
             else:
                 log.warning("Prompt match(s) found but no extension match. The last extension prompt will be used.")
 
@@ -744,29 +764,15 @@ class ModeManager(PathFinder):
 
             # Some amount of time is needed for the recbuf to populate, esp. on slow BAUD systems or loaded servers.
             # Do this because the receive is completely unknown and we do not know what to expect or WHEN to expect it.
-            # After the first send do not check for any specific response, instead wait for a potential prompt
-            # only if the communication is not idle for the indicated time.
-            # Look for anything with a carriage return/new line OR
-            #  the Linux prompt without a carriage return (special break case).
-            speculative_prompt = r'(?:.*[\r\n]+)|(?: # )'
-            log.debug("Stimulus 1") if self.verbose_level > 0 else None
-            self.__uut_conn.send('\r', expectphrase=None, timeout=30, regex=True)
-            try:
-                self.__uut_conn.waitfor(speculative_prompt, timeout=90, idle_timeout=60, regex=True)
-            except apexceptions.IdleTimeoutException:
-                log.debug("Idle with no previous prompt.") if self.verbose_level > 0 else None
-
-            if self.__need_to_abort():
-                log.warning("Aborting prompt detection (during stimulus)...")
-                return None
-
-            log.debug("Stimulus 2") if self.verbose_level > 0 else None
-            self.__uut_conn.send('\r', expectphrase=speculative_prompt, timeout=30, idle_timeout=60, regex=True)
+            # The stimulus windows escalate from a few secs up to the long idle wait; the wait is for ANY known prompt
+            # (last known prompt first) or a well known query prompt so a responsive UUT is found in the first window.
+            _, hint_prompt = self.__get_mode_hint()
+            discovery = PromptDiscovery(self.__uut_conn, self.__prompt_automaton,
+                                        timeouts=(apexceptions.TimeoutException, apexceptions.IdleTimeoutException),
+                                        abort=self.__need_to_abort)
+            prompt = discovery.discover(hint_prompt=hint_prompt)
             # Used for deep debug; comment out normally. log.debug('recbuf = {!r}'.format(self.__uut_conn.recbuf))
-            recbuf_list = self.__uut_conn.recbuf.splitlines()
-            if recbuf_list and len(recbuf_list) > 0:
-                prompt = self.__uut_conn.recbuf.splitlines()[-1]
-            else:
+            if not prompt:
                 log.debug("Stimulus did NOT produce any discernable prompt!") if self.verbose_level > 0 else None
         except Warning as w:
             log.warning('{0}'.format(w))
@@ -819,6 +825,7 @@ class ModeManager(PathFinder):
                 self.__current_mode = mode
                 self.__current_prompt = prompt
                 self.__current_prompt_pattern = self.__uut_prompt_map.get(mode, None)
+                self.__set_mode_hint(mode, prompt)
                 break
             else:
                 # Try to check if unit is in some query prompt mode and answer default if so.
@@ -867,6 +874,30 @@ class ModeManager(PathFinder):
 
         return mode
 
+    def __get_mode_hint(self):
+        """ Get Mode Hint
+        The last known mode and its actual prompt; also kept in the UUT descriptor runtime field 'last_known_mode'
+        (saved/retrieved with the descriptor) so a new mode manager (ex. recovery after an abort) starts with it.
+        :return (tuple): (<mode>, <prompt>); (None, None) if unknown.
+        """
+        hint = self.__mode_hint if self.__mode_hint else getattr(getattr(self._callback, 'ud', None),
+                                                                 'last_known_mode', None)
+        return (hint.get('mode'), hint.get('prompt')) if isinstance(hint, dict) else (None, None)
+
+    def __set_mode_hint(self, mode, prompt=None):
+        """ Set Mode Hint
+        :param (str) mode:
+        :param (str) prompt: Actual prompt; default = the active prompt when it is a discovered prompt (not the map).
+        """
+        if not prompt:
+            prompt = self.__uut_active_prompts.get(mode)
+            prompt = prompt if prompt != self.__uut_prompt_map.get(mode) else None
+        self.__mode_hint = dict(mode=mode, prompt=prompt)
+        ud = getattr(self._callback, 'ud', None)
+        if ud is not None and hasattr(ud, 'last_known_mode'):
+            ud.last_known_mode = self.__mode_hint
+        return
+
     def __reset_active_uut_prompt_map(self):
         """ Reset Active prompts
         This should be performed after a power cycle since prompts are context sensitive and are saved.
@@ -944,6 +975,7 @@ class ModeManager(PathFinder):
                     self.__uut_mode_output[modepath[index + 1]] = self.__uut_conn.recbuf
                     # Update the current mode since the transition function was successful.
                     self.__current_mode = modepath[index + 1]
+                    self.__set_mode_hint(self.__current_mode)
 
                     # Update path history
                     # This is a tuple list [(<state>, <use_flag>), ...]
@@ -983,6 +1015,9 @@ class ModeManager(PathFinder):
         patterns for boot_msg and the boot_mode list (if supplied).
         Some well known patterns for IOS are included by default.
         Note: The active prompt repository is cleared when an implied boot occurs.
+        The boot milestones are time stamped as they arrive (see boot_tracker); the history of the milestones (per
+        product and boot target) flags a slow boot early (see the boot_tracker property).  The history may also cut
+        the boot timeout only if the ModeManager was created with adaptive_boot_timeout=True.
 
         Example of using this method:
         result, _ = xx.wait_for_boot(boot_mode=['BTLDR', 'IOS', 'IOSE'],
@@ -1006,6 +1041,12 @@ class ModeManager(PathFinder):
         all_found_items = {}
         firmware_update_event = False
         reload_event = True
+        boot_history_key = history_key(self.__boot_history_key if self.__boot_history_key else
+                                       getattr(self.__mode_module, '__name__', 'unknown'),
+                                       boot_mode=boot_mode, boot_msg=boot_msg)
+        self.__boot_tracker = BootPhaseTracker(product=boot_history_key, history_dir=self.__boot_history_dir,
+                                               adaptive_timeout=self.__adaptive_boot_timeout)
+        self.__boot_tracker.start(recbuf=self.__uut_conn.recbuf)
 
         try:
             # Beginning
@@ -1016,6 +1057,7 @@ class ModeManager(PathFinder):
                     # There has to be sufficient idle time for some UUTs that do stackpower discovery.
                     self.__uut_conn.waitfor(boot_msg, timeout=240, idle_timeout=idle_timeout, regex=True)
                     log.debug("Starting boot message found = {0}".format(boot_msg))
+                    self.__boot_tracker.scan(self.__uut_conn.recbuf)
                 except (apexceptions.TimeoutException, apexceptions.IdleTimeoutException):
                     log.warning("Start boot message not found (timed-out).")
                     log.warning("IOS variants can ignore the initial message; boot processing will proceed anyway...")
@@ -1079,18 +1121,28 @@ class ModeManager(PathFinder):
                 while not found_prompt and loop_count < 50 and not self.__need_to_abort():
 
                     active_pattern = '|'.join([boot_pattern, boot_interim_msgs]) if boot_interim_msgs else boot_pattern
-                    time.sleep(2)
                     log.debug("Wait for active pattern: loop count = {0}".
                               format(loop_count)) if self.verbose_level > 0 else None
                     log.debug("Active pattern = {0}".format(active_pattern)) if self.verbose_level > 0 else None
-                    self.__uut_conn.waitfor(active_pattern, timeout=timeout, idle_timeout=idle_timeout, regex=True)
-                    time.sleep(self.RECBUF_TIME)
+                    # The boot milestones not yet seen are also waited on so each one is time stamped as it arrives.
+                    milestone_pattern = self.__boot_tracker.pattern()
+                    wait_timeout = timeout if firmware_update_event else self.__boot_tracker.timeout(timeout)
+                    self.__uut_conn.waitfor('|'.join([active_pattern, milestone_pattern]) if milestone_pattern
+                                            else active_pattern, timeout=wait_timeout, idle_timeout=idle_timeout,
+                                            regex=True)
+                    new_milestones = self.__boot_tracker.scan(self.__uut_conn.recbuf)
+                    self.__boot_tracker.overdue()
+                    if new_milestones and not re.search(active_pattern, self.__boot_tracker.last_text):
+                        # Milestone only; keep waiting (not counted as a loop).
+                        continue
+                    time.sleep(self.BOOT_SETTLE_TIME)
 
                     # Logic tree for all patterns (well known and provided)
                     # -----------------------------------------------------
                     if re.search(boot_prompt_pattern, self.__uut_conn.recbuf):
                         log.debug("Boot prompt pattern found!.") if self.verbose_level > 0 else None
                         found_prompt = True
+                        self.__boot_tracker.mark('prompt')
 
                     elif boot_interim_msgs and re.search(boot_interim_msgs, self.__uut_conn.recbuf):
                         # The interim messages during boot up are a "one-shot" occurrence so as they are
@@ -1244,6 +1296,7 @@ class ModeManager(PathFinder):
             raise ExceptionModeManager(e.message)
         finally:
             log.debug("Is prompt found: {0}".format(found_prompt))
+            self.__boot_tracker.finish(success=found_prompt)
             return found_prompt, all_found_items
 
     def __check_transition_functions(self):
@@ -12,6 +12,9 @@ import sys
 import logging
 import argparse
 import importlib
+import heapq
+import random
+import timeit
 
 # BU Lib
 # ------
@@ -83,10 +86,19 @@ class PathFinder(object):
     }
     Key is either the node or a tuple with node and 0/1 boolean to indicate if the node is "stateful"
 
+    Routing:
+    The MINCOST and MINHOP paths for all node pairs are precomputed (Dijkstra) into a routing table the first time
+    a path is requested; any change to the state machine (add_node or statemachine setter) invalidates the table.
+    Ties are broken in favor of the path that lists its destination nodes first (same as the full traversal).
+    MAXCOST, MAXHOP, and "followpath" requests still require the full traversal of all simple paths; those results
+    are cached per source/destination pair and invalidated along with the routing table.
+
     Application of this class should be to inherit it with a higher-level class that can use the
     bestpaths for device manipulation.
     See "machinemanager.py" as an example of using this class.
     """
+    ROUTED_PATHTYPES = ['MINCOST', 'MINHOP']
+    PATHTYPES = ['MINCOST', 'MAXCOST', 'MINHOP', 'MAXHOP']
 
     def __init__(self, **kwargs):
         """
@@ -99,6 +111,8 @@ class PathFinder(object):
 
         self.__statemachine_define = kwargs.get('statemachine', {})  # Required when not using .add_node()
         self.verbose = kwargs.get('verbose', False)
+        self.__routing_table = None
+        self.__allpaths_cache = {}
 
         self.__initialize_statemachine(self.__statemachine_define)
         return
@@ -125,13 +139,19 @@ class PathFinder(object):
         self.__statemachine_define = newvalue
         self.__initialize_statemachine(newvalue)
 
+    @property
+    def routing_table(self):
+        if self.__routing_table is None:
+            self.__routing_table = self.__build_routing_table()
+        return self.__routing_table
+
     # USER Methods ----------------------------------------------------------------------------------------------------------
     #
     def show_version(self):
         log.info(self.__repr__())
 
     @func_details
-    def add_node(self, node, destnodelist=[], stateful=False):
+    def add_node(self, node, destnodelist=None, stateful=False):
         """
         Add a "node" to the state machine.  Each node contains a list of "next immediate nodes" that the
         indicated (source) node can go to (i.e. destination nodes).
@@ -146,6 +166,7 @@ class PathFinder(object):
         :return: True if the node add was successful.
         """
         ret = False
+        destnodelist = destnodelist if destnodelist else []
         try:
             if node in self.statedefinitions:
                 log.warning("{0} already exists, destination node list will be updated instead.".format(node))
@@ -159,14 +180,25 @@ class PathFinder(object):
             # Append this node to the state table definition and indicate it is not stateful.
             self.statedefinitions[node] = destnodelist
             self.statefulnodes[node] = stateful
+            self.invalidate_routes()
             ret = True
         except Exception as e:
             log.exception("{0}: {1}".format(type(e).__name__.upper(), e.message))
         finally:
             return ret
 
+    def invalidate_routes(self):
+        """ Invalidate Routes
+        Discard the precomputed routing table and cached traversals; they are rebuilt on the next path request.
+        Call this if the statedefinitions are modified directly (i.e. not via add_node or the statemachine setter).
+        :return:
+        """
+        self.__routing_table = None
+        self.__allpaths_cache = {}
+        return
+
     @func_details
-    def get_path(self, srcnode='', dstnode='', pathtype='MINCOST', withcost=False, followpath=[]):
+    def get_path(self, srcnode='', dstnode='', pathtype='MINCOST', withcost=False, followpath=None):
         """
         Get the path for the given source & destination nodes and path type.
         Primarily intended to be used by other processing functions which should provide direct action to
@@ -180,10 +212,8 @@ class PathFinder(object):
         :return: List of nodes in ordered sequence representing a 'path' to the desired destination.
         """
         pathsequence = []
+        followpath = [] if followpath is None else followpath
         try:
-            allpossiblepaths = {}
-            allpossiblepathmetrics = {}
-
             # Validate the inputs
             if srcnode not in self.statedefinitions:
                 msg = "Source Mode '{0}' is unknown.".format(srcnode)
@@ -195,14 +225,19 @@ class PathFinder(object):
                 msg = "Followpath '{0}' is not a list.".format(followpath)
                 raise Exception(msg)
 
-            # Do the heavy work!
-            self.__traverse(srcnode, dstnode, allpossiblepaths)
-            pathmetrics = self.__pathmetrics(allpossiblepaths, allpossiblepathmetrics)
-
-            # More input validation at post-processing.
-            if pathtype not in pathmetrics:
+            if pathtype not in self.PATHTYPES:
                 raise Exception("Unknown path type requested.")
 
+            # Fast path: precomputed routing table.
+            if pathtype in self.ROUTED_PATHTYPES and not followpath:
+                route = self.routing_table[pathtype].get(srcnode, {}).get(dstnode, [])
+                pathsequence = list(route) if withcost else [segment[0] for segment in route]
+                log.info("Best Path for {0} = {1}\n".format(pathtype, pathsequence)) if self.verbose and route else None
+                return pathsequence
+
+            # Do the heavy work!
+            allpossiblepaths, allpossiblepathmetrics, pathmetrics = self.__get_all_paths(srcnode, dstnode)
+
             # Do some detailed printing if requested.
             if self.verbose:
                 log.debug("-" * 60)
@@ -267,7 +302,7 @@ class PathFinder(object):
 
                 # 2. Check if the "costing feature" was requested.
                 if withcost:
-                    pathsequence = allpossiblepaths[pathmetrics[pathtype][0]]
+                    pathsequence = list(allpossiblepaths[pathmetrics[pathtype][0]])
                 else:
                     pathsequence = statesonlypathsequence
 
@@ -333,6 +368,7 @@ class PathFinder(object):
     def __initialize_statemachine(self, statemachine_define):
         self.statedefinitions = {}
         self.statefulnodes = {}
+        self.invalidate_routes()
 
         # If a dict method was used for input, process the data into the appropriate attributes.
         #  The keys in a statemachine_define dict can be a tuple (for stateful nodes), therefore need to break apart.
@@ -346,7 +382,73 @@ class PathFinder(object):
                     self.statedefinitions[kn] = statemachine_define[k]
                     self.statefulnodes[kn] = k[1]
 
-    def __traverse(self, src, dst, validpathcollection={}, currentpath=[], _pathindex=1, _originalsrc=None):
+    def __build_routing_table(self):
+        """
+        Build the all-pairs routing table for the MINCOST and MINHOP path types.
+        :return: Dict of {<pathtype>: {<srcnode>: {<dstnode>: [(<node>, <cost>), ...]}}}
+        """
+        routing_table = {}
+        for pathtype in self.ROUTED_PATHTYPES:
+            routing_table[pathtype] = {}
+            for srcnode in self.statedefinitions:
+                routing_table[pathtype][srcnode] = self.__shortest_paths(srcnode, hops=(pathtype == 'MINHOP'))
+        log.debug("Routing table built for {0} nodes.".format(len(self.statedefinitions))) if self.verbose else None
+        return routing_table
+
+    def __shortest_paths(self, src, hops=False):
+        """
+        Dijkstra single-source shortest paths.
+        The heap key is (<metric>, <branch index sequence>) so that equal metric paths resolve to the path found
+        first by the full traversal (i.e. the lexicographically lowest sequence of destination list positions).
+        :param src: Source Node
+        :param hops: True = every segment has a metric of 1 (MINHOP); False = use the segment cost (MINCOST).
+        :return: Dict of {<dstnode>: [(<node>, <cost>), ...]} for all reachable destinations (excluding src).
+        """
+        routes = {}
+        settled = set()
+        heap = [(0, (), src, [(src, 0)])]
+        while heap:
+            metric, branchseq, node, path = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node != src:
+                routes[node] = path
+            for i, (nextnode, cost) in enumerate(self.statedefinitions.get(node, [])):
+                if nextnode in settled or nextnode not in self.statedefinitions:
+                    continue
+                heapq.heappush(heap, (metric + (1 if hops else cost), branchseq + (i,), nextnode,
+                                      path + [(nextnode, cost)]))
+        return routes
+
+    def __get_all_paths(self, srcnode, dstnode):
+        """
+        Full traversal of all simple paths (cached per source/destination pair).
+        :param srcnode: Source Node
+        :param dstnode: Destination Node
+        :return: Tuple of (allpossiblepaths, allpossiblepathmetrics, pathmetrics)
+        """
+        key = (srcnode, dstnode)
+        if key not in self.__allpaths_cache:
+            allpossiblepaths = {}
+            allpossiblepathmetrics = {}
+            self.__traverse(srcnode, dstnode, allpossiblepaths)
+            pathmetrics = self.__pathmetrics(allpossiblepaths, allpossiblepathmetrics)
+            self.__allpaths_cache[key] = (allpossiblepaths, allpossiblepathmetrics, pathmetrics)
+        allpossiblepaths, allpossiblepathmetrics, pathmetrics = self.__allpaths_cache[key]
+        return dict(allpossiblepaths), dict(allpossiblepathmetrics), dict(pathmetrics)
+
+    def _traverse_path(self, srcnode, dstnode, pathtype='MINCOST'):
+        """
+        Uncached full traversal (the original algorithm); used for benchmarking and verification of the routing table.
+        :return: List of (<node>, <cost>) for the requested path type.
+        """
+        allpossiblepaths = {}
+        self.__traverse(srcnode, dstnode, allpossiblepaths)
+        pathmetrics = self.__pathmetrics(allpossiblepaths, {})
+        return allpossiblepaths[pathmetrics[pathtype][0]] if allpossiblepaths else []
+
+    def __traverse(self, src, dst, validpathcollection=None, currentpath=None, _pathindex=1, _originalsrc=None):
         """
         Recursively traverse the the entire state machine of nodes and their paths to determine all possible paths from
         the given source to the given destination.
@@ -360,6 +462,8 @@ class PathFinder(object):
         :return: True if node in branch list was a valid path (for future use if needed, serves as placeholder).
         """
         validpath = False
+        validpathcollection = {} if validpathcollection is None else validpathcollection
+        currentpath = [] if currentpath is None else currentpath
 
         # First time into the routine
         if _originalsrc is None:
@@ -415,7 +519,7 @@ class PathFinder(object):
 
         return validpath
 
-    def __pathmetrics(self, allpossiblepaths, metriccollection={}):
+    def __pathmetrics(self, allpossiblepaths, metriccollection=None):
         """
         Collect the minimum and maximum cost & hop for each path of all possible paths.
         From the metric collection, determine the first paths of minimum and maximum for cost and hop.
@@ -425,6 +529,7 @@ class PathFinder(object):
         {'MINCOST':tuple, 'MAXCOST':tuple, 'MINHOP':tuple, 'MAXHOP':tuple} where tuple = (<pathindex>, <value>).
         """
         pathmetrics = {'MINCOST': None, 'MAXCOST': None, 'MINHOP': None, 'MAXHOP': None}
+        metriccollection = {} if metriccollection is None else metriccollection
         try:
             # Collect up costs and hops for each possible path.
             for pathindex in range(1, len(allpossiblepaths) + 1):
@@ -536,6 +641,50 @@ def get_config(cfg_module_name):
         return _state_machine
 
 
+def build_random_state_machine(node_count=12, max_branches=4, max_cost=10, seed=0):
+    """ Build Random State Machine
+    Generate a connected state machine definition for benchmarking.
+    :param (int) node_count:
+    :param (int) max_branches: Max destination nodes per node.
+    :param (int) max_cost:
+    :param (int) seed: Random seed for a repeatable definition.
+    :return (dict): State machine definition.
+    """
+    rnd = random.Random(seed)
+    nodes = ['N{0}'.format(i) for i in range(node_count)]
+    _state_machine = {}
+    for i, node in enumerate(nodes):
+        # Ring segment guarantees every node is reachable.
+        destnodes = [(nodes[(i + 1) % node_count], rnd.randint(1, max_cost))]
+        for destnode in rnd.sample(nodes, min(max_branches, node_count)):
+            if destnode != node and destnode not in [d[0] for d in destnodes] and len(destnodes) < max_branches:
+                destnodes.append((destnode, rnd.randint(1, max_cost)))
+        _state_machine[node] = destnodes
+    return _state_machine
+
+
+def benchmark(state_machine, pathtype='MINCOST', iterations=3):
+    """ Benchmark
+    Compare the routed path lookup against the full traversal for all node pairs of the given state machine.
+    :param (dict) state_machine: State machine definition.
+    :param (str) pathtype: MINCOST or MINHOP
+    :param (int) iterations:
+    :return (dict): {'traverse': <secs>, 'routed': <secs>, 'build': <secs>, 'pairs': <count>, 'mismatches': <count>}
+    """
+    pf = PathFinder(statemachine=state_machine)
+    pairs = [(s, d) for s in pf.statedefinitions for d in pf.statedefinitions if s != d]
+    pf.invalidate_routes()
+    build_time = timeit.timeit(lambda: pf.routing_table, number=1)
+    routed = timeit.timeit(lambda: [pf.get_path(s, d, pathtype, withcost=True) for s, d in pairs], number=iterations)
+    traverse = timeit.timeit(lambda: [pf._traverse_path(s, d, pathtype) for s, d in pairs], number=iterations)
+    mismatches = [(s, d) for s, d in pairs if pf.get_path(s, d, pathtype, withcost=True) != pf._traverse_path(s, d, pathtype)]
+    results = {'traverse': traverse / iterations, 'routed': routed / iterations, 'build': build_time,
+               'pairs': len(pairs), 'mismatches': len(mismatches)}
+    log.info("Benchmark {0}: nodes={1} pairs={2} build={3:.6f}s routed={4:.6f}s traverse={5:.6f}s mismatches={6}".format(
+        pathtype, len(pf.statedefinitions), len(pairs), build_time, results['routed'], results['traverse'], len(mismatches)))
+    return results
+
+
 if __name__ == '__main__':
     # Use this for standalone execution.
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -553,6 +702,9 @@ if __name__ == '__main__':
                         help="Ending node when determining path.")
     parser.add_argument("-f", "--followpath", dest="followpath", default=None, action="store",
                         help="Follow path for stateful nodes.")
+    parser.add_argument("-b", "--benchmark", dest="benchmark", default=0, type=int, action="store",
+                        help="Benchmark the routing table vs the full traversal using a random state machine "
+                             "with the given number of nodes (or the module state machine if given).")
 
     args = parser.parse_args()
     smd = {}
@@ -573,4 +725,9 @@ if __name__ == '__main__':
         bestpath = pf.get_path(args.startnode, args.endnode, followpath=fp)
         print(bestpath)
 
+    if args.benchmark:
+        sm = get_config(args.module) if args.module else build_random_state_machine(node_count=args.benchmark)
+        for pt in PathFinder.ROUTED_PATHTYPES:
+            print(benchmark(sm, pathtype=pt))
+
     sys.exit(0)
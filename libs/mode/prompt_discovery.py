@@ -0,0 +1,173 @@
+"""
+========================================================================================================================
+Prompt Discovery
+========================================================================================================================
+
+Fast discovery of the current UUT prompt for the Mode Manager.
+
+Current mode detection sent two carriage returns with long idle waits (90/60 secs) and then matched the last line
+against each pattern of the prompt map in turn, repeated over 3 attempts; an unknown state (ex. after an abort)
+could take minutes to resolve.  This module provides:
+    1. PromptAutomaton: the prompt map precompiled into one combined regex (first match in map order, same result
+       as matching each pattern in turn); also used as the wait pattern so the console wait returns as soon as
+       ANY known prompt arrives.
+    2. PromptDiscovery: short, escalating stimulus windows (a few secs first, the legacy idle wait last); the
+       escalation stops as soon as a known prompt is found or the same unknown prompt is seen twice (stable).
+    3. A last-known-mode hint (mode + actual prompt) that is waited on first and breaks the tie of prompts that
+       are shared by more than one mode (see ModeManager; the hint is kept in the UUT descriptor runtime
+       field last_known_mode).
+
+Usage:
+    automaton = PromptAutomaton(uut_prompt_map)
+    discovery = PromptDiscovery(uut_conn, automaton, timeouts=(TimeoutException, IdleTimeoutException))
+    prompt = discovery.discover(hint_prompt='Nyquist> ')
+    mode = automaton.first(prompt)
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import logging
+
+
+__title__ = "Prompt Discovery"
+__version__ = '2.0.0'
+__author__ = 'bborel'
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+# (timeout, idle_timeout) secs per stimulus
+STIMULUS_WINDOWS = [(3, 2), (10, 5), (30, 15), (90, 60)]
+# Well known query prompts (answered by the Mode Manager) and the Linux prompt w/o a line end; stop waiting on these.
+QUERY_PROMPTS = [r'\[[yY](?:[eE][sS])?\]', r'\[[rR][eE][tT][uU][rR][nN]\]', r'[cC]ommand.*: ', r' # ']
+# Inline flags or back references change meaning when patterns are combined.
+_NO_COMBINE_RE = re.compile(r'\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=')
+
+
+class PromptAutomaton(object):
+    """ Prompt Automaton
+    """
+    def __init__(self, prompt_map):
+        """
+        :param (list) prompt_map: [(<mode>, <pattern>), (<mode>, <pattern>, (<command>, <pattern>)), ...] in
+                                  match priority order (i.e. the raw uut_prompt_map).
+        """
+        self.entries = [(item[0], item[1], item[2] if len(item) == 3 else None) for item in prompt_map or []]
+        self._compiled = [re.compile(pattern) for _, pattern, _ in self.entries]
+        self._combined = None
+        if self.entries and not any([_NO_COMBINE_RE.search(pattern) for _, pattern, _ in self.entries]):
+            try:
+                self._combined = re.compile('|'.join(['(?P<_p{0}>{1})'.format(i, pattern)
+                                                      for i, (_, pattern, _) in enumerate(self.entries)]))
+            except (re.error, AssertionError) as e:
+                log.debug("Prompt patterns not combined ({0}).".format(e))
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def pattern(self):
+        """ Combined regex of all prompts (for a console wait). """
+        return '|'.join(['(?:{0})'.format(pattern) for _, pattern, _ in self.entries])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def matches(self, prompt):
+        """ Matches
+        :param (str) prompt: Actual prompt (last line from the UUT).
+        :return (generator): (<mode>, <pattern>, <extension>) of each matching entry in map order.
+        """
+        if not prompt:
+            return
+        start = 0
+        if self._combined:
+            m = self._combined.match(prompt)
+            if not m:
+                return
+            start = min([int(k[2:]) for k, v in m.groupdict().items() if k.startswith('_p') and v is not None])
+        for i in range(start, len(self.entries)):
+            if self._compiled[i].match(prompt):
+                yield self.entries[i]
+
+    def first(self, prompt):
+        """ First
+        :return (str): Mode of the first matching entry (extensions not resolved); None if no match.
+        """
+        for mode, _, _ in self.matches(prompt):
+            return mode
+        return None
+
+    def wait_pattern(self, hint_prompt=None):
+        """ Wait Pattern
+        :param (str) hint_prompt: Actual prompt of the last known mode; waited on first.
+        :return (str):
+        """
+        patterns = ['(?:{0})'.format(re.escape(hint_prompt))] if hint_prompt else []
+        patterns += ['(?:{0})'.format(p) for p in QUERY_PROMPTS]
+        return '|'.join(patterns + [self.pattern]) if self.entries else '|'.join(patterns)
+
+
+class PromptDiscovery(object):
+    """ Prompt Discovery
+    """
+    def __init__(self, conn, automaton, windows=None, timeouts=(), abort=None):
+        """
+        :param (obj) conn: UUT connection (Apollo); uses send(), waitfor() and recbuf.
+        :param (PromptAutomaton) automaton:
+        :param (list) windows: [(<timeout>, <idle_timeout>), ...] escalating stimulus windows.
+        :param (tuple) timeouts: Exception classes of the connection for a timed-out wait.
+        :param (func) abort: Returns True when the discovery should stop.
+        """
+        self.conn = conn
+        self.automaton = automaton
+        self.windows = windows if windows else STIMULUS_WINDOWS
+        self.timeouts = tuple(timeouts)
+        self.abort = abort
+        self.stimuli = 0
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def discover(self, hint_prompt=None):
+        """ Discover
+        :param (str) hint_prompt: Actual prompt of the last known mode.
+        :return (str): Last line from the UUT (the prompt); None if nothing was received.
+        """
+        pattern = self.automaton.wait_pattern(hint_prompt)
+        prompt, previous = None, None
+        self.stimuli = 0
+        for timeout, idle_timeout in self.windows:
+            if self.abort and self.abort():
+                log.warning("Aborting prompt discovery...")
+                return None
+            self.stimuli += 1
+            log.debug("Stimulus {0} ({1}/{2} secs)".format(self.stimuli, timeout, idle_timeout))
+            self.conn.send('\r', expectphrase=None, timeout=30, regex=True)
+            try:
+                self.conn.waitfor(pattern, timeout=timeout, idle_timeout=idle_timeout, regex=True)
+            except self.timeouts:
+                log.debug("No known prompt within {0} secs.".format(timeout))
+            prompt = last_line(self.conn.recbuf)
+            if prompt and self.automaton.first(prompt):
+                break
+            if prompt and prompt == previous:
+                log.debug("Stable unknown prompt.")
+                break
+            previous = prompt
+        return prompt
+
+
+def last_line(text):
+    """ Last line (non-empty) of the console text; None if there is none. """
+    lines = [line for line in (text or '').splitlines() if line.strip()]
+    return lines[-1] if lines else None
@@ -0,0 +1,40 @@
+"""
+Prompt Corpus
+Console tails captured from UUTs (last stimulus response) with the expected mode; used for replay tests.
+"""
+
+__title__ = 'EntSw Prompt Corpus'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+uut_prompt_map = [
+    ('BTLDR', 'switch:', ('version', 'System Bootstrap')),
+    ('GOLDBTLDR', 'switch:', ('version', 'Golden')),
+    ('IOS', '[sS]witch>'),
+    ('IOSE', '[sS]witch#'),
+    ('IOSECFG', r'[sS]witch\(config\)#'),
+    ('DIAG', 'Diag>'),
+    ('TRAF', 'Traf>'),
+    ('SYMSH', '-> '),
+    ('LINUX', r'(?:~ # )|(?:/[a-zA-Z][\S]* # )'),
+    ('STARDUST', r'(?:Stardust> )|(?:[A-Z][\S]*> )'),
+]
+
+captures = [
+    ('\r\nswitch: \r\nswitch: ', 'BTLDR'),
+    ('\r\n\r\nSwitch>\r\nSwitch>', 'IOS'),
+    ('\r\nswitch#', 'IOSE'),
+    ('\r\nSwitch(config)#', 'IOSECFG'),
+    ('\r\n\r\nDiag> ', 'DIAG'),
+    ('\r\nTraf> ', 'TRAF'),
+    ('\r\n-> ', 'SYMSH'),
+    ('\r\n~ # \r\n~ # ', 'LINUX'),
+    ('\r\n/mnt/flash3 # ', 'LINUX'),
+    ('\r\nNyquist> \r\nNyquist> ', 'STARDUST'),
+    ('\r\nStardust> ', 'STARDUST'),
+    ('SysMem: PASSED\r\nHomestead> ', 'STARDUST'),
+    ('\r\nWould you like to enter the initial configuration dialog? [yes/no]: ', None),
+    ('\r\nProceed with reload? [confirm]', None),
+    ('\r\n# ', None),
+    ('\r\n', None),
+]
@@ -0,0 +1,65 @@
+"""
+---------------------------------------------------------------------
+Transition Functions for the UUT simulator (see sim_transcript)
+---------------------------------------------------------------------
+"""
+# Python
+# ------
+import logging
+
+
+__title__ = 'EntSw Simulator Mode Module'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+uut_state_machine = {
+    'BTLDR': [('LINUX', 5), ('IOS', 10)],
+    'LINUX': [('BTLDR', 7), ('STARDUST', 3)],
+    'STARDUST': [('LINUX', 4)],
+    'IOS': [('IOSE', 2)],
+    'IOSE': [('BTLDR', 10)],
+}
+
+
+def btldr_to_linux(pp, **kwargs):
+    pp.uut_conn.send('boot flash:V160.SSA\r', expectphrase=pp.mode_mgr.uut_prompt_map['LINUX'], timeout=60, regex=True)
+    return True
+
+
+def btldr_to_ios(pp, **kwargs):
+    pp.uut_conn.send('boot flash:cat9k_iosxe.bin\r', expectphrase=None, timeout=30)
+    boot_result, _ = pp.mode_mgr.wait_for_boot(boot_mode=['IOS'], boot_msg='attempting to boot',
+                                               timeout=60, idle_timeout=30)
+    return boot_result
+
+
+def linux_to_btldr(pp, **kwargs):
+    return _reset(pp)
+
+
+def linux_to_stardust(pp, **kwargs):
+    pp.uut_conn.send('Stardust\r', expectphrase=pp.mode_mgr.uut_prompt_map['STARDUST'], timeout=60, regex=True)
+    return True
+
+
+def stardust_to_linux(pp, **kwargs):
+    pp.uut_conn.send('exit\r', expectphrase=pp.mode_mgr.uut_prompt_map['LINUX'], timeout=60, regex=True)
+    return True
+
+
+def ios_to_iose(pp, **kwargs):
+    pp.uut_conn.send('enable\r', expectphrase=pp.mode_mgr.uut_prompt_map['IOSE'], timeout=30, regex=True)
+    return True
+
+
+def iose_to_btldr(pp, **kwargs):
+    return _reset(pp)
+
+
+def _reset(pp):
+    pp.uut_conn.send('reset\r', expectphrase=None, timeout=30)
+    boot_result, _ = pp.mode_mgr.wait_for_boot(boot_mode=['BTLDR'], boot_msg='System Bootstrap',
+                                               timeout=60, idle_timeout=30)
+    return boot_result
@@ -0,0 +1,69 @@
+"""
+Simulator Transcript
+Condensed C9300 console transcript (rommon, Linux, Stardust diags and IOS) for the UUT simulator tests.
+Timing is in UUT secs.
+"""
+
+__title__ = 'EntSw Simulator Transcript'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+uut_prompt_map = [
+    ('BTLDR', 'switch:'),
+    ('IOS', '[sS]witch>'),
+    ('IOSE', '[sS]witch#'),
+    ('LINUX', r'(?:~ # )|(?:/[a-zA-Z][\S]* # )'),
+    ('STARDUST', r'(?:Stardust> )|(?:[A-Z][\S]*> )'),
+]
+
+transcript = {
+    'name': 'C9300 Nyquist',
+    'mode': 'OFF',
+    'prompts': {
+        'BTLDR': 'switch: ',
+        'LINUX': '~ # ',
+        'STARDUST': 'Nyquist> ',
+        'IOS': 'Switch>',
+        'IOSE': 'Switch#',
+    },
+    'sequences': {
+        'boot': {
+            'chunks': [[0.5, 'Initializing Hardware......\r\n'],
+                       [1.0, '\r\nSystem Bootstrap, Version 16.6.1r [FC1], RELEASE SOFTWARE (P)\r\n'],
+                       [0.5, 'Current image running: Primary Rommon Image\r\n\r\n']],
+            'mode': 'BTLDR',
+        },
+        'ios_boot': {
+            'chunks': [[1.0, 'boot: attempting to boot from [flash:cat9k_iosxe.bin]\r\n'],
+                       [2.0, 'Restricted Rights Legend\r\n'],
+                       [2.0, '\r\nPress RETURN to get started!\r\n']],
+            'mode': 'IOS',
+            'prompt': False,
+        },
+    },
+    'commands': {
+        'BTLDR': [
+            {'cmd': r'^set$', 'chunks': [[0.2, 'MAC_ADDR=00:11:22:33:44:55\r\nMODEL_NUM=C9300-48UXM\r\n']]},
+            {'cmd': r'^boot flash:.*\.SSA', 'chunks': [[1.0, 'Loading "flash:V160.SSA"\r\n'],
+                                                       [2.0, 'Linux version 4.4.91\r\n']], 'mode': 'LINUX'},
+            {'cmd': r'^boot ', 'sequence': 'ios_boot'},
+        ],
+        'LINUX': [
+            {'cmd': r'^Stardust$', 'chunks': [[1.5, 'Stardust v2.15 (Nyquist)\r\n']], 'mode': 'STARDUST'},
+        ],
+        'STARDUST': [
+            {'cmd': r'^SysMem', 'chunks': [[0.5, 'SysMem: testing...\r\n'], [1.0, 'SysMem: PASSED\r\n']]},
+            {'cmd': r'^exit$', 'chunks': [[0.2, '']], 'mode': 'LINUX'},
+        ],
+        'IOS': [
+            {'cmd': r'^en(able)?$', 'chunks': [], 'mode': 'IOSE'},
+        ],
+        '*': [
+            {'cmd': r'^reset$', 'chunks': [[0.1, 'Resetting...\r\n']], 'sequence': 'boot'},
+        ],
+    },
+    'unknown': {
+        'BTLDR': 'Unknown cmd\r\n',
+        'STARDUST': 'ERR: unknown command\r\n',
+    },
+}
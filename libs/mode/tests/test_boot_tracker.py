@@ -0,0 +1,109 @@
+import logging
+import time
+import shutil
+import tempfile
+import threading
+
+from .. import boot_tracker
+
+__title__ = 'EntSw Boot Phase Tracker Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestBootPhaseTracker(object):
+
+    def setup_method(self, method):
+        self.history_dir = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.history_dir)
+
+    def __tracker(self, **kwargs):
+        return boot_tracker.BootPhaseTracker(product='C9300.Nyquist', history_dir=self.history_dir, **kwargs)
+
+    def test_streaming_scan(self):
+        tracker = self.__tracker()
+        tracker.start(recbuf='old Press RETURN\n')
+        recbuf = 'old Press RETURN\nSystem Bootstrap, Version 16.6.1r\n'
+        assert tracker.scan(recbuf) == ['rommon']
+        assert tracker.last_text == 'System Bootstrap, Version 16.6.1r\n'
+        recbuf += 'boot: attempting to boot from [flash:cat9k.bin]\nLinux version 4.4.'
+        assert tracker.scan(recbuf) == ['image_load', 'kernel']
+        assert tracker.scan(recbuf) == [] and tracker.last_text == ''
+        assert tracker.pattern() == '(?:(?:Press RETURN))'
+        # Buffer cleared (ex. reload)
+        assert tracker.scan('Press RETURN to get started!') == ['ios_ready']
+        assert tracker.pattern() is None
+        tracker.mark('prompt')
+        assert list(tracker.seen.keys()) == ['rommon', 'image_load', 'kernel', 'ios_ready', 'prompt']
+        assert list(tracker.phases().keys()) == list(tracker.seen.keys())
+        assert tracker.timeout(600) == 600  # No history
+
+    def test_history_and_adaptive_timeout(self):
+        for total in [100.0, 110.0, 120.0]:
+            tracker = self.__tracker()
+            tracker.start()
+            tracker._start = time.time() - total
+            tracker.scan('System Bootstrap')
+            tracker.mark('prompt')
+            tracker.finish(success=True)
+        tracker = self.__tracker()
+        tracker.start()
+        tracker.finish(success=False)
+
+        tracker = self.__tracker(history_size=3)
+        assert len(tracker.history) == 4
+        assert 120.0 <= tracker.expected('total') < 121.0
+        assert 120.0 <= tracker.expected('prompt') < 121.0
+        tracker.start()
+        # The caller's timeout is never cut unless opted in.
+        assert tracker.timeout(600) == 600
+        tracker.adaptive_timeout = True
+        assert 240 <= tracker.timeout(600) <= 242
+        assert tracker.timeout(200) == 200
+        tracker.finish(success=True)
+        assert len(self.__tracker().history) == 3
+
+    def test_concurrent_history(self):
+        # Containers booting at the same time all load the history before any of them finishes.
+        trackers = [self.__tracker() for _ in range(4)]
+        for tracker in trackers:
+            tracker.start()
+            tracker.mark('prompt')
+        threads = [threading.Thread(target=tracker.finish, args=(True,)) for tracker in trackers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(self.__tracker().history) == 4
+        self.__tracker(history_size=3).finish(success=True)
+        assert len(self.__tracker().history) == 3
+
+    def test_slow_boot(self):
+        tracker = self.__tracker()
+        tracker._history = [dict(ok=True, total=60.0, phases={'rommon': 2.0, 'kernel': 20.0}) for _ in range(5)]
+        tracker.start()
+        tracker._start = time.time() - 10.0
+        assert tracker.overdue() == ['rommon']
+        assert tracker.overdue() == []
+        tracker.scan('System Bootstrap\nStarting kernel')
+        assert [s[0] for s in tracker.slow] == ['rommon']
+        tracker._start = time.time() - 40.0
+        tracker.scan('System Bootstrap\nStarting kernel ... Linux version')
+        assert tracker.seen['kernel'] < 20.0 * 1.5
+
+    def test_history_key(self):
+        ios = boot_tracker.history_key('C9300.Nyquist', boot_mode=['IOSE', 'IOS'], boot_msg='(?:Booting)')
+        assert ios.startswith('C9300.Nyquist.IOS.IOSE.')
+        assert ios == boot_tracker.history_key('C9300.Nyquist', boot_mode=['IOS', 'IOSE'], boot_msg='(?:Booting)')
+        assert boot_tracker.history_key('C9300.Nyquist', boot_mode='BTLDR') == 'C9300.Nyquist.BTLDR'
+        # Quick rommon boots do not shorten the expected time of a full IOS boot.
+        btldr = boot_tracker.BootPhaseTracker(product=boot_tracker.history_key('C9300.Nyquist', boot_mode='BTLDR'),
+                                              history_dir=self.history_dir)
+        btldr._history = [dict(ok=True, total=5.0, phases={}) for _ in range(5)]
+        btldr.finish(success=True)
+        assert self.__tracker().history == []
+        assert boot_tracker.BootPhaseTracker(product=ios, history_dir=self.history_dir).history == []
@@ -1,6 +1,8 @@
 import logging
 
 from ..pathfinder import PathFinder
+from ..pathfinder import build_random_state_machine
+from ..pathfinder import benchmark
 from ..modemanager import ModeManager
 
 __title__ = 'EntSw General Library Mode Unit Tests'
@@ -102,3 +104,18 @@ class TestMach(object):
         assert ['STARDUST', 'SYMSH'] == sm.get_path('STARDUST', 'SYMSH')
         assert ['SYMSH', 'STARDUST', 'LINUX', 'BTLDR', 'IOS', 'IOSE'] == sm.get_path('SYMSH', 'IOSE')
 
+    def test_pathfinder_routing_table(self):
+        sm = PathFinder(statemachine=TestMach.uut_state_machine2)
+        for src in sm.statedefinitions:
+            for dst in sm.statedefinitions:
+                for pathtype in PathFinder.ROUTED_PATHTYPES:
+                    assert sm.get_path(src, dst, pathtype, withcost=True) == sm._traverse_path(src, dst, pathtype)
+        assert ['IOS', 'IOSE', 'IOSCFG'] == sm.get_path('IOS', 'IOSCFG')
+        # Invalidation on add_node
+        sm.add_node('IOS', [('IOSE', 2), ('IOSCFG', 1)])
+        assert ['IOS', 'IOSCFG'] == sm.get_path('IOS', 'IOSCFG')
+
+    def test_pathfinder_benchmark(self):
+        results = benchmark(build_random_state_machine(node_count=9), pathtype='MINCOST', iterations=1)
+        assert results['mismatches'] == 0
+        assert results['routed'] < results['traverse']
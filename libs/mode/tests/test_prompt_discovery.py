@@ -0,0 +1,89 @@
+import logging
+import re
+
+from .. import prompt_discovery
+from . import prompt_corpus
+
+__title__ = 'EntSw Prompt Discovery Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class FakeTimeout(Exception):
+    pass
+
+
+class FakeConn(object):
+    """ Replays a UUT console: one response per stimulus (None = no response). """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.recbuf = ''
+        self.waits = []
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False):
+        response = self.responses.pop(0) if self.responses else None
+        self.recbuf += response if response else ''
+
+    def waitfor(self, pattern, timeout=30, idle_timeout=None, regex=False):
+        self.waits.append((pattern, timeout))
+        if not re.search(pattern, self.recbuf):
+            raise FakeTimeout()
+
+
+def legacy_prompt_to_mode(prompt_map, prompt):
+    for item_set in prompt_map:
+        if re.match(item_set[1], prompt):
+            return item_set[0]
+    return None
+
+
+class TestPromptDiscovery(object):
+
+    def setup_method(self, method):
+        self.automaton = prompt_discovery.PromptAutomaton(prompt_corpus.uut_prompt_map)
+
+    def teardown_method(self, method):
+        pass
+
+    def test_corpus(self):
+        assert self.automaton._combined is not None
+        for capture, expected in prompt_corpus.captures:
+            prompt = prompt_discovery.last_line(capture)
+            assert self.automaton.first(prompt) == expected, capture
+            assert legacy_prompt_to_mode(prompt_corpus.uut_prompt_map, prompt or '') == expected
+        assert [m[0] for m in self.automaton.matches('switch: ')] == ['BTLDR', 'GOLDBTLDR']
+        assert [m[0] for m in self.automaton.matches('Switch> ')] == ['IOS', 'STARDUST']
+        # Inline flags are not combined; same results.
+        automaton = prompt_discovery.PromptAutomaton([('IOS', '(?i)switch>'), ('STARDUST', r'[A-Z]\S*> ')])
+        assert automaton._combined is None
+        assert automaton.first('SWITCH>') == 'IOS' and automaton.first('Nyquist> ') == 'STARDUST'
+
+    def test_escalating_stimulus(self):
+        # Slow UUT: nothing on the first stimulus.
+        conn = FakeConn([None, '\r\nNyquist> '])
+        discovery = prompt_discovery.PromptDiscovery(conn, self.automaton, timeouts=(FakeTimeout,))
+        assert discovery.discover(hint_prompt='Nyquist> ') == 'Nyquist> '
+        assert discovery.stimuli == 2
+        assert [t for _, t in conn.waits] == [3, 10]
+        assert conn.waits[0][0].startswith('(?:{0})|'.format(re.escape('Nyquist> ')))
+
+        # Responsive UUT: first window only.
+        conn = FakeConn(['\r\nswitch: '])
+        discovery = prompt_discovery.PromptDiscovery(conn, self.automaton, timeouts=(FakeTimeout,))
+        assert discovery.discover() == 'switch: ' and discovery.stimuli == 1
+
+    def test_unknown_and_abort(self):
+        # A stable unknown prompt stops the escalation.
+        query = '\r\nProceed with reload? [confirm]'
+        conn = FakeConn([query, query, query, query])
+        discovery = prompt_discovery.PromptDiscovery(conn, self.automaton, timeouts=(FakeTimeout,))
+        assert discovery.discover() == 'Proceed with reload? [confirm]' and discovery.stimuli == 2
+
+        conn = FakeConn([])
+        discovery = prompt_discovery.PromptDiscovery(conn, self.automaton, timeouts=(FakeTimeout,))
+        assert discovery.discover() is None and discovery.stimuli == len(prompt_discovery.STIMULUS_WINDOWS)
+
+        discovery = prompt_discovery.PromptDiscovery(conn, self.automaton, abort=lambda: True)
+        assert discovery.discover() is None and discovery.stimuli == 0
@@ -0,0 +1,165 @@
+import logging
+import copy
+import time
+import shutil
+import tempfile
+
+from .. import uut_simulator
+from .. import prompt_discovery
+from .. import boot_tracker
+from . import sim_transcript
+from . import sim_mode
+
+__title__ = 'EntSw UUT Simulator Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+SPEED = 50.0
+
+
+class TestUutSimulator(object):
+
+    def setup_method(self, method):
+        self.conn = uut_simulator.SimulatedUutConn(copy.deepcopy(sim_transcript.transcript), speed=SPEED)
+
+    def teardown_method(self, method):
+        pass
+
+    def test_rommon_linux_stardust(self):
+        conn = self.conn
+        start = time.time()
+        conn.power_on()
+        conn.waitfor('switch: ', timeout=60, idle_timeout=30)
+        assert 'System Bootstrap' in conn.recbuf and conn.mode == 'BTLDR'
+        assert (time.time() - start) * SPEED >= 2.0
+        conn.send('set\r', expectphrase='switch: ', timeout=30)
+        assert 'MODEL_NUM=C9300-48UXM' in conn.recbuf and conn.recbuf.startswith('set\r\n')
+        conn.send('bogus\r', expectphrase='switch: ', timeout=30)
+        assert 'Unknown cmd' in conn.recbuf
+        conn.send('boot flash:V160.SSA\r', expectphrase=r'~ # ', timeout=60, regex=True)
+        conn.send('Stardust\r', expectphrase='Nyquist> ', timeout=60)
+        conn.send('SysMem\r', expectphrase='PASSED', timeout=60)
+        conn.waitfor('Nyquist> ', timeout=10)
+        assert conn.mode == 'STARDUST' and conn.recbuf.endswith('Nyquist> ')
+        assert [m for m, _ in conn.history] == ['BTLDR', 'BTLDR', 'BTLDR', 'LINUX', 'STARDUST']
+
+    def test_timeouts(self):
+        conn = self.conn
+        conn.power_on()
+        try:
+            conn.waitfor('switch: ', timeout=1)
+            assert False
+        except uut_simulator.TimeoutException:
+            pass
+        conn.waitfor('switch: ', timeout=60)
+        start = time.time()
+        try:
+            conn.send('\r', expectphrase='never', timeout=600, idle_timeout=5)
+            assert False
+        except uut_simulator.IdleTimeoutException:
+            pass
+        assert 5.0 <= (time.time() - start) * SPEED < 60.0
+
+    def test_ios_boot_and_prompt_discovery(self):
+        conn = self.conn
+        conn.power_on()
+        tracker = boot_tracker.BootPhaseTracker(product='sim', history_dir=None)
+        tracker.start()
+        conn.waitfor('switch: ', timeout=60)
+        conn.send('boot flash:cat9k_iosxe.bin\r')
+        while 'ios_ready' not in tracker.seen:
+            conn.waitfor(tracker.pattern(), timeout=60, regex=True)
+            tracker.scan(conn.recbuf)
+        assert list(tracker.seen.keys()) == ['image_load', 'kernel', 'ios_ready']
+
+        automaton = prompt_discovery.PromptAutomaton(sim_transcript.uut_prompt_map)
+        discovery = prompt_discovery.PromptDiscovery(conn, automaton, timeouts=(uut_simulator.TimeoutException,
+                                                                                uut_simulator.IdleTimeoutException))
+        prompt = discovery.discover()
+        assert prompt == 'Switch>' and automaton.first(prompt) == 'IOS' and discovery.stimuli == 1
+
+    def test_record_replay_and_benchmark(self):
+        live = self.conn
+        live.power_on()
+        live.waitfor('switch: ', timeout=60)
+        recorder = uut_simulator.TranscriptRecorder(live, sim_transcript.uut_prompt_map)
+        live.send('\r', expectphrase='switch: ', timeout=30)
+        live.send('set\r', expectphrase='switch: ', timeout=30)
+        live.send('boot flash:V160.SSA\r', expectphrase=r'~ # ', timeout=60, regex=True)
+        transcript = recorder.stop()
+        assert transcript['prompts'] == {'BTLDR': 'switch: ', 'LINUX': '~ # '}
+        assert [e.get('mode') for e in transcript['commands']['BTLDR']] == [None, 'LINUX']
+
+        transcript['mode'] = 'BTLDR'
+        replay = uut_simulator.SimulatedUutConn(transcript, speed=SPEED)
+        replay.send('set\r', expectphrase='switch: ', timeout=30)
+        assert 'MODEL_NUM=C9300-48UXM' in replay.recbuf
+        replay.send('boot flash:V160.SSA\r', expectphrase=r'~ # ', timeout=60, regex=True)
+        assert 'Linux version' in replay.recbuf and replay.mode == 'LINUX'
+
+        def flow(conn):
+            conn.power_on()
+            conn.waitfor('switch: ', timeout=60)
+
+        results = uut_simulator.benchmark(flow, lambda: uut_simulator.SimulatedUutConn(
+            sim_transcript.transcript, speed=SPEED), runs=3)
+        assert len(results['runs']) == 3 and 2.0 <= results['uut_p50'] < 10.0
+
+
+class TestModeManagerReplay(object):
+    """ ModeManager boot and mode paths replayed against the simulated console. """
+
+    def setup_method(self, method):
+        # The ModeManager needs the Apollo environment; the simulator tests above do not.
+        from ..modemanager import ModeManager
+
+        class SimModeManager(ModeManager):
+            RECBUF_TIME = 0.1
+            RECBUF_CLEAR_TIME = 0.1
+            BOOT_SETTLE_TIME = 0.1
+
+        self.history_dir = tempfile.mkdtemp()
+        self.conn = uut_simulator.SimulatedUutConn(copy.deepcopy(sim_transcript.transcript), speed=SPEED)
+        self.pp = type('SimProduct', (), {'uut_conn': self.conn})()
+        self.pp.ud = type('SimDescriptor', (), {'last_known_mode': None})()
+        self.new_mode_mgr = lambda: SimModeManager(mode_module=sim_mode, uut_conn=self.conn,
+                                                   statemachine=sim_mode.uut_state_machine,
+                                                   uut_prompt_map=sim_transcript.uut_prompt_map,
+                                                   callback=self.pp, apollo_go=False, boot_history_key='sim',
+                                                   boot_history_dir=self.history_dir, verbose_level=0)
+        self.pp.mode_mgr = self.new_mode_mgr()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.history_dir)
+
+    def test_wait_for_boot_and_goto_mode(self):
+        conn, mm = self.conn, self.pp.mode_mgr
+        conn.power_on()
+        found, _ = mm.wait_for_boot(boot_mode=['BTLDR'], boot_msg='System Bootstrap', timeout=60, idle_timeout=30)
+        assert found and mm.is_mode('BTLDR', refresh=True)
+        assert list(mm.boot_tracker.seen.keys()) == ['rommon', 'prompt']
+
+        # BTLDR -> LINUX -> STARDUST
+        assert mm.goto_mode('STARDUST') and conn.mode == 'STARDUST'
+        # STARDUST -> LINUX -> BTLDR (reset + rommon boot) -> IOS (IOS boot + RETURN) -> IOSE
+        assert mm.goto_mode('IOSE') and conn.mode == 'IOSE'
+        assert 'ios_ready' in mm.boot_tracker.seen
+        # IOSE -> BTLDR -> LINUX
+        assert mm.goto_mode('LINUX') and conn.mode == 'LINUX'
+        assert [m for m, text in conn.history if text == 'reset\r'] == ['LINUX', 'IOSE']
+        assert mm.is_mode('LINUX', refresh=True)
+
+    def test_mode_hint_in_descriptor(self):
+        conn, mm = self.conn, self.pp.mode_mgr
+        conn.power_on()
+        found, _ = mm.wait_for_boot(boot_mode=['BTLDR'], boot_msg='System Bootstrap', timeout=60, idle_timeout=30)
+        assert found and mm.goto_mode('STARDUST') and mm.is_mode('STARDUST', refresh=True)
+        assert self.pp.ud.last_known_mode.get('mode') == 'STARDUST'
+
+        # A new mode manager (ex. after an abort) starts from the hint kept in the descriptor.
+        self.pp.mode_mgr = self.new_mode_mgr()
+        assert self.pp.mode_mgr.mode_hint == mm.mode_hint
+        assert self.pp.mode_mgr.mode_hint[0] == 'STARDUST'
+        assert self.pp.mode_mgr.is_mode('STARDUST', refresh=True)
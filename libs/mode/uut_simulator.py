@@ -0,0 +1,354 @@
+"""
+========================================================================================================================
+UUT Simulator
+========================================================================================================================
+
+Simulated UUT console for offline runs of the mode and diags flows (no hardware, no station).
+
+The simulator plugs in behind the UUT connection interface used by the libs (send/sende/waitfor/recbuf/clear_recbuf,
+status/open/close, power_on/power_off) and replays a transcript with realistic timing:
+    1. Transcript = prompts per mode, a command table per mode (regex of the command -> timed output chunks and the
+       mode after the command) and named sequences (ex. 'boot' after power on or a reset/reload command).
+       Transcripts are plain dicts (JSON files) and can be recorded from a live connection (TranscriptRecorder).
+    2. Output is delivered chunk by chunk on a scaled clock (speed=10 runs 10x faster than the recorded timing;
+       the timeouts of the callers are in UUT time and are scaled the same way).
+    3. Timeouts raise the Apollo timeout exceptions when Apollo is available.
+
+Transcript example:
+    {
+        'name': 'C9300 Nyquist',
+        'mode': 'OFF',
+        'prompts': {'BTLDR': 'switch: ', 'LINUX': '/ # ', 'STARDUST': 'Nyquist> '},
+        'sequences': {'boot': {'chunks': [[1.5, 'System Bootstrap, Version 16.6.1r\\r\\n']], 'mode': 'BTLDR'}},
+        'commands': {
+            'BTLDR': [{'cmd': r'^boot ', 'chunks': [[3.0, 'Linux version 4.4.91\\r\\n']], 'mode': 'LINUX'}],
+            '*': [{'cmd': r'^reset$', 'sequence': 'boot'}],
+        },
+    }
+
+Usage:
+    conn = SimulatedUutConn(transcript, speed=10)
+    conn.power_on()
+    conn.waitfor('switch: ', timeout=120)
+    conn.send('boot flash:cat9k.bin\\r', expectphrase='/ # ', timeout=300, regex=True)
+    timings = benchmark(lambda c: ..., lambda: SimulatedUutConn(transcript, speed=10), runs=5)
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import json
+import time
+import logging
+
+# BU Lib
+# ------
+from ..utils.step_telemetry import percentile
+from .prompt_discovery import PromptAutomaton
+from .prompt_discovery import last_line
+
+# Apollo
+# ------
+try:
+    import apollo.libs.lib as aplib
+    from apollo.engine import apexceptions
+except ImportError:
+    aplib = None
+    apexceptions = None
+
+
+__title__ = "UUT Simulator"
+__version__ = '2.0.0'
+__author__ = 'bborel'
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+STATUS_OPEN = aplib.STATUS_OPEN if aplib else 'open'
+STATUS_CLOSED = 'closed'
+POWER_OFF_MODE = 'OFF'
+BOOT_MODE = 'BOOT'
+_PROMPT = object()
+
+
+class SimulatorTimeout(Exception):
+    pass
+
+
+class SimulatorIdleTimeout(Exception):
+    pass
+
+
+TimeoutException = apexceptions.TimeoutException if apexceptions else SimulatorTimeout
+IdleTimeoutException = apexceptions.IdleTimeoutException if apexceptions else SimulatorIdleTimeout
+
+
+class SimulatedUutConn(object):
+    """ Simulated UUT Connection
+    recbuf = data received since the last send (or clear_recbuf); waitfor() searches the data received after the
+    previous match.
+    """
+    def __init__(self, transcript, speed=1.0, name='uutTN', echo=True):
+        """
+        :param (dict|str) transcript: Transcript dict or JSON file name.
+        :param (float) speed: Clock scale (10 = 10x faster than the transcript timing).
+        :param (str) name:
+        :param (bool) echo: Echo the sent text (as the UUT console does).
+        """
+        if not isinstance(transcript, dict):
+            with open(transcript, 'r') as fp:
+                transcript = json.load(fp)
+        self.transcript = transcript
+        self.speed = float(speed)
+        self.name = name
+        self.uid = id(self)
+        self.echo = echo
+        self.status = STATUS_OPEN
+        self.power_status = None
+        self.foundphrase = None
+        self.mode = transcript.get('mode', POWER_OFF_MODE)
+        self.recbuf = ''
+        self.history = []
+        self._match_pos = 0
+        self._pending = []
+        self._last_rx = self._now()
+        self._commands = [(m, [(re.compile(e['cmd']), e) for e in entries])
+                          for m, entries in transcript.get('commands', {}).items()]
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def prompt(self):
+        return self.transcript.get('prompts', {}).get(self.mode, '')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Connection Interface
+    # ------------------------------------------------------------------------------------------------------------------
+    def open(self):
+        self.status = STATUS_OPEN
+        return True
+
+    def close(self):
+        self.status = STATUS_CLOSED
+        return True
+
+    def power_on(self):
+        """ Power on; the 'boot' sequence is scheduled (if any). """
+        self.power_status = 'on'
+        self.clear_recbuf()
+        if self.mode == POWER_OFF_MODE:
+            self.__schedule_sequence('boot')
+        return True
+
+    def power_off(self):
+        self.power_status = 'off'
+        self._pending = []
+        self.mode = POWER_OFF_MODE
+        return True
+
+    def power_cycle(self):
+        self.power_off()
+        return self.power_on()
+
+    def clear_recbuf(self):
+        self.__flush()
+        self.recbuf = ''
+        self._match_pos = 0
+        return
+
+    def send(self, text, expectphrase=None, timeout=30, idle_timeout=None, regex=False):
+        """ Send
+        :param (str) text: Command (with line end).
+        :param (str) expectphrase: Wait for this after the send (None = no wait).
+        :return (bool):
+        """
+        self.__flush()
+        self.recbuf = ''
+        self._match_pos = 0
+        self.history.append((self.mode, text))
+        if self.status != STATUS_OPEN:
+            raise IOError("Simulated connection '{0}' is not open.".format(self.name))
+        if self.echo and self.mode != POWER_OFF_MODE:
+            self.__receive(text.rstrip('\r\n') + '\r\n' if text.strip() else '\r\n')
+        if self.mode != POWER_OFF_MODE:
+            self.__respond(text)
+        if expectphrase is not None:
+            self.waitfor(expectphrase, timeout=timeout, idle_timeout=idle_timeout, regex=regex)
+        return True
+
+    def sende(self, text, expectphrase=None, timeout=30, idle_timeout=None, regex=False):
+        return self.send(text, expectphrase=expectphrase, timeout=timeout, idle_timeout=idle_timeout, regex=regex)
+
+    def waitfor(self, expectphrase, timeout=30, idle_timeout=None, regex=False):
+        """ Wait For
+        :param (str) expectphrase:
+        :param (int) timeout: Secs (UUT time)
+        :param (int) idle_timeout: Secs (UUT time) without any received data.
+        :return (bool): True; raises the timeout exceptions otherwise.
+        """
+        pattern_re = re.compile(expectphrase if regex else re.escape(expectphrase))
+        start = self._now()
+        while True:
+            self.__flush()
+            m = pattern_re.search(self.recbuf, self._match_pos)
+            if m:
+                self.foundphrase = m.group()
+                self._match_pos = m.end()
+                return True
+            now = self._now()
+            if now - start >= timeout:
+                raise TimeoutException("Timed out waiting for '{0}' ({1} secs).".format(expectphrase, timeout))
+            if idle_timeout and now - max(start, self._last_rx) >= idle_timeout:
+                raise IdleTimeoutException("Idle waiting for '{0}' ({1} secs).".format(expectphrase, idle_timeout))
+            deadlines = [start + timeout] + ([max(start, self._last_rx) + idle_timeout] if idle_timeout else [])
+            deadlines += [self._pending[0][0]] if self._pending else []
+            self._sleep(min(deadlines) - now)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def _now(self):
+        """ UUT time (scaled clock). """
+        return time.time() * self.speed
+
+    def _sleep(self, uut_secs):
+        time.sleep(max(uut_secs, 0.0) / self.speed + 0.0005)
+
+    def __receive(self, text):
+        self.recbuf += text
+        self._last_rx = self._now()
+
+    def __flush(self):
+        """ Deliver the output chunks that are due. """
+        now = self._now()
+        while self._pending and self._pending[0][0] <= now:
+            _, text, mode = self._pending.pop(0)
+            text = self.prompt if text is _PROMPT else text
+            if text:
+                self.__receive(text)
+            if mode:
+                self.mode = mode
+        return
+
+    def __schedule(self, chunks, mode=None, prompt=True):
+        """ Schedule output chunks [[<delay secs>, <text>], ...] after the pending output. """
+        due = self._pending[-1][0] if self._pending else self._now()
+        baud = self.transcript.get('baud')
+        for delay, text in chunks:
+            due += delay + (len(text) * 10.0 / baud if baud else 0.0)
+            self._pending.append((due, text, None))
+        if mode:
+            self._pending.append((due, None, mode))
+        if prompt:
+            # Prompt of the mode at the time of delivery.
+            self._pending.append((due, _PROMPT, None))
+        return
+
+    def __schedule_sequence(self, name):
+        sequence = self.transcript.get('sequences', {}).get(name)
+        if not sequence:
+            log.debug("No '{0}' sequence in the transcript.".format(name))
+            return
+        # Commands during the sequence get the output of the BOOT mode (if any) and the prompt after the sequence.
+        self.mode = BOOT_MODE
+        self.__schedule(sequence.get('chunks', []), mode=sequence.get('mode'), prompt=sequence.get('prompt', True))
+        return
+
+    def __respond(self, text):
+        command = text.strip()
+        if not command:
+            self.__schedule([])
+            return
+        for mode, entries in self._commands:
+            if mode not in [self.mode, '*']:
+                continue
+            for cmd_re, entry in entries:
+                if cmd_re.search(command):
+                    if entry.get('sequence'):
+                        self.__schedule(entry.get('chunks', []), prompt=False)
+                        self.__schedule_sequence(entry['sequence'])
+                    else:
+                        self.__schedule(entry.get('chunks', []), mode=entry.get('mode'),
+                                        prompt=entry.get('prompt', True))
+                    return
+        unknown = self.transcript.get('unknown', {}).get(self.mode, '')
+        self.__schedule([[0.0, unknown]] if unknown else [])
+        return
+
+
+class TranscriptRecorder(object):
+    """ Transcript Recorder
+    Records the commands and responses of a live UUT connection into a transcript (the current mode is derived
+    from the last line of each response with the prompt map).
+    """
+    def __init__(self, conn, uut_prompt_map, name=None):
+        """
+        :param (obj) conn: Live UUT connection
+        :param (list) uut_prompt_map: [(<mode>, <pattern>), ...]
+        """
+        self.conn = conn
+        self.automaton = PromptAutomaton(uut_prompt_map)
+        self.transcript = dict(name=name if name else getattr(conn, 'name', 'uut'), mode=POWER_OFF_MODE,
+                               prompts={}, sequences={}, commands={})
+        self.mode = None
+        self.__send = conn.send
+        conn.send = self.send
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def send(self, text, *args, **kwargs):
+        mode = self.mode
+        start = time.time()
+        ret = self.__send(text, *args, **kwargs)
+        elapsed = time.time() - start
+        output = self.conn.recbuf
+        prompt = last_line(output)
+        new_mode = self.automaton.first(prompt)
+        if new_mode:
+            self.transcript['prompts'][new_mode] = prompt
+            output = output[:output.rfind(prompt)]
+        command = text.strip()
+        if mode and command:
+            # Echo is generated by the simulator.
+            output = output[len(command):].lstrip('\r\n') if output.startswith(command) else output
+            entry = dict(cmd='^{0}$'.format(re.escape(command)), chunks=[[round(elapsed, 3), output]])
+            entry.update(dict(mode=new_mode) if new_mode and new_mode != mode else {})
+            entries = self.transcript['commands'].setdefault(mode, [])
+            entries.append(entry) if entry['cmd'] not in [e['cmd'] for e in entries] else None
+        self.mode = new_mode if new_mode else self.mode
+        return ret
+
+    def stop(self):
+        self.conn.send = self.__send
+        return self.transcript
+
+    def save(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self.transcript, fp, indent=2, sort_keys=True)
+        return filename
+
+
+def benchmark(flow, conn_factory, runs=5):
+    """ Benchmark
+    Run a flow on a new simulated connection several times (ex. in CI for latency regressions).
+    :param (func) flow: flow(conn)
+    :param (func) conn_factory: Returns a new SimulatedUutConn.
+    :param (int) runs:
+    :return (dict): dict(runs=[<secs>, ...], p50=, p95=, uut_p50=) where uut_p50 is in UUT time (speed scaled).
+    """
+    timings, speed = [], 1.0
+    for _ in range(runs):
+        conn = conn_factory()
+        speed = conn.speed
+        start = time.time()
+        flow(conn)
+        timings.append(time.time() - start)
+    p50 = percentile(timings, 50)
+    return dict(runs=timings, p50=p50, p95=percentile(timings, 95), uut_p50=p50 * speed)
@@ -20,6 +20,7 @@ import time
 import re
 import logging
 import os
+import threading
 import parse
 from datetime import datetime
 
@@ -33,6 +34,7 @@ from apollo.engine import apexceptions
 # -----------
 from ..utils import common_utils
 from ..utils import license_utils
+from ..utils import image_cache
 
 
 __title__ = "IOS General Module"
@@ -57,6 +59,8 @@ class IOS(object):
     RECBUF_TIME = 3.0
     RECBUF_CLEAR_TIME = 1.0
     USE_CLEAR_RECBUF = False
+    USE_IMAGE_CACHE = True
+    IMAGE_PREFETCH_WORKERS = 4
 
     def __init__(self, mode_mgr, ud):
         log.info(self.__repr__())
@@ -66,6 +70,8 @@ class IOS(object):
         self._uut_prompt_map = self._mode_mgr.uut_prompt_map
         self._uut_prompt = self._uut_prompt_map['IOSE']
         self._callback = None
+        self._image_cache = image_cache.ImageCache()
+        self._download_lock = threading.Lock()
         return
 
     def __repr__(self):
@@ -668,7 +674,7 @@ class IOS(object):
         # Get the LID config
         if not major_line_id_cfg:
             try:
-                major_line_id_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id)
+                major_line_id_cfg = common_utils.get_lineid_config(major_line_id=major_line_id)
             except (apexceptions.ServiceFailure, apexceptions.ResultFailure) as err:
                 log.debug(err)
                 return aplib.FAIL, err.message
@@ -1484,13 +1490,13 @@ class IOS(object):
         log.debug("Local Filepath = {0}".format(local_filepath))
         # TODO: The SW download mechanisms are currently not working (per Bob Hakesly 3/1/2018)
         # status = cesiumlib.sync_software_by_name(ios_sw_config.get('image_name', ''), wait_for_result=True, timeout_minutes=15)
-        status = common_utils.download_image(src_filepath=local_filepath, dst_filepath=local_filepath)
-        log.info("IOS main image download Results: Status={0} Msg={1}".format(status.get('code', 0), status.get('message', '')))
-        result_list.append(status.get('result', False))
+        image_requests = [image_cache.ImageRequest(local_filepath, local_filepath, ios_sw_config.get('md5'))]
 
         if not ios_supp_files:
             log.warning("NO supplemental files were specified. Please ensure this is correct per the product definition.")
             log.warning("NO additional files will be available.")
+            status = self.__get_images(image_requests)[local_filepath]
+            log.info("IOS main image download Results: Status={0} Msg={1}".format(status.get('code', 0), status.get('message', '')))
             return True
 
         # Supplemental images
@@ -1515,8 +1521,17 @@ class IOS(object):
                     log.debug("CCO Filepath   = {0}".format(cco_filepath))
                     log.debug("Local Filepath = {0}".format(local_filepath))
                     tracking_list.append(supp_file)
-                    status = common_utils.download_image(src_filepath=local_filepath, dst_filepath=local_filepath)
-                    result_list.append(status.get('result', False))
+                    supp_md5 = supp_file_item[1] if isinstance(supp_file_item, tuple) and len(supp_file_item) > 1 else None
+                    supp_md5 = supp_md5 if supp_md5 and re.match(r'^[0-9a-fA-F]{32}$', str(supp_md5)) else None
+                    image_requests.append(image_cache.ImageRequest(local_filepath, local_filepath, supp_md5))
+
+        # Download the image set (main + supplemental) concurrently via the shared image cache.
+        statuses = self.__get_images(image_requests)
+        for req in image_requests:
+            status = statuses.get(req.dst_filepath, {})
+            log.info("IOS image {0} download Results: Status={1} Msg={2}".format(os.path.basename(req.dst_filepath),
+                                                                                 status.get('code', 0), status.get('message', '')))
+            result_list.append(status.get('result', False))
 
         # Cross-check
         # -----------
@@ -1537,6 +1552,38 @@ class IOS(object):
 
         return all(result_list)
 
+    def __get_images(self, image_requests):
+        """ (INTERNAL) Get Images
+        Place all requested images on the local server; served from the shared image cache when available, otherwise
+        fetched once for all containers (concurrently per image) under one network token for the container.
+        :param (list) image_requests: List of image_cache.ImageRequest
+        :return (dict): {<dst_filepath>: <status dict>, ...}
+        """
+        if not self.USE_IMAGE_CACHE:
+            return {req.dst_filepath: common_utils.download_image(src_filepath=req.src_filepath, dst_filepath=req.dst_filepath)
+                    for req in image_requests}
+        try:
+            with common_utils.network_bandwidth():
+                return self._image_cache.prefetch(image_requests, fetch=self.__fetch_image,
+                                                  max_workers=self.IMAGE_PREFETCH_WORKERS)
+        except (IOError, OSError) as e:
+            log.warning("Image cache is not usable ({0}); downloading directly.".format(e))
+            return {req.dst_filepath: common_utils.download_image(src_filepath=req.src_filepath, dst_filepath=req.dst_filepath)
+                    for req in image_requests}
+
+    def __fetch_image(self, src_filepath, tmp_filepath):
+        """ (INTERNAL) Fetch Image
+        Key-based scp runs concurrently; the fallback download uses the shared server connection and is serialized.
+        :param (str) src_filepath:
+        :param (str) tmp_filepath:
+        :return (bool):
+        """
+        if image_cache.scp_fetch(src_filepath, tmp_filepath):
+            return True
+        with self._download_lock:
+            status = common_utils.download_image(src_filepath=src_filepath, dst_filepath=tmp_filepath)
+        return status.get('result', False) and os.path.isfile(tmp_filepath)
+
     @func_details
     def get_ios_version(self):
         """ Get current IOS version from CLI
@@ -2548,7 +2595,7 @@ class IOS(object):
         # Inputs
         if not major_line_id_cfg:
             log.debug("Getting Major LineID data...")
-            major_line_id_cfg = cesiumlib.get_lineid_config(major_line_id=major_line_id)
+            major_line_id_cfg = common_utils.get_lineid_config(major_line_id=major_line_id)
         if not top_level_product_id:
             top_level_product_id = cesiumlib.get_lineid_toplevel_product_id(major_line_id_cfg).get('prod_name')
         if not top_level_product_id or not common_utils.validate_pid(top_level_product_id):
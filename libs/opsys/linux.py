@@ -33,6 +33,7 @@ from apollo.libs import lib as aplib
 
 # BU Specific
 # -----------
+from ..utils import common_utils
 from ..utils.common_utils import func_details
 from ..utils.common_utils import func_retry
 from ..utils.common_utils import apollo_step
@@ -40,6 +41,7 @@ from ..utils.common_utils import shellcmd
 from ..utils.common_utils import touch
 from ..utils.common_utils import validate_ip_addr
 from ..utils.common_utils import get_system_ip_and_mask
+from . import tftp_transfer
 
 __title__ = "Linux (diag kernel) General Module"
 __version__ = '2.0.0'
@@ -61,6 +63,7 @@ class Linux(object):
     MountDescriptor = collections.namedtuple('MountDescriptor', 'device dir')
     Disk = collections.namedtuple('Disk', 'size gsize bytes devices')
     RECBUF_TIME = 5.0
+    TFTP_MAX_SESSIONS = 4
     FDISK = {'checked': False, 'cmd': 'fdisk', 'param': ''}
 
     def __init__(self, mode_mgr, ud):
@@ -1497,7 +1500,7 @@ class Linux(object):
 
     @func_details
     def transfer_tftp_files(self, src_files=None, dst_files=None, direction='get',
-                            server_ip=None, netmask=None, ip=None, transfer_timeout=600, force=True):
+                            server_ip=None, netmask=None, ip=None, transfer_timeout=600, force=True, max_sessions=None):
         """ TFTP File Transfer (with checking and path creation)
         --------------------------------------------------------
         Transfer files between the UUT/target device (running Linux) and the LOCAL or REMOTE APOLLO SERVER.
@@ -1524,6 +1527,8 @@ class Linux(object):
           3) Some limitations will exist if a remote server is specified, particularly with the 'put' operation.
           4) If the UUT cannot ping the server, an attempt to setup the UUT on the test network will be done
              (if the server ip and netmask are provided).
+          5) Multiple 'get' files are transferred concurrently (max_sessions) via the TftpTransferManager with
+             batched verification and retry of only the failed files; max_sessions=1 uses the serial transfer.
 
         :param (list) src_files: List of source file items.
         :param (list) dst_files: List of destination file items.
@@ -1533,6 +1538,7 @@ class Linux(object):
         :param (str) ip: UUT assigned IP on the private test network
         :param (int) transfer_timeout: Timeout for file transfer; adjust appropriately for large files.
         :param (bool) force:  Ignore existing files and overwrite if True.
+        :param (int) max_sessions: Max concurrent TFTP GET sessions (default = TFTP_MAX_SESSIONS).
         :return: True if all files transferred successfully (i.e. via file presence or valid crc).
         """
 
@@ -1559,15 +1565,16 @@ class Linux(object):
 
             attempt_count = 0
             result = False
-            while attempt_count < 3 and not result:
-                attempt_count += 1
-                self._uut_conn.send('{0} {1}\r'.format(cmd, server_ip), expectphrase=self._uut_prompt, timeout=transfer_timeout,
-                              regex=True)
-                time.sleep(self.RECBUF_TIME)
-                if any([x in self._uut_conn.recbuf.lower() for x in ['error', 'fail', 'no such file', 'timeout']]):
-                    log.error("TFTP {0}: FAILED = {1}".format(direction.upper(), self._uut_conn.recbuf))
-                else:
-                    result = True
+            with common_utils.network_bandwidth():
+                while attempt_count < 3 and not result:
+                    attempt_count += 1
+                    self._uut_conn.send('{0} {1}\r'.format(cmd, server_ip), expectphrase=self._uut_prompt, timeout=transfer_timeout,
+                                  regex=True)
+                    time.sleep(self.RECBUF_TIME)
+                    if any([x in self._uut_conn.recbuf.lower() for x in ['error', 'fail', 'no such file', 'timeout']]):
+                        log.error("TFTP {0}: FAILED = {1}".format(direction.upper(), self._uut_conn.recbuf))
+                    else:
+                        result = True
 
             if result:
                 log.debug("TFTP {0}: checking result...".format(direction.upper()))
@@ -1628,6 +1635,11 @@ class Linux(object):
                 log.error("Check UUT network settings and connections.")
                 return False
 
+        max_sessions = self.TFTP_MAX_SESSIONS if max_sessions is None else max_sessions
+        if direction == 'get' and max_sessions > 1 and len(src_files) > 1:
+            return self.__transfer_tftp_files_pipelined(src_files, dst_files, server_ip, tftp_secure_dir, is_local_server,
+                                                        transfer_timeout, force, max_sessions)
+
         # Process the file list
         for src_file_item, dst_file_item in zip(src_files, dst_files):
             src_file, crc = src_file_item if isinstance(src_file_item, tuple) else (src_file_item, None)
@@ -1762,6 +1774,72 @@ class Linux(object):
         log.info("TFTP {0}: Successful!".format(direction.upper())) if ret else None
         return ret
 
+    def __transfer_tftp_files_pipelined(self, src_files, dst_files, server_ip, tftp_secure_dir, is_local_server,
+                                        transfer_timeout, force, max_sessions):
+        """ (INTERNAL) TFTP GET of multiple files with concurrent sessions.
+        Same params as transfer_tftp_files().
+        :return: True if all files transferred successfully.
+        """
+        items = []
+        result_list = []
+        for src_file_item, dst_file_item in zip(src_files, dst_files):
+            src_file, crc = src_file_item if isinstance(src_file_item, tuple) else (src_file_item, None)
+            dst_file, crc2 = dst_file_item if isinstance(dst_file_item, tuple) else (dst_file_item, None)
+            crc = crc2 if not crc and crc2 else crc
+            src_file = src_file.strip() if src_file else src_file
+            dst_file = dst_file.strip() if dst_file else src_file
+            if not src_file:
+                log.warning("TFTP GET: source filename is empty. Ignore this transfer.")
+                continue
+            if src_file[0:1] == '/':
+                log.error("TFTP GET: Cannot use absolute paths in the source files ({0}).".format(src_file))
+                log.error("TFTP GET: Ensure usage of the TFTP server directory with a relative path for source files.")
+                result_list.append(False)
+                continue
+            items.append(tftp_transfer.TftpItem(src_file, dst_file, crc))
+
+        mgr = tftp_transfer.TftpTransferManager(self._uut_conn, self._uut_prompt, server_ip, max_sessions=max_sessions,
+                                                transfer_timeout=transfer_timeout, recbuf_time=self.RECBUF_TIME)
+        log.debug(mgr)
+
+        # Allow skipping files already present at the destination (one batched check) if not forcing the transfer.
+        if not force and items:
+            missing = mgr.verify(items)
+            log.debug("TFTP GET: skip {0} file(s); already present.".format(len(items) - len(missing)))
+            items = missing
+
+        # Make any new dirs that are specified by the destination files (default permissions for new dirs).
+        dst_dirs = sorted(set([os.path.dirname(item.dst) for item in items if os.path.dirname(item.dst)]))
+        if dst_dirs:
+            self._uut_conn.send('for d in {0}; do test -d $d || {{ mkdir -p $d; chmod 777 $d; }}; done\r'.format(' '.join(dst_dirs)),
+                                expectphrase=self._uut_prompt, timeout=30, regex=True)
+
+        if items:
+            with common_utils.network_bandwidth():
+                result_list.append(mgr.transfer(items))
+            # Now match up the permissions: the server file --> uut file (batched per permission)
+            permission_map = {}
+            for item in items:
+                if not mgr.results[item.dst].passed:
+                    continue
+                src_file_full = os.path.join(tftp_secure_dir, item.src)
+                if is_local_server and os.path.exists(src_file_full):
+                    permissions = oct(os.stat(src_file_full).st_mode & 0o777)
+                else:
+                    permissions = oct(0o755)
+                permission_map.setdefault(permissions, []).append(item.dst)
+            for permissions, files in permission_map.items():
+                log.debug("TFTP GET: file permissions = {0} for {1}".format(permissions, files))
+                self._uut_conn.send('chmod {0} {1}\r'.format(permissions, ' '.join(files)), expectphrase=self._uut_prompt,
+                                    timeout=30, regex=True)
+
+        log.debug("TFTP result list = {0}".format(result_list))
+        ret = all(result_list)
+
+        self._uut_conn.send('sync\r', expectphrase=self._uut_prompt, timeout=transfer_timeout, regex=True)
+        log.info("TFTP GET: Successful!") if ret else None
+        return ret
+
     @func_details
     def transfer_tftp_directory(self, src_dir=None, dst_dir=None, direction='get',
                                 server_ip=None, netmask=None, ip=None, transfer_timeout=600, force=True):
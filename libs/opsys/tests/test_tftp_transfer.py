@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from .. import tftp_transfer
+from ...utils import console_utils
+
+__title__ = 'EntSw TFTP Transfer Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+PROMPT = r'(?:~|/)[^\n]*# '
+FAST_PROFILE = console_utils.CompletionProfile(quiet=0.01, settle=0.0, poll=0.005, max_wait=None)
+
+
+class TftpdShell(object):
+    """ Local tftpd stand-in + UUT shell.
+    Background tftp GETs copy files from the server dir to the UUT dir after a delay; the status file, md5sum,
+    and stat commands are answered from the UUT dir.
+    """
+    def __init__(self, server_dir, uut_dir, delay=0.1, fail_once=None, corrupt_once=None, hang_once=None):
+        self.recbuf = ''
+        self.server_dir = server_dir
+        self.uut_dir = uut_dir
+        self.delay = delay
+        self.fail_once = set(fail_once or [])
+        self.corrupt_once = set(corrupt_once or [])
+        self.hang_once = set(hang_once or [])
+        self.killed = {}
+        self.writers = {}
+        self.max_writers = 0
+        self.status = []
+        self.gets = []
+        self.active = 0
+        self.max_active = 0
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False, **kwargs):
+        cmd = text.strip()
+        self.commands.append(cmd)
+        output = self.__run(cmd)
+        self.recbuf = '{0}\n{1}/ # '.format(cmd, output + '\n' if output else '')
+
+    def __run(self, cmd):
+        m = re.match(r'\(tftp -g -r (\S+) -l (\S+) (\S+) .*?echo "(\S+) \$\?" >> \S+\) &', cmd)
+        if m:
+            t = threading.Thread(target=self.__tftp_get, args=m.group(1, 2, 4))
+            t.daemon = True
+            t.start()
+            return '[1] 1234'
+        if cmd.startswith('cat '):
+            with self._lock:
+                return '\n'.join(self.status)
+        if cmd.startswith('rm -f ') and 'touch' in cmd:
+            with self._lock:
+                self.status = []
+            return ''
+        if cmd.startswith('rm -f '):
+            for f in cmd.split()[2:]:
+                os.remove(os.path.join(self.uut_dir, f)) if os.path.exists(os.path.join(self.uut_dir, f)) else None
+            return ''
+        m = re.match(r'pkill -9 -f "tftp -g -r \S+ -l (\S+) "', cmd)
+        if m:
+            self.killed[m.group(1)].set() if m.group(1) in self.killed else None
+            return ''
+        m = re.match(r'(md5sum|stat -c "%s %n") (.*) 2>/dev/null', cmd)
+        if m:
+            lines = []
+            for f in m.group(2).split():
+                path = os.path.join(self.uut_dir, f)
+                if not os.path.exists(path):
+                    continue
+                if m.group(1) == 'md5sum':
+                    with open(path, 'rb') as fp:
+                        lines.append('{0}  {1}'.format(hashlib.md5(fp.read()).hexdigest(), f))
+                else:
+                    lines.append('{0} {1}'.format(os.path.getsize(path), f))
+            return '\n'.join(lines)
+        return ''
+
+    def __tftp_get(self, src, dst, tag):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.gets.append(src)
+            self.writers[dst] = self.writers.get(dst, 0) + 1
+            self.max_writers = max(self.max_writers, self.writers[dst])
+        time.sleep(self.delay)
+        code = 0
+        src_path = os.path.join(self.server_dir, src)
+        dst_path = os.path.join(self.uut_dir, dst)
+        if src in self.hang_once:
+            # Stalled session: partial file until killed.
+            self.hang_once.discard(src)
+            self.killed[dst] = threading.Event()
+            with open(dst_path, 'wb') as fp:
+                fp.write(b'partial')
+            self.killed[dst].wait(10)
+            code = 137
+        elif src in self.fail_once or not os.path.exists(src_path):
+            self.fail_once.discard(src)
+            code = 1
+        elif src in self.corrupt_once:
+            self.corrupt_once.discard(src)
+            with open(dst_path, 'wb') as fp:
+                fp.write(b'corrupt')
+        else:
+            shutil.copyfile(src_path, dst_path)
+        with self._lock:
+            self.active -= 1
+            self.writers[dst] -= 1
+            self.status.append('{0} {1}'.format(tag, code))
+
+
+class TestTftpTransferManager(object):
+
+    def setup_method(self, method):
+        self.server_dir = tempfile.mkdtemp()
+        self.uut_dir = tempfile.mkdtemp()
+        self.items = []
+        for i in range(6):
+            name = 'image{0}.bin'.format(i)
+            data = os.urandom(1024 * (i + 1))
+            with open(os.path.join(self.server_dir, name), 'wb') as fp:
+                fp.write(data)
+            self.items.append(tftp_transfer.TftpItem(name, name, hashlib.md5(data).hexdigest()))
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.server_dir)
+        shutil.rmtree(self.uut_dir)
+
+    def __mgr(self, conn, **kwargs):
+        return tftp_transfer.TftpTransferManager(conn, PROMPT, '10.1.1.1', poll_interval=0.02,
+                                                 completion_profile=FAST_PROFILE, **kwargs)
+
+    def test_concurrent_transfer(self):
+        conn = TftpdShell(self.server_dir, self.uut_dir, delay=0.2)
+        mgr = self.__mgr(conn, max_sessions=3)
+        start = time.time()
+        assert mgr.transfer(self.items)
+        assert time.time() - start < 6 * 0.2
+        assert conn.max_active == 3
+        assert len([c for c in conn.commands if c.startswith('md5sum')]) == 1
+        for item in self.items:
+            result = mgr.results[item.dst]
+            assert result.passed and result.attempts == 1
+            assert result.size == os.path.getsize(os.path.join(self.server_dir, item.src))
+            assert result.rate > 0
+
+    def test_retry_failed_only(self):
+        conn = TftpdShell(self.server_dir, self.uut_dir, delay=0.01, fail_once=['image1.bin'],
+                          corrupt_once=['image4.bin'])
+        mgr = self.__mgr(conn, max_sessions=4)
+        assert mgr.transfer(self.items)
+        assert sorted(conn.gets) == sorted([item.src for item in self.items] + ['image1.bin', 'image4.bin'])
+        assert mgr.results['image1.bin'].attempts == 2
+        assert mgr.results['image4.bin'].attempts == 2
+        assert mgr.results['image0.bin'].attempts == 1
+
+    def test_missing_file_and_presence_check(self):
+        conn = TftpdShell(self.server_dir, self.uut_dir, delay=0.01)
+        items = [tftp_transfer.TftpItem('image0.bin', 'image0.bin', None),
+                 tftp_transfer.TftpItem('nofile.bin', 'nofile.bin', None)]
+        mgr = self.__mgr(conn, max_sessions=2, max_attempts=2)
+        assert not mgr.transfer(items)
+        assert mgr.results['image0.bin'].passed
+        assert not mgr.results['nofile.bin'].passed
+        assert mgr.results['nofile.bin'].attempts == 2
+        assert mgr.verify(items) == [items[1]]
+
+    def test_timeout_kills_and_cleans(self):
+        conn = TftpdShell(self.server_dir, self.uut_dir, delay=0.01, hang_once=['image2.bin'])
+        mgr = self.__mgr(conn, max_sessions=6, transfer_timeout=0.3)
+        assert mgr.transfer(self.items)
+        assert mgr.results['image2.bin'].attempts == 2
+        assert mgr.results['image0.bin'].attempts == 1
+        # Stalled session killed, its partial file removed, and only then the retry: never two writers.
+        kill = conn.commands.index('pkill -9 -f "tftp -g -r image2.bin -l image2.bin "')
+        remove = conn.commands.index('rm -f image2.bin', kill)
+        retry = [i for i, c in enumerate(conn.commands) if c.startswith('(tftp -g -r image2.bin ')][1]
+        assert kill < remove < retry
+        assert conn.max_writers == 1
@@ -0,0 +1,266 @@
+"""
+========================================================================================================================
+TFTP Transfer Manager
+========================================================================================================================
+
+Pipelined TFTP transfers on the UUT Linux shell with batched integrity verification.
+
+The legacy Linux.transfer_tftp_files() runs one foreground tftp command per file and then one md5/cksum command per
+file.  This manager instead:
+    1. Keeps up to 'max_sessions' tftp sessions in flight as background jobs on the UUT shell; each job appends
+       "<tag> <exit code>" to a status file which is polled to refill the window.
+    2. Verifies ALL files of a pass with one batched command per checksum type (md5sum/cksum), plus one
+       batched 'stat' for file presence and sizes.
+    3. Retries only the files that failed (transfer or verification) up to 'max_attempts'; the partial files are
+       removed first.  Sessions still running at the pass timeout are killed (and confirmed gone via their status
+       line) so that a retry never has two writers for the same file.
+    4. Reports per-file throughput (bytes/sec based on the observed in-flight time).
+
+IMPORTANT: Only the UUT connection object and the UUT prompt pattern are used; no Apollo dependencies.
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import time
+import logging
+from collections import namedtuple
+from collections import OrderedDict
+
+# BU Specific
+# -----------
+from ..utils import console_utils
+
+__title__ = "TFTP Transfer Manager"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+# src = source file (relative to the server tftp secure dir), dst = destination file on the UUT,
+# crc = expected md5 (32 hex chars) or cksum (1-10 digits) or None for presence only.
+TftpItem = namedtuple('TftpItem', 'src dst crc')
+TftpResult = namedtuple('TftpResult', 'passed attempts size secs rate error')
+
+
+class TftpTransferManager(object):
+    """ TFTP Transfer Manager
+    """
+    STATUS_FILE = '/tmp/.tftp_xfer_status'
+    MD5_CMD = 'md5sum'
+    CKSUM_CMD = 'cksum'
+    BATCH_SIZE = 16
+    ABORT_POLLS = 10
+    DEFAULT_PROFILE = console_utils.CompletionProfile(quiet=0.5, settle=0.1, poll=0.05, max_wait=None)
+
+    def __init__(self, uut_conn, uut_prompt, server_ip, max_sessions=4, max_attempts=3, transfer_timeout=600,
+                 poll_interval=1.0, recbuf_time=5.0, completion_profile=DEFAULT_PROFILE):
+        """
+        :param (obj) uut_conn: UUT connection object.
+        :param (str) uut_prompt: UUT Linux prompt (regex).
+        :param (str) server_ip: TFTP server IP.
+        :param (int) max_sessions: Max number of concurrent tftp sessions on the UUT.
+        :param (int) max_attempts: Max attempts per file.
+        :param (int) transfer_timeout: Max time for one pass of transfers (all sessions) to complete.
+        :param (float) poll_interval: Time between polls of the status file.
+        :param (float) recbuf_time: Legacy recbuf wait; upper bound for the response completion.
+        :param (CompletionProfile) completion_profile: Response completion timing for all shell commands.
+        """
+        self._uut_conn = uut_conn
+        self._uut_prompt = uut_prompt
+        self.server_ip = server_ip
+        self.max_sessions = max(1, max_sessions)
+        self.max_attempts = max_attempts
+        self.transfer_timeout = transfer_timeout
+        self.poll_interval = poll_interval
+        self._completion = console_utils.ResponseCompletion(uut_conn, prompt=uut_prompt, fallback_time=recbuf_time,
+                                                            default_profile=completion_profile)
+        self._tag_count = 0
+        self.results = OrderedDict()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def transfer(self, items):
+        """ Transfer (TFTP GET)
+        :param (list) items: List of TftpItem
+        :return (bool): True if all items transferred and verified.
+        """
+        attempts = dict([(item.dst, 0) for item in items])
+        errors = dict()
+        timing = dict()
+        pending = list(items)
+        self.results = OrderedDict()
+        while pending:
+            for item in pending:
+                attempts[item.dst] += 1
+            log.debug("TFTP MGR: pass with {0} file(s), {1} session(s)...".format(len(pending), self.max_sessions))
+            exit_codes, pass_timing = self.__run_window(pending)
+            timing.update(pass_timing)
+            transferred = [item for item in pending if exit_codes.get(item.dst) == 0]
+            for item in pending:
+                if exit_codes.get(item.dst) != 0:
+                    errors[item.dst] = 'tftp exit code {0}'.format(exit_codes.get(item.dst, 'timeout'))
+            bad = self.verify(transferred)
+            for item in bad:
+                errors[item.dst] = 'verification failed'
+            for item in transferred:
+                if item not in bad:
+                    errors.pop(item.dst, None)
+            pending = [item for item in pending if item.dst in errors and attempts[item.dst] < self.max_attempts]
+            if pending:
+                log.warning("TFTP MGR: retrying {0}".format([item.dst for item in pending]))
+                self.__remove([item.dst for item in pending])
+
+        sizes = self.get_sizes([item.dst for item in items if item.dst not in errors])
+        for item in items:
+            size = sizes.get(item.dst, 0)
+            secs = timing.get(item.dst, 0.0)
+            rate = size / secs if secs > 0 else 0.0
+            self.results[item.dst] = TftpResult(item.dst not in errors, attempts[item.dst], size, secs, rate,
+                                                errors.get(item.dst))
+        self.print_results()
+        return all([r.passed for r in self.results.values()])
+
+    def verify(self, items):
+        """ Verify
+        Batched integrity check of files on the UUT: one command per checksum type (per batch of files).
+        :param (list) items: List of TftpItem
+        :return (list): Items that failed verification.
+        """
+        failed = []
+        md5_items = [item for item in items if item.crc and len(item.crc) == 32]
+        cksum_items = [item for item in items if item.crc and len(item.crc) <= 10]
+        other_items = [item for item in items if item.crc and 10 < len(item.crc) != 32]
+        presence_items = [item for item in items if not item.crc]
+        for item in other_items:
+            log.error("TFTP MGR: file '{0}' expected crc={1} is of unknown size.".format(item.dst, item.crc))
+            failed.append(item)
+
+        md5s = self.__batch_query(self.MD5_CMD, [item.dst for item in md5_items],
+                                  r'^([0-9a-fA-F]{32})[ \t]+[*]?(\S+)[ \t]*$', (2, 1))
+        cksums = self.__batch_query(self.CKSUM_CMD, [item.dst for item in cksum_items],
+                                    r'^([0-9]{1,10})[ \t]+[0-9]+[ \t]+(\S+)[ \t]*$', (2, 1))
+        for item in md5_items:
+            if md5s.get(item.dst, '').lower() != item.crc.lower():
+                log.error("TFTP MGR: '{0}' md5 {1} does not match expected {2}.".format(item.dst, md5s.get(item.dst), item.crc))
+                failed.append(item)
+        for item in cksum_items:
+            if cksums.get(item.dst) != item.crc:
+                log.error("TFTP MGR: '{0}' cksum {1} does not match expected {2}.".format(item.dst, cksums.get(item.dst), item.crc))
+                failed.append(item)
+        if presence_items:
+            sizes = self.get_sizes([item.dst for item in presence_items])
+            for item in presence_items:
+                if item.dst not in sizes:
+                    log.error("TFTP MGR: '{0}' NOT present.".format(item.dst))
+                    failed.append(item)
+        return failed
+
+    def get_sizes(self, files):
+        """ Get Sizes
+        :param (list) files: UUT files
+        :return (dict): {<file>: <size>, ...} for files that are present.
+        """
+        sizes = self.__batch_query('stat -c "%s %n"', files, r'^([0-9]+)[ \t]+(\S+)[ \t]*$', (2, 1))
+        return dict([(k, int(v)) for k, v in sizes.items()])
+
+    def print_results(self):
+        log.debug("-" * 100)
+        log.debug("{0:<50} {1:<6} {2:>4} {3:>12} {4:>8} {5:>12}".format('File', 'Result', 'Att', 'Bytes', 'Secs', 'Bytes/sec'))
+        log.debug("-" * 100)
+        for dst, r in self.results.items():
+            log.debug("{0:<50} {1:<6} {2:>4} {3:>12} {4:>8.2f} {5:>12.0f}".format(dst, 'PASS' if r.passed else 'FAIL',
+                                                                                  r.attempts, r.size, r.secs, r.rate))
+        log.debug("-" * 100)
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __send(self, cmd, timeout=30):
+        self._uut_conn.send('{0}\r'.format(cmd), expectphrase=self._uut_prompt, timeout=timeout, regex=True)
+        self._completion.wait(cmd)
+        return self._uut_conn.recbuf
+
+    def __run_window(self, items):
+        """ (INTERNAL) Run a bounded window of background tftp sessions.
+        :param (list) items: List of TftpItem
+        :return (tuple): ({<dst>: <exit code>, ...}, {<dst>: <in-flight secs>, ...})
+        """
+        queue = list(items)
+        in_flight = {}
+        exit_codes = {}
+        timing = {}
+        self.__send('rm -f {0}; touch {0}'.format(self.STATUS_FILE))
+        start = time.time()
+        while queue or in_flight:
+            while queue and len(in_flight) < self.max_sessions:
+                item = queue.pop(0)
+                self._tag_count += 1
+                tag = 'XFER{0}'.format(self._tag_count)
+                self.__send('(tftp -g -r {0} -l {1} {2} >/dev/null 2>&1; echo "{3} $?" >> {4}) &'.format(
+                    item.src, item.dst, self.server_ip, tag, self.STATUS_FILE))
+                in_flight[tag] = (item, time.time())
+            if time.time() - start > self.transfer_timeout:
+                log.error("TFTP MGR: transfer timeout; {0} session(s) incomplete.".format(len(in_flight)))
+                self.__abort(in_flight)
+                break
+            time.sleep(self.poll_interval) if in_flight else None
+            for tag, code in re.findall(r'^(XFER[0-9]+) ([0-9]+)[ \t]*$', self.__send('cat {0}'.format(self.STATUS_FILE)),
+                                        re.MULTILINE):
+                if tag in in_flight:
+                    item, launch_time = in_flight.pop(tag)
+                    exit_codes[item.dst] = int(code)
+                    timing[item.dst] = time.time() - launch_time
+        return exit_codes, timing
+
+    def __abort(self, in_flight):
+        """ (INTERNAL) Kill the unfinished tftp sessions and remove their partial files.
+        A killed session still appends its status line; that confirms the writer is gone before the file is removed.
+        :param (dict) in_flight: {<tag>: (<TftpItem>, <launch time>), ...}
+        :return:
+        """
+        for item, _ in in_flight.values():
+            self.__send('pkill -9 -f "tftp -g -r {0} -l {1} "'.format(item.src, item.dst))
+        running = set(in_flight)
+        for _ in range(self.ABORT_POLLS):
+            running -= set(re.findall(r'^(XFER[0-9]+) [0-9]+[ \t]*$', self.__send('cat {0}'.format(self.STATUS_FILE)),
+                                      re.MULTILINE))
+            if not running:
+                break
+            time.sleep(self.poll_interval)
+        if running:
+            log.warning("TFTP MGR: {0} not confirmed stopped.".format([in_flight[tag][0].dst for tag in running]))
+        self.__remove([item.dst for item, _ in in_flight.values()])
+        return
+
+    def __remove(self, files):
+        for i in range(0, len(files), self.BATCH_SIZE):
+            self.__send('rm -f {0}'.format(' '.join(files[i:i + self.BATCH_SIZE])))
+        return
+
+    def __batch_query(self, cmd, files, pattern, groups):
+        """ (INTERNAL) Run a command on batches of files and parse one line per file.
+        :param (str) cmd: Command prefix
+        :param (list) files:
+        :param (str) pattern: Regex for each output line.
+        :param (tuple) groups: Regex group indexes for (filename, value).
+        :return (dict): {<filename>: <value>, ...}
+        """
+        values = {}
+        p = re.compile(pattern, re.MULTILINE)
+        for i in range(0, len(files), self.BATCH_SIZE):
+            batch = files[i:i + self.BATCH_SIZE]
+            recbuf = self.__send('{0} {1} 2>/dev/null'.format(cmd, ' '.join(batch)))
+            for m in p.finditer(recbuf):
+                values[m.group(groups[0])] = m.group(groups[1])
+        return values
@@ -6,20 +6,22 @@ Power
 # ------
 import sys
 import time
-import re
 import logging
 
 # Apollo
 # ------
 import apollo.libs.lib as aplib
-import apollo.libs.locking as locking
 
 # BU Lib
 # ------
 from apollo.scripts.entsw.libs.utils.common_utils import apollo_step
+from apollo.scripts.entsw.libs.utils.common_utils import get_active_modular_registry
+from apollo.scripts.entsw.libs.product_drivers.power_sequencer import PowerSequencer
+from apollo.scripts.entsw.libs.product_drivers.power_sequencer import DEFAULT_STAGGER
+from apollo.scripts.entsw.libs.product_drivers import term_server
 
 __title__ = "Catalyst Power General Module"
-__version__ = '2.0.0'
+__version__ = '2.1.0'
 __author__ = ['bborel']
 
 thismodule = sys.modules[__name__]
@@ -37,6 +39,9 @@ if not hasattr(aplib.conn, 'uutTN'):
 
 class Power(object):
     POTENTIAL_CHANNELS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+    # Product definition overrides: uut_config['power_sequence'] = {'concurrent': True, 'stagger': 0.5, 'verify': ['ON'], 'strict': False}
+    # Verification of the channel states is opt-in (verify=[] means no status reads after the operation).
+    DEFAULT_SEQUENCE_CFG = {'concurrent': True, 'stagger': DEFAULT_STAGGER, 'verify': [], 'strict': False}
 
     def __init__(self, mode_mgr, ud):
         log.info(self.__repr__())
@@ -62,6 +67,9 @@ class Power(object):
                     self.__available_channels.append((c, conn))
         log.info("Available power channels = {0}".format(self.__available_channels))
         self._callback = None
+        self.__sequencer = None
+        self.__sequence_verbose = True
+        self.__ts_drivers = {}
         return
 
     def __repr__(self):
@@ -70,6 +78,31 @@ class Power(object):
     @property
     def available_channels(self):
         return self.__available_channels
+
+    @property
+    def sequence_cfg(self):
+        cfg = dict(self.DEFAULT_SEQUENCE_CFG)
+        cfg.update((getattr(self._ud, 'uut_config', None) or {}).get('power_sequence', {}))
+        return cfg
+
+    @property
+    def sequencer(self):
+        """ The sequencer (and its timestamp history) is kept; its settings follow the current uut_config. """
+        cfg = self.sequence_cfg
+        if not self.__sequencer:
+            self.__sequencer = PowerSequencer(operation=self.__sequence_operation,
+                                              status=self.__sequence_status,
+                                              group=self.__sequence_group,
+                                              expected_states={'ON': aplib.STATUS_OPEN, 'OFF': aplib.STATUS_CLOSED})
+        self.__sequencer.stagger = cfg['stagger']
+        self.__sequencer.concurrent = cfg['concurrent']
+        self.__sequencer.verify_ops = list(cfg['verify'])
+        return self.__sequencer
+
+    @property
+    def timestamps(self):
+        """ On/off timestamps per channel: {channel: [(op, start, end), ...]} """
+        return self.sequencer.timestamps()
     # ==================================================================================================================
     # APOLLO STEP Methods
     # ==================================================================================================================
@@ -87,22 +120,20 @@ class Power(object):
         log.info('CONTAINER_KEY:')
         log.info('{0}'.format(container_key))
         container = container_key.split("|")[-1]
-        pl, ar, ts, _ = container_key.split("|", 3)
 
         # 1. Check for power dependencies
         if self._ud.category == 'MODULAR':
-            active_modular_name = '_'.join([pl, ar, ts, 'ActiveModular'])
-            with locking.ContainerPriorityLock('__active_modular__'):
-                active_modular = aplib.get_cached_data(active_modular_name)
-                if not active_modular:
-                    log.error("No active modular stations; please activate a UUT for allocation.")
-                    return aplib.FAIL
-                if container == active_modular[0] and self._uut_conn.status != aplib.STATUS_OPEN:
-                    log.debug("Modular; primary connection for power on.")
-                    bypass = False
-                else:
-                    log.debug("Modular; shared connection and/or connection already open.")
-                    bypass = True
+            # Expired leases (aborted/crashed containers) are reaped here.
+            active_modular = get_active_modular_registry().members()
+            if not active_modular:
+                log.error("No active modular stations; please activate a UUT for allocation.")
+                return aplib.FAIL
+            if container == active_modular[0] and self._uut_conn.status != aplib.STATUS_OPEN:
+                log.debug("Modular; primary connection for power on.")
+                bypass = False
+            else:
+                log.debug("Modular; shared connection and/or connection already open.")
+                bypass = True
 
         # 2. Skip power if allowed
         if bypass:
@@ -110,7 +141,8 @@ class Power(object):
             return aplib.PASS
 
         # 3. Perform the power operation !!
-        self.__power_operation(op='ON', channels=channels)
+        if not self.__power_operation(op='ON', channels=channels) and self.sequence_cfg['strict']:
+            return aplib.FAIL, 'Power channel state check failed after ON.'
 
         # 4. UUT Boot process
         if not wait_for_boot:
@@ -136,25 +168,23 @@ class Power(object):
         container_key = aplib.get_my_container_key()
         log.info('CONTAINER_KEY:')
         log.info('{0}'.format(container_key))
-        pl, ar, ts, _ = container_key.split("|", 3)
 
         # 1. Check for power dependencies
         if self._ud.category == 'MODULAR':
-            active_modular_name = '_'.join([pl, ar, ts, 'ActiveModular'])
-            with locking.ContainerPriorityLock('__active_modular__'):
-                active_modular = aplib.get_cached_data(active_modular_name)
-                if active_modular:
-                    if len(active_modular) > 1:
-                        log.debug("More than one modular UUT container is active; cannot power off.")
-                        log.debug("Active: {0}".format(active_modular))
-                        return aplib.SKIPPED
-                    elif len(active_modular) == 1:
-                        log.debug("One active modular container left; stay powered on.")
-                        log.debug("Active: {0}".format(active_modular))
-                        return aplib.SKIPPED
-                    else:
-                        log.debug("NO active modular containers!")
-                        log.debug("Power OFF is allowed.")
+            # Expired leases (aborted/crashed containers) are reaped here; they no longer keep the chassis powered.
+            active_modular = get_active_modular_registry().members()
+            if active_modular:
+                if len(active_modular) > 1:
+                    log.debug("More than one modular UUT container is active; cannot power off.")
+                    log.debug("Active: {0}".format(active_modular))
+                    return aplib.SKIPPED
+                elif len(active_modular) == 1:
+                    log.debug("One active modular container left; stay powered on.")
+                    log.debug("Active: {0}".format(active_modular))
+                    return aplib.SKIPPED
+            else:
+                log.debug("NO active modular containers!")
+                log.debug("Power OFF is allowed.")
 
         # 2. Determine OFF state
         if self._ud.keep_connected:  # or aplib.get_apollo_mode() == aplib.MODE_DEBUG:
@@ -169,7 +199,8 @@ class Power(object):
             return aplib.PASS
 
         # 3. Perform the power operation !!
-        self.__power_operation(op='OFF', channels=channels)
+        if not self.__power_operation(op='OFF', channels=channels) and self.sequence_cfg['strict']:
+            return aplib.FAIL, 'Power channel state check failed after OFF.'
         return aplib.PASS
 
     @apollo_step
@@ -245,19 +276,35 @@ class Power(object):
         See cycle_on(...)
             off(...)
 
-        For multi power supplies, this will perform one op at a time for all power supplies (i.e. channels)
+        For multi power supplies, the channels (i.e. power supplies) are sequenced concurrently by the PowerSequencer;
+        channels sharing a power connection are still done one at a time.  For CYCLE, all channels go OFF before any ON.
+        Set uut_config['power_sequence'] = {'concurrent': False} for the legacy one-at-a-time sequencing.
         :param op:
         :param channels:
         :param verbose:
-        :return:
+        :return (bool): True if all channels completed and all checked channel states matched.
         """
         channels = [c for c, o in self.__available_channels] if str(channels).upper() == 'ALL' else channels
         channels = [channels] if not isinstance(channels, list) else channels
-        op = ['OFF', 'ON'] if op == 'CYCLE' else [op]
-        for op_step in op:
-            for channel in channels:
-                self.__power_operation_workhorse(op=op_step, channel=channel, verbose=verbose)
-        return True
+        self.__sequence_verbose = verbose
+        result = self.sequencer.run(op=op, channels=[c.upper() for c in channels])
+        for event in self.sequencer.last_sequence:
+            log.info("Power {0:<3} channel {1}: {2:.1f}s  state={3}".format(event.op, event.channel, event.duration, event.state))
+        return result
+
+    def __sequence_operation(self, op, channel):
+        return self.__power_operation_workhorse(op=op, channel=channel, verbose=self.__sequence_verbose)
+
+    def __sequence_status(self, channel):
+        return self.__power_operation_workhorse(op='STATUS', channel=channel, verbose=self.__sequence_verbose)
+
+    def __sequence_group(self, channel):
+        """ Channels on the same power connection must not be driven concurrently. """
+        if channel == 'A':
+            conn = self.connA if self.connA and self.connA != self._mode_mgr.uut_conn else self._mode_mgr.uut_conn
+        else:
+            conn = getattr(self, 'conn{0}'.format(channel), None)
+        return id(conn) if conn else channel
 
     def __power_operation_workhorse(self, op='', channel='', verbose=True):
         """ (INTERNAL) Power Operation Workhorse
@@ -292,6 +339,8 @@ class Power(object):
             2) For a small percentage of time, a USB connection failure can occur IF the USB reset is NOT done.
 
         Note: Both USB Terminal Servers require a specific configuration. (See docs for further details. TBD)
+        The vendor commands, USB hub port maps and the (pooled) T/S control sessions are in term_server.py;
+        uut_config['ts_station_model'] selects a registered port map and uut_config['ts_port_map_file'] loads maps.
 
         :param (str) channel: Specific power equipment controller- 'A', 'B', 'C', 'D', etc.
                               This will correspond to the UUT's PSUs.
@@ -309,61 +358,34 @@ class Power(object):
         op = op.upper()
         log.info("POWER {0} for {1}...".format(op, channel))
 
-        port_offset = 0
         channel = channel.upper()
         uut_pwr_conn = None
         conn = None
 
-        OPENGEAR_USB_HUB_PORT_MAP = {
-            # Syntax = <UUT#>: (<hub loc>, <hub port>, <physical port>)
-            1: ('3-1', 1, 17), 2: ('3-1', 2, 18), 3: ('3-1', 3, 19), 4: ('3-1', 4, 20), 5: ('3-1', 5, 21),
-            6: ('3-1', 6, 22),
-            7: ('3-2', 1, 23), 8: ('3-2', 2, 24), 9: ('3-2', 3, 25), 10: ('3-2', 4, 26), 11: ('3-2', 5, 27),
-            12: ('3-2', 6, 28),
-            13: ('5-3', 1, 29), 14: ('5-3', 2, 30), 15: ('5-3', 3, 31), 16: ('5-3', 4, 32),
-            # These USB ports are NOT used since we do NOT have matching RS-232 ports!
-            # 17: ('5-3', 5, 33), 18: ('5-3', 6, 34),
-            # 19: ('5-4', 1, 35), 20: ('5-4', 2, 36), 21: ('5-4', 3, 37), 22: ('5-4', 4, 38), 23: ('5-4', 5, 39), 24: ('5-4', 6, 40),
-        }
-
         # Assign alias' --------
         if channel == 'A':
             if self.connA and self.connA != self._mode_mgr.uut_conn:
                 uut_pwr_conn = self.connA
             conn = self._mode_mgr.uut_conn
-        elif channel == 'B' and self.connB:
-            uut_pwr_conn = self.connB
-            port_offset = 16 if uut_pwr_conn.model.lower() == 'lantronix' or uut_pwr_conn.model.lower() == 'opengear' else 0
-        elif channel == 'C' and self.connC:
-            uut_pwr_conn = self.connC
-        elif channel == 'D' and self.connD:
-            uut_pwr_conn = self.connD
-        elif channel == 'E' and self.connE:
-            uut_pwr_conn = self.connE
-        elif channel == 'F' and self.connF:
-            uut_pwr_conn = self.connF
-        elif channel == 'G' and self.connG:
-            uut_pwr_conn = self.connG
-        elif channel == 'H' and self.connH:
-            uut_pwr_conn = self.connH
+        elif channel in self.POTENTIAL_CHANNELS[1:]:
+            uut_pwr_conn = getattr(self, 'conn{0}'.format(channel), None)
 
         if not uut_pwr_conn and not conn:
             __logdebug("Power channel: '{0}' is NOT available.".format(channel))
             return
 
         uut_pwr_conn.clear_recbuf() if uut_pwr_conn else None
+        driver = self.__ts_driver(uut_pwr_conn) if uut_pwr_conn else None
+        # Both Lantronix & OpenGear have 16 usable USB ports so the port is normalized against the max usable port count.
+        p = driver.port(self._ud.uut_index, channel) if driver else None
         __logdebug("Channel     : {0}".format(channel))
-        __logdebug("UUT Pwr Conn: {0}".format(uut_pwr_conn))
+        __logdebug("UUT Pwr Conn: {0}  ({1} port={2})".format(uut_pwr_conn, driver.VENDOR if driver else None, p))
         __logdebug("UUT Conn    : {0}".format(conn))
         time.sleep(1.0)
 
-        # Both Lantronix & OpenGear have 16 usable USB ports so normalize UUT index against their max usable port count.
-        port_boundary = 16
-        normalized_uut_index = ((self._ud.uut_index - 1) % port_boundary) + 1 if ((self._ud.uut_index - 1) % port_boundary) != 0 else 1
-
         # Power OFF ----------
         if op in ['CYCLE', 'OFF']:
-            __logdebug("OFF-->") if verbose else None
+            __logdebug("OFF-->")
             if conn and not uut_pwr_conn:
                 __loginfo("Integrated {0} PSU OFF.".format(channel))
                 conn.power_off()
@@ -372,34 +394,8 @@ class Power(object):
                 __loginfo("Separate console; disconnect.")
                 conn.close()
             if uut_pwr_conn:
-                p = normalized_uut_index + port_offset
                 __loginfo("Separate {0} PSU OFF.".format(channel))
-                uut_pwr_conn.open()
-                time.sleep(1)
-                if uut_pwr_conn.model.lower() == 'lantronix':
-                    __logdebug("Lantronix")
-                    uut_pwr_conn.send('set deviceport port {0} assertdtr disable\r'.format(p), expectphrase='> ',
-                                      timeout=30)
-                    __logdebug("Disconnect USB port={0}".format(p))
-                    time.sleep(1)
-                    uut_pwr_conn.close() if op == 'OFF' else None
-                elif uut_pwr_conn.model.lower() == 'opengear':
-                    __logdebug("OpenGear")
-                    # Note: For this to work, the RS-232 port must NOT be connected by Apollo via telnet/ssh.
-                    # uut_pwr_conn.send('config -s config.ports.port{0}.dtrmode=activeuser -r serialconfig\r'.format(p), expectphrase='# ', timeout=30)
-                    uut_pwr_conn.send('config -s config.ports.port{0}.dtrmode=alwayson -r serialconfig\r'.format(p),
-                                      expectphrase='# ', timeout=30)
-                    __logdebug("Disconnect USB port={0}".format(p))
-                    usb_hub_loc = OPENGEAR_USB_HUB_PORT_MAP[p][0]
-                    usb_hub_port = OPENGEAR_USB_HUB_PORT_MAP[p][1]
-                    __logdebug("Connect USB port={0}  Location={1}  HubPort={2}".format(p, usb_hub_loc, usb_hub_port))
-                    uut_pwr_conn.send('uhubctl -l {0} -p {1} -a 0\r'.format(usb_hub_loc, usb_hub_port),
-                                      expectphrase='# ', timeout=30)
-                    uut_pwr_conn.send('pmshell -l port{0:02d} --dtr 0\r'.format(p), expectphrase='# ', timeout=30)
-                    time.sleep(1)
-                    uut_pwr_conn.close() if op == 'OFF' else None
-                else:
-                    uut_pwr_conn.power_off()
+                driver.power_off(p)
             # if 'FANGROUP' in aplib.get_container_sync_groups():
             #    _op_station_fans('OFF')
             __logdebug("<--OFF")
@@ -416,34 +412,11 @@ class Power(object):
                 __loginfo("Integrated {0} PSU ON.".format(channel))
                 conn.power_on()
             if uut_pwr_conn:
-                p = normalized_uut_index + port_offset
                 __loginfo("Separate {0} PSU ON.".format(channel))
-                uut_pwr_conn.open()
-                time.sleep(1)
-                if uut_pwr_conn.model.lower() == 'lantronix':
-                    __logdebug("Lantronix")
-                    uut_pwr_conn.send('set deviceport port {0} assertdtr enable\r'.format(p), expectphrase='> ',
-                                      timeout=30)
-                    __logdebug("Connect USB port={0}".format(p))
-                elif uut_pwr_conn.model.lower() == 'opengear':
-                    __logdebug("OpenGear")
-                    # Note: For this to work, the RS-232 port must NOT be connected by Apollo via telnet/ssh.
-                    usb_hub_loc = OPENGEAR_USB_HUB_PORT_MAP[p][0]
-                    usb_hub_port = OPENGEAR_USB_HUB_PORT_MAP[p][1]
-                    __logdebug("Connect USB port={0}  Location={1}  HubPort={2}".format(p, usb_hub_loc, usb_hub_port))
-                    # uut_pwr_conn.send('uhubctl -l {0} -p {1} -a 2\r'.format(usb_hub_loc, usb_hub_port), expectphrase='# ', timeout=30)
-                    # __logdebug("OpenGear waiting 10 secs...")
-                    # time.sleep(10.0)
-                    uut_pwr_conn.send('pmshell -l port{0:02d} --dtr 1\r'.format(p), expectphrase='# ', timeout=30)
-                    uut_pwr_conn.send('uhubctl -l {0} -p {1} -a 1\r'.format(usb_hub_loc, usb_hub_port),
-                                      expectphrase='# ', timeout=30)
-                    # uut_pwr_conn.send('pmshell -l port{0:02d}\r'.format(p + port_boundary), expectphrase='# ', timeout=30)
-                    # uut_pwr_conn.send('config -s config.ports.port{0}.dtrmode=alwayson -r serialconfig\r'.format(p), expectphrase='# ', timeout=30)
-                    # __logdebug("OpenGear waiting 10 secs...")
+                driver.power_on(p)
+                if driver.CONSOLE_WAKE and conn:
                     time.sleep(1.0)
-                    conn.send('\r', expectphrase='.*', timeout=30, regex=True) if conn else None
-                else:
-                    uut_pwr_conn.power_on()
+                    conn.send('\r', expectphrase='.*', timeout=30, regex=True)
             #if 'FANGROUP' in aplib.get_container_sync_groups():
             #    _op_station_fans('ON')
             __logdebug("<--ON")
@@ -454,29 +427,9 @@ class Power(object):
             __logdebug("STATUS-->")
             status = None
             if uut_pwr_conn:
-                p = normalized_uut_index + port_offset
                 __loginfo("Separate {0} PSU STATUS.".format(channel))
-                uut_pwr_conn.open()
-                time.sleep(1)
-                if uut_pwr_conn.model.lower() == 'lantronix':
-                    __logdebug("Lantronix")
-                    pat = 'Assert D[ST]R: (disabled|enabled)'
-                    uut_pwr_conn.send('admin version\r', expectphrase='> ', timeout=30)
-                    uut_pwr_conn.send('show deviceport port {0} display data\r'.format(p), expectphrase='> ', timeout=30)
-                    time.sleep(3)
-                    m = re.search(pat, uut_pwr_conn.recbuf)
-                    status = aplib.STATUS_OPEN if m and m.group(1) == 'enabled' else aplib.STATUS_CLOSED
-                elif uut_pwr_conn.model.lower() == 'opengear':
-                    __logdebug("OpenGear")
-                    pat = 'label (.*)'
-                    uut_pwr_conn.send('cat /etc/version\r', expectphrase='# ', timeout=30)
-                    uut_pwr_conn.send('config -g config.ports.port{0}\r'.format(p), expectphrase='# ', timeout=30)
-                    time.sleep(3)
-                    m = re.search(pat, uut_pwr_conn.recbuf)
-                    __logdebug(m)
-                    status = aplib.STATUS_OPEN if m and m.group(1) != '' else aplib.STATUS_CLOSED
-                else:
-                    status = uut_pwr_conn.status
+                state = driver.status(p)
+                status = None if state is None else (aplib.STATUS_OPEN if state else aplib.STATUS_CLOSED)
             if conn and not uut_pwr_conn:
                 __loginfo("Integrated {0} PSU STATUS.".format(channel))
                 status = conn.status
@@ -486,3 +439,13 @@ class Power(object):
 
         return
 
+    def __ts_driver(self, uut_pwr_conn):
+        """ Terminal server driver per power connection (the T/S control session is pooled by term_server). """
+        if id(uut_pwr_conn) not in self.__ts_drivers:
+            uut_config = getattr(self._ud, 'uut_config', None) or {}
+            if uut_config.get('ts_port_map_file'):
+                term_server.registry.load(uut_config['ts_port_map_file'])
+            driver = term_server.get_driver(uut_pwr_conn, station_model=uut_config.get('ts_station_model'))
+            log.debug("T/S driver: {0} for {1}".format(driver.__class__.__name__, uut_pwr_conn))
+            self.__ts_drivers[id(uut_pwr_conn)] = driver
+        return self.__ts_drivers[id(uut_pwr_conn)]
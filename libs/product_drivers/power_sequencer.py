@@ -0,0 +1,193 @@
+"""
+Power Sequencer
+========================================================================================================================
+
+Concurrent power sequencing for multi-channel (multi-PSU) UUTs.
+The channel operation itself (DTR toggle, USB hub port reset, integrated PSU) is provided by the caller; this module
+only schedules it:
+    1. Channels are grouped by their power connection; channels sharing a connection (e.g. one terminal server)
+       are run one at a time, independent groups run concurrently.
+    2. Channel starts are staggered (inrush current; terminal server load).
+    3. Each channel state is checked afterwards (optional) and the on/off timestamps are recorded.
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import time
+import logging
+import threading
+from collections import deque
+
+__title__ = "Power Sequencer Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_STAGGER = 0.5
+HISTORY_SIZE = 100
+
+
+class ChannelEvent(object):
+    """ One channel operation: timestamps, state and error. """
+    def __init__(self, channel, op):
+        self.channel = channel
+        self.op = op
+        self.start = None
+        self.end = None
+        self.state = None
+        self.verified = None
+        self.error = None
+
+    def __repr__(self):
+        return "ChannelEvent({0} {1} {2:.2f}s state={3} verified={4}{5})".format(
+            self.channel, self.op, self.duration, self.state, self.verified, ' error={0}'.format(self.error) if self.error else '')
+
+    @property
+    def duration(self):
+        return (self.end - self.start) if self.start and self.end else 0.0
+
+    def as_dict(self):
+        return dict(channel=self.channel, op=self.op, start=self.start, end=self.end, duration=round(self.duration, 3),
+                    state=self.state, verified=self.verified, error=str(self.error) if self.error else None)
+
+
+class PowerSequencer(object):
+    """ Power Sequencer
+    Run a power operation over several channels concurrently.
+    """
+    def __init__(self, operation, status=None, group=None, stagger=DEFAULT_STAGGER, concurrent=True,
+                 expected_states=None, verify_ops=None):
+        """
+        :param (func) operation: operation(op, channel) performs 'ON' or 'OFF' on one channel.
+        :param (func) status: status(channel) returns the channel state (None = unknown).
+        :param (func) group: group(channel) returns a key; channels with the same key are never run concurrently.
+        :param (float) stagger: Secs between channel starts.
+        :param (bool) concurrent: False = legacy one-at-a-time sequencing.
+        :param (dict) expected_states: {op: state} expected from status() after the op.
+        :param (list) verify_ops: Ops to check the state for (default all ops with an expected state).
+        """
+        self.operation = operation
+        self.status = status
+        self.group = group if group else (lambda channel: channel)
+        self.stagger = stagger
+        self.concurrent = concurrent
+        self.expected_states = expected_states if expected_states else {}
+        self.verify_ops = verify_ops if verify_ops is not None else list(self.expected_states.keys())
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.last_sequence = []
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self, op, channels):
+        """ Run
+        :param (str) op: 'ON', 'OFF' or 'CYCLE' (= OFF for all channels then ON for all channels).
+        :param (list) channels: Channel names.
+        :return (bool): True if every channel op completed and all checked states matched.
+        """
+        self.last_sequence = []
+        ops = ['OFF', 'ON'] if op.upper() == 'CYCLE' else [op.upper()]
+        result = True
+        for op_step in ops:
+            events = self.__run_step(op_step, channels)
+            if op_step in self.verify_ops and self.status:
+                self.__verify(events)
+            self.last_sequence += events
+            # Channel errors are not swallowed (same as a sequential run); the first is raised once the step is done.
+            errors = [e.error for e in events if e.error]
+            if errors:
+                raise errors[0]
+            result = result and all([e.verified is not False for e in events])
+        return result
+
+    def timestamps(self, channel=None):
+        """ On/off timestamps per channel from the history.
+        :return (dict): {channel: [(op, start, end), ...]}
+        """
+        stamps = {}
+        for e in self.history:
+            if channel is None or e.channel == channel:
+                stamps.setdefault(e.channel, []).append((e.op, e.start, e.end))
+        return stamps
+
+    def summary(self):
+        """ Last sequence as a list of dicts (e.g. for uut_config/logging). """
+        return [e.as_dict() for e in self.last_sequence]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __run_step(self, op, channels):
+        events = [ChannelEvent(channel, op) for channel in channels]
+        groups = self.__groups(events)
+        log.debug("Power {0}: groups={1} concurrent={2} stagger={3}s".format(
+            op, [[e.channel for e in g] for g in groups], self.concurrent, self.stagger))
+        self.__run_groups(self.__operate, groups, self.stagger)
+        self.history.extend(events)
+        return events
+
+    def __groups(self, events):
+        keys, groups = [], []
+        for event in events:
+            key = self.group(event.channel)
+            if key not in keys:
+                keys.append(key)
+                groups.append([])
+            groups[keys.index(key)].append(event)
+        return groups
+
+    def __run_groups(self, func, groups, stagger):
+        """ Groups run concurrently (staggered starts); events within a group run in order. """
+        def __group_worker(events, delay):
+            time.sleep(delay) if delay else None
+            for event in events:
+                func(event)
+
+        if not self.concurrent or len(groups) == 1:
+            __group_worker([e for g in groups for e in g], 0.0)
+            return
+        threads = []
+        for i, events in enumerate(groups):
+            t = threading.Thread(target=__group_worker, args=(events, i * stagger), name='power_{0}'.format(events[0].channel))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        return
+
+    def __operate(self, event):
+        event.start = time.time()
+        try:
+            self.operation(event.op, event.channel)
+        except Exception as e:
+            log.error("Power {0} channel {1} failed: {2}".format(event.op, event.channel, e))
+            event.error = e
+        event.end = time.time()
+        return
+
+    def __check(self, event):
+        expected = self.expected_states.get(event.op)
+        try:
+            event.state = self.status(event.channel)
+        except Exception as e:
+            log.warning("Power {0} state check failed: {1}".format(event.channel, e))
+            event.state = None
+        # Unknown state is not a mismatch; some equipment cannot report it.
+        event.verified = None if event.state is None or expected is None else event.state == expected
+        if event.verified is False:
+            log.warning("Power {0} channel {1}: state={2} expected={3}".format(event.op, event.channel, event.state, expected))
+        return
+
+    def __verify(self, events):
+        self.__run_groups(self.__check, self.__groups([e for e in events if not e.error]), 0.0)
+        return
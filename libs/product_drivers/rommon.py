@@ -145,6 +145,8 @@ class Rommon(RommonBase):
     RECBUF_TIME = 3.0
     RECBUF_CLEAR_TIME = 1.0
     USE_CLEAR_RECBUF = False
+    SET_CMD = 'set'
+    SET_CHUNK_SIZE = 240
     NETWORK_PARAM_SETS = {
         'Gen2': ['MAC_ADDR', 'IP_ADDR', None, 'DEFAULT_ROUTER', None],
         'Gen3': ['MAC_ADDR', 'IP_ADDRESS', 'IP_SUBNET_MASK', 'DEFAULT_GATEWAY', 'TFTP_SERVER'],
@@ -320,67 +322,21 @@ class Rommon(RommonBase):
             time.sleep(1.0)
             self._uut_conn.send('\r', expectphrase=self._uut_prompt, timeout=20, regex=True)
 
-            # Set or update the params
+            # Set or update the params (only the changed ones)
             log.debug("SETTING Rommon Params...")
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key]:
-                        if setparams[key] != fullparams[key]:
-                            # Change the parameter
-                            self._mac_special(key, setparams, fullparams)
-                            self._uut_conn.send('set {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                               expectphrase=self._uut_prompt, timeout=20, regex=True)
-                            log.info("{0} = {1}  (set changed)".format(key, setparams[key]))
-                        else:
-                            # No change necessary
-                            log.info("{0} = {1}".format(key, setparams[key]))
-                    else:
-                        # Empty or null value will be ignored.
-                        log.info("{0} is empty; not allowed when setting. Use 'unset' instead.".format(key))
-                else:
-                    # Create a new parameter if it has a value
-                    if setparams[key]:
-                        self._uut_conn.send('set {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                           expectphrase=self._uut_prompt, timeout=10, regex=True)
-                        log.info("{0} = {1}  (set new)".format(key, setparams[key]))
-                    else:
-                        log.debug("{0} is empty & new, ignore it.".format(key))
-            self._fresh_read = False
+            changes = self._diff_params(setparams, fullparams)
+            self._write_params(changes, timeout=20) if changes else None
 
             # Burn the parameter block
-            # The "pb:" area is a strictly defined set of params used by IOS (and diags) that MUST be populated!
-            # Note: "pb:" is typically protected by a read-only setting.
-            #       The ro setting should be restored during customer configuration time.
-            time.sleep(1.0)
-            self._uut_conn.send('set_bs pb: rw\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
-            self._uut_conn.send('set_param -all\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
-            time.sleep(self.RECBUF_TIME)
-            if 'Parameters burned' in self._uut_conn.recbuf:
-                log.debug("Parameters burned into pb:")
-            else:
-                log.error("Parameters NOT burned into pb: !")
-                ret = False
-                raise aplib.apexceptions.ResultFailure("Param burn in pb: NOT confirmed.")
-            if restore_ro:
-                log.debug('Restore pb: to read-only.')
-                self._uut_conn.send('set_bs pb: ro\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
+            ret = self._burn_params(restore_ro=restore_ro)
 
-            # Now verify that the params were actually set
-            fullparams = self.get_params()
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key] and setparams[key] != fullparams[key]:
-                        # Invalid; something went wrong during the set process.
-                        log.warning("{0} set = '{1}'  found = '{2}'".format(key, setparams[key], fullparams[key]))
-                        ret = False
-                else:
-                    if setparams[key]:
-                        # Invalid, the item is missing and is not ignored.
-                        log.warning("{0} was NOT found.".format(key))
-                        ret = False
+            # Now verify that the params were actually set (fresh readback; failed params are re-sent one at a time)
+            ret = self._verify_written(setparams, changes, timeout=20,
+                                       after_write=lambda: self._burn_params(restore_ro=restore_ro)) and ret
 
         except aplib.apexceptions.ResultFailure as e:
             log.error(e)
+            ret = False
         except Exception as e:
             log.error(e)
         finally:
@@ -964,6 +920,130 @@ class Rommon(RommonBase):
                 log.warning("Current MAC and set MAC are equivalent but in different forms; be careful!")
         return
 
+    def _diff_params(self, setparams, fullparams, force=False):
+        """ Diff Params
+        Compare the desired params against the current params (i.e. the get_params() cache).
+        :param (dict) setparams: Params and values to set.
+        :param (dict) fullparams: Current params.
+        :param (bool) force: Write existing params even if unchanged.
+        :return (OrderedDict): {<key>: <value>, ...} Only the params that must be written (changed or new).
+        """
+        changes = OrderedDict()
+        for key in setparams:
+            if key in fullparams:
+                if setparams[key]:
+                    if setparams[key] != fullparams[key] or force:
+                        # Change the parameter
+                        self._mac_special(key, setparams, fullparams)
+                        changes[key] = setparams[key]
+                        log.info("{0} = {1}  (set changed)".format(key, setparams[key]))
+                    else:
+                        # No change necessary
+                        log.info("{0} = {1}".format(key, setparams[key]))
+                else:
+                    # Empty or null value will be ignored.
+                    log.info("{0} is empty; not allowed when setting. Use 'unset' instead.".format(key))
+            else:
+                # Create a new parameter if it has a value
+                if setparams[key]:
+                    changes[key] = setparams[key]
+                    log.info("{0} = {1}  (set new)".format(key, setparams[key]))
+                else:
+                    log.debug("{0} is empty & new, ignore it.".format(key))
+        return changes
+
+    def _write_params(self, changes, timeout=30, chunk_size=None):
+        """ Write Params
+        Send the set commands pipelined in chunks sized to the console buffer (SET_CHUNK_SIZE);
+        the prompt is only waited for once per chunk (i.e. after the echo of the last command in the chunk).
+        :param (dict) changes: {<key>: <value>, ...}
+        :param (int) timeout: Timeout per param.
+        :param (int) chunk_size: Max chars per chunk (default=SET_CHUNK_SIZE); 0 = one command at a time.
+        :return (int): Number of chunks sent.
+        """
+        chunk_size = self.SET_CHUNK_SIZE if chunk_size is None else chunk_size
+        cmds = ['{0} {1} {2}'.format(self.SET_CMD, key, value if ' ' not in value else '"{0}"'.format(value))
+                for key, value in changes.items()]
+        chunks = []
+        for cmd in cmds:
+            if chunks and len('\r'.join(chunks[-1] + [cmd])) < chunk_size:
+                chunks[-1].append(cmd)
+            else:
+                chunks.append([cmd])
+        for chunk in chunks:
+            log.debug("Writing {0} param(s)...".format(len(chunk)))
+            self._uut_conn.send('{0}\r'.format('\r'.join(chunk)),
+                                expectphrase=r'{0}[\s\S]*?(?:{1})'.format(re.escape(chunk[-1]), self._uut_prompt),
+                                timeout=timeout * len(chunk), regex=True)
+        self._fresh_read = False
+        return len(chunks)
+
+    def _verify_written(self, setparams, changes, timeout=30, after_write=None):
+        """ Verify Written Params
+        Fresh readback (never the get_params() cache) and verify.  The pipelined set commands are typed ahead;
+        if any param did not take, the failed ones are re-sent one at a time and read back again.
+        :param (dict) setparams: Params and values to set.
+        :param (dict) changes: Params that were written (see _diff_params()).
+        :param (int) timeout: Timeout per param.
+        :param (func) after_write: Called after the re-send and before the readback (ex. burn or reset).
+        :return (bool): True if all non-empty params match.
+        """
+        self._fresh_read = False
+        fullparams = self.get_params()
+        if self._verify_params(setparams, fullparams):
+            return True
+        failed = OrderedDict([(k, v) for k, v in changes.items() if fullparams.get(k) != v])
+        if not failed:
+            return False
+        log.warning("Re-sending {0} param(s) one at a time: {1}".format(len(failed), list(failed.keys())))
+        self._write_params(failed, timeout=timeout, chunk_size=0)
+        after_write() if after_write else None
+        self._fresh_read = False
+        return self._verify_params(setparams, self.get_params())
+
+    def _burn_params(self, restore_ro=False):
+        """ Burn Params
+        The "pb:" area is a strictly defined set of params used by IOS (and diags) that MUST be populated!
+        Note: "pb:" is typically protected by a read-only setting.
+              The ro setting should be restored during customer configuration time.
+        :param (bool) restore_ro: Restore pb: to read-only after the burn.
+        :return (bool): True if burned (ResultFailure otherwise).
+        """
+        time.sleep(1.0)
+        self._uut_conn.send('set_bs pb: rw\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
+        self._uut_conn.send('set_param -all\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
+        time.sleep(self.RECBUF_TIME)
+        if 'Parameters burned' in self._uut_conn.recbuf:
+            log.debug("Parameters burned into pb:")
+        else:
+            log.error("Parameters NOT burned into pb: !")
+            raise aplib.apexceptions.ResultFailure("Param burn in pb: NOT confirmed.")
+        if restore_ro:
+            log.debug('Restore pb: to read-only.')
+            self._uut_conn.send('set_bs pb: ro\r', expectphrase=self._uut_prompt, timeout=10, regex=True)
+        return True
+
+    @staticmethod
+    def _verify_params(setparams, fullparams):
+        """ Verify Params
+        :param (dict) setparams: Params and values that were set.
+        :param (dict) fullparams: Params read back.
+        :return (bool): True if all non-empty params match.
+        """
+        ret = True
+        for key in setparams:
+            if key in fullparams:
+                if setparams[key] and setparams[key] != fullparams[key]:
+                    # Invalid; something went wrong during the set process.
+                    log.warning("{0} set = '{1}'  found = '{2}'".format(key, setparams[key], fullparams[key]))
+                    ret = False
+            else:
+                if setparams[key]:
+                    # Invalid, the item is missing and is not ignored.
+                    log.warning("{0} was NOT found.".format(key))
+                    ret = False
+        return ret
+
     def _check_dependencies(self):
         if not self._mode_mgr:
             log.warning("*" * 50)
@@ -1191,6 +1271,8 @@ class RommonC9200(RommonGen3):
     This class is product family specific.
     Families included: Quake
     """
+    SET_CMD = 'setenv'
+
     def __init__(self, mode_mgr, ud, **kwargs):
         super(RommonC9200, self).__init__(mode_mgr, ud, **kwargs)
         return
@@ -1338,53 +1420,24 @@ class RommonC9200(RommonGen3):
             # Get initial settings
             fullparams = self.get_params()
 
-            # Set or update the params
+            # Set or update the params (only the changed ones)
             log.debug("SETTING C2K/C9200 Gen3 Rommon Params...")
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key]:
-                        if setparams[key] != fullparams[key]:
-                            # Change the parameter
-                            self._mac_special(key, setparams, fullparams)
-                            self._uut_conn.send('setenv {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                               expectphrase=self._uut_prompt, timeout=20, regex=True)
-                            log.info("{0} = {1}  (set changed)".format(key, setparams[key]))
-                        else:
-                            # No change necessary
-                            log.info("{0} = {1}".format(key, setparams[key]))
-                    else:
-                        # Empty or null value will be ignored.
-                        log.info("{0} is empty; not allowed when setting. Use 'unset' instead.".format(key))
-                else:
-                    # Create a new parameter if it has a value
-                    if setparams[key]:
-                        self._uut_conn.send('setenv {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                           expectphrase=self._uut_prompt, timeout=10, regex=True)
-                        log.info("{0} = {1}  (set new)".format(key, setparams[key]))
-                    else:
-                        log.debug("{0} is empty & new, ignore it.".format(key))
-            self._fresh_read = False
+            changes = self._diff_params(setparams, fullparams)
+            if not changes:
+                log.debug("All params are current; no write, reset, or readback needed.")
+                return ret
+            self._write_params(changes, timeout=20)
 
-            # Now verify that the params were actually set
-            if reset_required:
+            def __reset():
                 log.debug("Reset is required...")
                 self._uut_conn.send('reset\r', expectphrase='reset', timeout=20, regex=True)  # 'reset the system (y/n)?'
                 self._uut_conn.send('y\r', expectphrase='.*', timeout=30, regex=True)
                 log.debug("Waiting for boot...")
                 self._mode_mgr.wait_for_boot(boot_mode=['BTLDR'], boot_msg='(?:Booting)|(?:Initializing)')
 
-            fullparams = self.get_params()
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key] and setparams[key] != fullparams[key]:
-                        # Invalid; something went wrong during the set process.
-                        log.warning("{0} setenv = '{1}'  found = '{2}'".format(key, setparams[key], fullparams[key]))
-                        ret = False
-                else:
-                    if setparams[key]:
-                        # Invalid, the item is missing and is not ignored.
-                        log.warning("{0} was NOT found.".format(key))
-                        ret = False
+            # Now verify that the params were actually set
+            __reset() if reset_required else None
+            ret = self._verify_written(setparams, changes, timeout=20, after_write=__reset if reset_required else None)
 
         except aplib.apexceptions.ResultFailure as e:
             log.error(e)
@@ -1893,56 +1946,28 @@ class RommonC9300(RommonGen3):
             self._uut_conn.send('\r', expectphrase=self._uut_prompt, timeout=20, regex=True)
             time.sleep(1.0)
 
-            # Set or update the params
+            # Set or update the params (only the changed ones)
             log.debug("SETTING Gen3 Rommon Params...")
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key]:
-                        if setparams[key] != fullparams[key] or force:
-                            # Change the parameter
-                            self._mac_special(key, setparams, fullparams)
-                            self._uut_conn.send('set {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                               expectphrase=self._uut_prompt, timeout=30, regex=True)
-                            log.info("{0} = {1}  (set changed)".format(key, setparams[key]))
-                        else:
-                            # No change necessary
-                            log.info("{0} = {1}".format(key, setparams[key]))
-                    else:
-                        # Empty or null value will be ignored.
-                        log.info("{0} is empty; not allowed when setting. Use 'unset' instead.".format(key))
-                else:
-                    if setparams[key]:
-                        # Create a new parameter
-                        self._uut_conn.send('set {0} {1}\r'.format(key, setparams[key] if ' ' not in setparams[key] else '"{0}"'.format(setparams[key])),
-                                           expectphrase=self._uut_prompt, timeout=30, regex=True)
-                        log.info("{0} = {1}  (set new)".format(key, setparams[key]))
-                    else:
-                        log.debug("{0} is empty & new, ignore it.".format(key))
-            self._fresh_read = False
+            changes = self._diff_params(setparams, fullparams, force=force)
+            if not changes:
+                log.debug("All params are current; no write, reset, or readback needed.")
+                return ret
+            self._write_params(changes, timeout=30)
 
-            # Now verify that the params were actually set
-            time.sleep(1.0)
-            self._uut_conn.send('\r', expectphrase=self._uut_prompt, timeout=20, regex=True)
-            time.sleep(1.0)
-            if reset_required:
-                log.debug("Reset is required...")
-                self._uut_conn.send('reset\r', expectphrase='reset', timeout=20, regex=True)  # 'reset? [y]'
-                self._uut_conn.send('y\r', expectphrase='.*', timeout=30, regex=True)
-                log.debug("Waiting for boot...")
-                self._mode_mgr.wait_for_boot(boot_mode=['BTLDR'], boot_msg='(?:Booting)|(?:Initializing)')
+            def __settle_and_reset():
+                time.sleep(1.0)
+                self._uut_conn.send('\r', expectphrase=self._uut_prompt, timeout=20, regex=True)
+                time.sleep(1.0)
+                if reset_required:
+                    log.debug("Reset is required...")
+                    self._uut_conn.send('reset\r', expectphrase='reset', timeout=20, regex=True)  # 'reset? [y]'
+                    self._uut_conn.send('y\r', expectphrase='.*', timeout=30, regex=True)
+                    log.debug("Waiting for boot...")
+                    self._mode_mgr.wait_for_boot(boot_mode=['BTLDR'], boot_msg='(?:Booting)|(?:Initializing)')
 
-            fullparams = self.get_params()
-            for key in setparams:
-                if key in fullparams:
-                    if setparams[key] and setparams[key] != fullparams[key]:
-                        # Invalid; something went wrong during the set process.
-                        log.warning("{0} set = '{1}'  found = '{2}'".format(key, setparams[key], fullparams[key]))
-                        ret = False
-                else:
-                    if setparams[key]:
-                        # Invalid, the item is missing and is not ignored.
-                        log.warning("{0} was NOT found.".format(key))
-                        ret = False
+            # Now verify that the params were actually set
+            __settle_and_reset()
+            ret = self._verify_written(setparams, changes, timeout=30, after_write=__settle_and_reset)
 
         except aplib.apexceptions.ResultFailure as e:
             log.error(e)
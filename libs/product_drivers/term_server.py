@@ -0,0 +1,397 @@
+"""
+Terminal Server
+========================================================================================================================
+
+Terminal server (USB T/S) power control used by the Power driver:
+    1. PortMapRegistry: validated UUT# -> (USB hub loc, hub port, physical port) maps per vendor/station model;
+       maps are registered in code or loaded from JSON.
+    2. Vendor drivers (Lantronix, OpenGear, Generic) that own the vendor specific DTR/USB commands.
+    3. SessionPool: the control session of a terminal server is opened once and reused across power operations
+       (and across channels/containers using the same connection object) instead of open/close per operation.
+
+The drivers only need the Apollo connection API (open, close, send, recbuf, status, power_on/off).
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import time
+import json
+import logging
+import threading
+
+# Apollo
+# ------
+try:
+    from apollo.libs import lib as aplib
+except ImportError:
+    aplib = None
+
+__title__ = "Terminal Server Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+STATUS_OPEN = aplib.STATUS_OPEN if aplib else 'open'
+STATUS_CLOSED = aplib.STATUS_CLOSED if aplib else 'closed'
+
+# Both Lantronix & OpenGear have 16 usable USB ports.
+USABLE_PORTS = 16
+
+OPENGEAR_USB_HUB_PORT_MAP = {
+    # Syntax = <UUT#>: (<hub loc>, <hub port>, <physical port>)
+    1: ('3-1', 1, 17), 2: ('3-1', 2, 18), 3: ('3-1', 3, 19), 4: ('3-1', 4, 20), 5: ('3-1', 5, 21),
+    6: ('3-1', 6, 22),
+    7: ('3-2', 1, 23), 8: ('3-2', 2, 24), 9: ('3-2', 3, 25), 10: ('3-2', 4, 26), 11: ('3-2', 5, 27),
+    12: ('3-2', 6, 28),
+    13: ('5-3', 1, 29), 14: ('5-3', 2, 30), 15: ('5-3', 3, 31), 16: ('5-3', 4, 32),
+    # These USB ports are NOT used since we do NOT have matching RS-232 ports!
+    # 17: ('5-3', 5, 33), 18: ('5-3', 6, 34),
+    # 19: ('5-4', 1, 35), 20: ('5-4', 2, 36), 21: ('5-4', 3, 37), 22: ('5-4', 4, 38), 23: ('5-4', 5, 39), 24: ('5-4', 6, 40),
+}
+
+
+class PortMapError(Exception):
+    pass
+
+
+# ======================================================================================================================
+# Port Map Registry
+# ======================================================================================================================
+class PortMapRegistry(object):
+    """ Port maps per vendor and station model.
+    Lookup order: (vendor, station model) then (vendor, 'default').
+    """
+    DEFAULT = 'default'
+    HUB_LOC_PATTERN = r'^\d+(-\d+)*$'
+
+    def __init__(self):
+        self.__maps = {}
+        self.__lock = threading.Lock()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def models(self):
+        return sorted(self.__maps.keys())
+
+    def register(self, vendor, port_map, station_model=DEFAULT):
+        """ Register (validated) port map.
+        :param (str) vendor: 'opengear', etc.
+        :param (dict) port_map: {<UUT#>: (<hub loc>, <hub port>, <physical port>)}
+        :param (str) station_model: Station model (e.g. T/S HW model) or 'default'.
+        :return (dict): The normalized map.
+        """
+        port_map = self.validate(port_map)
+        with self.__lock:
+            self.__maps[(vendor.lower(), station_model)] = port_map
+        log.debug("Port map registered: {0}/{1} ({2} ports)".format(vendor, station_model, len(port_map)))
+        return port_map
+
+    def load(self, path):
+        """ Load port maps from JSON: {<vendor>: {<station model>: {"<UUT#>": [<hub loc>, <hub port>, <physical port>]}}}
+        :return (list): (vendor, station model) keys loaded.
+        """
+        with open(path) as fp:
+            data = json.load(fp)
+        if not isinstance(data, dict):
+            raise PortMapError("Port map file {0}: top level must be a dict of vendors.".format(path))
+        loaded = []
+        for vendor, models in data.items():
+            for station_model, port_map in models.items():
+                try:
+                    self.register(vendor, port_map, station_model)
+                except PortMapError as e:
+                    raise PortMapError("Port map file {0} [{1}/{2}]: {3}".format(path, vendor, station_model, e))
+                loaded.append((vendor.lower(), station_model))
+        return loaded
+
+    def get(self, vendor, station_model=None):
+        """ Port map for vendor/station model; None if the vendor has none (e.g. Lantronix). """
+        vendor = vendor.lower()
+        return self.__maps.get((vendor, station_model)) or self.__maps.get((vendor, self.DEFAULT))
+
+    def validate(self, port_map):
+        """ Normalize keys to int and entries to tuples; reject bad/duplicate entries. """
+        if not isinstance(port_map, dict) or not port_map:
+            raise PortMapError("Port map must be a non-empty dict.")
+        normalized = {}
+        hub_ports, physical_ports = {}, {}
+        for uut_num, entry in port_map.items():
+            try:
+                uut_num = int(uut_num)
+            except (TypeError, ValueError):
+                raise PortMapError("UUT# '{0}' is not an int.".format(uut_num))
+            if uut_num < 1:
+                raise PortMapError("UUT# {0} must be >= 1.".format(uut_num))
+            if not isinstance(entry, (list, tuple)) or len(entry) != 3:
+                raise PortMapError("UUT# {0}: entry must be (<hub loc>, <hub port>, <physical port>).".format(uut_num))
+            hub_loc, hub_port, physical_port = entry
+            if not isinstance(hub_loc, (str, type(u''))) or not re.match(self.HUB_LOC_PATTERN, hub_loc):
+                raise PortMapError("UUT# {0}: bad hub loc '{1}'.".format(uut_num, hub_loc))
+            if not isinstance(hub_port, int) or not isinstance(physical_port, int) or hub_port < 1 or physical_port < 1:
+                raise PortMapError("UUT# {0}: hub port and physical port must be ints >= 1.".format(uut_num))
+            if (hub_loc, hub_port) in hub_ports:
+                raise PortMapError("UUT# {0}: hub {1} port {2} already used by UUT# {3}.".format(uut_num, hub_loc, hub_port, hub_ports[(hub_loc, hub_port)]))
+            if physical_port in physical_ports:
+                raise PortMapError("UUT# {0}: physical port {1} already used by UUT# {2}.".format(uut_num, physical_port, physical_ports[physical_port]))
+            hub_ports[(hub_loc, hub_port)] = uut_num
+            physical_ports[physical_port] = uut_num
+            normalized[uut_num] = (str(hub_loc), hub_port, physical_port)
+        return normalized
+
+
+registry = PortMapRegistry()
+registry.register('opengear', OPENGEAR_USB_HUB_PORT_MAP)
+
+
+# ======================================================================================================================
+# Session Pool
+# ======================================================================================================================
+class SessionPool(object):
+    """ Reused terminal server control sessions.
+    A session is opened on first use and kept open; sessions idle longer than idle_timeout are re-opened.
+    Use of one session is serialized (one command sequence at a time).
+    """
+    def __init__(self, idle_timeout=600, settle=1.0):
+        """
+        :param (int) idle_timeout: Secs; an idle session older than this is closed and re-opened on next use.
+        :param (float) settle: Secs to wait after opening a session.
+        """
+        self.idle_timeout = idle_timeout
+        self.settle = settle
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+        self.opens = 0
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def session(self, conn):
+        """ Context manager: yields the open connection for exclusive use. """
+        return _PooledSession(self, conn)
+
+    def close(self, conn):
+        entry = self.__entry(conn)
+        with entry['lock']:
+            self.__close(conn, entry)
+        return
+
+    def close_all(self):
+        with self.__lock:
+            items = list(self.__sessions.values())
+        for conn, entry in items:
+            with entry['lock']:
+                self.__close(conn, entry)
+        return
+
+    def _acquire(self, conn):
+        entry = self.__entry(conn)
+        entry['lock'].acquire()
+        try:
+            now = time.time()
+            stale = entry['last'] and (now - entry['last']) > self.idle_timeout
+            if stale:
+                log.debug("T/S session idle {0:.0f}s; re-open.".format(now - entry['last']))
+                self.__close(conn, entry)
+            if not entry['open'] or getattr(conn, 'status', STATUS_OPEN) != STATUS_OPEN:
+                conn.open()
+                entry['open'] = True
+                self.opens += 1
+                time.sleep(self.settle) if self.settle else None
+        except Exception:
+            entry['lock'].release()
+            raise
+        return conn
+
+    def _release(self, conn):
+        entry = self.__entry(conn)
+        entry['last'] = time.time()
+        entry['lock'].release()
+        return
+
+    def __entry(self, conn):
+        with self.__lock:
+            if id(conn) not in self.__sessions:
+                self.__sessions[id(conn)] = (conn, dict(open=False, last=None, lock=threading.RLock()))
+            return self.__sessions[id(conn)][1]
+
+    @staticmethod
+    def __close(conn, entry):
+        if entry['open']:
+            try:
+                conn.close()
+            except Exception as e:
+                log.warning("T/S session close: {0}".format(e))
+        entry['open'] = False
+        entry['last'] = None
+        return
+
+
+class _PooledSession(object):
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __enter__(self):
+        return self.pool._acquire(self.conn)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            # Unknown session state after a failure; start fresh next time.
+            self.pool.close(self.conn)
+        self.pool._release(self.conn)
+        return False
+
+
+pool = SessionPool()
+
+
+# ======================================================================================================================
+# Vendor Drivers
+# ======================================================================================================================
+class TermServerDriver(object):
+    """ Base T/S driver: port resolution + power on/off/status of a UUT port. """
+    VENDOR = None
+    PROMPT = '# '
+    CONSOLE_WAKE = False  # Send a CR on the UUT console after power on.
+    STATUS_WAIT = 3       # Secs for the port data to arrive after a status query.
+
+    def __init__(self, conn, port_map=None, session_pool=None, usable_ports=USABLE_PORTS):
+        self.conn = conn
+        self.port_map = port_map
+        self.pool = session_pool if session_pool else pool
+        self.usable_ports = usable_ports
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def port(self, uut_index, channel='A'):
+        """ Physical T/S port of a UUT channel; channel 'B' (2nd PSU) uses the upper port bank. """
+        normalized = ((uut_index - 1) % self.usable_ports) + 1
+        return normalized + (self.usable_ports if channel.upper() == 'B' else 0)
+
+    def hub(self, port):
+        """ (hub loc, hub port) of a T/S port. """
+        if not self.port_map or port not in self.port_map:
+            raise PortMapError("{0}: no USB hub port map entry for port {1}.".format(self.VENDOR, port))
+        return self.port_map[port][0], self.port_map[port][1]
+
+    def send(self, cmd, expectphrase=None, timeout=30):
+        self.conn.send(cmd, expectphrase=expectphrase if expectphrase else self.PROMPT, timeout=timeout)
+
+    def clear_recbuf(self):
+        self.conn.clear_recbuf() if hasattr(self.conn, 'clear_recbuf') else None
+
+    def power_off(self, port):
+        raise NotImplementedError
+
+    def power_on(self, port):
+        raise NotImplementedError
+
+    def status(self, port):
+        """ :return (bool): True = on, False = off, None = unknown. """
+        raise NotImplementedError
+
+
+class LantronixDriver(TermServerDriver):
+    VENDOR = 'lantronix'
+    PROMPT = '> '
+
+    def power_off(self, port):
+        with self.pool.session(self.conn):
+            self.send('set deviceport port {0} assertdtr disable\r'.format(port))
+        return
+
+    def power_on(self, port):
+        with self.pool.session(self.conn):
+            self.send('set deviceport port {0} assertdtr enable\r'.format(port))
+        return
+
+    def status(self, port):
+        with self.pool.session(self.conn):
+            self.clear_recbuf()
+            self.send('admin version\r')
+            self.send('show deviceport port {0} display data\r'.format(port))
+            time.sleep(self.STATUS_WAIT)
+            m = re.search('Assert D[ST]R: (disabled|enabled)', self.conn.recbuf)
+        return bool(m and m.group(1) == 'enabled')
+
+
+class OpenGearDriver(TermServerDriver):
+    VENDOR = 'opengear'
+    PROMPT = '# '
+    CONSOLE_WAKE = True
+
+    def power_off(self, port):
+        # Note: For this to work, the RS-232 port must NOT be connected by Apollo via telnet/ssh.
+        usb_hub_loc, usb_hub_port = self.hub(port)
+        with self.pool.session(self.conn):
+            self.send('config -s config.ports.port{0}.dtrmode=alwayson -r serialconfig\r'.format(port))
+            log.debug("Disconnect USB port={0}  Location={1}  HubPort={2}".format(port, usb_hub_loc, usb_hub_port))
+            self.send('uhubctl -l {0} -p {1} -a 0\r'.format(usb_hub_loc, usb_hub_port))
+            self.send('pmshell -l port{0:02d} --dtr 0\r'.format(port))
+        return
+
+    def power_on(self, port):
+        usb_hub_loc, usb_hub_port = self.hub(port)
+        with self.pool.session(self.conn):
+            log.debug("Connect USB port={0}  Location={1}  HubPort={2}".format(port, usb_hub_loc, usb_hub_port))
+            self.send('pmshell -l port{0:02d} --dtr 1\r'.format(port))
+            self.send('uhubctl -l {0} -p {1} -a 1\r'.format(usb_hub_loc, usb_hub_port))
+        return
+
+    def status(self, port):
+        with self.pool.session(self.conn):
+            self.clear_recbuf()
+            self.send('cat /etc/version\r')
+            self.send('config -g config.ports.port{0}\r'.format(port))
+            time.sleep(self.STATUS_WAIT)
+            m = re.search('label (.*)', self.conn.recbuf)
+        return bool(m and m.group(1) != '')
+
+
+class GenericDriver(TermServerDriver):
+    """ Equipment with native power control (e.g. relay box on the connection power API). """
+    VENDOR = 'generic'
+
+    def power_off(self, port):
+        with self.pool.session(self.conn):
+            self.conn.power_off()
+
+    def power_on(self, port):
+        with self.pool.session(self.conn):
+            self.conn.power_on()
+
+    def status(self, port):
+        status = getattr(self.conn, 'status', None)
+        return None if status is None else status == STATUS_OPEN
+
+
+DRIVERS = {
+    LantronixDriver.VENDOR: LantronixDriver,
+    OpenGearDriver.VENDOR: OpenGearDriver,
+}
+
+
+def get_driver(conn, station_model=None, port_map_registry=None, session_pool=None):
+    """ Driver for a power connection based on its 'model' attribute.
+    :param (obj) conn: Apollo connection (T/S control session).
+    :param (str) station_model: Port map selection (default map if not registered).
+    :param (obj) port_map_registry: Default = module registry.
+    :param (obj) session_pool: Default = module pool.
+    :return (TermServerDriver):
+    """
+    vendor = str(getattr(conn, 'model', '') or '').lower()
+    port_map_registry = port_map_registry if port_map_registry else registry
+    driver_class = DRIVERS.get(vendor, GenericDriver)
+    return driver_class(conn, port_map=port_map_registry.get(vendor, station_model), session_pool=session_pool)
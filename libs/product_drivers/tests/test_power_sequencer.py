@@ -0,0 +1,84 @@
+"""Unit Tests for power_sequencer module"""
+import threading
+import time
+from unittest import TestCase
+
+from .. import power_sequencer
+
+OPEN, CLOSED = 'open', 'closed'
+
+
+class FakeTermServerConn(object):
+    """ Mocked terminal server connection: DTR toggle with a fixed latency. """
+    def __init__(self, name, latency=0.3, stuck=False):
+        self.name = name
+        self.latency = latency
+        self.stuck = stuck
+        self.dtr = 0
+        self.sent = []
+        self.busy = threading.Lock()
+
+    def send(self, text, expectphrase=None, timeout=30):
+        # Concurrent use of one session would interleave; flag it.
+        if not self.busy.acquire(False):
+            raise RuntimeError("{0}: session already in use".format(self.name))
+        try:
+            time.sleep(self.latency)
+            self.sent.append((time.time(), text))
+            if 'pmshell' in text and not self.stuck:
+                self.dtr = 1 if '--dtr 1' in text else 0
+        finally:
+            self.busy.release()
+
+    @property
+    def status(self):
+        return OPEN if self.dtr else CLOSED
+
+
+class PowerSequencerTest(TestCase):
+    def setUp(self):
+        shared = FakeTermServerConn('TS2')
+        self.conns = {'A': FakeTermServerConn('TS1'), 'B': shared, 'C': shared, 'D': FakeTermServerConn('TS3')}
+
+    def sequencer(self, **kwargs):
+        def operation(op, channel):
+            self.conns[channel].send('pmshell -l port01 --dtr {0}\r'.format(1 if op == 'ON' else 0))
+        return power_sequencer.PowerSequencer(operation=operation,
+                                              status=lambda channel: self.conns[channel].status,
+                                              group=lambda channel: id(self.conns[channel]),
+                                              expected_states={'ON': OPEN, 'OFF': CLOSED},
+                                              **kwargs)
+
+    def test_concurrent_on_with_stagger(self):
+        seq = self.sequencer(stagger=0.1)
+        start = time.time()
+        self.assertTrue(seq.run('ON', ['A', 'B', 'C', 'D']))
+        elapsed = time.time() - start
+        # 3 groups (B & C share a session): ~2 x latency + stagger, not 4 x latency.
+        self.assertTrue(elapsed < 1.0, elapsed)
+        events = dict([(e.channel, e) for e in seq.last_sequence])
+        self.assertTrue(events['D'].start - events['A'].start >= 0.2 - 0.02)
+        self.assertTrue(events['C'].start >= events['B'].end)
+        self.assertEqual([e.state for e in seq.last_sequence], [OPEN] * 4)
+        self.assertEqual(sorted(seq.timestamps().keys()), ['A', 'B', 'C', 'D'])
+
+    def test_cycle_sequential_and_verify(self):
+        seq = self.sequencer(stagger=0.0, concurrent=False, verify_ops=['ON', 'OFF'])
+        self.conns['D'].stuck = True
+        self.assertFalse(seq.run('CYCLE', ['A', 'D']))
+        self.assertEqual([(e.op, e.channel) for e in seq.last_sequence], [('OFF', 'A'), ('OFF', 'D'), ('ON', 'A'), ('ON', 'D')])
+        self.assertEqual([e.verified for e in seq.last_sequence], [True, True, True, False])
+        # All OFF before any ON; strictly one at a time.
+        ends = [e.end for e in seq.last_sequence]
+        starts = [e.start for e in seq.last_sequence]
+        self.assertTrue(all([starts[i + 1] >= ends[i] for i in range(3)]))
+        self.assertEqual([op for op, _, _ in seq.timestamps('A')['A']], ['OFF', 'ON'])
+        self.assertEqual(seq.summary()[3]['verified'], False)
+
+    def test_channel_error(self):
+        seq = self.sequencer(stagger=0.0)
+        self.conns['B'] = None
+        self.assertRaises(AttributeError, seq.run, 'CYCLE', ['A', 'B', 'D'])
+        # The failing step still completes the other channels; no ON after a failed OFF.
+        self.assertEqual([(e.op, e.channel, e.error is None) for e in seq.last_sequence],
+                         [('OFF', 'A', True), ('OFF', 'B', False), ('OFF', 'D', True)])
@@ -0,0 +1,98 @@
+"""Unit Tests for rommon module (set_params write path)"""
+from collections import OrderedDict
+from unittest import TestCase
+
+from .. import rommon
+
+
+class FakeRommonConn(object):
+    """ Mocked rommon console: 'set' lists the vars; typed-ahead set commands for 'drop' keys are lost. """
+    def __init__(self, params, drop=None, drop_always=False):
+        self.params = dict(params)
+        self.drop = set(drop or [])
+        self.drop_always = drop_always
+        self.sends = []
+        self.recbuf = ''
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False):
+        cmds = [c for c in text.split('\r') if c]
+        self.sends.append(cmds)
+        self.recbuf = ''
+        for cmd in cmds:
+            parts = cmd.split(' ', 2)
+            if cmd == 'set':
+                self.recbuf = ''.join(['{0}={1}\n'.format(k, v) for k, v in sorted(self.params.items())])
+            elif cmd == 'set_param -all':
+                self.recbuf = 'Parameters burned\n'
+            elif parts[0] == 'set' and len(parts) == 3:
+                if parts[1] in self.drop and (len(cmds) > 1 or self.drop_always):
+                    continue
+                self.params[parts[1]] = parts[2].strip('"')
+        return
+
+    def clear_recbuf(self):
+        self.recbuf = ''
+
+    def sets(self):
+        return [cmds for cmds in self.sends if cmds and cmds[0].startswith('set ')]
+
+    def reads(self):
+        return len([cmds for cmds in self.sends if cmds == ['set']])
+
+
+class FastRommon(rommon.Rommon):
+    RECBUF_TIME = 0
+    SET_CHUNK_SIZE = 60
+
+    def __init__(self, conn):
+        self._uut_conn = conn
+        self._uut_prompt = 'switch: '
+        self._fresh_read = False
+        self._params = {}
+
+
+PARAMS = OrderedDict([('MODEL_NUM', 'WS-C3850-48P'), ('SYSTEM_SERIAL_NUM', 'FOC1234X0AB'),
+                      ('MOTHERBOARD_SERIAL_NUM', 'FOC12345678'), ('VERSION_ID', 'V01'),
+                      ('BOOT', 'flash:cat3k_caa-universalk9.bin'), ('CONFIG_FILE', 'flash:config.text')])
+
+
+class TestRommonSetParams(TestCase):
+
+    def test_chunking(self):
+        conn = FakeRommonConn({})
+        rmn = FastRommon(conn)
+        chunks = rmn._write_params(PARAMS)
+        self.assertEqual(chunks, len(conn.sends))
+        self.assertTrue(1 < chunks < len(PARAMS))
+        self.assertTrue(all([len('\r'.join(cmds)) < rmn.SET_CHUNK_SIZE for cmds in conn.sends if len(cmds) > 1]))
+        self.assertEqual(sum([len(cmds) for cmds in conn.sends]), len(PARAMS))
+        self.assertEqual(conn.params, dict(PARAMS))
+        self.assertFalse(rmn._fresh_read)
+        self.assertEqual(rmn._write_params(PARAMS, chunk_size=0), len(PARAMS))
+
+    def test_verify_fresh_readback(self):
+        conn = FakeRommonConn(PARAMS)
+        rmn = FastRommon(conn)
+        self.assertTrue(rmn.set_params(dict(PARAMS)))
+        # Nothing to write, but the readback after the burn is still a fresh read (not the cache).
+        self.assertEqual(conn.sets(), [])
+        self.assertEqual(conn.reads(), 2)
+
+        conn.params['VERSION_ID'] = 'V02'
+        self.assertFalse(rmn._verify_written(dict(PARAMS), OrderedDict()))
+        self.assertEqual(conn.reads(), 3)
+
+    def test_retry_failed_params(self):
+        conn = FakeRommonConn({'BAUD': '9600'}, drop=['VERSION_ID'])
+        rmn = FastRommon(conn)
+        self.assertTrue(rmn.set_params(dict(PARAMS)))
+        # Lost typed-ahead param re-sent alone, then read back again.
+        self.assertEqual(conn.sets()[-1], ['set VERSION_ID V01'])
+        self.assertEqual(conn.params, dict(PARAMS, BAUD='9600'))
+        self.assertEqual(conn.reads(), 3)
+
+        conn = FakeRommonConn({'BAUD': '9600'}, drop=['BOOT'], drop_always=True)
+        rmn = FastRommon(conn)
+        self.assertFalse(rmn.set_params(dict(PARAMS)))
+        self.assertEqual(conn.sets()[-1], ['set BOOT flash:cat3k_caa-universalk9.bin'])
+        self.assertNotIn('BOOT', conn.params)
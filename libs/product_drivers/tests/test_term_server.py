@@ -0,0 +1,110 @@
+"""Unit Tests for term_server module"""
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from .. import term_server
+
+
+class FakeTermServerConn(object):
+    """ Mocked T/S control session: records opens/closes and commands. """
+    def __init__(self, model, responses=None):
+        self.model = model
+        self.responses = responses if responses else {}
+        self.status = term_server.STATUS_CLOSED
+        self.opens, self.closes = 0, 0
+        self.sent = []
+        self.recbuf = ''
+
+    def open(self):
+        self.opens += 1
+        self.status = term_server.STATUS_OPEN
+
+    def close(self):
+        self.closes += 1
+        self.status = term_server.STATUS_CLOSED
+
+    def clear_recbuf(self):
+        self.recbuf = ''
+
+    def send(self, text, expectphrase=None, timeout=30):
+        if self.status != term_server.STATUS_OPEN:
+            raise RuntimeError('Session not open')
+        self.sent.append(text.strip())
+        self.recbuf += self.responses.get(text.strip(), '') + expectphrase
+
+
+class TermServerTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.registry = term_server.PortMapRegistry()
+        self.pool = term_server.SessionPool(settle=0.0)
+        term_server.TermServerDriver.STATUS_WAIT = 0
+
+    def tearDown(self):
+        term_server.TermServerDriver.STATUS_WAIT = 3
+        shutil.rmtree(self.tmp)
+
+    def test_registry(self):
+        self.registry.register('OpenGear', term_server.OPENGEAR_USB_HUB_PORT_MAP)
+        path = os.path.join(self.tmp, 'maps.json')
+        with open(path, 'w') as fp:
+            json.dump({'opengear': {'IM7216': {'1': ['1-1', 1, 17], '2': ['1-1', 2, 18]}}}, fp)
+        self.assertEqual(self.registry.load(path), [('opengear', 'IM7216')])
+        self.assertEqual(self.registry.get('opengear', 'IM7216')[2], ('1-1', 2, 18))
+        self.assertEqual(self.registry.get('opengear', 'unknown')[13], ('5-3', 1, 29))
+        self.assertEqual(self.registry.get('lantronix'), None)
+
+        bad_maps = [{}, {'x': ('3-1', 1, 17)}, {1: ('3-1', 1)}, {1: ('hub', 1, 17)}, {1: ('3-1', 0, 17)},
+                    {1: ('3-1', 1, 17), 2: ('3-1', 1, 18)}, {1: ('3-1', 1, 17), 2: ('3-1', 2, 17)}]
+        for port_map in bad_maps:
+            self.assertRaises(term_server.PortMapError, self.registry.register, 'opengear', port_map)
+        with open(path, 'w') as fp:
+            json.dump({'opengear': {'IM7216': {'1': ['1-1', 1, 17], '2': ['1-1', 1, 18]}}}, fp)
+        self.assertRaises(term_server.PortMapError, self.registry.load, path)
+
+    def test_opengear_pooled(self):
+        conn = FakeTermServerConn('OpenGear', responses={'config -g config.ports.port2': 'config.ports.port2.label UUT02\r\n'})
+        self.registry.register('opengear', term_server.OPENGEAR_USB_HUB_PORT_MAP)
+        driver = term_server.get_driver(conn, port_map_registry=self.registry, session_pool=self.pool)
+        self.assertTrue(isinstance(driver, term_server.OpenGearDriver))
+        self.assertEqual((driver.port(18), driver.port(2, 'B')), (2, 18))
+
+        driver.power_off(2)
+        driver.power_on(2)
+        self.assertEqual(conn.sent, ['config -s config.ports.port2.dtrmode=alwayson -r serialconfig',
+                                     'uhubctl -l 3-1 -p 2 -a 0', 'pmshell -l port02 --dtr 0',
+                                     'pmshell -l port02 --dtr 1', 'uhubctl -l 3-1 -p 2 -a 1'])
+        self.assertEqual((conn.opens, conn.closes, self.pool.opens), (1, 0, 1))
+        # Ports without a hub entry (2nd PSU bank) are rejected before touching the T/S.
+        self.assertRaises(term_server.PortMapError, driver.power_on, 18)
+
+        # Session dropped by the T/S: re-opened; failure: closed for a fresh start.
+        conn.close()
+        self.assertEqual(driver.status(2), True)
+        self.assertEqual(conn.opens, 2)
+        conn.send = None
+        self.assertRaises(TypeError, driver.power_off, 2)
+        self.assertEqual(conn.status, term_server.STATUS_CLOSED)
+
+    def test_lantronix_and_generic(self):
+        conn = FakeTermServerConn('Lantronix', responses={'show deviceport port 3 display data': 'Assert DTR: disabled\r\n'})
+        driver = term_server.get_driver(conn, port_map_registry=self.registry, session_pool=self.pool)
+        driver.power_on(3)
+        self.assertEqual(driver.status(3), False)
+        self.assertEqual(conn.sent[0], 'set deviceport port 3 assertdtr enable')
+
+        self.pool.idle_timeout = -1
+        driver.power_off(3)
+        self.assertEqual((conn.opens, conn.closes), (2, 1))
+        self.pool.close_all()
+        self.assertEqual(conn.status, term_server.STATUS_CLOSED)
+
+        relay = FakeTermServerConn('RelayBox')
+        relay.power_on = lambda: setattr(relay, 'powered', True)
+        driver = term_server.get_driver(relay, port_map_registry=self.registry, session_pool=self.pool)
+        self.assertTrue(isinstance(driver, term_server.GenericDriver))
+        driver.power_on(1)
+        self.assertEqual((relay.powered, driver.status(1)), (True, True))
@@ -10,12 +10,19 @@ import subprocess
 from time import time
 from time import sleep
 from collections import namedtuple
+from collections import deque
 import ConfigParser
 import os
+import sys
+import json
+import heapq
+import signal
+import threading
+import multiprocessing
 
 
 __title__ = "Apollo Run Tool"
-__version__ = '1.4.1'
+__version__ = '1.5.0'
 __author__ = ['sdubrul', 'bborel']
 
 
@@ -45,6 +52,8 @@ class TestResult(object):
     ABORT = "ABORT"
     HTTP_ERROR = "HTTP_ERROR"
     GEN_ERROR = "ERROR"
+    TIMEOUT = "TIMEOUT"
+    CANCELLED = "CANCELLED"
 
     error_lookup = {
         200: PASS,
@@ -72,19 +81,211 @@ def delay(start_delay, identifier):
         sleep(start_delay)
 
 
-def _run_apollo_container_with_container_id(c):
+class ContainerScheduler(object):
+    """Container Scheduler
+    Runs apollocli for each container with a bounded number of workers (instead of one process per container).
+        1. Priority order: lowest priority value first; submission order for the same priority.
+        2. Per-container timeout: the apollocli process group is killed after the container timeout + KILL_MARGIN.
+        3. Cancellation: cancel() (or fail_fast) marks the queued containers as CANCELLED and kills the running ones.
+        4. Streaming: the status and the log tail of each container are printed (and given to on_result) as soon as
+           the container finishes.
+        5. Summary: summary() / summary_file give a machine-readable (JSON) run summary.
     """
-    Helper function that accepts a tuple rather than separate keyword arguments
-    :param c:
-    :return:
-    """
-    return run_apollo_container(prod_line=c.prod_line, area=c.area, test_station=c.test_station,
-                                container=c.container, mode=c.mode, answers=c.answers, start_delay=c.start_delay, timeout=c.timeout)
+    KILL_MARGIN = 60
+    LOG_TAIL_LINES = 20
+
+    def __init__(self, max_workers=None, cli_cmd=None, on_result=None, fail_fast=False, summary_file=None,
+                 log_level='DEBUG'):
+        """
+        :param max_workers: Worker cap (default = CPU count).
+        :param cli_cmd: apollocli command (default from load_cli_cmd()).
+        :param on_result: Callback on_result(result) as each container finishes.
+        :param fail_fast: Cancel the remaining containers on the first non-PASS result.
+        :param summary_file: Write the JSON run summary here.
+        :param log_level: apollocli log level.
+        """
+        self.max_workers = max_workers if max_workers else multiprocessing.cpu_count()
+        self.cli_cmd = cli_cmd if cli_cmd else load_cli_cmd()
+        self.on_result = on_result
+        self.fail_fast = fail_fast
+        self.summary_file = summary_file
+        self.log_level = log_level
+        self.results = {}
+        self._queue = []
+        self._count = 0
+        self._records = {}
+        self._procs = {}
+        self._lock = threading.Lock()
+        self._print_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._start = None
+        self._end = None
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def submit(self, container_id, priority=0):
+        """
+        :param container_id: ContainerId
+        :param priority: Lower runs first.
+        :return: Submission index (key of the results)
+        """
+        with self._lock:
+            index = self._count
+            self._count += 1
+            heapq.heappush(self._queue, (priority, index, container_id))
+            self._records[index] = dict(container=container_id.container, priority=priority, status='QUEUED',
+                                       queued=time(), started=None, finished=None, returncode=None)
+        return index
+
+    def run(self):
+        """
+        Run all submitted containers.
+        :return: [TestResult, ...] in submission order
+        """
+        self._start = time()
+        workers = min(self.max_workers, len(self._queue)) if self._queue else 0
+        print("Scheduler: {0} container(s), {1} worker(s)".format(len(self._queue), workers))
+        threads = [threading.Thread(target=self._worker, name='apruntool-{0}'.format(i)) for i in range(workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(1.0)
+        self._end = time()
+        if self.summary_file:
+            self.save_summary(self.summary_file)
+        return [self.results[index] for index in sorted(self.results)]
+
+    def cancel(self):
+        """Cancel all queued containers and kill the running ones."""
+        # Same lock as the process start: a container either sees the cancel before it starts or is in the snapshot.
+        with self._lock:
+            self._cancelled.set()
+            procs = list(self._procs.values())
+        for proc in procs:
+            self._kill(proc)
+
+    def summary(self):
+        """
+        :return: dict(start, end, wall, max_workers, counts={status: n}, containers=[{...}, ...])
+        """
+        containers = []
+        counts = {}
+        for index in sorted(self._records):
+            record = dict(self._records[index])
+            result = self.results.get(index)
+            record.update(dict(time=result.time, error=result.error) if result else {})
+            containers.append(record)
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+        wall = (self._end if self._end else time()) - self._start if self._start else 0.0
+        return dict(start=self._start, end=self._end, wall=wall, max_workers=self.max_workers, counts=counts,
+                    containers=containers)
+
+    def save_summary(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.summary(), fp, indent=2, sort_keys=True)
+        return path
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    return
+                priority, index, c = heapq.heappop(self._queue)
+            if self._cancelled.is_set():
+                result = TestResult(TestResult.CANCELLED, '', 'Cancelled before start.', 0.0, c.container)
+            else:
+                result = self._run_one(index, c)
+            self._finish(index, result)
+
+    def _run_one(self, index, c):
+        # Start delay is relative to the scheduler start (staggered starts as with the process pool).
+        wait = self._start + c.start_delay - time()
+        while wait > 0 and not self._cancelled.is_set():
+            sleep(min(wait, 0.5))
+            wait = self._start + c.start_delay - time()
+        if self._cancelled.is_set():
+            return TestResult(TestResult.CANCELLED, '', 'Cancelled before start.', 0.0, c.container)
+
+        call = build_cli_call(c.prod_line, c.area, c.test_station, c.container, mode=c.mode, log_level=self.log_level,
+                              answers=c.answers, timeout=c.timeout, cli_cmd=self.cli_cmd)
+        print("{0}: START {1}".format(c.container, call))
+        self._records[index].update(dict(status='RUNNING', started=time()))
+        lines = []
+        with Timer() as timer:
+            with self._lock:
+                if self._cancelled.is_set():
+                    return TestResult(TestResult.CANCELLED, '', 'Cancelled before start.', 0.0, c.container)
+                try:
+                    proc = subprocess.Popen(call, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            preexec_fn=os.setsid, universal_newlines=True)
+                except OSError as e:
+                    return TestResult(TestResult.GEN_ERROR, '', str(e), 0.0, c.container)
+                self._procs[index] = proc
+            reader = threading.Thread(target=self._read, args=(proc, lines))
+            reader.daemon = True
+            reader.start()
+            deadline = time() + c.timeout + self.KILL_MARGIN
+            timed_out = False
+            while proc.poll() is None:
+                if time() > deadline:
+                    timed_out = True
+                    self._kill(proc)
+                    break
+                sleep(0.1)
+            proc.wait()
+            reader.join(5.0)
+            with self._lock:
+                self._procs.pop(index, None)
+        self._records[index]['returncode'] = proc.returncode
+        raw_output = ''.join(lines)
+        if timed_out:
+            status, log, error = TestResult.TIMEOUT, raw_output, 'Killed after {0} sec.'.format(c.timeout + self.KILL_MARGIN)
+        elif self._cancelled.is_set() and proc.returncode != 0:
+            status, log, error = TestResult.CANCELLED, raw_output, 'Cancelled while running.'
+        elif proc.returncode != 0:
+            status, log, error = TestResult.GEN_ERROR, raw_output, 'apollocli exit code {0}'.format(proc.returncode)
+        else:
+            status, log, error = parse_cli_output(raw_output)
+        return TestResult(status, log, error, timer.seconds, c.container)
 
+    @staticmethod
+    def _read(proc, lines):
+        for line in iter(proc.stdout.readline, ''):
+            lines.append(line)
+        proc.stdout.close()
 
-def run_apollo_containers(prod_line, area, test_station, containers, mode='PROD', answers=None, start_delay=0, timeout=10000):
+    @staticmethod
+    def _kill(proc):
+        try:
+            os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+        except OSError:
+            pass
+
+    def _finish(self, index, result):
+        tail = deque(result.log.splitlines(), maxlen=self.LOG_TAIL_LINES)
+        with self._print_lock:
+            self.results[index] = result
+            self._records[index].update(dict(status=result.status, finished=time()))
+            print("=" * 30)
+            print("{0}  ({1}/{2} done)".format(result, len(self.results), self._count))
+            if result.error:
+                print("error = {0}".format(result.error))
+            print("\n".join(["  | {0}".format(line) for line in tail]))
+            sys.stdout.flush()
+        if self.on_result:
+            self.on_result(result)
+        if self.fail_fast and result.status != TestResult.PASS and not self._cancelled.is_set():
+            print("Scheduler: fail fast on {0}; cancelling the remaining containers.".format(result.identifier))
+            self.cancel()
+
+
+def run_apollo_containers(prod_line, area, test_station, containers, mode='PROD', answers=None, start_delay=0, timeout=10000,
+                          max_workers=None, priorities=None, fail_fast=False, summary_file=None, on_result=None):
     """
-    Call a bunch of apollo containers through the apollo cli in parallel.
+    Call a bunch of apollo containers through the apollo cli in parallel (bounded; see ContainerScheduler).
     Note: This assumes ALL containers have the same prod_line, area, test_station, mode, answers, and start_delay.
     :param prod_line:
     :param area:
@@ -93,26 +294,28 @@ def run_apollo_containers(prod_line, area, test_station, containers, mode='PROD'
     :param mode:
     :param answers:
     :param start_delay:
-    :param label:
-    :return:
+    :param timeout:
+    :param max_workers: Worker cap (default = CPU count).
+    :param priorities: {container: priority, ...} lower runs first (default 0).
+    :param fail_fast: Cancel the remaining containers on the first failure.
+    :param summary_file: JSON run summary file.
+    :param on_result: Callback as each container finishes.
+    :return: [TestResult, ...] in the order of containers
     """
     container_ids = [ContainerId(prod_line, area, test_station, container, mode, answers, index * start_delay, timeout)
                      for index, container in enumerate(containers)]
+    priorities = priorities if priorities else {}
 
-    # setup a process pool
-    from multiprocessing import Pool
-    process_count = len(container_ids)
-    print("Pool process count = {0}".format(process_count))
-    pool = Pool(processes=process_count)
+    scheduler = ContainerScheduler(max_workers=max_workers, fail_fast=fail_fast, summary_file=summary_file,
+                                   on_result=on_result)
+    for c in container_ids:
+        scheduler.submit(c, priority=priorities.get(c.container, 0))
+    return scheduler.run()
 
-    # launch & return
-    results = pool.map(_run_apollo_container_with_container_id, container_ids)
-    return results
 
-
-def run_apollo_containers_explicitly(run_dict):
+def run_apollo_containers_explicitly(run_dict, max_workers=None, fail_fast=False, summary_file=None, on_result=None):
     """
-    Call a set of apollo containers (each with explicit data) through the apollo cli in parallel.
+    Call a set of apollo containers (each with explicit data) through the apollo cli in parallel (bounded).
     :param run_dict = {
      index: {
         prod_line:
@@ -123,24 +326,22 @@ def run_apollo_containers_explicitly(run_dict):
         answers:
         start_delay:
         timeout:
+        priority: (optional) lower runs first
         }, ... }
-    :return:
+    :param max_workers: Worker cap (default = CPU count).
+    :param fail_fast: Cancel the remaining containers on the first failure.
+    :param summary_file: JSON run summary file.
+    :param on_result: Callback as each container finishes.
+    :return: [TestResult, ...] in index order
     """
-    container_ids = []
+    scheduler = ContainerScheduler(max_workers=max_workers, fail_fast=fail_fast, summary_file=summary_file,
+                                   on_result=on_result)
     for index in sorted(run_dict):
         ctdict = run_dict[index]
-        container_ids.append(ContainerId(ctdict['prod_line'], ctdict['area'], ctdict['test_station'], ctdict['container'],
-                                         ctdict['mode'], ctdict['answers'], index * ctdict['start_delay'], ctdict['timeout']))
-
-    # setup a process pool for an iterable
-    from multiprocessing import Pool
-    process_count = len(container_ids)
-    print("Pool process count = {0}".format(process_count))
-    pool = Pool(processes=process_count)
-
-    # launch & return
-    results = pool.map(_run_apollo_container_with_container_id, container_ids)
-    return results
+        scheduler.submit(ContainerId(ctdict['prod_line'], ctdict['area'], ctdict['test_station'], ctdict['container'],
+                                     ctdict['mode'], ctdict['answers'], index * ctdict['start_delay'], ctdict['timeout']),
+                         priority=ctdict.get('priority', 0))
+    return scheduler.run()
 
 
 def load_cli_cmd():
@@ -165,6 +366,68 @@ def load_cli_cmd():
     return cli_cmd
 
 
+def build_cli_call(prod_line, area, test_station, container, mode='PROD', log_level='DEBUG', answers=None, timeout=10000,
+                   cli_cmd=None):
+    """
+    Build the apollocli command line for a container.
+    :return: Shell command string
+    """
+    cli_cmd = cli_cmd if cli_cmd else load_cli_cmd()
+    call = '{cli_cmd} -pl "{prod_line}" --area "{area}" -ts "{test_station}" -cn "{container}" --log-level {log_level} ' \
+           '--timeout {timeout} --m {mode}'.format(cli_cmd=cli_cmd, prod_line=prod_line, area=area,
+                                                   test_station=test_station, container=container,
+                                                   log_level=log_level, timeout=timeout, mode=mode)
+    # add the answer list to the call if there is one provided
+    if answers:
+        answers_string = ' --body "{}"'.format(answers.__str__())
+        call = call + answers_string
+    return call
+
+
+def parse_cli_output(raw_output):
+    """
+    Get the container result from the apollocli output.
+    :param raw_output: Complete stdout of apollocli
+    :return: (status, log, error)
+    """
+    # split the log and the result dict from the last line out of the raw output
+    output_list = raw_output.splitlines()
+    log = "\n".join(output_list[:-1])
+    output_dict = ''
+    for line in output_list:
+        # run thru all, we want the "last appearance"
+        if ('Container: ' in line) and (', Result: ' in line):
+            output_dict = line
+        elif 'Result: ' in line:
+            output_dict = line
+
+    # get the results from the output dict.
+    # Kinda hacky for now..
+    items = output_dict.split('Error: ')
+
+    # grab error
+    if len(items) > 1:
+        error = items[1]
+    else:
+        error = ""
+
+    # grab status
+    result_raw = items[0]
+    if "PASS" in result_raw:
+        status = TestResult.PASS
+    elif "FAIL" in result_raw:
+        status = TestResult.FAIL
+    elif "SKIPPED" in result_raw:
+        # Mark any SKIPPED as a PASS since skips are considered "don't care"
+        status = TestResult.PASS
+    else:
+        # Something went wrong as we didn't got a status back. (Like container not found)
+        # Set status to error and save the output as error
+        status = TestResult.GEN_ERROR
+        error = result_raw
+    return status, log, error
+
+
 def run_apollo_container(prod_line, area, test_station, container, mode='PROD', log_level='DEBUG', answers=None, start_delay=0, timeout=10000):
     """Run a container through cli
 
@@ -241,31 +504,13 @@ def run_apollo_container(prod_line, area, test_station, container, mode='PROD',
 
     """
 
-    cli_cmd = load_cli_cmd()
-
     status = None
 
     delay(start_delay, container)
 
-    if True:
-        call = '{cli_cmd} -pl "{prod_line}" --area "{area}" -ts "{test_station}" -cn "{container}" --log-level {log_level} ' \
-               '--timeout {timeout} --m {mode}'.format(cli_cmd=cli_cmd, prod_line=prod_line, area=area,
-                                                       test_station=test_station, container=container,
-                                                       log_level=log_level, timeout=timeout, mode=mode)
-        # add the answer list to the call if there is one provided
-        if answers:
-            answers_string = ' --body "{}"'.format(answers.__str__())
-            call = call + answers_string
-        print("{}: {}".format(container, call))
-        # call_split = re.findall(r'(?:[^\s,"]|"(?:\\.|[^"])*")+', call)  # prepare the call for calling
-
-    if False:
-        # James Blue method (does not work for subprocess).
-        call_args = cli_cmd.split()
-        call_args += ['-pl', prod_line, '--area', area, '-ts', test_station, '-cn', container, '--timeout', timeout, '-m', mode, '-ll', log_level]
-        if answers:
-            call_args.append('--body')
-            call_args.append(str(answers))
+    call = build_cli_call(prod_line, area, test_station, container, mode=mode, log_level=log_level, answers=answers,
+                          timeout=timeout)
+    print("{}: {}".format(container, call))
 
     raw_output = ''
     log = ''
@@ -291,41 +536,7 @@ def run_apollo_container(prod_line, area, test_station, container, mode='PROD',
     print("=" * 30)
     if status != "ERROR":
         print("INFO: Subprocess result scanning...")
-        # split the log and the result dict from the last line out of the raw output
-        output_list = raw_output.splitlines()
-        log = "\n".join(output_list[:-1])
-        output_dict = ''
-        for line in output_list:
-            # run thru all, we want the "last appearance"
-            if ('Container: ' in line) and (', Result: ' in line):
-                output_dict = line
-            elif 'Result: ' in line:
-                output_dict = line
-
-        # get the results from the output dict.
-        # Kinda hacky for now..
-        items = output_dict.split('Error: ')
-
-        # grab error
-        if len(items) > 1:
-            error = items[1]
-        else:
-            error = ""
-
-        # grab status
-        result_raw = items[0]
-        if "PASS" in result_raw:
-            status = TestResult.PASS
-        elif "FAIL" in result_raw:
-            status = TestResult.FAIL
-        elif "SKIPPED" in result_raw:
-            # Mark any SKIPPED as a PASS since skips are considered "don't care"
-            status = TestResult.PASS
-        else:
-            # Something went wrong as we didn't got a status back. (Like container not found)
-            # Set status to error and save the output as error
-            status = "ERROR"
-            error = result_raw
+        status, log, error = parse_cli_output(raw_output)
     else:
         print("NOTICE: Subprocess produces an exception error!")
 
@@ -0,0 +1,336 @@
+"""
+Change Tracker
+
+Incremental support for the Test Runner Tool:
+1. Import dependency graph of the work tree (ast based; absolute, explicit relative and implicit relative imports),
+2. Per-file content hashes and per-check results cached between runs, and
+3. Reachability of changed files to the modules that need re-linting and the unittests that need re-running.
+
+Lint checks (pep8, pyflakes) are file local; only changed files are re-checked.
+Unittests are re-run when any file in their import closure (or an ancestor conftest.py) changed, or when their
+cached result was not a pass.
+Results are keyed by content, so a partial run (e.g. pep8 only) never hides changes from the other checks.
+Checks are cached with a signature (e.g. the pep8 ignore list); a different signature invalidates that check.
+"""
+
+import os
+import ast
+import json
+import hashlib
+import tempfile
+import fnmatch
+from collections import deque
+from xml.etree import ElementTree
+
+__title__ = 'CITP Change Tracker'
+__author__ = ['bborel']
+__version__ = '1.0.0'
+
+EXCLUDE_DIRS = ['.svn', 'CVS', '.bzr', '.hg', '.git', '__pycache__', '.tox', '.cache']
+TEST_PATTERN = 'test_*.py'
+
+
+class ChangeTracker(object):
+    """ Content hash cache and import graph for a work tree. """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, root, cache_file, exclude_dirs=None):
+        """
+        :param (str) root: Work tree root.
+        :param (str) cache_file: JSON cache location (reused across runs).
+        :param (list) exclude_dirs: Dir names not walked.
+        """
+        self.root = os.path.abspath(root)
+        self.cache_file = cache_file
+        self.exclude_dirs = exclude_dirs if exclude_dirs is not None else EXCLUDE_DIRS
+        self.hashes = {}
+        self.modules = {}
+        self.deps = {}
+        self.changed = set()
+        self.removed = set()
+        self.saved = {}
+        self.cache = self.__load()
+
+    def __str__(self):
+        return "Change Tracker: {0} files, {1} changed, {2} removed".format(len(self.hashes), len(self.changed), len(self.removed))
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, self.root)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def scan(self):
+        """ Hash the tree, build the import graph and diff against the cache.
+        :return (set): Changed (new or modified) relative paths.
+        """
+        self.hashes = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted([d for d in dirnames if d not in self.exclude_dirs and not d.startswith('.')])
+            for filename in fnmatch.filter(filenames, '*.py'):
+                path = os.path.join(dirpath, filename)
+                self.hashes[os.path.relpath(path, self.root)] = self.__hash(path)
+
+        self.modules = {}
+        for path in self.hashes:
+            self.modules[self.__module_name(path)] = path
+
+        self.deps = {}
+        for path in self.hashes:
+            self.deps[path] = sorted(self.__imports(path))
+
+        cached = self.cache['files']
+        self.changed = set([p for p, h in self.hashes.items() if cached.get(p, {}).get('hash') != h])
+        self.removed = set(cached) - set(self.hashes)
+        return self.changed
+
+    def affected(self):
+        """ All files reachable (reverse imports) from the files changed or removed since the last save.
+        :return (set): Relative paths.
+        """
+        rdeps = {}
+        for path, deps in self.deps.items():
+            for dep in deps:
+                rdeps.setdefault(dep, set()).add(path)
+        # Removed files are no longer in the graph; use the importers recorded last run.
+        for path, entry in self.cache['files'].items():
+            for dep in entry.get('deps', []):
+                if dep in self.removed and path in self.hashes:
+                    rdeps.setdefault(dep, set()).add(path)
+
+        affected = set()
+        queue = deque(self.changed | self.removed)
+        while queue:
+            path = queue.popleft()
+            if path in affected:
+                continue
+            affected.add(path)
+            queue.extend(rdeps.get(path, set()) - affected)
+        return affected & set(self.hashes)
+
+    def tests(self):
+        """ All unittest files in the tree. """
+        return sorted([p for p in self.hashes if fnmatch.fnmatch(os.path.basename(p), TEST_PATTERN)])
+
+    def closure(self, path):
+        """ A file and everything it imports (transitively). """
+        closure = set()
+        queue = deque([path])
+        while queue:
+            item = queue.popleft()
+            if item in closure or item not in self.hashes:
+                continue
+            closure.add(item)
+            queue.extend(self.deps.get(item, []))
+        return closure
+
+    def key(self, path, closure=False):
+        """ Content key of a path; with closure, of the path and its import closure. """
+        if not closure:
+            return self.hashes.get(path)
+        digest = hashlib.sha1()
+        for item in sorted(self.closure(path)):
+            digest.update('{0}:{1}\n'.format(item, self.hashes[item]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def stale(self, check, signature='', paths=None, closure=False, rerun_failed=False):
+        """ Paths that must be (re)run for a check; everything else can use the cached result.
+        :param (str) check: Check name (e.g. 'pep8').
+        :param (str) signature: Check options; a different signature invalidates the check cache.
+        :param (list) paths: Candidate paths (default all files).
+        :param (bool) closure: The check depends on the import closure (unittests), not just the file (lint).
+        :param (bool) rerun_failed: Also re-run paths whose cached result was not a pass.
+        :return (list): Relative paths.
+        """
+        paths = sorted(self.hashes) if paths is None else paths
+        results = self.__check_results(check, signature)
+        stale = []
+        for path in paths:
+            result = results.get(path)
+            if not result or result.get('key') != self.key(path, closure) or (rerun_failed and result['fails'] != 0):
+                stale.append(path)
+        return stale
+
+    def result(self, check, path):
+        """ Cached result dict (fails, report, duration) for a check/path, or None. """
+        return self.cache['checks'].get(check, {}).get('results', {}).get(path)
+
+    def store(self, check, signature, path, fails, report='', duration=0.0, closure=False):
+        """ Record a fresh result for a check/path. """
+        results = self.__check_results(check, signature)
+        results[path] = dict(key=self.key(path, closure), fails=fails, report=report, duration=round(duration, 3))
+
+    def reuse(self, check, paths):
+        """ Account for cached results used in place of a run.
+        :return (float): Secs saved (sum of the last measured durations).
+        """
+        saved = sum([(self.result(check, p) or {}).get('duration', 0.0) for p in paths])
+        self.saved[check] = self.saved.get(check, 0.0) + saved
+        return saved
+
+    def time_saved(self):
+        """ Total secs saved across all checks this run. """
+        return sum(self.saved.values())
+
+    def save(self):
+        """ Commit hashes, deps and results (atomic write). """
+        files = {}
+        for path, digest in self.hashes.items():
+            files[path] = dict(hash=digest, deps=self.deps.get(path, []))
+        self.cache['files'] = files
+        # Drop results of files no longer in the tree.
+        for check in self.cache['checks'].values():
+            for path in list(check['results']):
+                if path not in files:
+                    check['results'].pop(path)
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix='.change_tracker')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(self.cache, fp, indent=1, sort_keys=True)
+        os.rename(tmp, self.cache_file)
+        return True
+
+    @staticmethod
+    def split_report(report, paths):
+        """ Split a lint report (one 'path:line: msg' per line) into per-path reports.
+        :return (dict): {path: [lines]} for each of the paths (empty list = clean).
+        """
+        per_path = dict([(p, []) for p in paths])
+        for line in report.splitlines():
+            path = os.path.normpath(line.split(':')[0].lstrip('./')) if ':' in line else None
+            if path in per_path:
+                per_path[path].append(line)
+        return per_path
+
+    def junit_results(self, xml_file, paths):
+        """ Per-test-file fails and durations from a pytest junitxml file.
+        :param (str) xml_file: junitxml result file.
+        :param (list) paths: Test files that were run (relative).
+        :return (dict): {path: (fails, duration)}; None if the file is unreadable.
+        """
+        try:
+            tree = ElementTree.parse(xml_file)
+        except (IOError, OSError, ElementTree.ParseError):
+            return None
+        by_module = dict([(self.__module_name(p), p) for p in paths])
+        results = dict([(p, [0, 0.0]) for p in paths])
+        for case in tree.iter('testcase'):
+            path = case.get('file')
+            path = os.path.normpath(path) if path else self.__longest_prefix(case.get('classname', ''), by_module)
+            if path not in results:
+                continue
+            results[path][1] += float(case.get('time', 0) or 0)
+            if case.find('failure') is not None or case.find('error') is not None:
+                results[path][0] += 1
+        return dict([(p, tuple(v)) for p, v in results.items()])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __load(self):
+        empty = dict(version=self.CACHE_VERSION, root=self.root, files={}, checks={})
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return empty
+        try:
+            with open(self.cache_file) as fp:
+                cache = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return empty
+        if cache.get('version') != self.CACHE_VERSION or cache.get('root') != self.root:
+            return empty
+        return cache
+
+    def __check_results(self, check, signature):
+        entry = self.cache['checks'].get(check)
+        if not entry or entry.get('signature') != signature:
+            entry = self.cache['checks'][check] = dict(signature=signature, results={})
+        return entry['results']
+
+    @staticmethod
+    def __hash(path):
+        with open(path, 'rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+
+    @staticmethod
+    def __module_name(path):
+        parts = os.path.splitext(path)[0].split(os.sep)
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        return '.'.join(parts)
+
+    @staticmethod
+    def __longest_prefix(name, lookup):
+        parts = name.split('.')
+        while parts:
+            if '.'.join(parts) in lookup:
+                return lookup['.'.join(parts)]
+            parts.pop()
+        return None
+
+    def __resolve(self, name):
+        """ Module name to tree path; installed prefixes (e.g. apollo.scripts.<bu>) are stripped. """
+        parts = name.split('.')
+        for i in range(0, len(parts) - 1 if len(parts) > 1 else 1):
+            path = self.modules.get('.'.join(parts[i:]))
+            if path:
+                return path
+        return None
+
+    def __imports(self, path):
+        """ Tree files imported by a file (plus parent package __init__ files and ancestor conftest files). """
+        full_path = os.path.join(self.root, path)
+        package = self.__module_name(path).split('.')
+        if os.path.basename(path) != '__init__.py':
+            package = package[:-1]
+        deps = set()
+        try:
+            with open(full_path) as fp:
+                tree = ast.parse(fp.read(), full_path)
+        except (SyntaxError, TypeError, ValueError):
+            # Unparsable files cannot be followed; the lint checks will flag them.
+            tree = None
+
+        groups = []
+        for node in ast.walk(tree) if tree else []:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    # Implicit relative (py2) first, then absolute.
+                    groups.append(['.'.join(package + [alias.name]), alias.name])
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base = package[:len(package) - node.level + 1] if node.level > 1 else package
+                    bases = ['.'.join(base + ([node.module] if node.module else []))]
+                else:
+                    bases = ['.'.join(package + [node.module]), node.module]
+                for alias in node.names:
+                    # 'from pkg import mod' imports a submodule; 'from mod import name' imports the module.
+                    groups.append([c for b in bases for c in ['{0}.{1}'.format(b, alias.name), b]])
+
+        for candidates in groups:
+            for candidate in candidates:
+                dep = self.__resolve(candidate) if candidate else None
+                if dep:
+                    if dep != path:
+                        deps.add(dep)
+                    break
+
+        # Packages: importing a.b.c runs a/__init__ and a/b/__init__.
+        for dep in list(deps) + [path]:
+            parts = dep.split(os.sep)[:-1]
+            while parts:
+                init = os.path.join(*(parts + ['__init__.py']))
+                if init in self.hashes and init != path:
+                    deps.add(init)
+                parts.pop()
+        # pytest loads conftest.py from the test dir and its ancestors.
+        if fnmatch.fnmatch(os.path.basename(path), TEST_PATTERN):
+            parts = path.split(os.sep)[:-1]
+            while True:
+                conftest = os.path.join(*(parts + ['conftest.py'])) if parts else 'conftest.py'
+                if conftest in self.hashes:
+                    deps.add(conftest)
+                if not parts:
+                    break
+                parts.pop()
+        return deps
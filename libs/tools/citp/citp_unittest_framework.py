@@ -140,6 +140,7 @@ class CITPUnittestFramework(object):
                                                'mode': uut_data.get('mode', 'DEBUG'),
                                                'start_delay': uut_data.get('start_delay', 1),
                                                'timeout': uut_data.get('timeout', 10000),
+                                               'priority': uut_data.get('priority', 0),
                                                'answers': _answers}
         print("Run Dict = {0}".format(run_dict))
         return run_dict
@@ -28,18 +28,21 @@ import shlex
 import parse
 import ast
 import socket
+import time
 
 
 from apollo_control import ApolloControl
+from change_tracker import ChangeTracker
 
 
 __title__ = "CITP Test Runner Tool"
-__version__ = '3.2.0'
+__version__ = '3.3.0'
 __author__ = ['bborel', 'sdubrul']
 
 __local_archive_path__ = '/opt/cisco/te'
 __local_jenkins_workpath__ = '/var/lib/jenkins'
 __runtests_cfg__ = '/tmp/runtests.cfg'
+__runtests_cache__ = '/tmp/runtests_cache.json'
 
 
 class TestResult(object):
@@ -92,7 +95,7 @@ class TestRunner(object):
 
     def __init__(self, verbose=False, verbose2=False, restart_apollo=True, clear_apollo_logs=True, tests_to_run=DEFAULT_TESTS,
                  pytest_modules_to_run='', xdist=False, pytest_capture='sys', pytest_expr=None, show_gui=False,
-                 apollo_start_args='', pep8='', nolinking=True, log_tag=''):
+                 apollo_start_args='', pep8='', nolinking=True, log_tag='', incremental=False, cache_file=__runtests_cache__):
 
         try:
             # Banner
@@ -113,11 +116,14 @@ class TestRunner(object):
             self.pep8 = pep8
             self.nolinking = nolinking
             self.log_tag = log_tag
+            self.incremental = incremental
+            self.cache_file = cache_file
 
             # Some more variables
             self.results = []
             self.environment = None   # list of everything
             self.env_location = None  # 'svn' or 'jenkins'
+            self.change_tracker = None  # incremental mode only
 
             # Who is using this
             self.user = pwd.getpwuid(os.getuid())[0]
@@ -575,6 +581,7 @@ class TestRunner(object):
             ("pytests available", ','.join(self.available_pytest_modules_list)),
             ("apollo restart", str(self.restart_apollo)),
             ('env location', self.env_location),
+            ("incremental", "{0}  ({1})".format(self.incremental, self.cache_file) if self.incremental else str(self.incremental)),
             ("verbose", str(self.verbose)),
         ]
 
@@ -775,6 +782,10 @@ class TestRunner(object):
         for result in self.results:
             print(result)
         passed = all([result.passed() for result in self.results])
+        if self.change_tracker:
+            print("Incremental: {0} changed, {1} affected; time saved ~{2:.1f}s ({3})".format(
+                len(self.change_tracker.changed), len(self.change_tracker.affected()), self.change_tracker.time_saved(),
+                ', '.join(['{0}={1:.1f}s'.format(k, v) for k, v in sorted(self.change_tracker.saved.items())])))
         self.textbox("End Result = {0}".format("PASS" if passed else "FAIL"))
         return not passed
 
@@ -798,6 +809,11 @@ class TestRunner(object):
     def run_tests(self):
         self.show_test_options()
         self.setup_result_folder()
+        if self.incremental:
+            print("* Scanning for changes (cache={0})...".format(self.cache_file))
+            self.change_tracker = ChangeTracker(self.work_path, self.cache_file)
+            self.change_tracker.scan()
+            print("* {0}; {1} affected.".format(self.change_tracker, len(self.change_tracker.affected())))
         print("* Running tests...")
         for test in self.tests_to_run:
             result = self.run_test(test)
@@ -807,6 +823,8 @@ class TestRunner(object):
                 self.results += result
             sys.stdout.flush()
             sys.stderr.flush()
+        if self.change_tracker:
+            self.change_tracker.save()
 
     def run_test(self, name):
         self.header(name)
@@ -833,8 +851,19 @@ class TestRunner(object):
         return result
 
     def pep8_test(self):
-        cmd = "pep8 {0} --format=pylint --count --ignore={1} --max-line-length={2}".format(self.work_path, self.pep8, self.PEP8_MAX_LINE_LEN)
-        print("cmd = {0}".format(cmd))
+        if self.change_tracker:
+            return self.__lint_incremental('pep8', self.__pep8_run, signature='{0} {1}'.format(self.pep8, self.PEP8_MAX_LINE_LEN))
+
+        pep8_fails, pep8_report = self.__pep8_run([self.work_path])
+        if pep8_fails:
+            print(pep8_report)
+
+        result = TestResult("pep8", fails=pep8_fails, data=pep8_report)
+        return result
+
+    def __pep8_run(self, targets):
+        cmd = "pep8 {0} --format=pylint --count --ignore={1} --max-line-length={2}".format(' '.join(targets), self.pep8, self.PEP8_MAX_LINE_LEN)
+        print("cmd = {0}".format(cmd) if len(targets) < 10 else "cmd = {0} ... ({1} files)".format(cmd[:120], len(targets)))
         pep8_process = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
         pep8_stdout, pep8_stderr = pep8_process.communicate()
@@ -848,14 +877,17 @@ class TestRunner(object):
 
         # chomp off the first ./ as Jenkins is unable to correlate path with this 'linux fs header'
         pep8_report = "".join([line.lstrip('./') for line in pep8_report.splitlines(True)])
+        return pep8_fails, pep8_report
 
-        if pep8_fails:
-            print(pep8_report)
+    def pyflakes_test(self):
+        if self.change_tracker:
+            return self.__lint_incremental('pyflakes', self.__pyflakes_run)
 
-        result = TestResult("pep8", fails=pep8_fails, data=pep8_report)
+        pyflakes_result, pyflakes_report = self.__pyflakes_run([self.work_path])
+        result = TestResult("pyflakes", fails=pyflakes_result, data=pyflakes_report)
         return result
 
-    def pyflakes_test(self):
+    def __pyflakes_run(self, targets):
         def report_with_bypass(self, message_class, *args, **kwargs):
             text_lineno = args[0].lineno - 1
             with open(self.filename, 'r') as code:
@@ -869,7 +901,7 @@ class TestRunner(object):
         pyflakes_err = StringIO.StringIO()
 
         reporter = pyflakes.reporter.Reporter(warningStream=pyflakes_out, errorStream=pyflakes_err)
-        pyflakes_result = pyflakes.api.checkRecursive([self.work_path], reporter)
+        pyflakes_result = pyflakes.api.checkRecursive(targets, reporter)
         pyflakes_out.flush()
         pyflakes_err.flush()
 
@@ -880,8 +912,35 @@ class TestRunner(object):
 
         pyflakes_report = "".join([line.lstrip('./') for line in pyflakes_out.getvalue().strip().splitlines(True)])
         pyflakes_report = "".join(["%s:%s: [E]%s" % tuple(line.split(':')) for line in pyflakes_report.splitlines(True)])
+        return pyflakes_result, pyflakes_report
+
+    def __lint_incremental(self, test_name, run, signature=''):
+        # Lint is file local: check the changed files only and merge with the cached per-file reports.
+        tracker = self.change_tracker
+        stale = tracker.stale(test_name, signature)
+        unattributed, unstored = 0, []
+        if stale:
+            start = time.time()
+            fails, report = run(stale)
+            duration = (time.time() - start) / len(stale)
+            per_path = tracker.split_report(report, stale)
+            # Fails without a file in the report (e.g. syntax errors); the clean-looking files are not cached.
+            unattributed = max(fails - sum([len(lines) for lines in per_path.values()]), 0)
+            for path, lines in per_path.items():
+                if lines or not unattributed:
+                    tracker.store(test_name, signature, path, len(lines), report='\n'.join(lines), duration=duration)
+                else:
+                    unstored.append(path)
+        saved = tracker.reuse(test_name, sorted(set(tracker.hashes) - set(stale)))
+        print("* Incremental {0}: {1} of {2} files checked; {3:.1f}s saved.".format(test_name, len(stale), len(tracker.hashes), saved))
 
-        result = TestResult("pyflakes", fails=pyflakes_result, data=pyflakes_report)
+        results = [tracker.result(test_name, path) for path in sorted(tracker.hashes) if path not in unstored]
+        fails = sum([r['fails'] for r in results]) + unattributed
+        report = '\n'.join([r['report'] for r in results if r['report']])
+        if fails:
+            print(report)
+
+        result = TestResult(test_name, fails=fails, data=report)
         return result
 
     def __pytest_generate_params(self, available_pytest_modules, pytest_modules_to_run):
@@ -904,6 +963,9 @@ class TestRunner(object):
             if isinstance(v, list):
                 # Immediate workspace unittests
                 expr, ignore, run_modules = self.__pytest_generate_params(self.available_pytest_modules[k], v)
+                if self.change_tracker:
+                    result_list.append(self.__pytest_incremental(test_name, marker, result_file, processes_opt, gui, expr, run_modules))
+                    continue
                 cmd = 'py.test -rxs -v -m {0} {1} ' \
                       '--junitxml={2} {3}' \
                       '--capture={4} {5} {6} {7}'.format(marker, processes_opt, result_file, gui, self.pytest_capture, expr, ignore, ' '.join(run_modules))
@@ -933,6 +995,32 @@ class TestRunner(object):
 
         return result_list
 
+    def __pytest_incremental(self, test_name, marker, result_file, processes_opt, gui, expr, run_modules):
+        # Only the unittests whose import closure changed (or that did not pass last time) are run.
+        tracker = self.change_tracker
+        signature = ' '.join([marker, processes_opt, gui, expr])
+        tests = [t for t in tracker.tests() if '.' in run_modules or [m for m in run_modules if t.startswith(m.rstrip('/') + '/')]]
+        stale = tracker.stale(test_name, signature, tests, closure=True, rerun_failed=True)
+        saved = tracker.reuse(test_name, sorted(set(tests) - set(stale)))
+        print("* Incremental {0}: {1} of {2} test files affected; {3:.1f}s saved.".format(test_name, len(stale), len(tests), saved))
+        if not stale:
+            return TestResult(test_name, fails=0, data="All {0} test files unaffected; cached results used.".format(len(tests)))
+
+        cmd = 'py.test -rxs -v -m {0} {1} ' \
+              '--junitxml={2} {3}' \
+              '--capture={4} {5} {6}'.format(marker, processes_opt, result_file, gui, self.pytest_capture, expr, ' '.join(stale))
+        start = time.time()
+        result = self.call_pytest(test_name, cmd)
+        per_file = tracker.junit_results(result_file, stale)
+        if per_file is None:
+            per_file = dict([(path, (0, (time.time() - start) / len(stale))) for path in stale])
+        if not result.passed() and not [fails for fails, _ in per_file.values() if fails]:
+            # Failed outside of any test case (e.g. collection); nothing can be trusted.
+            per_file = dict([(path, (-1, duration)) for path, (_, duration) in per_file.items()])
+        for path, (fails, duration) in per_file.items():
+            tracker.store(test_name, signature, path, fails, duration=duration, closure=True)
+        return result
+
     def pytest_test(self):
         test_name = 'pytest'
         marker = "'not performance and not webgui'"
@@ -1173,6 +1261,12 @@ Case 1a.
    If you want to run all (pep8, pyflakes, and pytest) on all folders, use:
    • apruntests
 
+ Case 6.
+   If you want to run all (pep8, pyflakes, and pytest) but only on what changed since the last incremental run, use:
+   • apruntests --incremental
+   Lint is re-run on changed files only; pytest only on test files whose imports (transitively) changed or that failed.
+   Cached results are merged into the report along with the estimated time saved.  Delete the cache to force a full run.
+
     """)                                                                                                                 # nopep8
     return
 
@@ -1215,6 +1309,10 @@ if __name__ == "__main__":
                         dest="cfg", default=False, action="store_true")
     parser.add_argument("--nolinking", dest="nolinking", default=False, action="store_true",
                         help="Turn off Apollo link creation (default=off).")
+    parser.add_argument("--incremental", dest="incremental", default=False, action="store_true",
+                        help="Only re-run checks and pytests affected by files changed since the last run (default=off).")
+    parser.add_argument("--cache", dest="cache_file", default=__runtests_cache__, action="store",
+                        help="Incremental result cache file (default={0}).".format(__runtests_cache__))
     args = parser.parse_args()
 
     if args.usage:
@@ -1241,7 +1339,9 @@ if __name__ == "__main__":
                             apollo_start_args=args.apollo_start_args,
                             pep8=args.pep8,
                             nolinking=args.nolinking,
-                            log_tag=args.log_tag
+                            log_tag=args.log_tag,
+                            incremental=args.incremental,
+                            cache_file=args.cache_file
                             )
     test_suite.main(args)
     exit(0)
@@ -0,0 +1,96 @@
+import logging
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+from .. import apollo_run_tool
+
+__title__ = 'EntSw Apollo Run Tool Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+# Fake apollocli: the container name gives the behavior (<RESULT>_<secs>); the start order is logged.
+FAKE_APOLLOCLI = '''
+import sys
+import time
+args = sys.argv[1:]
+container = args[args.index('-cn') + 1]
+with open(sys.argv[0] + '.starts', 'a') as fp:
+    fp.write(container + '\\n')
+result, secs = container.split('_')
+print('Sequence log for ' + container)
+sys.stdout.flush()
+time.sleep(float(secs))
+if result == 'CRASH':
+    sys.exit(3)
+print('Container: {0}, Result: {1}'.format(container, result) + (', Error: boom' if result == 'FAIL' else ''))
+'''
+
+
+class TestApolloRunTool(object):
+
+    def setup_method(self, method):
+        self.tmp = tempfile.mkdtemp()
+        self.cli = os.path.join(self.tmp, 'apollocli.py')
+        with open(self.cli, 'w') as fp:
+            fp.write(FAKE_APOLLOCLI)
+        self.cli_cmd = '{0} {1}'.format(sys.executable, self.cli)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.tmp)
+
+    def __starts(self):
+        with open(self.cli + '.starts') as fp:
+            return fp.read().split()
+
+    def __submit(self, scheduler, containers, timeout=100):
+        for container, priority in containers:
+            scheduler.submit(apollo_run_tool.ContainerId('UAT', 'PCBST', 'Station_A_01', container, 'DEBUG', None, 0,
+                                                         timeout), priority=priority)
+
+    def test_bounded_priority_streaming(self):
+        streamed = []
+        summary_file = os.path.join(self.tmp, 'summary.json')
+        scheduler = apollo_run_tool.ContainerScheduler(max_workers=2, cli_cmd=self.cli_cmd, summary_file=summary_file,
+                                                       on_result=lambda r: streamed.append(r.identifier))
+        self.__submit(scheduler, [('PASS_0.6', 5), ('FAIL_0.1', 1), ('PASS_0.2', 0), ('CRASH_0.1', 9)])
+        results = scheduler.run()
+        assert [r.identifier for r in results] == ['PASS_0.6', 'FAIL_0.1', 'PASS_0.2', 'CRASH_0.1']
+        assert [r.status for r in results] == ['PASS', 'FAIL', 'PASS', 'ERROR']
+        assert results[1].error == 'boom' and 'Sequence log' in results[0].log
+        starts = self.__starts()
+        assert sorted(starts[:2]) == ['FAIL_0.1', 'PASS_0.2'] and starts[2:] == ['PASS_0.6', 'CRASH_0.1']
+        assert streamed[0] == 'FAIL_0.1' and streamed[-1] in ['PASS_0.6', 'CRASH_0.1']
+
+        with open(summary_file) as fp:
+            summary = json.load(fp)
+        assert summary['max_workers'] == 2 and summary['counts'] == {'PASS': 2, 'FAIL': 1, 'ERROR': 1}
+        assert summary['containers'][3]['returncode'] == 3
+        assert 0.7 <= summary['wall'] < 3.0
+
+    def test_timeout_and_fail_fast(self):
+        scheduler = apollo_run_tool.ContainerScheduler(max_workers=1, cli_cmd=self.cli_cmd, fail_fast=True)
+        scheduler.KILL_MARGIN = 0
+        self.__submit(scheduler, [('PASS_5', 0)], timeout=0.3)
+        self.__submit(scheduler, [('PASS_0.1', 1)])
+        start = time.time()
+        results = scheduler.run()
+        assert time.time() - start < 3.0
+        assert [r.status for r in results] == ['TIMEOUT', 'CANCELLED']
+        assert self.__starts() == ['PASS_5']
+
+    def test_cancel_running(self):
+        scheduler = apollo_run_tool.ContainerScheduler(max_workers=2, cli_cmd=self.cli_cmd)
+        self.__submit(scheduler, [('PASS_5', 0), ('PASS_5', 0), ('PASS_0.1', 1)])
+        canceller = apollo_run_tool.threading.Timer(0.5, scheduler.cancel)
+        canceller.start()
+        start = time.time()
+        results = scheduler.run()
+        assert time.time() - start < 3.0
+        assert [r.status for r in results] == ['CANCELLED', 'CANCELLED', 'CANCELLED']
+        assert scheduler.summary()['counts'] == {'CANCELLED': 3}
@@ -0,0 +1,130 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from .. import change_tracker
+
+__title__ = 'EntSw Change Tracker Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+TREE = {
+    'pkg/__init__.py': '',
+    'pkg/a.py': 'import os\nVALUE = 1\n',
+    'pkg/b.py': 'from . import a\n',
+    'pkg/c.py': 'import a\nfrom apollo.scripts.entsw.pkg.d import helper\n',
+    'pkg/d.py': 'def helper():\n    pass\n',
+    'pkg/tests/__init__.py': '',
+    'pkg/tests/conftest.py': '',
+    'pkg/tests/test_b.py': 'from .. import b\n',
+    'pkg/tests/test_c.py': 'from ..c import a\n',
+    'pkg/tests/test_x.py': 'import json\n',
+}
+
+JUNIT = '''<?xml version="1.0" encoding="utf-8"?>
+<testsuite errors="0" failures="1" name="pytest" tests="3">
+<testcase classname="pkg.tests.test_b.TestB" name="test_one" time="1.5"></testcase>
+<testcase classname="pkg.tests.test_c.TestC" name="test_one" time="2.0"><failure message="assert"></failure></testcase>
+<testcase classname="pkg.tests.test_c" name="test_two" time="0.5"></testcase>
+</testsuite>
+'''
+
+
+class TestChangeTracker(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.root, 'cache.json')
+        for path, text in TREE.items():
+            self.write(path, text)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.root, path)
+        if not os.path.exists(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as fp:
+            fp.write(text)
+
+    def tracker(self):
+        tracker = change_tracker.ChangeTracker(self.root, self.cache_file)
+        tracker.scan()
+        return tracker
+
+    def run(self, tracker, signature=''):
+        """ Fake full run: every stale file is checked and passes. """
+        for path in tracker.stale('pep8', signature):
+            tracker.store('pep8', signature, path, 0, duration=0.25)
+        tests = tracker.tests()
+        for path in tracker.stale('pytest', '', tests, closure=True, rerun_failed=True):
+            tracker.store('pytest', '', path, 0, duration=2.0, closure=True)
+        tracker.save()
+
+    def test_import_graph(self):
+        tracker = self.tracker()
+        assert tracker.deps['pkg/b.py'] == ['pkg/__init__.py', 'pkg/a.py']
+        # Implicit relative and installed (apollo.scripts.<bu>) imports.
+        assert tracker.deps['pkg/c.py'] == ['pkg/__init__.py', 'pkg/a.py', 'pkg/d.py']
+        assert tracker.deps['pkg/tests/test_c.py'] == ['pkg/__init__.py', 'pkg/c.py', 'pkg/tests/__init__.py', 'pkg/tests/conftest.py']
+        assert tracker.closure('pkg/tests/test_b.py') == set(['pkg/tests/test_b.py', 'pkg/b.py', 'pkg/a.py', 'pkg/__init__.py',
+                                                              'pkg/tests/__init__.py', 'pkg/tests/conftest.py'])
+        assert tracker.tests() == ['pkg/tests/test_b.py', 'pkg/tests/test_c.py', 'pkg/tests/test_x.py']
+        assert len(tracker.changed) == len(TREE) and tracker.affected() == set(TREE)
+
+    def test_incremental(self):
+        tracker = self.tracker()
+        assert len(tracker.stale('pep8')) == len(TREE)
+        self.run(tracker)
+
+        # Nothing changed: all cached.
+        tracker = self.tracker()
+        assert tracker.changed == set() and tracker.stale('pep8') == []
+        assert tracker.stale('pytest', '', tracker.tests(), closure=True) == []
+        assert tracker.reuse('pytest', tracker.tests()) == 6.0
+
+        # A leaf module changed: only it is re-linted; only the tests importing it (transitively) re-run.
+        self.write('pkg/a.py', 'import os\nVALUE = 2\n')
+        tracker = self.tracker()
+        assert tracker.changed == set(['pkg/a.py'])
+        assert tracker.affected() == set(['pkg/a.py', 'pkg/b.py', 'pkg/c.py', 'pkg/tests/test_b.py', 'pkg/tests/test_c.py'])
+        assert tracker.stale('pep8') == ['pkg/a.py']
+        assert tracker.stale('pytest', '', tracker.tests(), closure=True) == ['pkg/tests/test_b.py', 'pkg/tests/test_c.py']
+        assert tracker.reuse('pep8', sorted(set(tracker.hashes) - set(['pkg/a.py']))) == 0.25 * (len(TREE) - 1)
+
+        # A partial run (lint only) must not hide the change from pytest.
+        tracker.store('pep8', '', 'pkg/a.py', 0)
+        tracker.save()
+        tracker = self.tracker()
+        assert tracker.stale('pep8') == []
+        assert tracker.stale('pytest', '', tracker.tests(), closure=True) == ['pkg/tests/test_b.py', 'pkg/tests/test_c.py']
+
+        # New options invalidate the check; failed tests re-run.
+        assert len(tracker.stale('pep8', signature='E221')) == len(TREE)
+        tracker.store('pytest', '', 'pkg/tests/test_x.py', 1, closure=True)
+        assert tracker.stale('pytest', '', ['pkg/tests/test_x.py'], closure=True, rerun_failed=True) == ['pkg/tests/test_x.py']
+
+        # Removed module: its importers are affected and their tests re-run.
+        self.run(tracker)
+        os.remove(os.path.join(self.root, 'pkg/d.py'))
+        tracker = self.tracker()
+        assert tracker.removed == set(['pkg/d.py'])
+        assert tracker.affected() == set(['pkg/c.py', 'pkg/tests/test_c.py'])
+        assert tracker.stale('pytest', '', tracker.tests(), closure=True) == ['pkg/tests/test_c.py']
+
+    def test_reports(self):
+        tracker = self.tracker()
+        report = 'pkg/a.py:1: [E501] line too long\n./pkg/b.py:3: [E]undefined name\npkg/a.py:2: [W291] trailing'
+        per_path = tracker.split_report(report, ['pkg/a.py', 'pkg/b.py', 'pkg/c.py'])
+        assert [len(per_path[p]) for p in ['pkg/a.py', 'pkg/b.py', 'pkg/c.py']] == [2, 1, 0]
+
+        xml_file = os.path.join(self.root, 'pytest.xml')
+        with open(xml_file, 'w') as fp:
+            fp.write(JUNIT)
+        results = tracker.junit_results(xml_file, ['pkg/tests/test_b.py', 'pkg/tests/test_c.py'])
+        assert results == {'pkg/tests/test_b.py': (0, 1.5), 'pkg/tests/test_c.py': (1, 2.5)}
+        assert tracker.junit_results(os.path.join(self.root, 'missing.xml'), []) is None
@@ -0,0 +1,309 @@
+""" Bandwidth Scheduler Module
+========================================================================================================================
+
+Token based scheduler for network-heavy steps (image downloads, TFTP loads) of the UUT containers on a station.
+
+The legacy common_utils.network_availability() polled a cached usage record under a lock every ~30 secs; a container
+could sit idle for the full interval after bandwidth was freed and there was no ordering of the waiters.
+This scheduler instead:
+    1. Grants up to 'max_tokens' concurrent holders per station (concurrency cap).
+    2. Queues waiters by area priority (lower value = served first), then FIFO within the same priority.
+    3. Hands a released token directly to the next waiter and rings that waiter's doorbell (wake-on-release);
+       in-process waiters are woken by an event, other containers see a doorbell file on the next 0.1 sec check.
+       The shared state is only re-read on a doorbell or every 'check_interval' (safety net).
+    4. Reclaims tokens of holders older than 'hold_timeout' and drops queued waiters that stopped checking in.
+    5. Records per-container wait time metrics (count, avg, max, last).
+
+The state lock and the state store are injectable (ex. Apollo locking.ContainerPriorityLock and the Apollo cached
+data functions); the defaults are a file lock and a JSON file in the shared dir.
+
+Usage:
+    scheduler = BandwidthScheduler(name='network', max_tokens=10, area_priorities={'PCBST': 1, 'SYSFT': 9})
+    with scheduler.token(container='UUT01', area='PCBST'):
+        <download>
+    scheduler.print_metrics()
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import time
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# BU Specific
+# -----------
+from .file_lock import FileLock
+
+
+__title__ = "Bandwidth Scheduler Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), 'bandwidth_scheduler')
+DEFAULT_MAX_TOKENS = 10
+DEFAULT_PRIORITY = 5
+DEFAULT_HOLD_TIMEOUT = 1800
+DEFAULT_CHECK_INTERVAL = 20.0
+DOORBELL_POLL = 0.1
+
+
+class BandwidthScheduler(object):
+    """ Bandwidth Scheduler
+    """
+    _events = {}
+    _events_lock = threading.Lock()
+
+    def __init__(self, name='network', max_tokens=DEFAULT_MAX_TOKENS, area_priorities=None, lock_factory=None,
+                 store=None, shared_dir=DEFAULT_SHARED_DIR, hold_timeout=DEFAULT_HOLD_TIMEOUT,
+                 check_interval=DEFAULT_CHECK_INTERVAL):
+        """
+        :param (str) name: Scheduler name (ex. 'network.<station>'); all containers using the same name share tokens.
+        :param (int) max_tokens: Max concurrent token holders (concurrency cap).
+        :param (dict) area_priorities: Form of {<test area>: <priority>, ...}; lower value = served first.
+        :param (func) lock_factory: Returns a lock context manager for a name; default = file lock in shared_dir.
+        :param (tuple) store: (get_func(key), put_func(key, value)) for the shared state; default = JSON file in shared_dir.
+        :param (str) shared_dir: Directory for doorbells (and the default lock + state).
+        :param (int) hold_timeout: Max time (secs) a token is held before it is reclaimed.
+        :param (float) check_interval: Max time (secs) between re-reads of the shared state by a waiter.
+        """
+        self.name = name
+        self.max_tokens = max(1, max_tokens)
+        self.area_priorities = area_priorities if area_priorities else {}
+        self.shared_dir = shared_dir
+        self.hold_timeout = hold_timeout
+        self.check_interval = check_interval
+        self._safe_name = re.sub(r'[^A-Za-z0-9_.\-]', '_', name)
+        self._lock_factory = lock_factory if lock_factory else self.__file_lock
+        self._store = store if store else (self.__file_get, self.__file_put)
+        self.__make_shared_dir()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def acquire(self, container, area=None, timeout=None):
+        """ Acquire
+        Idempotent; a container that already holds a token keeps it.
+        :param (str) container: Container key (or name)
+        :param (str) area: Test area (for priority)
+        :param (float) timeout: Max wait (secs); None = wait forever.
+        :return (bool): True if the token is held.
+        """
+        priority = self.area_priorities.get(area, DEFAULT_PRIORITY)
+        start = time.time()
+        event = self.__event(container)
+        event.clear()
+        self.__clear_doorbell(container)
+        granted = container in self.__update(self.__enqueue, container, area, priority)['holders']
+        if not granted:
+            state = self.get_state()
+            log.debug("Bandwidth {0}: {1} queued (priority={2}, holders={3}/{4}, queued={5}).".format(
+                self.name, container, priority, len(state['holders']), self.max_tokens, len(state['queue'])))
+        last_check = time.time()
+        while not granted:
+            if timeout is not None and time.time() - start > timeout:
+                self.__update(self.__dequeue, container)
+                log.warning("Bandwidth {0}: {1} timeout after {2:.1f} secs.".format(self.name, container, time.time() - start))
+                return False
+            rung = event.wait(DOORBELL_POLL) or self.__doorbell_rung(container)
+            if rung or time.time() - last_check >= self.check_interval:
+                event.clear()
+                self.__clear_doorbell(container)
+                granted = container in self.__update(self.__enqueue, container, area, priority)['holders']
+                last_check = time.time()
+        wait = time.time() - start
+        self.__update(self.__record_wait, container, wait)
+        log.debug("Bandwidth {0}: {1} acquired (wait={2:.2f} secs).".format(self.name, container, wait))
+        return True
+
+    def release(self, container):
+        """ Release
+        The token is handed to the next waiter(s) by priority and their doorbells are rung.
+        :param (str) container:
+        :return (bool): True if the container held a token.
+        """
+        held = container in self.get_state()['holders']
+        self.__update(self.__release, container)
+        log.debug("Bandwidth {0}: {1} {2}.".format(self.name, container, 'released' if held else 'already released'))
+        return held
+
+    @contextmanager
+    def token(self, container, area=None, timeout=None):
+        """ Token (context manager)
+        A token already held by the container (ex. from network_availability) is NOT released on exit.
+        """
+        held = self.is_holder(container)
+        if not held and not self.acquire(container, area=area, timeout=timeout):
+            raise RuntimeError("Bandwidth {0}: no token for {1} within {2} secs.".format(self.name, container, timeout))
+        try:
+            yield
+        finally:
+            self.release(container) if not held else None
+
+    def is_holder(self, container):
+        return container in self.get_state()['holders']
+
+    def get_state(self):
+        """ Get State
+        :return (dict): {'holders': {<container>: {...}}, 'queue': [{...}, ...], 'metrics': {<container>: {...}}}
+        """
+        return self.__normalize(self._store[0](self.__key))
+
+    def get_metrics(self, container=None):
+        """ Get Metrics
+        :param (str) container: None = all containers.
+        :return (dict): {<container>: {'count', 'total', 'avg', 'max', 'last'}, ...} or the stats for one container.
+        """
+        metrics = {}
+        for c, m in self.get_state()['metrics'].items():
+            metrics[c] = dict(m, avg=m['total'] / m['count'] if m['count'] else 0.0)
+        return metrics.get(container, {}) if container else metrics
+
+    def print_metrics(self):
+        log.debug("-" * 100)
+        log.debug("Bandwidth {0} wait times (max tokens={1})".format(self.name, self.max_tokens))
+        log.debug("{0:<50} {1:>6} {2:>10} {3:>10} {4:>10}".format('Container', 'Count', 'Avg', 'Max', 'Last'))
+        log.debug("-" * 100)
+        for c, m in sorted(self.get_metrics().items()):
+            log.debug("{0:<50} {1:>6} {2:>10.2f} {3:>10.2f} {4:>10.2f}".format(c, m['count'], m['avg'], m['max'], m['last']))
+        log.debug("-" * 100)
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def __key(self):
+        return '__bandwidth_{0}__'.format(self.name)
+
+    def __update(self, func, *args):
+        """ (INTERNAL) Read-modify-write of the shared state under the state lock; rings the doorbells of new holders.
+        :return (dict): Updated state
+        """
+        with self._lock_factory(self.__key):
+            state = self.__normalize(self._store[0](self.__key))
+            func(state, *args)
+            granted = self.__dispatch(state)
+            self._store[1](self.__key, state)
+        for container in granted:
+            self.__ring_doorbell(container)
+        return state
+
+    def __enqueue(self, state, container, area, priority):
+        now = time.time()
+        if container in state['holders']:
+            return
+        for entry in state['queue']:
+            if entry['container'] == container:
+                entry['seen'] = now
+                return
+        state['seq'] += 1
+        state['queue'].append(dict(container=container, area=area, priority=priority, seq=state['seq'],
+                                   requested=now, seen=now))
+        return
+
+    def __dequeue(self, state, container):
+        state['queue'] = [e for e in state['queue'] if e['container'] != container]
+        return
+
+    def __release(self, state, container):
+        state['holders'].pop(container, None)
+        return
+
+    def __record_wait(self, state, container, wait):
+        m = state['metrics'].setdefault(container, dict(count=0, total=0.0, max=0.0, last=0.0))
+        m['count'] += 1
+        m['total'] += wait
+        m['max'] = max(m['max'], wait)
+        m['last'] = wait
+        return
+
+    def __dispatch(self, state):
+        """ (INTERNAL) Reclaim stale holders/waiters and grant free tokens to the best waiters.
+        :return (list): Containers granted a token.
+        """
+        now = time.time()
+        for c, h in list(state['holders'].items()):
+            if now - h['granted'] > self.hold_timeout:
+                log.warning("Bandwidth {0}: reclaiming token of {1} (held {2:.0f} secs).".format(self.name, c, now - h['granted']))
+                state['holders'].pop(c)
+        stale = max(60.0, 3 * self.check_interval)
+        state['queue'] = [e for e in state['queue'] if now - e['seen'] <= stale]
+        state['queue'].sort(key=lambda e: (e['priority'], e['seq']))
+        granted = []
+        while state['queue'] and len(state['holders']) < self.max_tokens:
+            entry = state['queue'].pop(0)
+            state['holders'][entry['container']] = dict(area=entry['area'], priority=entry['priority'], granted=now)
+            granted.append(entry['container'])
+        return granted
+
+    @staticmethod
+    def __normalize(state):
+        state = state if isinstance(state, dict) else {}
+        for k, v in [('holders', {}), ('queue', []), ('metrics', {}), ('seq', 0)]:
+            state.setdefault(k, v)
+        return state
+
+    def __event(self, container):
+        with self._events_lock:
+            return self._events.setdefault((self.name, container), threading.Event())
+
+    def __doorbell_file(self, container):
+        return os.path.join(self.shared_dir, '{0}.{1}.bell'.format(self._safe_name, re.sub(r'[^A-Za-z0-9_.\-]', '_', container)))
+
+    def __ring_doorbell(self, container):
+        self.__event(container).set()
+        try:
+            open(self.__doorbell_file(container), 'a').close()
+        except (IOError, OSError) as e:
+            log.debug("Bandwidth {0}: doorbell for {1} not set ({2}).".format(self.name, container, e))
+        return
+
+    def __doorbell_rung(self, container):
+        return os.path.exists(self.__doorbell_file(container))
+
+    def __clear_doorbell(self, container):
+        try:
+            os.remove(self.__doorbell_file(container))
+        except OSError:
+            pass
+        return
+
+    def __make_shared_dir(self):
+        if not os.path.isdir(self.shared_dir):
+            try:
+                os.makedirs(self.shared_dir)
+            except OSError:
+                pass
+        return
+
+    def __file_lock(self, name):
+        return FileLock(os.path.join(self.shared_dir, '{0}.lock'.format(self._safe_name)), timeout=600, poll=0.01)
+
+    def __file_get(self, key):
+        try:
+            with open(os.path.join(self.shared_dir, '{0}.json'.format(self._safe_name)), 'r') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def __file_put(self, key, value):
+        fd, tmp_file = tempfile.mkstemp(prefix='.state_', dir=self.shared_dir)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(value, fp)
+        os.rename(tmp_file, os.path.join(self.shared_dir, '{0}.json'.format(self._safe_name)))
+        return
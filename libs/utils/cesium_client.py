@@ -0,0 +1,316 @@
+""" Cesium Client Module
+========================================================================================================================
+
+Client layer for Cesium service calls (used by common_utils.cesium_srvc_retry and the lookup helpers).
+
+Features:
+    1. Per-run TTL caching of idempotent queries (ex. genealogy, LineID config, CMPD, SN data).
+       Cache keys are the endpoint name + the call args; the cache is in-memory for the client (i.e. the run).
+    2. Coalescing of concurrent identical (cacheable) requests:
+         a) Threads in the same process wait on the in-flight call.
+         b) Containers on the same server serialize on a per-request file lock; a container that waited on the lock
+            uses the result published by the holder if it was produced AFTER the waiter's request started.
+            Published results can hold sensitive data (ex. CMPD, passwords): the shared dir is private to the user
+            (0700), the result files are 0600, and results are purged once their TTL has expired.
+    3. Exponential backoff with jitter for retries; the first attempt is never delayed.
+    4. Per-endpoint metrics: calls, errors, retries, cache hits, coalesced, and latency (avg/p50/p95/max).
+
+Non-idempotent services (ex. ACT2 signing, SN generation) must NOT be given a ttl; they are never cached or coalesced.
+
+Usage:
+    client = CesiumClient()
+    g = client.call('get_genealogy', cesiumlib.get_genealogy, kwargs=dict(serial_number=sn, product_id=pid, level=1), ttl=300)
+    client.print_metrics()
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import time
+import json
+import copy
+import random
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+# BU Specific
+# -----------
+from .file_lock import FileLock
+
+
+__title__ = "Cesium Client Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300.0
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), 'cesium_client')
+PURGE_INTERVAL = 60.0
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 16.0
+BACKOFF_JITTER = 0.5
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, max_delay=BACKOFF_MAX, jitter=BACKOFF_JITTER):
+    """ Backoff Delay
+    Exponential backoff with jitter; no delay for the first attempt.
+    :param (int) attempt: Attempt number (1 = first attempt)
+    :param (float) base: Delay for the first retry (attempt 2).
+    :param (float) max_delay: Max delay (before jitter).
+    :param (float) jitter: Fraction of the delay that is randomized (0 = none, 1 = full jitter).
+    :return (float): Delay (secs)
+    """
+    if attempt <= 1:
+        return 0.0
+    delay = min(max_delay, base * 2 ** (attempt - 2))
+    return delay * (1.0 - jitter) + random.uniform(0, delay * jitter)
+
+
+class CesiumClient(object):
+    """ Cesium Client
+    """
+    def __init__(self, default_ttl=DEFAULT_TTL, shared_dir=DEFAULT_SHARED_DIR, coalesce_timeout=120):
+        """
+        :param (float) default_ttl: TTL used when call(..., ttl=True).
+        :param (str) shared_dir: Directory for cross-container request locks and published results.
+        :param (int) coalesce_timeout: Max wait (secs) on another container's identical request.
+        """
+        self.default_ttl = default_ttl
+        self.shared_dir = shared_dir
+        self.coalesce_timeout = coalesce_timeout
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._last_purge = 0.0
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def call(self, endpoint, func, args=(), kwargs=None, ttl=None, max_attempts=1, retry_exceptions=(Exception,)):
+        """ Call
+        :param (str) endpoint: Service name (cache key prefix and metrics key)
+        :param (func) func: Service function
+        :param (tuple) args: Service function args
+        :param (dict) kwargs: Service function kwargs
+        :param (float|bool) ttl: Cache time-to-live (secs); True = default ttl; None/0 = not cacheable.
+        :param (int) max_attempts: Attempts for the service (backoff w/ jitter between attempts).
+        :param (tuple) retry_exceptions: Exceptions that qualify for a retry.
+        :return: Service response
+        """
+        kwargs = kwargs if kwargs else {}
+        ttl = self.default_ttl if ttl is True else ttl
+        if not ttl:
+            return self.__call_with_retry(endpoint, func, args, kwargs, max_attempts, retry_exceptions)
+
+        key = self.get_key(endpoint, args, kwargs)
+        found, value = self.__cache_get(key)
+        if found:
+            self.__metric(endpoint)['cache_hits'] += 1
+            return value
+
+        # Coalesce in-process
+        with self._lock:
+            event = self._in_flight.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._in_flight[key] = event
+        if not owner:
+            event.wait(self.coalesce_timeout)
+            found, value = self.__cache_get(key)
+            if found:
+                self.__metric(endpoint)['coalesced'] += 1
+                return value
+            return self.__call_with_retry(endpoint, func, args, kwargs, max_attempts, retry_exceptions)
+
+        try:
+            value = self.__call_shared(key, endpoint, func, args, kwargs, ttl, max_attempts, retry_exceptions)
+            with self._lock:
+                self._cache[key] = (time.time() + ttl, copy.deepcopy(value))
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            event.set()
+
+    def invalidate(self, endpoint=None):
+        """ Invalidate
+        :param (str) endpoint: Invalidate only this endpoint's entries; None = all.
+        :return:
+        """
+        with self._lock:
+            for key in list(self._cache.keys()):
+                if endpoint is None or key.split('|', 1)[0] == endpoint:
+                    self._cache.pop(key)
+        return
+
+    def purge(self):
+        """ Purge
+        Remove the published results (all containers) whose TTL has expired.
+        :return (int): Number of results removed.
+        """
+        self._last_purge = time.time()
+        count = 0
+        try:
+            result_files = [f for f in os.listdir(self.shared_dir) if f.endswith('.json')]
+        except OSError:
+            return count
+        for result_file in [os.path.join(self.shared_dir, f) for f in result_files]:
+            published = self.__read_published(result_file)
+            if published is None or published.get('expires', 0) < time.time():
+                try:
+                    os.remove(result_file)
+                    count += 1
+                except OSError:
+                    pass
+        log.debug("Cesium client: purged {0} expired result(s).".format(count)) if count else None
+        return count
+
+    def note_retry(self, endpoint):
+        """ Note a retry done by an external retry loop (ex. cesium_srvc_retry). """
+        self.__metric(endpoint)['retries'] += 1
+        return
+
+    def get_metrics(self, endpoint):
+        """ Get Metrics
+        :param (str) endpoint:
+        :return (dict): count, errors, retries, cache_hits, coalesced, avg, p50, p95, max
+        """
+        m = self.__metric(endpoint)
+        lat = sorted(m['latency'])
+        stats = {k: v for k, v in m.items() if k != 'latency'}
+        stats['avg'] = sum(lat) / len(lat) if lat else 0.0
+        stats['p50'] = self.percentile(lat, 50)
+        stats['p95'] = self.percentile(lat, 95)
+        stats['max'] = lat[-1] if lat else 0.0
+        return stats
+
+    def print_metrics(self):
+        log.debug("-" * 110)
+        log.debug("{0:<40} {1:>6} {2:>6} {3:>6} {4:>6} {5:>6} {6:>8} {7:>8} {8:>8}".format(
+            'Endpoint', 'Calls', 'Errors', 'Retry', 'Hits', 'Coal', 'p50', 'p95', 'max'))
+        log.debug("-" * 110)
+        for endpoint in self._metrics.keys():
+            s = self.get_metrics(endpoint)
+            log.debug("{0:<40} {1:>6} {2:>6} {3:>6} {4:>6} {5:>6} {6:>8.3f} {7:>8.3f} {8:>8.3f}".format(
+                endpoint, s['count'], s['errors'], s['retries'], s['cache_hits'], s['coalesced'], s['p50'], s['p95'], s['max']))
+        log.debug("-" * 110)
+        return
+
+    @staticmethod
+    def get_key(endpoint, args, kwargs):
+        return '{0}|{1}'.format(endpoint, json.dumps([list(args), kwargs], sort_keys=True, default=str))
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        if not sorted_values:
+            return 0.0
+        index = int(round((pct / 100.0) * (len(sorted_values) - 1)))
+        return sorted_values[index]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __metric(self, endpoint):
+        with self._lock:
+            return self._metrics.setdefault(endpoint, dict(count=0, errors=0, retries=0, cache_hits=0, coalesced=0,
+                                                           latency=[]))
+
+    def __cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.time():
+                return True, copy.deepcopy(entry[1])
+            self._cache.pop(key, None)
+        return False, None
+
+    def __call_with_retry(self, endpoint, func, args, kwargs, max_attempts, retry_exceptions):
+        attempt = 0
+        while True:
+            attempt += 1
+            time.sleep(backoff_delay(attempt)) if attempt > 1 else None
+            try:
+                return self.__timed_call(endpoint, func, args, kwargs)
+            except retry_exceptions:
+                if attempt >= max_attempts:
+                    raise
+                self.note_retry(endpoint)
+                log.debug("Cesium client: {0} attempt {1} failed; retrying.".format(endpoint, attempt))
+
+    def __timed_call(self, endpoint, func, args, kwargs):
+        m = self.__metric(endpoint)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            m['errors'] += 1
+            raise
+        finally:
+            m['count'] += 1
+            m['latency'].append(time.time() - start)
+
+    def __call_shared(self, key, endpoint, func, args, kwargs, ttl, max_attempts, retry_exceptions):
+        """ (INTERNAL) Cross-container coalescing via a per-request file lock and a published result. """
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        result_file = os.path.join(self.shared_dir, '{0}.json'.format(digest))
+        requested = time.time()
+        try:
+            if not os.path.isdir(self.shared_dir):
+                os.makedirs(self.shared_dir, 0o700)
+            os.chmod(self.shared_dir, 0o700)
+            lock = FileLock(os.path.join(self.shared_dir, '{0}.lock'.format(digest)), timeout=self.coalesce_timeout,
+                            poll=0.05)
+            lock.__enter__()
+        except (IOError, OSError) as e:
+            log.debug("Cesium client: no cross-container coalescing ({0}).".format(e))
+            return self.__call_with_retry(endpoint, func, args, kwargs, max_attempts, retry_exceptions)
+
+        try:
+            published = self.__read_published(result_file)
+            if published and requested <= published['time'] <= requested + ttl:
+                self.__metric(endpoint)['coalesced'] += 1
+                return published['value']
+            value = self.__call_with_retry(endpoint, func, args, kwargs, max_attempts, retry_exceptions)
+            self.__publish(result_file, value, ttl)
+            return value
+        finally:
+            lock.__exit__(None, None, None)
+            self.purge() if time.time() - self._last_purge > PURGE_INTERVAL else None
+
+    @staticmethod
+    def __read_published(result_file):
+        try:
+            with open(result_file, 'r') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def __publish(self, result_file, value, ttl):
+        now = time.time()
+        try:
+            data = json.dumps(dict(time=now, expires=now + ttl, value=value))
+        except (TypeError, ValueError):
+            return
+        fd, tmp_file = tempfile.mkstemp(prefix='.result_', dir=self.shared_dir)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(data)
+        os.rename(tmp_file, result_file)
+        return
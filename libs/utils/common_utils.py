@@ -38,6 +38,7 @@ import shutil
 import random
 import itertools
 import json
+from contextlib import contextmanager
 
 
 # Apollo
@@ -48,6 +49,13 @@ from apollo.engine import utils as aputils
 from apollo.libs import cesiumlib
 from apollo.libs import locking
 
+# BU Specific
+# -----------
+from ..utils import cesium_client
+from ..utils import bandwidth_scheduler
+from ..utils import step_telemetry
+from ..utils import lease_registry
+from ..utils import data_index
 
 __title__ = "EntSw Common Utility Module"
 __version__ = '2.0.0'
@@ -57,6 +65,15 @@ DEPTH = 0
 IP_RESERVED_SPACE = 20
 CESIUM_MAX_SERVICE_ATTEMPTS = 3
 CESIUM_MAX_SERVICE_TIME = 10.00
+CESIUM_CACHE_TTL = 300.0
+CESIUM_SNPULL_CACHE_TTL = 60.0
+CESIUM_CLIENT = cesium_client.CesiumClient(default_ttl=CESIUM_CACHE_TTL)
+NETWORK_MAX_TOKENS = 10
+NETWORK_AREA_PRIORITIES = {}  # Form of {<test area>: <priority>}; lower value = served first (default = 5).
+NETWORK_SCHEDULERS = {}
+ACTIVE_MODULAR_TTL = 300  # Lease time (secs) of an active modular container; renewed by heartbeat.
+TELEMETRY_LOG_PATH = '/tftpboot/logs/telemetry/'
+STEP_TELEMETRY = step_telemetry.DEFAULT
 CESIUM_LOCKED_SERVICES = {'ACT2': ['get_act2_certificate_chain',
                                    'sign_act2_challenge_data',
                                    'get_act2_cliip',
@@ -120,6 +137,22 @@ def show_version():
 # ----------------------------------------------------------------------------------------------------------------------
 # Decorators
 # ----------------------------------------------------------------------------------------------------------------------
+def telemetry_context():
+    """ Telemetry Context
+    Container, UUT serial number, and test area for the step telemetry records.
+    :return (dict):
+    """
+    try:
+        puid = aplib.apdicts.userdict.get('udd', {}).get('puid')
+        return dict(container=aplib.get_my_container_key(), uut=getattr(puid, 'sernum', None),
+                    area=aplib.apdicts.test_info.test_area)
+    except (RuntimeError, KeyError, AttributeError):
+        return {}
+
+
+STEP_TELEMETRY.configure(root_dir=TELEMETRY_LOG_PATH, context_func=telemetry_context)
+
+
 def func_details(func=None, show=True, show_args=False):
     """ DECORATOR Function Details
     Use this as a decorator to show function info in the SEQLOG.
@@ -145,23 +178,29 @@ def func_details(func=None, show=True, show_args=False):
         # calling_module = inspect.getmodule(frame[0])  <-- future use
         funcmodule = inspect.getmodule(func)
         qualified_function_name = '{0}.{1}'.format(funcmodule.__name__, func.__name__)
-        if kwargs:
-            if show_args:
-                append_args_text = "{0}".format(args[0:])
-                append_kwargs_text = "{0}".format(kwargs)
-                log.debug(r"{0}> {1}{2} ...".format(ident, qualified_function_name, append_args_text))
-                step = 800
-                for i in range(0, len(append_kwargs_text), step):
-                    log.debug("{0} {1}  {2}".format(' ' * len(ident),
-                                                    ' ' * len(qualified_function_name),
-                                                    append_kwargs_text[i:i + step]))
+        record = STEP_TELEMETRY.begin(qualified_function_name, kind='func')
+        try:
+            if kwargs:
+                if show_args:
+                    append_args_text = "{0}".format(args[0:])
+                    append_kwargs_text = "{0}".format(kwargs)
+                    log.debug(r"{0}> {1}{2} ...".format(ident, qualified_function_name, append_args_text))
+                    step = 800
+                    for i in range(0, len(append_kwargs_text), step):
+                        log.debug("{0} {1}  {2}".format(' ' * len(ident),
+                                                        ' ' * len(qualified_function_name),
+                                                        append_kwargs_text[i:i + step]))
+                else:
+                    log.debug(r"{0}> {1}".format(ident, qualified_function_name))
+                r = func(*args, **kwargs)
             else:
-                log.debug(r"{0}> {1}".format(ident, qualified_function_name))
-            r = func(*args, **kwargs)
-        else:
-            append_text = "{0}".format(args[0:]) if show_args else ''
-            log.debug(r"{0}> {1}{2}".format(ident, qualified_function_name, append_text))
-            r = func(*args)
+                append_text = "{0}".format(args[0:]) if show_args else ''
+                log.debug(r"{0}> {1}{2}".format(ident, qualified_function_name, append_text))
+                r = func(*args)
+        except BaseException as e:
+            STEP_TELEMETRY.end(record, result=e)
+            raise
+        STEP_TELEMETRY.end(record, result=r)
         # Add code here for after function
         log.debug(r"<{0} {1}".format(ident, qualified_function_name))
         DEPTH -= 1
@@ -170,7 +209,8 @@ def func_details(func=None, show=True, show_args=False):
     return func_wrapper
 
 
-def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_ATTEMPTS, max_time=CESIUM_MAX_SERVICE_TIME, lock_enabled=True):
+def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_ATTEMPTS, max_time=CESIUM_MAX_SERVICE_TIME, lock_enabled=True,
+                      cache_ttl=None, no_retry=()):
     """ DECORATOR Cesium Service Retry
 
     USAGE INSTRUCTIONS:
@@ -187,12 +227,27 @@ def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_AT
             def verify_quack_label(sernum, label_sernum):
                 return cesiumlib.verify_quack_label(serial_number=sernum, quack_label_number=label_sernum)
 
+        Idempotent queries (lookups) can be cached per run and coalesced with identical concurrent requests
+        (see cesium_client.CesiumClient):
+        Ex3.
+            @cesium_srvc_retry(cache_ttl=CESIUM_CACHE_TTL)
+            def get_genealogy(serial_number, product_id, level=1):
+                return cesiumlib.get_genealogy(serial_number=serial_number, product_id=product_id, level=level)
+
+        Retries use exponential backoff with jitter; the first attempt is NOT delayed.
+        A definitive answer from the service (ex. ResultFailure for unknown data) should not be retried:
+        Ex4.
+            @cesium_srvc_retry(cache_ttl=CESIUM_CACHE_TTL, no_retry=(apexceptions.ResultFailure,))
+            def get_lineid_config(major_line_id):
+                return cesiumlib.get_lineid_config(major_line_id=major_line_id)
 
     :param (obj) func:
     :param (bool) record: Flag to record retries to the measurements db.
     :param (int) max_attempts: Maximum attempts to call the given service.
     :param (int) max_time: Maximum time allowed for a service call to respond.
     :param (bool) lock_enabled: If the service is tagged for locking then this will disable the locking when False.
+    :param (float) cache_ttl: Cache time-to-live (secs) for idempotent services; None = no caching/coalescing.
+    :param (tuple) no_retry: Exceptions raised as-is w/o a retry (i.e. only transport/service errors are retried).
     :return:
     """
     if func is None:
@@ -200,7 +255,9 @@ def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_AT
                                  record=record,
                                  max_attempts=max_attempts,
                                  max_time=max_time,
-                                 lock_enabled=lock_enabled)
+                                 lock_enabled=lock_enabled,
+                                 cache_ttl=cache_ttl,
+                                 no_retry=no_retry)
 
     @functools.wraps(func)
     def func_wrapper(*args, **kwargs):
@@ -244,21 +301,26 @@ def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_AT
                 mktime, mktime2 = 0.0, 0.0
                 try:
                     log.debug("Cesium Srvc: {0} attempt={1}...".format(_func.__name__.lstrip('_'), lp_cnt))
-                    time.sleep(lp_cnt ** 2)  # Back-off wait time, exponential
+                    if lp_cnt > 1:
+                        CESIUM_CLIENT.note_retry(srvc_name)
+                        time.sleep(cesium_client.backoff_delay(lp_cnt))  # Back-off wait time, exponential w/ jitter
                     if _lock_name:
                         log.debug("Cesium service lock attempt...")
                         with locking.named_priority_lock('cesium_service_lock_{0}'.format(_lock_name)):
                             log.debug("Cesium service running LOCKED ({0})...".format(_lock_name))
                             _, mktime = getservertime()
-                            r = _func(*args, **kwargs)
+                            r = CESIUM_CLIENT.call(srvc_name, _func, args, kwargs, ttl=cache_ttl)
                             _, mktime2 = getservertime()
                     else:
                         log.debug("Cesium service running unlocked...")
                         _, mktime = getservertime()
-                        r = _func(*args, **kwargs)
+                        r = CESIUM_CLIENT.call(srvc_name, _func, args, kwargs, ttl=cache_ttl)
                         _, mktime2 = getservertime()
                     _success = True
                     e = None
+                except no_retry as e:
+                    log.error("{0}: {1} (no retry)".format(type(e).__name__.upper(), e.message))
+                    raise
                 except (apexceptions.ServiceFailure, apexceptions.ApolloException, Exception) as e:
                     log.error("{0}: {1}".format(type(e).__name__.upper(), e.message))
                     _, mktime2 = getservertime()
@@ -292,6 +354,7 @@ def cesium_srvc_retry(func=None, record=True, max_attempts=CESIUM_MAX_SERVICE_AT
 
         # Run the Service w/ retrys
         ret, success, lp_cnt, srvc_times, cesium_err = __do_service_retrys(func, lock_name)
+        STEP_TELEMETRY.add_retries(lp_cnt - 1) if lp_cnt > 1 else None
 
         # Record
         if limits_are_available:
@@ -354,6 +417,7 @@ def func_retry(func=None, max_attempts=3, ask_yn=None):
                     return r
         else:
             log.debug("FUNC {0} max attempts met!  ERROR: {1}".format(func.__name__, f_err))
+        STEP_TELEMETRY.add_retries(cnt - 1) if cnt > 1 else None
         return r
 
     return func_wrapper
@@ -384,7 +448,13 @@ def apollo_step(func=None, s='', ctx=''):
         desc1 = '> STEP: {0}{1}{2}'.format(func.__name__.title().replace('_', ' '), addon1, addon2)
         log.info('-' * len(desc1))
         log.info(desc1)
-        r = func(*args, **kwargs)
+        record = STEP_TELEMETRY.begin('{0}{1}'.format(func.__name__, addon1), kind='step')
+        try:
+            r = func(*args, **kwargs)
+        except BaseException as e:
+            STEP_TELEMETRY.end(record, result=e)
+            raise
+        STEP_TELEMETRY.end(record, result=r)
         desc2 = '< STEP: {0}{1}'.format(func.__name__.title().replace('_', ' '), addon1)
         log.debug(desc2)
         log.debug('-' * len(desc2))
@@ -1666,7 +1736,7 @@ def readfiledata(filename, ast_flag=False, start_pattern=None, end_pattern=None,
     return filedata
 
 
-def data_file_lookup(data_file, column_labels, search_vals, data_separator=';'):
+def data_file_lookup(data_file, column_labels, search_vals, data_separator=';', indexed=True):
     """
     This function parses given file and returns list of dictionaries. The dictionary keys age taken from [column_labels]
     and values from matched line in data_file
@@ -1676,6 +1746,8 @@ def data_file_lookup(data_file, column_labels, search_vals, data_separator=';'):
     :param search_vals: List: list of dicts in format [{'column_name': 'searched_value'}, ...]. This function will
       look for value in given column_name
     :param data_separator: String: regular expression which is used to separate values in line
+    :param indexed: Bool: use the per-host index of the file (parsed once; re-parsed when the file changes) instead
+      of scanning every line (see data_index.py)
     :return: data_dict_list: List: List of dictionaries where keys are from data_format and values from data file. List
     is empty if no match found
 
@@ -1691,26 +1763,9 @@ def data_file_lookup(data_file, column_labels, search_vals, data_separator=';'):
             [{'pid': 'SFP-GE-S', 'eci': '131603', 'tan': '800-26525-01', 'pn': '10-2143-01', 'prodarray': '940'},]
 
     """
-    data_dict_list = []
-    with open(data_file, 'r') as f:
-        for line in f:
-            if re.match('\s*#', line):
-                continue
-            line = line.strip()
-            line = list(map(lambda x: None if x == '' else x, re.split(data_separator, line)))
-            if len(line) != len(column_labels):
-                raise ValueError('Invalid data format of {}. Expected {} items, {} found.'.format(
-                    line, len(column_labels), len(line)))
-            line = {k: v for k, v in zip(column_labels, line)}
-            match_check = filter(
-                lambda x:
-                True if re.match('{}$'.format(x.values()[0]), '{}'.format(line[x.keys()[0]]), flags=re.IGNORECASE)
-                else False,
-                search_vals
-            )
-            if len(match_check) == len(search_vals):
-                data_dict_list.append(line)
-    return data_dict_list
+    if indexed:
+        return data_index.lookup(data_file, column_labels, search_vals, data_separator)
+    return data_index.scan(data_file, column_labels, search_vals, data_separator)
 
 
 def writefiledata(filename, data, mode='w+', force_raw=False):
@@ -1834,14 +1889,15 @@ def download_image(src_filepath, dst_filepath=None, apollo_server_conn=None, dow
         log.warning("Ping failed; no server connectivity.")
         return status
 
-    # Perform remote copy
-    apollo_server_conn.send('scp -p gen-apollo@{0}:{1} {2}\r'.format(download_server, src_filepath, dst_filepath), expectphrase='.*', timeout=30, regex=True)
-    time.sleep(3.0)
-    if re.search('continue connecting', apollo_server_conn.recbuf):
-        apollo_server_conn.send('yes\r', expectphrase='.*', timeout=timeout, regex=True)
+    # Perform remote copy (throttled by the station network scheduler)
+    with network_bandwidth():
+        apollo_server_conn.send('scp -p gen-apollo@{0}:{1} {2}\r'.format(download_server, src_filepath, dst_filepath), expectphrase='.*', timeout=30, regex=True)
         time.sleep(3.0)
-    if re.search('[Pp]assword', apollo_server_conn.recbuf):
-        apollo_server_conn.send('Ad@pCr01!\r', expectphrase=speculative_prompt, timeout=timeout, regex=True)
+        if re.search('continue connecting', apollo_server_conn.recbuf):
+            apollo_server_conn.send('yes\r', expectphrase='.*', timeout=timeout, regex=True)
+            time.sleep(3.0)
+        if re.search('[Pp]assword', apollo_server_conn.recbuf):
+            apollo_server_conn.send('Ad@pCr01!\r', expectphrase=speculative_prompt, timeout=timeout, regex=True)
 
     # Check result
     if os.path.exists(dst_filepath):
@@ -1933,80 +1989,84 @@ def getservicestatus(service):
         return False
 
 
-def network_availability(action, max_container_usage=10, check_interval=20):
+def get_network_scheduler(max_tokens=NETWORK_MAX_TOKENS, check_interval=bandwidth_scheduler.DEFAULT_CHECK_INTERVAL):
+    """ Get Network Scheduler
+    Token based bandwidth scheduler shared by all containers of the station (see bandwidth_scheduler.py).
+    :param (int) max_tokens: Concurrency cap for the station.
+    :param (float) check_interval: Max time (secs) between state checks by a waiter (wake-on-release is immediate).
+    :return (obj): BandwidthScheduler
+    """
+    station = get_station_key()
+    scheduler = NETWORK_SCHEDULERS.get(station)
+    if not scheduler:
+        scheduler = bandwidth_scheduler.BandwidthScheduler(
+            name='network.{0}'.format(station),
+            area_priorities=NETWORK_AREA_PRIORITIES,
+            lock_factory=lambda name: locking.ContainerPriorityLock(name, wait_timeout=600, release_timeout=300),
+            store=(aplib.get_cached_data, aplib.cache_data))
+        NETWORK_SCHEDULERS[station] = scheduler
+    scheduler.max_tokens = max(1, max_tokens)
+    scheduler.check_interval = check_interval
+    return scheduler
+
+
+def get_active_modular_registry(priority=100, ttl=ACTIVE_MODULAR_TTL):
+    """ Get Active Modular Registry
+    Lease registry of the active linecard/supervisor containers of the chassis (see lease_registry.py).
+    The ordered container list is also published to '<pl>_<ar>_<ts>_ActiveModular' for legacy readers.
+    An expired lease is only reaped once its container is confirmed no longer RUNNING.
+    :param (int) priority: Lock priority; lower number is higher priority.
+    :param (int) ttl: Lease time (secs).
+    :return (obj): LeaseRegistry
+    """
+    pl, ar, ts, _ = aplib.get_my_container_key().split("|", 3)
+    active_name = '_'.join([pl, ar, ts, 'ActiveModular'])
+    return lease_registry.LeaseRegistry(
+        name=active_name,
+        ttl=ttl,
+        lock_factory=lambda name: locking.ContainerPriorityLock('__active_modular__', priority=priority),
+        store=(aplib.get_cached_data, aplib.cache_data),
+        publish_key=active_name,
+        alive=lambda container: aplib.get_container_status(container) == 'RUNNING')
+
+
+@contextmanager
+def network_bandwidth(max_container_usage=NETWORK_MAX_TOKENS):
+    """ Network Bandwidth (context manager)
+    Hold a network token for a download/load; a token already held via network_availability('acquire') is kept.
+    :param (int) max_container_usage: Throttle value; maximum number of containers to simultaneously use the test network.
+    :return:
+    """
+    scheduler = get_network_scheduler(max_tokens=max_container_usage)
+    with scheduler.token(aplib.get_my_container_key(), area=__get_network_area()):
+        yield
+
+
+def network_availability(action, max_container_usage=NETWORK_MAX_TOKENS, check_interval=20):
     """ Network Availability
 
     Use this to throttle the network load when many UUT containers are trying to use the test network to download
     large files from the server.
+    Waiters are queued by test area priority (NETWORK_AREA_PRIORITIES) and woken as soon as a token is released.
 
     :param (str) action:  'acquire' or 'release'
     :param (int) max_container_usage: Throttle value; maximum number of containers to simultaneously use the test network.
-    :param (int) check_interval: Minimum interval time for 'acquire' (secs).  A 10 sec buffer is always added to prevent resource flood.
+    :param (int) check_interval: Max interval time for re-checking while waiting (secs); a 10 sec buffer is always added.
     :return:
     """
     container = aplib.get_my_container_key()
-
-    def __acquire():
-        log.debug("Network acquire...")
-        allowed = False
-        with locking.ContainerPriorityLock('__network_availability__', wait_timeout=600, release_timeout=300):
-            netusage = aplib.get_cached_data('network_usage')
-            if not netusage:
-                netusage = dict(containers=[container], count=1, queued=[], qcount=0)
-
-            if netusage.get('count', 0) < max_container_usage:
-                log.debug("container is {}, containers is {}".format(container, netusage.get('containers')))
-                if container not in netusage.get('containers', []):
-                    log.debug("Network usage by container acquire...")
-                    netusage['containers'].append(container)
-                    netusage['count'] = len(netusage['containers'])
-                    allowed = True
-                    if container in netusage.get('queued', []):
-                        netusage['queued'].pop(netusage['queued'].index(container))
-                        netusage['qcount'] = len(netusage['queued'])
-                else:
-                    allowed = True
-                    log.debug("Network usage by container already acquired.")
-            else:
-                log.warning("Network usage by container is at maximum (Count={0}).".format(netusage.get('count', 0)))
-                log.warning("This container needs to wait.")
-                if container in netusage.get('containers', []):
-                    allowed = True
-                    log.debug("Network usage by container already acquired.")
-                elif container not in netusage.get('queued', []):
-                    log.debug("Container added to queue.")
-                    netusage['queued'].append(container)
-                    netusage['qcount'] += 1
-            aplib.cache_data('network_usage', netusage)
-        return allowed, netusage
-
-    def __release():
-        log.debug("Network release...")
-        with locking.ContainerPriorityLock('__network_availability__', wait_timeout=600, release_timeout=300):
-            netusage = aplib.get_cached_data('network_usage')
-            if netusage:
-                if container in netusage.get('containers', []):
-                    log.debug("Network container release.")
-                    netusage['containers'].pop(netusage['containers'].index(container))
-                    netusage['count'] = len(netusage['containers'])
-                else:
-                    log.debug("Container already released.")
-            aplib.cache_data('network_usage', netusage)
-        return True
+    scheduler = get_network_scheduler(max_tokens=max_container_usage, check_interval=check_interval + 10)
 
     if action.lower() == 'acquire':
-        acquired = False
-        while not acquired:
-            acquired, netusage = __acquire()
-            log.debug("Count  = {0},  Containers  = {1}".format(netusage.get('count', 0), netusage.get('containers', [])))
-            log.debug("QCount = {0},  QContainers = {1}".format(netusage.get('qcount', 0), netusage.get('queued', [])))
-            if not acquired:
-                waittime = (check_interval + 10)
-                log.debug("Waiting for network availability: Wait={0} secs...".format(waittime))
-                time.sleep(waittime)
+        log.debug("Network acquire...")
+        scheduler.acquire(container, area=__get_network_area())
+        state = scheduler.get_state()
+        log.debug("Count  = {0},  Containers  = {1}".format(len(state['holders']), sorted(state['holders'].keys())))
+        log.debug("QCount = {0},  QContainers = {1}".format(len(state['queue']), [e['container'] for e in state['queue']]))
 
     elif action.lower() == 'release':
-        __release()
+        log.debug("Network release...")
+        scheduler.release(container)
 
     else:
         log.warning("Unrecognized action.")
@@ -2014,6 +2074,13 @@ def network_availability(action, max_container_usage=10, check_interval=20):
     return
 
 
+def __get_network_area():
+    try:
+        return get_testarea()
+    except Exception:
+        return None
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # IP Query and Assignment
 # ----------------------------------------------------------------------------------------------------------------------
@@ -2609,12 +2676,13 @@ def read_sn_data(sernum, **kwargs):
     db_data_dict = dict(root=data_record)
     inputdict = dict(body=db_data_dict)
     log.info("Request = {0}".format(inputdict))
-    status, return_dict = aputils.do_internal_service(module=SNPULL_MODULE,
-                                                      function=SNPULL_FUNCTION,
-                                                      inputdict=inputdict,
-                                                      userdict=dict(),
-                                                      outputdict=dict(),
-                                                      )
+    status, return_dict = CESIUM_CLIENT.call('snpull', aputils.do_internal_service,
+                                             kwargs=dict(module=SNPULL_MODULE,
+                                                         function=SNPULL_FUNCTION,
+                                                         inputdict=inputdict,
+                                                         userdict=dict(),
+                                                         outputdict=dict()),
+                                             ttl=CESIUM_SNPULL_CACHE_TTL)
 
     result = return_dict.get(OUTPUT_DICT, {}).get(BODY, {}).get(ROOT, {}).get(MESSAGE, 'UNKNOWN')
     records_found = [i.get('records_found', 0) for i in return_dict.get(OUTPUT_DICT, {}).get(BODY, {}).get(ROOT, {}).get(BODY, {})]
@@ -2796,6 +2864,17 @@ def get_uut_suffix_index():
     return index
 
 
+@cesium_srvc_retry(record=False, cache_ttl=CESIUM_CACHE_TTL, no_retry=(apexceptions.ResultFailure,))
+def get_lineid_config(major_line_id):
+    """ Get LineID Config
+    Cached per run (and coalesced with identical concurrent requests); see cesium_client.
+    A ResultFailure (ex. unknown LineID) is raised as-is; only service errors are retried.
+    :param (int) major_line_id:
+    :return (dict): LineID config data
+    """
+    return cesiumlib.get_lineid_config(major_line_id=major_line_id)
+
+
 def get_parent_sernum(child_sernum, child_pid):
     """ Get Parent S/N
     :param child_sernum:
@@ -0,0 +1,455 @@
+r""" Console Utility Module
+========================================================================================================================
+
+This module contains support for UUT console interaction that is product and mode agnostic.
+
+Response Completion Engine:
+    Most console commands are sent with an expectphrase (the mode prompt) and then followed by a fixed
+    RECBUF_TIME sleep to let the receive buffer "settle" before it is parsed.  The completion engine replaces
+    that dead time by polling the receive buffer and returning as soon as one of the following is observed:
+        1. The expected prompt is at the tail of the buffer AND the buffer has been idle for the 'settle' window.
+        2. The buffer has been idle (quiescent) for the 'quiet' window.
+        3. The maximum wait (i.e. the legacy RECBUF_TIME) has elapsed.
+    Timing profiles are selectable per command (keyed by the first word of the command, case insensitive).
+    A profile of None for a command (or disabling the engine) falls back to the legacy fixed sleep.
+
+    Usage:
+        rc = ResponseCompletion(uut_conn, prompt=r'[A-Z][\S]*> ', fallback_time=5.0,
+                                profiles={'sysinit': CompletionProfile(quiet=2.0, settle=0.5, poll=0.2, max_wait=10.0)})
+        uut_conn.send('GetSystemStatus\r', expectphrase=prompt, regex=True, timeout=120)
+        rc.wait('GetSystemStatus')
+
+Block Streamer:
+    Long data (ex. ACT2 cert chains/signatures, X.509 keys/certs, Quack signatures) was pushed to the diags in fixed
+    small blocks with a fixed sleep after every block.  The streamer paces the blocks by the console echo instead:
+        1. Each block is sent and the echo of the block is awaited (no fixed sleep).
+        2. The block size only grows (doubles, up to max_size) when the data can be resent, i.e. a line kill
+           sequence is given for the diag input and the data starts a new input line (not joined to earlier data).
+           Other data never uses a block size larger than one already proven safe (intact echo).
+        3. A missing or garbled echo (overrun) halves the block size and caps further growth at that size; the line
+           is killed and the segment is restarted at the smaller size (bounded).  Data that cannot be resent raises
+           BlockStreamError (the garbled block has already reached the diag).
+        4. When all echoes are collected, the checksum (crc32) of the echoed data is compared to the sent data.
+        5. A console that does not echo at all is detected on the first blocks and the legacy pacing is used.
+
+    Usage:
+        bs = BlockStreamer(uut_conn, profile=StreamProfile(min_size=16, max_size=64, echo_timeout=5, legacy_sleep=0.3),
+                           line_kill='\x15')
+        verified = bs.stream(data, segments=2, interim_expectphrase='Read >', final_expectphrase='Status')
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import re
+import time
+import logging
+import binascii
+from collections import namedtuple
+from collections import OrderedDict
+
+# BU Specific
+# -----------
+from ..utils import step_telemetry
+
+
+__title__ = "Console Utility Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+# quiet    = idle time (secs) of the recbuf that qualifies as complete (no prompt needed)
+# settle   = idle time (secs) of the recbuf that qualifies as complete when the prompt is at the tail
+# poll     = polling interval (secs) of the recbuf
+# max_wait = maximum wait (secs); None = use the fallback time (i.e. legacy RECBUF_TIME)
+CompletionProfile = namedtuple('CompletionProfile', 'quiet settle poll max_wait')
+
+DEFAULT_PROFILE = CompletionProfile(quiet=1.0, settle=0.2, poll=0.1, max_wait=None)
+PROMPT_TAIL_SIZE = 256
+
+# min_size     = first (and smallest) block size (chars); typically the legacy fixed block size
+# max_size     = largest block size (chars)
+# echo_timeout = max wait (secs) for the echo of one block
+# legacy_sleep = sleep (secs) after each block when the console does not echo (legacy pacing)
+StreamProfile = namedtuple('StreamProfile', 'min_size max_size echo_timeout legacy_sleep')
+
+DEFAULT_STREAM_PROFILE = StreamProfile(min_size=16, max_size=64, echo_timeout=5, legacy_sleep=0.3)
+ECHO_TAIL_SIZE = 8
+NO_ECHO_LIMIT = 2
+MAX_SEGMENT_RESTARTS = 3
+
+
+class BlockStreamError(Exception):
+    pass
+
+
+class ResponseCompletion(object):
+    """ Response Completion Engine
+    Wait for a console response to be complete based on prompt detection and recbuf quiescence.
+    """
+    def __init__(self, uut_conn, prompt=None, fallback_time=5.0, profiles=None, default_profile=DEFAULT_PROFILE, enabled=True):
+        """
+        :param (obj) uut_conn: UUT connection object (must support the 'recbuf' attribute)
+        :param (str) prompt: Regex of the expected prompt
+        :param (float) fallback_time: Legacy fixed wait time; also the max wait when a profile does not specify one.
+        :param (dict) profiles: Per command timing profiles {<cmd>: CompletionProfile|None, ...}
+        :param (CompletionProfile) default_profile: Profile used for commands not found in the profiles.
+        :param (bool) enabled: False = always use the legacy fixed wait.
+        """
+        self._uut_conn = uut_conn
+        self._prompt = None
+        self._prompt_re = None
+        self.fallback_time = fallback_time
+        self.default_profile = default_profile
+        self.enabled = enabled
+        self._profiles = dict()
+        self._stats = OrderedDict()
+        self.prompt = prompt
+        self.update_profiles(profiles)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Properties
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def prompt(self):
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, newvalue):
+        self._prompt = newvalue
+        self._prompt_re = self.__compile_prompt(newvalue)
+
+    @property
+    def profiles(self):
+        return self._profiles
+
+    @property
+    def stats(self):
+        return self._stats
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def update_profiles(self, profiles):
+        """ Update Profiles
+        Add or replace command timing profiles.  Keys are normalized to lower case.
+        :param (dict) profiles: {<cmd>: CompletionProfile|None, ...}
+        :return:
+        """
+        for cmd, profile in (profiles or {}).items():
+            self._profiles[cmd.lower()] = profile
+        return
+
+    def get_profile(self, cmd=None):
+        """ Get Profile
+        :param (str) cmd: Full command string or command name; the first word is used for lookup.
+        :return (tuple): (found, CompletionProfile|None)
+        """
+        key = self.get_cmd_key(cmd)
+        if key and key in self._profiles:
+            return True, self._profiles[key]
+        return False, self.default_profile
+
+    def wait(self, cmd=None, prompt=None, factor=1.0):
+        """ Wait for Response Completion
+        :param (str) cmd: Command that was sent (used for profile selection and stats)
+        :param (str) prompt: Optional prompt regex override for this wait.
+        :param (float) factor: Scaling factor applied to the max wait (i.e. legacy RECBUF_TIME * factor).
+        :return (str): Completion reason: 'prompt', 'quiet', 'timeout', or 'fallback'
+        """
+        _, profile = self.get_profile(cmd)
+        prompt_re = self.__compile_prompt(prompt) if prompt else self._prompt_re
+        max_wait = (profile.max_wait if profile and profile.max_wait else self.fallback_time) * factor
+
+        start = time.time()
+        with step_telemetry.DEFAULT.console_wait():
+            if not self.enabled or not profile:
+                time.sleep(max_wait)
+                reason = 'fallback'
+            else:
+                reason = self.__poll(profile, prompt_re, start, max_wait)
+        self.__record(cmd, reason, time.time() - start, max_wait)
+        return reason
+
+    def send(self, text, expectphrase=None, timeout=30, regex=True, factor=1.0, **kwargs):
+        """ Send and Wait for Completion
+        Drop-in for the "send + RECBUF_TIME sleep" idiom.
+        :param (str) text: Text to send
+        :param (str) expectphrase: Expected phrase (defaults to the engine prompt)
+        :param (int) timeout: Send timeout
+        :param (bool) regex: Expectphrase is regex
+        :param (float) factor: Max wait scaling factor
+        :param kwargs: Other connection send params
+        :return (str): Completion reason
+        """
+        expectphrase = expectphrase if expectphrase else self._prompt
+        self._uut_conn.send(text, expectphrase=expectphrase, timeout=timeout, regex=regex, **kwargs)
+        return self.wait(cmd=text, factor=factor)
+
+    def print_stats(self):
+        """ Print Stats
+        Summary of the time spent waiting vs the legacy fixed wait time.
+        :return:
+        """
+        total_waited, total_saved = 0.0, 0.0
+        log.debug("-" * 90)
+        log.debug("{0:<30} {1:>6} {2:>10} {3:>10}  {4}".format('Command', 'Count', 'Waited', 'Saved', 'Reasons'))
+        log.debug("-" * 90)
+        for key, stat in self._stats.items():
+            log.debug("{0:<30} {1:>6} {2:>10.2f} {3:>10.2f}  {4}".format(key, stat['count'], stat['waited'],
+                                                                        stat['saved'], stat['reasons']))
+            total_waited += stat['waited']
+            total_saved += stat['saved']
+        log.debug("-" * 90)
+        log.debug("Total wait = {0:.2f} secs;  Total saved = {1:.2f} secs.".format(total_waited, total_saved))
+        return total_waited, total_saved
+
+    @staticmethod
+    def get_cmd_key(cmd):
+        """ Get Command Key
+        :param (str) cmd: Ex. 'PortStat -p:1-48\r'
+        :return (str): Ex. 'portstat'
+        """
+        if not cmd:
+            return None
+        words = cmd.strip().split()
+        return words[0].lower() if words else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __poll(self, profile, prompt_re, start, max_wait):
+        """ (INTERNAL) Poll the recbuf for completion.
+        :return (str): Completion reason
+        """
+        last_len = -1
+        last_change = start
+        while True:
+            now = time.time()
+            try:
+                buf_len = len(self._uut_conn.recbuf)
+            except (AttributeError, TypeError) as e:
+                log.debug("Completion engine cannot read recbuf ({0}); using fallback.".format(e))
+                time.sleep(max(0.0, max_wait - (now - start)))
+                return 'fallback'
+            if buf_len != last_len:
+                last_len = buf_len
+                last_change = now
+            idle = now - last_change
+            if prompt_re and idle >= profile.settle and prompt_re.search(self._uut_conn.recbuf[-PROMPT_TAIL_SIZE:]):
+                return 'prompt'
+            if idle >= profile.quiet:
+                return 'quiet'
+            if now - start >= max_wait:
+                return 'timeout'
+            time.sleep(min(profile.poll, max(0.0, max_wait - (now - start))))
+
+    def __record(self, cmd, reason, waited, max_wait):
+        key = self.get_cmd_key(cmd) or '<none>'
+        stat = self._stats.setdefault(key, dict(count=0, waited=0.0, saved=0.0, reasons={}))
+        stat['count'] += 1
+        stat['waited'] += waited
+        stat['saved'] += max(0.0, max_wait - waited)
+        stat['reasons'][reason] = stat['reasons'].get(reason, 0) + 1
+        return
+
+    @staticmethod
+    def __compile_prompt(prompt):
+        """ (INTERNAL) Compile the prompt regex so that it only matches at the tail of the buffer.
+        :param (str|list) prompt:
+        :return:
+        """
+        if not prompt:
+            return None
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        return re.compile('(?:{0})[ \t]*$'.format('|'.join(['(?:{0})'.format(p) for p in prompts])))
+
+
+class BlockStreamer(object):
+    """ Block Streamer
+    Stream data to the UUT console in blocks paced by the echo (see module notes).
+    """
+    def __init__(self, uut_conn, profile=DEFAULT_STREAM_PROFILE, timeout_exceptions=(Exception,), line_kill=None,
+                 max_restarts=MAX_SEGMENT_RESTARTS):
+        """
+        :param (obj) uut_conn: UUT connection object (must support send() and the 'recbuf' attribute)
+        :param (StreamProfile) profile: Block sizes and timing.
+        :param (tuple) timeout_exceptions: Exceptions raised by the connection when the echo is not received.
+        :param (str) line_kill: Sequence that discards the current diag input line (ex. '\x15'); None = the data
+                                cannot be resent (no block size growth beyond the proven safe size).
+        :param (int) max_restarts: Max segment restarts after an overrun.
+        """
+        self._uut_conn = uut_conn
+        self.profile = profile
+        self.timeout_exceptions = timeout_exceptions
+        self.line_kill = line_kill
+        self.max_restarts = max_restarts
+        self._size = profile.min_size
+        self._safe = profile.min_size
+        self._ceiling = profile.max_size
+        self._echo = None
+        self._no_echo = 0
+        self._joined = False
+        self._stats = dict(streams=0, blocks=0, chars=0, grows=0, overruns=0, restarts=0, secs=0.0)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def echo(self):
+        # None = not yet known, True = console echoes the data, False = no echo (legacy pacing)
+        return self._echo
+
+    @property
+    def block_size(self):
+        return self._size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def stream(self, data, segments=1, interim_expectphrase='.*', final_expectphrase='.*', join=False, verbose=False):
+        """ Stream
+        The segment boundaries are the same as the legacy fixed block send (based on the min_size) so that the diags
+        see identical segment lengths; only the pacing within a segment changes.
+        :param (str) data: Data to send to the UUT.
+        :param (int) segments: Number of segments the diag interface prompts for.
+        :param (str) interim_expectphrase: Response between segments (regex).
+        :param (str|list) final_expectphrase: Last response after all segments (regex).
+        :param (bool) join: Flag to allow more data for append (no carriage return at end).
+        :param (bool) verbose:
+        :return (bool): True = echo checksum verified, False = echo checksum mismatch, None = no echo to verify.
+        :raises BlockStreamError: Garbled echo that could not be recovered by a segment restart.
+        """
+        start = time.time()
+        unit = self.profile.min_size
+        blocks = len(data) // (unit * segments)
+        bounds = [[s * blocks * unit, (s + 1) * blocks * unit] for s in range(segments)]
+        bounds[-1][1] = len(data)
+        echoed = []
+        for s, (i, j) in enumerate(bounds):
+            # A segment can only be restarted if it starts a new diag input line.
+            resendable = self.line_kill is not None and (s > 0 or not self._joined)
+            echoed += self.__stream_segment(data[i:j], resendable, verbose)
+            if s != segments - 1:
+                # Send a carriage return if this is NOT the last segment.
+                self._uut_conn.send("\r", expectphrase=interim_expectphrase, timeout=120, regex=True)
+        self._joined = join
+        if not join:
+            # Send final carriage return if no other data will join the 'send session' to the UUT.
+            self._uut_conn.send("\r", expectphrase=final_expectphrase, timeout=120, regex=True)
+
+        verified = None if None in echoed else self.get_crc(''.join(echoed)) == self.get_crc(self.__strip(data))
+        secs = time.time() - start
+        self._stats['streams'] += 1
+        self._stats['secs'] += secs
+        log.debug("Block stream: {0} chars in {1:.2f} secs (block size={2}, echo={3}, verified={4}).".format(
+            len(data), secs, self._size, self._echo, verified))
+        if verified is False:
+            log.error("Block stream: echo checksum mismatch; the UUT did not receive the data intact.")
+        return verified
+
+    @staticmethod
+    def get_crc(data):
+        return binascii.crc32(data.encode('ascii') if not isinstance(data, bytes) else data) & 0xffffffff
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __stream_segment(self, segment, resendable, verbose):
+        """ (INTERNAL) Stream one segment; restart it (line kill) at a smaller block size after an overrun.
+        :return (list): Echo of each block (None for a block sent w/o echo)
+        """
+        for restart in range(self.max_restarts + 1):
+            echoed, block_size = self.__send_segment(segment, resendable, verbose)
+            if block_size is None:
+                return echoed
+            if not resendable:
+                raise BlockStreamError("Block stream: garbled echo at block size {0}; the data cannot be resent.".format(
+                    block_size))
+            # Discard the garbled line (also before giving up).
+            self._uut_conn.send(self.line_kill, expectphrase=None, timeout=30, regex=True)
+            time.sleep(self.profile.legacy_sleep)
+            if restart < self.max_restarts:
+                log.warning("Block stream: restarting the segment at block size {0} (restart {1}/{2}).".format(
+                    self._size, restart + 1, self.max_restarts))
+                self._stats['restarts'] += 1
+        raise BlockStreamError("Block stream: garbled echo after {0} segment restarts.".format(self.max_restarts))
+
+    def __send_segment(self, segment, grow, verbose):
+        """ (INTERNAL) Send the blocks of one segment; stop at the first garbled echo.
+        :return (tuple): (echo of each block, block size of the garbled block or None)
+        """
+        echoed = []
+        pos = 0
+        while pos < len(segment):
+            if self._echo is False:
+                size = self.profile.min_size
+            else:
+                size = self._size if grow else min(self._size, self._safe)
+            block = segment[pos:pos + size]
+            pos += len(block)
+            self._stats['blocks'] += 1
+            self._stats['chars'] += len(block)
+            if verbose:
+                log.debug("{0}:{1}".format(pos - len(block), block))
+            if self._echo is False:
+                self._uut_conn.send(block, expectphrase=None, timeout=120, idle_timeout=90, regex=True)
+                time.sleep(self.profile.legacy_sleep)
+                echoed.append(None)
+                continue
+            echo = self.__send_block(block)
+            echoed.append(echo)
+            if echo == self.__strip(block):
+                self._echo = True
+                self._no_echo = 0
+                self._safe = max(self._safe, len(block))
+                if grow and self._size < self._ceiling:
+                    self._size = min(self._ceiling, self._size * 2)
+                    self._stats['grows'] += 1
+            elif self._echo is None and not echo:
+                echoed[-1] = None
+                self._no_echo += 1
+                if self._no_echo >= NO_ECHO_LIMIT:
+                    log.warning("Block stream: no console echo; using legacy pacing.")
+                    self._echo = False
+            else:
+                self._stats['overruns'] += 1
+                self._ceiling = max(self.profile.min_size, len(block) // 2)
+                self._size = min(self._size, self._ceiling)
+                self._safe = min(self._safe, self._ceiling)
+                log.warning("Block stream: overrun at block size {0}; backing off to {1}.".format(len(block), self._size))
+                return echoed, len(block)
+        return echoed, None
+
+    @staticmethod
+    def __strip(text):
+        return re.sub(r'\s', '', text)
+
+    def __send_block(self, block):
+        """ (INTERNAL) Send a block and return its echo.
+        Whitespace is ignored in the echo compare (line wrapping by the console, line breaks in the data).
+        """
+        expected = self.__strip(block)
+        if not expected:
+            self._uut_conn.send(block, expectphrase=None, timeout=120, idle_timeout=90, regex=True)
+            return expected
+        pattern = r'\s*'.join([re.escape(c) for c in expected[-ECHO_TAIL_SIZE:]])
+        try:
+            self._uut_conn.send(block, expectphrase=pattern, timeout=self.profile.echo_timeout, regex=True)
+        except self.timeout_exceptions as e:
+            log.debug("Block stream: echo not received ({0}).".format(e))
+        echo = self.__strip(self._uut_conn.recbuf or '')
+        return echo[-len(expected):]
@@ -0,0 +1,375 @@
+""" Data Index Module
+========================================================================================================================
+
+Indexed lookups for the delimited data files used by common_utils.data_file_lookup() (ex. SFP, serial number and
+configuration tables).
+
+The legacy lookup re-read the file and applied a regex to every line on every call.  This module instead:
+    1. Parses a file once into rows; a per-column index (case-insensitive value -> row numbers) is built on the first
+       query of the column.
+    2. Answers a lookup by intersecting the row sets of all search columns:
+        - literal values (ex. 131603, 'SFP-GE-S') are dict lookups,
+        - prefix patterns (ex. '800-26525-.*') are a bisect over the sorted column values,
+        - any other regex is matched once per distinct column value (not once per line).
+       The results are the same as the line scan: full match, case-insensitive, rows in file order.
+    3. Invalidates the index when the file mtime or size changes (checked with one stat per lookup).
+    4. Shares the parsed rows across containers (processes) on the same host via a JSON snapshot in a shared dir;
+       a container that finds a current snapshot loads it instead of parsing.
+
+Usage:
+    rows = lookup('/opt/cisco/constellation/apollo/libs/te_libs/data_files/sfps.txt',
+                  ['pid', 'eci', 'tan', 'pn', 'prodarray'], [{'eci': 131603}])
+    index = cache.get(data_file, column_labels)
+    index.lookup({'pid': 'SFP-GE-S', 'prodarray': '940'})
+    index.prefix('tan', '800-26525')
+
+Benchmark (line scan vs. index):
+    python data_index.py -n 200000
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import time
+import json
+import bisect
+import hashlib
+import logging
+import argparse
+import tempfile
+import shutil
+import threading
+
+
+__title__ = "Data Index Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), 'data_index')
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+
+def split_line(line, column_labels, data_separator=';'):
+    """ Split Line
+    :return (list): Values of the data file line in column order (empty values are None).
+    :raises ValueError: Column count mismatch.
+    """
+    values = [None if x == '' else x for x in re.split(data_separator, line.strip())]
+    if len(values) != len(column_labels):
+        raise ValueError('Invalid data format of {}. Expected {} items, {} found.'.format(
+            values, len(column_labels), len(values)))
+    return values
+
+
+def parse_line(line, column_labels, data_separator=';'):
+    """ Parse Line
+    :return (dict): Row of the data file line (empty values are None).
+    """
+    return dict(zip(column_labels, split_line(line, column_labels, data_separator)))
+
+
+def scan(data_file, column_labels, search_vals, data_separator=';'):
+    """ Scan
+    Line by line lookup (the legacy data_file_lookup); kept as the reference for the index and the benchmark.
+    :param (str) data_file: File name
+    :param (list) column_labels: Ordered column names
+    :param (list) search_vals: Form of [{'column_name': 'searched_value'}, ...]; all must match.
+    :param (str) data_separator: Regex separating the values in a line.
+    :return (list): Matching rows (dicts)
+    """
+    rows = []
+    with open(data_file, 'r') as f:
+        for line in f:
+            if re.match(r'\s*#', line):
+                continue
+            row = parse_line(line, column_labels, data_separator)
+            if all([re.match('{}$'.format(v), '{}'.format(row[k]), flags=re.IGNORECASE)
+                    for sv in search_vals for k, v in sv.items()]):
+                rows.append(row)
+    return rows
+
+
+class DataIndex(object):
+    """ Data Index
+    Rows of one data file with a per-column index.
+    """
+    def __init__(self, data_file, column_labels, rows, signature=None):
+        """
+        :param (str) data_file:
+        :param (list) column_labels:
+        :param (list) rows: [[<value>, ...], ...] in column_labels order (file order).
+        :param (tuple) signature: (mtime, size) of the file when parsed.
+        """
+        self.data_file = data_file
+        self.column_labels = list(column_labels)
+        self.rows = rows
+        self.signature = signature
+        # Column indexes are built on the first query of the column.
+        self._values = {}   # {column: {'<value>': [row#, ...]}}
+        self._exact = {}    # {column: {'<value>'.lower(): [row#, ...]}}
+        self._sorted = {}   # {column: sorted(_exact keys)}  (built on first prefix query)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, self.data_file)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def lookup(self, search_vals):
+        """ Lookup (multi-key)
+        :param (list|dict) search_vals: [{'column_name': 'searched_value'}, ...] or {'column_name': 'searched_value', ...}
+                                        Values are full match, case-insensitive regex (same as the line scan).
+        :return (list): Matching rows (dicts) in file order.
+        """
+        return self.__rows(self.__lookup(search_vals))
+
+    def prefix(self, column, prefix, search_vals=None):
+        """ Prefix query (case-insensitive), optionally narrowed by more search values.
+        :return (list): Matching rows (dicts) in file order.
+        """
+        rows = self.__prefix(column, '{}'.format(prefix))
+        return self.__rows(rows & self.__lookup(search_vals) if search_vals else rows)
+
+    def values(self, column):
+        """ Distinct values of a column. """
+        self.__index(column)
+        return sorted(self._values[column].keys())
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __lookup(self, search_vals):
+        search_vals = [search_vals] if isinstance(search_vals, dict) else search_vals
+        matches = None
+        for column, pattern in [(k, v) for sv in search_vals for k, v in sv.items()]:
+            rows = self.__match(column, '{}'.format(pattern))
+            matches = rows if matches is None else matches & rows
+            if not matches:
+                break
+        return set(range(len(self.rows))) if matches is None else matches
+
+    def __index(self, column):
+        if column not in self._exact:
+            if column not in self.column_labels:
+                raise KeyError("Unknown column '{0}'; columns = {1}".format(column, self.column_labels))
+            c = self.column_labels.index(column)
+            values, exact = {}, {}
+            for n, row in enumerate(self.rows):
+                value = 'None' if row[c] is None else row[c]
+                if value in values:
+                    values[value].append(n)
+                else:
+                    values[value] = [n]
+            for value, numbers in values.items():
+                exact.setdefault(value.lower(), []).extend(numbers)
+            self._values[column] = values
+            self._exact[column] = exact
+        return self._exact[column]
+
+    def __match(self, column, pattern):
+        self.__index(column)
+        if not REGEX_CHARS & set(pattern):
+            return set(self._exact[column].get(pattern.lower(), []))
+        if pattern.endswith('.*') and not REGEX_CHARS & set(pattern[:-2]):
+            return self.__prefix(column, pattern[:-2])
+        regex = re.compile('{}$'.format(pattern), flags=re.IGNORECASE)
+        rows = set()
+        for value, numbers in self._values[column].items():
+            if regex.match(value):
+                rows.update(numbers)
+        return rows
+
+    def __prefix(self, column, prefix):
+        if column not in self._sorted:
+            self._sorted[column] = sorted(self.__index(column).keys())
+        keys = self._sorted[column]
+        prefix = prefix.lower()
+        rows = set()
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            rows.update(self._exact[column][keys[i]])
+        return rows
+
+    def __rows(self, numbers):
+        return [dict(zip(self.column_labels, self.rows[n])) for n in sorted(numbers)]
+
+
+class DataIndexCache(object):
+    """ Data Index Cache
+    Per process cache of DataIndex objects backed by per host JSON snapshots.
+    """
+    def __init__(self, shared_dir=DEFAULT_SHARED_DIR):
+        """
+        :param (str) shared_dir: Directory for the host snapshots; None = in-process only.
+        """
+        self.shared_dir = shared_dir
+        self.hits, self.loads, self.parses = 0, 0, 0
+        self._indexes = {}
+        self._lock = threading.Lock()
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, self.shared_dir)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self, data_file, column_labels, data_separator=';'):
+        """ Get
+        :return (obj): Current DataIndex of the file (re-built if the file changed).
+        """
+        key = (os.path.abspath(data_file), tuple(column_labels), data_separator)
+        st = os.stat(data_file)
+        signature = [st.st_mtime, st.st_size]
+        with self._lock:
+            index = self._indexes.get(key)
+            if index and index.signature == signature:
+                self.hits += 1
+                return index
+            index = self.__load(key, signature)
+            if not index:
+                index = self.__parse(key, signature)
+                self.__save(key, index)
+            self._indexes[key] = index
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes = {}
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __parse(self, key, signature):
+        data_file, column_labels, data_separator = key
+        log.debug("Data index: parsing {0}".format(data_file))
+        rows = []
+        with open(data_file, 'r') as f:
+            for line in f:
+                if re.match(r'\s*#', line):
+                    continue
+                rows.append(split_line(line, column_labels, data_separator))
+        self.parses += 1
+        return DataIndex(data_file, column_labels, rows, signature)
+
+    def __snapshot_file(self, key):
+        name = hashlib.sha1(json.dumps(list(key[:1]) + list(key[1]) + [key[2]]).encode('utf-8')).hexdigest()
+        return os.path.join(self.shared_dir, '{0}.json'.format(name))
+
+    def __load(self, key, signature):
+        if not self.shared_dir:
+            return None
+        try:
+            with open(self.__snapshot_file(key), 'r') as fp:
+                snapshot = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        if snapshot.get('signature') != signature or snapshot.get('column_labels') != list(key[1]):
+            return None
+        self.loads += 1
+        log.debug("Data index: loaded snapshot of {0}".format(key[0]))
+        return DataIndex(key[0], key[1], snapshot['rows'], signature)
+
+    def __save(self, key, index):
+        if not self.shared_dir:
+            return
+        try:
+            if not os.path.exists(self.shared_dir):
+                os.makedirs(self.shared_dir)
+            fd, tmp_file = tempfile.mkstemp(prefix='.index_', dir=self.shared_dir)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(dict(data_file=key[0], column_labels=list(key[1]), signature=index.signature,
+                               rows=index.rows), fp)
+            os.rename(tmp_file, self.__snapshot_file(key))
+        except (IOError, OSError) as e:
+            log.warning("Data index: snapshot not saved: {0}".format(e))
+        return
+
+
+cache = DataIndexCache()
+
+
+def lookup(data_file, column_labels, search_vals, data_separator=';'):
+    """ Lookup
+    Indexed equivalent of scan().
+    :return (list): Matching rows (dicts)
+    """
+    return cache.get(data_file, column_labels, data_separator).lookup(search_vals)
+
+
+def benchmark(rows=200000, queries=100, data_file=None):
+    """ Benchmark
+    Synthetic SFP table (pid;eci;tan;pn;prodarray); repeated ECI lookups by line scan vs. index.
+    :param (int) rows: Number of rows in the data file.
+    :param (int) queries: Number of lookups.
+    :param (str) data_file: Existing data file to use instead (5 columns); default = temp file (removed after).
+    :return (dict): scan_secs, build_secs (first lookup), load_secs (first lookup from the snapshot), index_secs
+    """
+    tmp_dir = tempfile.mkdtemp()
+    columns = ['pid', 'eci', 'tan', 'pn', 'prodarray']
+    try:
+        if not data_file:
+            data_file = os.path.join(tmp_dir, 'sfps.txt')
+            with open(data_file, 'w') as fp:
+                fp.write('# pid;eci;tan;pn;prodarray\n')
+                for i in range(rows):
+                    fp.write('SFP-{0};{1};800-{2:05d}-01;10-{3:04d}-01;{4}\n'.format(i, 100000 + i, i % 99999, i % 9999, 900 + i % 50))
+        search = [[{'eci': 100000 + (i * 7919) % rows}] for i in range(queries)]
+
+        start = time.time()
+        for sv in search[:max(1, queries // 10)]:
+            scan(data_file, columns, sv)
+        scan_secs = (time.time() - start) * queries / max(1, queries // 10)
+
+        idx_cache = DataIndexCache(shared_dir=tmp_dir)
+        start = time.time()
+        idx_cache.get(data_file, columns).lookup(search[0])
+        build_secs = time.time() - start
+
+        start = time.time()
+        DataIndexCache(shared_dir=tmp_dir).get(data_file, columns).lookup(search[0])
+        load_secs = time.time() - start
+
+        start = time.time()
+        for sv in search:
+            idx_cache.get(data_file, columns).lookup(sv)
+        index_secs = time.time() - start
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return dict(rows=rows, queries=queries, scan_secs=scan_secs, build_secs=build_secs, load_secs=load_secs,
+                index_secs=index_secs)
+
+
+if __name__ == '__main__':
+    # Use this for standalone benchmarking.
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--rows", dest="rows", default=200000, type=int, action="store",
+                        help="Number of rows in the data file (default 200000).")
+    parser.add_argument("-q", "--queries", dest="queries", default=100, type=int, action="store",
+                        help="Number of lookups (default 100).")
+    parser.add_argument("-f", "--file", dest="data_file", default=None, action="store",
+                        help="Existing 5 column data file (default is a generated file).")
+    args = parser.parse_args()
+    results = benchmark(rows=args.rows, queries=args.queries, data_file=args.data_file)
+    print("Rows          : {0}".format(results['rows']))
+    print("Queries       : {0}".format(results['queries']))
+    print("Line scan     : {0:.4f} secs ({1:.4f} secs/query; estimated)".format(
+        results['scan_secs'], results['scan_secs'] / results['queries']))
+    print("Index build   : {0:.4f} secs (first lookup)".format(results['build_secs']))
+    print("Index load    : {0:.4f} secs (host snapshot; other container)".format(results['load_secs']))
+    print("Index lookups : {0:.4f} secs ({1:.6f} secs/query)".format(
+        results['index_secs'], results['index_secs'] / results['queries']))
@@ -0,0 +1,57 @@
+""" File Lock Module
+========================================================================================================================
+
+Cross-process (and cross-thread) exclusive lock on a shared file (fcntl.flock).
+
+Used by all containers on an Apollo server that coordinate through a shared directory (image cache, bandwidth
+scheduler, Cesium client coalescing, PoE poller, ...).
+
+Usage:
+    with FileLock('/tftpboot/.image_cache/locks/index.lock', timeout=60):
+        ...
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import time
+import errno
+import fcntl
+import logging
+
+
+__title__ = "File Lock Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+
+class FileLock(object):
+    """ Cross-process (and cross-thread) exclusive lock on a shared file. """
+    def __init__(self, lock_file, timeout=60, poll=0.2):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self.poll = poll
+        self._fp = None
+
+    def __enter__(self):
+        self._fp = open(self.lock_file, 'a')
+        start = time.time()
+        while True:
+            try:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES) or time.time() - start > self.timeout:
+                    self._fp.close()
+                    raise
+                time.sleep(self.poll)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+        self._fp.close()
+        return False
@@ -0,0 +1,383 @@
+""" Image Cache Module
+========================================================================================================================
+
+Content-addressed local image cache shared by all containers on an Apollo server.
+
+Images (IOS main, SR pkgs, recovery, etc.) are stored once under the cache dir keyed by their md5 digest and
+indexed by filename.  A request for an image is served from the cache (hard link into the requested destination
+path, or copy if across filesystems) and only fetched when not present.  Features:
+    1. Hash-indexed: objects/<md5[:2]>/<md5>; names map to digests; the expected md5 (when known) is verified.
+       A name alone (no md5) is only served from the cache when the source file is unchanged (same size & mtime as
+       when it was cached); otherwise (ex. remote source) it is fetched again.
+    2. Size-bounded with LRU eviction (last access time per object).
+    3. Atomic renames for all objects, destinations, and the index.
+    4. Cross-container locking (file_lock.FileLock on the shared filesystem): one lock for the index and one lock per image
+       so that N containers requesting the same image share a single download.
+    5. Concurrent prefetch of an image set (thread per image, bounded).
+
+Usage:
+    cache = ImageCache()
+    reqs = [ImageRequest(src_filepath=..., dst_filepath='/tftpboot/C9300/cat9k_iosxe.bin', md5='b802...'), ...]
+    results = cache.prefetch(reqs, fetch=my_fetch_function, max_workers=4)
+
+    The fetch function must have the signature:  fetch(src_filepath, tmp_filepath) --> bool
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import time
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+
+# BU Specific
+# -----------
+from .file_lock import FileLock
+
+
+__title__ = "Image Cache Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_CACHE_DIR = '/tftpboot/.image_cache'
+DEFAULT_MAX_BYTES = 64 * 1024 ** 3
+DEFAULT_DOWNLOAD_SERVER = '10.1.1.1'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+ImageRequest = namedtuple('ImageRequest', 'src_filepath dst_filepath md5')
+
+
+class ImageCache(object):
+    """ Image Cache
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, lock_timeout=1800):
+        """
+        :param (str) cache_dir: Shared cache directory (should be on the same filesystem as /tftpboot for hard links).
+        :param (int) max_bytes: Max total size of all cached objects.
+        :param (int) lock_timeout: Max wait time (secs) for another container's download of the same image.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def lookup(self, name=None, md5=None, source=None):
+        """ Lookup
+        :param (str) name: Image filename (basename)
+        :param (str) md5: Image md5 digest; takes precedence over the name.
+        :param (list) source: [size, mtime] of the source file (see get_source_stat); required for a lookup by name
+                              only since the same name can be a different image (ex. a rebuilt image).
+        :return (str): Cached object path or None.
+        """
+        with self.__locked('index'):
+            index = self.__load_index()
+            if md5:
+                digest = md5.lower()
+            elif source and index['sources'].get(name) == list(source):
+                digest = index['names'].get(name)
+            else:
+                return None
+            if not digest or digest not in index['objects']:
+                return None
+            obj_path = self.__object_path(digest)
+            if not os.path.isfile(obj_path):
+                log.debug("Image cache object missing for {0}; dropping index entry.".format(name or digest))
+                self.__drop(index, digest)
+                self.__save_index(index)
+                return None
+            index['objects'][digest]['atime'] = time.time()
+            self.__save_index(index)
+        return obj_path
+
+    def add(self, filepath, name=None, md5=None, move=False, source=None):
+        """ Add
+        Ingest a file into the cache.
+        :param (str) filepath: File to add.
+        :param (str) name: Image name (default is the basename of the filepath).
+        :param (str) md5: Expected md5 digest; the file is rejected on mismatch.
+        :param (bool) move: True = rename the file into the cache, False = link (or copy) it.
+        :param (list) source: [size, mtime] of the source file the image came from (None = unknown).
+        :return (str): md5 digest if added, None otherwise.
+        """
+        name = name if name else os.path.basename(filepath)
+        digest = self.get_md5(filepath)
+        if md5 and digest != md5.lower():
+            log.error("Image cache: '{0}' md5 {1} does not match expected {2}.".format(name, digest, md5))
+            return None
+        obj_path = self.__object_path(digest)
+        self.__makedirs(os.path.dirname(obj_path))
+        if not os.path.isfile(obj_path):
+            if move:
+                os.rename(filepath, obj_path)
+            else:
+                self.__place(filepath, obj_path)
+        with self.__locked('index'):
+            index = self.__load_index()
+            entry = index['objects'].setdefault(digest, dict(size=os.path.getsize(obj_path), names=[]))
+            entry['names'] = sorted(set(entry['names'] + [name]))
+            entry['atime'] = time.time()
+            index['names'][name] = digest
+            if source:
+                index['sources'][name] = list(source)
+            else:
+                index['sources'].pop(name, None)
+            self.__evict(index, keep=digest)
+            self.__save_index(index)
+        log.debug("Image cache: added '{0}' ({1}).".format(name, digest))
+        return digest
+
+    def get(self, src_filepath, dst_filepath, md5=None, fetch=None):
+        """ Get
+        Place the image at the destination path; served from the cache or fetched (once for all containers).
+        :param (str) src_filepath: Source image path + filename (passed to the fetch function).
+        :param (str) dst_filepath: Destination image path + filename.
+        :param (str) md5: Expected md5 digest (optional)
+        :param (func) fetch: fetch(src_filepath, tmp_filepath) --> bool
+        :return (dict): Status dict: code, data, message ('PRESENT', 'HIT', 'FETCHED', 'FAILURE'), result
+        """
+        status = dict(code=0, data=dst_filepath, message='FAILURE', result=False)
+        name = os.path.basename(dst_filepath)
+        source = self.get_source_stat(src_filepath)
+
+        # Already in place (ex. from an earlier UUT); ingest it so other destinations can share it.
+        if self.__present(dst_filepath, name, md5):
+            status.update(message='PRESENT', result=True)
+            return status
+
+        with self.__locked('image_{0}'.format(md5.lower() if md5 else name), timeout=self.lock_timeout, poll=0.1):
+            # Placed by another container while waiting on the image lock (ex. same /tftpboot path, no md5).
+            if self.__present(dst_filepath, name, md5, verbose=False):
+                status.update(message='PRESENT', result=True)
+                return status
+            obj_path = self.lookup(name=name, md5=md5, source=source)
+            if obj_path:
+                status['message'] = 'HIT'
+            elif fetch:
+                tmp_dir = os.path.join(self.cache_dir, 'tmp')
+                self.__makedirs(tmp_dir)
+                fd, tmp_filepath = tempfile.mkstemp(prefix='.{0}_'.format(name), dir=tmp_dir)
+                os.close(fd)
+                os.remove(tmp_filepath)
+                try:
+                    if fetch(src_filepath, tmp_filepath) and os.path.isfile(tmp_filepath):
+                        digest = self.add(tmp_filepath, name=name, md5=md5, move=True, source=source)
+                        obj_path = self.__object_path(digest) if digest else None
+                        status['message'] = 'FETCHED' if obj_path else 'FAILURE'
+                    else:
+                        log.error("Image cache: fetch of '{0}' failed.".format(src_filepath))
+                finally:
+                    os.remove(tmp_filepath) if os.path.exists(tmp_filepath) else None
+            if not obj_path:
+                status['message'] = 'FAILURE'
+                return status
+            self.__place(obj_path, dst_filepath)
+
+        status['result'] = True
+        return status
+
+    def prefetch(self, requests, fetch, max_workers=4):
+        """ Prefetch
+        Concurrently get a set of images.
+        :param (list) requests: List of ImageRequest
+        :param (func) fetch: fetch(src_filepath, tmp_filepath) --> bool
+        :param (int) max_workers: Max number of concurrent gets.
+        :return (dict): {<dst_filepath>: <status dict>, ...}
+        """
+        results = {}
+        queue = list(requests)
+        queue_lock = threading.Lock()
+
+        def __worker():
+            while True:
+                with queue_lock:
+                    if not queue:
+                        return
+                    req = queue.pop(0)
+                start = time.time()
+                try:
+                    status = self.get(req.src_filepath, req.dst_filepath, md5=req.md5, fetch=fetch)
+                except (IOError, OSError) as e:
+                    log.error("Image cache: get of '{0}' raised: {1}".format(req.dst_filepath, e))
+                    status = dict(code=1, data=req.dst_filepath, message='FAILURE', result=False)
+                log.debug("Image cache: {0:<8} {1} ({2:.1f} secs)".format(status['message'], req.dst_filepath,
+                                                                         time.time() - start))
+                results[req.dst_filepath] = status
+
+        threads = [threading.Thread(target=__worker) for _ in range(max(1, min(max_workers, len(requests))))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def evict(self):
+        """ Evict
+        Enforce the size bound (LRU).
+        :return:
+        """
+        with self.__locked('index'):
+            index = self.__load_index()
+            self.__evict(index)
+            self.__save_index(index)
+        return
+
+    def get_usage(self):
+        """ Get Usage
+        :return (tuple): (<object count>, <total bytes>)
+        """
+        with self.__locked('index'):
+            index = self.__load_index()
+        return len(index['objects']), sum([o['size'] for o in index['objects'].values()])
+
+    @staticmethod
+    def get_source_stat(filepath):
+        """ Get Source Stat
+        :param (str) filepath: Local file.
+        :return (list): [size, mtime] or None if not a local file.
+        """
+        try:
+            st = os.stat(filepath)
+        except (IOError, OSError):
+            return None
+        return [st.st_size, st.st_mtime]
+
+    @staticmethod
+    def get_md5(filepath):
+        md5 = hashlib.md5()
+        with open(filepath, 'rb') as fp:
+            for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def __locked(self, lock_name, timeout=60, poll=0.01):
+        self.__makedirs(os.path.join(self.cache_dir, 'locks'))
+        return FileLock(os.path.join(self.cache_dir, 'locks', '{0}.lock'.format(re.sub(r'[^\w.\-]', '_', lock_name))),
+                         timeout=timeout, poll=poll)
+
+    def __load_index(self):
+        try:
+            with open(self.index_file, 'r') as fp:
+                index = json.load(fp)
+            if index.get('version') == INDEX_VERSION:
+                index.setdefault('sources', {})
+                return index
+        except (IOError, OSError, ValueError):
+            pass
+        return dict(version=INDEX_VERSION, objects={}, names={}, sources={})
+
+    def __save_index(self, index):
+        fd, tmp_file = tempfile.mkstemp(prefix='.index_', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(index, fp)
+        os.rename(tmp_file, self.index_file)
+        return
+
+    def __evict(self, index, keep=None):
+        total = sum([o['size'] for o in index['objects'].values()])
+        for digest, entry in sorted(index['objects'].items(), key=lambda x: x[1].get('atime', 0)):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            log.debug("Image cache: evicting {0} {1} ({2} bytes).".format(digest, entry['names'], entry['size']))
+            self.__drop(index, digest)
+            total -= entry['size']
+        return
+
+    def __drop(self, index, digest):
+        entry = index['objects'].pop(digest, {})
+        for name in entry.get('names', []):
+            if index['names'].get(name) == digest:
+                index['names'].pop(name, None)
+                index['sources'].pop(name, None)
+        obj_path = self.__object_path(digest)
+        os.remove(obj_path) if os.path.exists(obj_path) else None
+        return
+
+    def __present(self, dst_filepath, name, md5, verbose=True):
+        """ (INTERNAL) True if the destination is already in place (ingested into the cache if not there yet). """
+        if not os.path.isfile(dst_filepath):
+            return False
+        if md5 and self.get_md5(dst_filepath) != md5.lower():
+            log.warning("Image cache: '{0}' is present but the md5 does not match; "
+                        "replacing.".format(dst_filepath)) if verbose else None
+            return False
+        dst_source = self.get_source_stat(dst_filepath)
+        if not self.lookup(name=name, md5=md5, source=dst_source):
+            self.add(dst_filepath, name=name, md5=md5, source=dst_source)
+        return True
+
+    @staticmethod
+    def __place(src, dst):
+        """ (INTERNAL) Atomically place src at dst via hard link (or copy when across filesystems). """
+        ImageCache.__makedirs(os.path.dirname(dst))
+        tmp = '{0}.{1}.{2}.tmp'.format(dst, os.getpid(), threading.current_thread().ident)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.rename(tmp, dst)
+        return
+
+    @staticmethod
+    def __makedirs(path):
+        if path and not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        return
+
+
+def scp_fetch(src_filepath, dst_filepath, download_server=DEFAULT_DOWNLOAD_SERVER, user='gen-apollo', timeout=1800):
+    """ SCP Fetch
+    Non-interactive (key based) scp; safe to run concurrently since no shared console connection is used.
+    :param (str) src_filepath: Remote path + filename
+    :param (str) dst_filepath: Local path + filename
+    :param (str) download_server: Common Apollo server in local network
+    :param (str) user:
+    :param (int) timeout:
+    :return (bool): True if the file was copied.
+    """
+    cmd = ['timeout', str(timeout), 'scp', '-p', '-q', '-o', 'BatchMode=yes', '-o', 'StrictHostKeyChecking=no',
+           '{0}@{1}:{2}'.format(user, download_server, src_filepath), dst_filepath]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = proc.communicate()
+    except OSError as e:
+        log.debug("scp fetch unavailable: {0}".format(e))
+        return False
+    if proc.returncode != 0:
+        log.debug("scp fetch of {0} failed ({1}): {2}".format(src_filepath, proc.returncode, err.strip()))
+        return False
+    return os.path.isfile(dst_filepath)
@@ -0,0 +1,191 @@
+""" Layered Config Module
+========================================================================================================================
+
+Copy-on-write layered view of nested configuration dicts (ex. product definition 'COMMON' + '<codename>' sections).
+
+The legacy assembly deep-merged each section into the uut_config with common_utils.update_dict_recursively().
+The first section's nested dicts/lists were placed by reference and the next section was then merged INTO them,
+so the product definition module data (shared by every product and container in the process) was changed by each
+assembly.  The layered view instead:
+    1. Holds the layers by reference (lowest priority first) and never changes them; a new layer (override) gives a
+       new view (new_child) and leaves the original view as is (ChainMap-like).
+    2. Resolves a key on access only (cost = keys touched); nested dicts are resolved as nested views.
+    3. Merges with the same rules as update_dict_recursively (dict merge, list replace or list union per layer)
+       but into new objects.
+    4. Tracks the provenance of each key (the layers that supplied the resolved value).
+    5. Materializes (to_dict) into new containers so that the result can be changed freely.
+
+Usage:
+    view = LayeredConfig().new_child(family['COMMON'], 'COMMON').new_child(family[codename], codename)
+    view['poe']['type']
+    view.provenance(('poe', 'type'))
+    uut_config = view.to_dict()
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import copy
+import logging
+from collections import namedtuple
+from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+__title__ = "Layered Config Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+# list_replace = how a list value of this layer is combined with the list below it (see merge_lists).
+Layer = namedtuple('Layer', 'name mapping list_replace')
+
+_MISSING = object()
+
+
+class LayeredConfig(Mapping):
+    """ Layered Config
+    Read-only; key order is the order of first appearance from the lowest layer up.
+    Values are returned by reference to the layer data (do not change them); use to_dict() for a changeable copy.
+    """
+    def __init__(self, layers=None):
+        """
+        :param (list) layers: [Layer, ...] lowest priority first.
+        """
+        self._layers = tuple(layers) if layers else tuple()
+        self._cache = {}
+        return
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, [layer.name for layer in self._layers])
+
+    def __getitem__(self, key):
+        return self.__entry(key)[0]
+
+    def __iter__(self):
+        seen = set()
+        for layer in self._layers:
+            for key in layer.mapping:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return len(set().union(*[set(layer.mapping.keys()) for layer in self._layers]))
+
+    def __contains__(self, key):
+        return any([key in layer.mapping for layer in self._layers])
+
+    @property
+    def layers(self):
+        return [layer.name for layer in self._layers]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def new_child(self, mapping, name=None, list_replace=True):
+        """ New Child
+        :param (dict) mapping: Override layer (held by reference; not changed).
+        :param (str) name: Layer name for provenance.
+        :param (bool) list_replace: True = lists of this layer replace the lists below; False = union.
+        :return (LayeredConfig): New view; this view is unchanged.
+        """
+        name = name if name is not None else 'layer{0}'.format(len(self._layers))
+        return self.__class__(self._layers + (Layer(name, mapping if mapping else {}, list_replace),))
+
+    def provenance(self, key):
+        """ Provenance
+        :param (str|tuple) key: Key or a path of nested keys (ex. ('poe', 'type')).
+        :return (list): Names of the layers that supplied the resolved value; empty if the key is not present.
+        """
+        path = key if isinstance(key, tuple) else (key,)
+        view = self
+        for k in path[:-1]:
+            view = view.get(k) if isinstance(view, LayeredConfig) else None
+        if not isinstance(view, LayeredConfig) or path[-1] not in view:
+            return []
+        return view.__entry(path[-1])[1]
+
+    def provenance_map(self):
+        """ Provenance Map
+        :return (OrderedDict): {<key>: [<layer name>, ...], ...} for the top level keys.
+        """
+        return OrderedDict([(k, self.provenance(k)) for k in self])
+
+    def to_dict(self):
+        """ To Dict
+        Materialize the view into new dicts/lists (nothing is shared with the layers).
+        The container type of the lowest layer supplying a dict is kept (ex. OrderedDict).
+        :return (dict):
+        """
+        result = OrderedDict() if self._layers and isinstance(self._layers[0].mapping, OrderedDict) else dict()
+        for k in self:
+            v = self[k]
+            result[k] = v.to_dict() if isinstance(v, LayeredConfig) else copy.deepcopy(v)
+        return result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __entry(self, key):
+        if key not in self._cache:
+            self._cache[key] = self.__resolve(key)
+        return self._cache[key]
+
+    def __resolve(self, key):
+        """ (INTERNAL) Combine the values of a key from the lowest layer up (update_dict_recursively rules).
+        :return (tuple): (<value>, [<layer name>, ...])
+        """
+        value, sources, sublayers = _MISSING, [], []
+        for layer in [layer for layer in self._layers if key in layer.mapping]:
+            v = layer.mapping[key]
+            if isinstance(v, Mapping):
+                sources = sources + [layer.name] if sublayers else [layer.name]
+                sublayers.append(Layer(layer.name, v, layer.list_replace))
+                value = None
+            elif isinstance(v, list) and isinstance(value, list):
+                value, sources = merge_lists(value, v, layer.list_replace), sources + [layer.name]
+            else:
+                value, sources, sublayers = v, [layer.name], []
+        if value is _MISSING:
+            raise KeyError(key)
+        return (self.__class__(sublayers) if sublayers else value), sources
+
+
+def merge_lists(orig, new, list_replace=True):
+    """ Merge Lists
+    Same results as common_utils.update_dict_recursively() for a list value but without changing either list.
+    :param (list) orig: Lower layer list
+    :param (list) new: Upper layer list
+    :param (bool) list_replace: True = replace element-wise (dict elements are merged), False = union.
+    :return (list): New list
+    """
+    if list_replace:
+        merged = []
+        for i, v in enumerate(new):
+            if i < len(orig) and isinstance(v, Mapping) and isinstance(orig[i], Mapping):
+                merged.append(LayeredConfig([Layer('', orig[i], list_replace), Layer('', v, list_replace)]).to_dict())
+            else:
+                merged.append(v)
+        # Legacy: an empty new list keeps the first element of the original.
+        return merged if new or not orig else orig[:1]
+    try:
+        set(orig + new)
+        return orig + [i for i in new if i not in orig]
+    except TypeError:
+        pass
+    if not all([isinstance(i, tuple) and len(i) == 2 for i in orig + new]):
+        return [i for i in orig if i not in new] + new
+    # 2-element tuple lists are used as an OrderedDict; the new items take the place of duplicate keys.
+    orig = list(orig)
+    for item in new:
+        o_keys = [a for a, b in orig]
+        orig.pop(o_keys.index(item[0])) if item[0] in o_keys else None
+    return orig + new
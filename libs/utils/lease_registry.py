@@ -0,0 +1,278 @@
+""" Lease Registry Module
+========================================================================================================================
+
+Lease based registry of active members (ex. the active linecard/supervisor containers of a modular chassis).
+
+The legacy "active card" list was a cached list that was only cleaned of orphaned containers when some container
+deactivated (with a container status query for every entry); an aborted run left the list stale and the chassis
+powered.  This registry instead:
+    1. Keeps one lease per member, keyed by member (O(1) activate/renew/deactivate/membership).
+    2. Expires a lease that is not renewed within 'ttl' secs; expired members are reaped on every access.
+       With an 'alive' check, an expired member is only reaped once confirmed gone (ex. container not RUNNING).
+    3. Renews leases from a heartbeat thread per member; the heartbeat stops (and the lease then expires) when the
+       member is no longer alive.
+    4. Keeps the activation order (first active member = primary; a lease re-activated by the heartbeat keeps its
+       place) and a bounded audit history (activate, renew lost, deactivate, expire, ...).
+    5. Optionally publishes the ordered member list to a legacy key after every change.
+
+The state lock and the state store are injectable (ex. Apollo locking.ContainerPriorityLock and the Apollo cached
+data functions); the defaults are in-process.
+
+Usage:
+    registry = LeaseRegistry('pl_ar_ts_ActiveModular', ttl=300)
+    registry.activate('LC1', card='Linecard')
+    registry.start_heartbeat('LC1')
+    registry.members()  # ['LC1']
+    registry.deactivate('LC1')
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import time
+import logging
+import threading
+
+
+__title__ = "Lease Registry Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_HISTORY_SIZE = 200
+
+
+class LeaseRegistry(object):
+    """ Lease Registry
+    """
+    _local_state = {}
+    _local_lock = threading.RLock()
+    _heartbeats = {}
+
+    def __init__(self, name, ttl=DEFAULT_TTL, lock_factory=None, store=None, publish_key=None,
+                 history_size=DEFAULT_HISTORY_SIZE, clock=time.time, alive=None):
+        """
+        :param (str) name: Registry name; all containers using the same name share the registry.
+        :param (int) ttl: Lease time (secs); a lease not renewed within this time expires.
+        :param (func) lock_factory: Returns a lock context manager for a name; default = in-process lock.
+        :param (tuple) store: (get_func(key), put_func(key, value)) for the shared state; default = in-process dict.
+        :param (str) publish_key: Key to also store the ordered member list under (legacy readers); None = no publish.
+        :param (int) history_size: Max audit history entries.
+        :param (func) clock: Time source.
+        :param (func) alive: alive(member) -> False confirms an expired member is gone; None = reap on expiry.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.publish_key = publish_key
+        self.history_size = history_size
+        self.clock = clock
+        self.alive = alive
+        self._lock_factory = lock_factory if lock_factory else (lambda key: self._local_lock)
+        self._store = store if store else (self._local_state.get, self._local_state.__setitem__)
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def activate(self, member, **info):
+        """ Activate
+        Idempotent; an active member only has its lease renewed (and info updated).
+        :param (str) member: Member (ex. container name)
+        :param info: Extra data kept with the lease (ex. card='Linecard').
+        :return (bool): True if newly activated.
+        """
+        return self.__update(self.__activate, member, info)
+
+    def renew(self, member):
+        """ Renew
+        :param (str) member:
+        :return (bool): True if the lease was renewed; False if the member is not active (never activated or expired).
+        """
+        return self.__update(self.__renew, member)
+
+    def deactivate(self, member):
+        """ Deactivate
+        :param (str) member:
+        :return (bool): True if the member was active.
+        """
+        self.stop_heartbeat(member)
+        return self.__update(self.__deactivate, member)
+
+    def members(self):
+        """ Members
+        :return (list): Active members in activation order (first = primary).
+        """
+        return self.__update(lambda state: self.__ordered(state))
+
+    def is_active(self, member):
+        return self.__update(lambda state: member in state['leases'])
+
+    def leases(self):
+        """ Leases
+        :return (dict): {<member>: {'seq', 'since', 'renewed', 'expires', 'info'}, ...}
+        """
+        return self.__update(lambda state: dict(state['leases']))
+
+    def history(self, member=None):
+        """ History
+        :param (str) member: None = all members.
+        :return (list): [{'time', 'member', 'event', 'detail'}, ...] oldest first.
+        """
+        history = self.__update(lambda state: list(state['history']))
+        return [h for h in history if member is None or h['member'] == member]
+
+    def reap(self):
+        """ Reap
+        Expired leases are also reaped on every other access; use this to force it.
+        :return (list): Members reaped by this call.
+        """
+        return self.__update(lambda state: state.pop('_reaped', []))
+
+    def start_heartbeat(self, member, interval=None, alive=None):
+        """ Start Heartbeat
+        Renew the lease from a daemon thread every 'interval' secs (default ttl / 3).
+        A lease lost while the member is alive (ex. a stalled renew) is re-activated.
+        :param (str) member:
+        :param (float) interval: Secs.
+        :param (func) alive: alive() -> False stops the heartbeat (the lease then expires).
+        :return:
+        """
+        self.stop_heartbeat(member)
+        stop = threading.Event()
+        interval = interval if interval else max(1.0, self.ttl / 3.0)
+        lease = self.leases().get(member, {})
+
+        def __beat():
+            while not stop.wait(interval):
+                try:
+                    if alive and not alive():
+                        log.warning("Lease {0}: {1} is no longer alive; heartbeat stopped.".format(self.name, member))
+                        break
+                    if not self.renew(member):
+                        log.warning("Lease {0}: {1} lost its lease; re-activating.".format(self.name, member))
+                        self.__update(self.__activate, member, dict(lease.get('info', {})), lease.get('seq'))
+                except Exception as e:
+                    log.warning("Lease {0}: {1} heartbeat failed: {2}".format(self.name, member, e))
+
+        t = threading.Thread(target=__beat, name='lease_{0}'.format(member))
+        t.daemon = True
+        t.start()
+        self._heartbeats[(self.name, member)] = stop
+        return
+
+    def stop_heartbeat(self, member):
+        stop = self._heartbeats.pop((self.name, member), None)
+        stop.set() if stop else None
+        return
+
+    def print_members(self, title='Active'):
+        state = self.__update(lambda s: dict(s['leases']))
+        msg = "{0} ({1})".format(title, self.name)
+        log.info(msg)
+        log.info("-" * len(msg))
+        now = self.clock()
+        for m in self.__ordered(dict(leases=state)):
+            log.info("{0:<20} {1:<40} expires in {2:.0f}s".format(m, state[m]['info'], state[m]['expires'] - now))
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def __key(self):
+        return '__lease_{0}__'.format(self.name)
+
+    def __update(self, func, *args):
+        """ (INTERNAL) Read-modify-write of the shared state under the state lock; expired leases are reaped first.
+        :return: func() result
+        """
+        with self._lock_factory(self.__key):
+            state = self.__normalize(self._store[0](self.__key))
+            before = self.__ordered(state)
+            state['_reaped'] = self.__expire(state)
+            result = func(state, *args)
+            state.pop('_reaped', None)
+            self._store[1](self.__key, state)
+            after = self.__ordered(state)
+            if self.publish_key and after != before:
+                self._store[1](self.publish_key, after)
+        return result
+
+    def __activate(self, state, member, info, seq=None):
+        now = self.clock()
+        lease = state['leases'].get(member)
+        if lease:
+            lease.update(renewed=now, expires=now + self.ttl)
+            lease['info'].update(info)
+            return False
+        if seq is None:
+            state['seq'] += 1
+            seq = state['seq']
+        state['leases'][member] = dict(seq=seq, since=now, renewed=now, expires=now + self.ttl, info=info)
+        self.__audit(state, member, 'activate', info)
+        log.debug("Lease {0}: {1} activated.".format(self.name, member))
+        return True
+
+    def __renew(self, state, member):
+        lease = state['leases'].get(member)
+        if not lease:
+            self.__audit(state, member, 'renew lost')
+            return False
+        now = self.clock()
+        lease.update(renewed=now, expires=now + self.ttl)
+        return True
+
+    def __deactivate(self, state, member):
+        if state['leases'].pop(member, None) is None:
+            return False
+        self.__audit(state, member, 'deactivate')
+        log.debug("Lease {0}: {1} deactivated.".format(self.name, member))
+        return True
+
+    def __expire(self, state):
+        now = self.clock()
+        expired = [m for m, lease in state['leases'].items() if lease['expires'] < now]
+        for m in [m for m in expired if self.__is_alive(m)]:
+            # Missed renewals (ex. stalled heartbeat) but the member is still alive: keep it.
+            state['leases'][m].update(expires=now + self.ttl)
+            self.__audit(state, m, 'expire skipped', 'still alive')
+            log.warning("Lease {0}: {1} not renewed but still alive; lease kept.".format(self.name, m))
+            expired.remove(m)
+        for m in expired:
+            lease = state['leases'].pop(m)
+            self.__audit(state, m, 'expire', 'last renewed {0:.0f}s ago'.format(now - lease['renewed']))
+            log.warning("Lease {0}: {1} expired (no renewal for {2:.0f}s).".format(self.name, m, now - lease['renewed']))
+        return expired
+
+    def __is_alive(self, member):
+        if not self.alive:
+            return False
+        try:
+            return self.alive(member)
+        except Exception as e:
+            log.warning("Lease {0}: {1} status unknown ({2}); lease kept.".format(self.name, member, e))
+            return True
+
+    def __audit(self, state, member, event, detail=None):
+        state['history'].append(dict(time=self.clock(), member=member, event=event, detail=detail))
+        del state['history'][:-self.history_size]
+        return
+
+    @staticmethod
+    def __ordered(state):
+        return sorted(state['leases'], key=lambda m: state['leases'][m]['seq'])
+
+    @staticmethod
+    def __normalize(state):
+        state = state if isinstance(state, dict) else {}
+        for k, v in [('leases', {}), ('history', []), ('seq', 0)]:
+            state.setdefault(k, v)
+        return state
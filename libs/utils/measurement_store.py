@@ -0,0 +1,444 @@
+""" Measurement Store Module
+========================================================================================================================
+
+Typed, columnar, append-only store for UUT measurements (ex. serdes eye sweeps, temperatures, voltages).
+
+The diag readings were parsed into namedtuples of strings that were only logged; any analysis meant re-parsing the
+log files.  This store keeps each measurement kind as a table of typed columns:
+    1. Tag columns (ex. core, side, lane, sensor) are dictionary encoded into unsigned int arrays.
+    2. Value columns are float64 arrays (NaN for missing or non-numeric readings); a time column is always kept.
+    3. Rows are append-only; flush() appends the new rows to one binary file per column and then rewrites the small
+       JSON schema (tag dictionaries + committed row count) via atomic rename.  A torn append (rows beyond the
+       committed count) is ignored on load and overwritten on the next flush.
+    4. Query API: select(), column(), rows(), and stats() grouped by any tag columns (ex. per-lane, per-core,
+       per-sensor).
+
+Files per UUT run:  <root dir>/<run id>/<kind>.json  and  <root dir>/<run id>/<kind>.<column>.bin
+No root dir = in-memory store only.
+
+Usage:
+    store = MeasurementStore('/tftpboot/logs/measurements', run_id='FOC12345678_20170101120000')
+    store.append('sif_eye', tags={'core': 0, 'side': 'e', 'lane': 'A0', 'stat': 'Sum'}, values={'Amin': 172.5})
+    store.flush()
+    stats = store.stats('sif_eye', 'Amin', group_by=['core', 'lane'], where={'stat': 'Sum'})
+    # stats = {(0, 'A0'): Stats(count=1, min=172.5, max=172.5, mean=172.5, stdev=0.0), ...}
+
+Benchmark (ingest rate, flush/load time, query latency):
+    python measurement_store.py -n 200000
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import math
+import time
+import json
+import array
+import logging
+import argparse
+import tempfile
+import shutil
+from collections import namedtuple
+from collections import OrderedDict
+
+
+__title__ = "Measurement Store Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+TIME_COLUMN = 'time'
+TAG_TYPECODE = 'I'
+VALUE_TYPECODE = 'd'
+NAN = float('nan')
+
+Stats = namedtuple('Stats', 'count min max mean stdev')
+
+
+def to_float(text):
+    """ To Float
+    Convert a diag reading to a float; units/percent suffixes are dropped.
+    :param (str|int|float) text: Ex. '172.5', '89.15%', '-0.209', '(Max)', 'NA', None
+    :return (float): Value or NaN
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text)
+    m = re.match(r'^\s*([+\-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+\-]?\d+)?)\s*[%a-zA-Z]*\s*$', str(text)) if text is not None else None
+    return float(m.group(1)) if m else NAN
+
+
+class MeasurementTable(object):
+    """ Measurement Table
+    One measurement kind; the columns are typed arrays of equal length.
+    """
+    def __init__(self, kind, tags, fields):
+        """
+        :param (str) kind: Measurement kind (ex. 'sif_eye')
+        :param (list) tags: Tag column names
+        :param (list) fields: Value column names
+        """
+        if TIME_COLUMN in tags or TIME_COLUMN in fields or set(tags) & set(fields):
+            raise ValueError("Measurement table {0}: column names must be unique (and not '{1}').".format(kind, TIME_COLUMN))
+        self.kind = kind
+        self.tags = list(tags)
+        self.fields = list(fields)
+        self.columns = OrderedDict([(TIME_COLUMN, array.array(VALUE_TYPECODE))])
+        for tag in self.tags:
+            self.columns[tag] = array.array(TAG_TYPECODE)
+        for field in self.fields:
+            self.columns[field] = array.array(VALUE_TYPECODE)
+        self.dictionaries = {tag: [] for tag in self.tags}
+        self.committed = 0
+        self._codes = {tag: {} for tag in self.tags}
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    def __len__(self):
+        return len(self.columns[TIME_COLUMN])
+
+    def append(self, tags, values, ts):
+        unknown = (set(tags) - set(self.tags)) | (set(values) - set(self.fields))
+        if unknown:
+            raise ValueError("Measurement table {0}: unknown column(s) {1}.".format(self.kind, sorted(unknown)))
+        self.columns[TIME_COLUMN].append(ts)
+        for tag in self.tags:
+            self.columns[tag].append(self.encode(tag, tags.get(tag)))
+        for field in self.fields:
+            self.columns[field].append(to_float(values.get(field)))
+        return
+
+    def encode(self, tag, value, add=True):
+        """ Encode a tag value into its dictionary code (None if unknown and not added). """
+        key = self.__key(value)
+        code = self._codes[tag].get(key)
+        if code is None and add:
+            code = len(self.dictionaries[tag])
+            self.dictionaries[tag].append(value)
+            self._codes[tag][key] = code
+        return code
+
+    @staticmethod
+    def __key(value):
+        # str/unicode (py2 JSON loads unicode) and numbers are keyed by type class; anything else by its JSON text.
+        if isinstance(value, (str, type(u''))):
+            return 's', u'{0}'.format(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return 'n', value
+        return 'j', json.dumps(value, sort_keys=True)
+
+    def decode(self, tag, code):
+        return self.dictionaries[tag][code]
+
+    def load_dictionaries(self, dictionaries):
+        for tag in self.tags:
+            for value in dictionaries.get(tag, []):
+                self.encode(tag, value)
+        return
+
+
+class MeasurementStore(object):
+    """ Measurement Store
+    """
+    def __init__(self, root_dir=None, run_id=None):
+        """
+        :param (str) root_dir: Root directory for persisted runs; None = in-memory only.
+        :param (str) run_id: UUT run identifier (ex. '<sernum>_<timestamp>'); default = timestamp.
+        """
+        self.run_id = run_id if run_id else time.strftime('%Y%m%d%H%M%S')
+        self.path = os.path.join(root_dir, re.sub(r'[^A-Za-z0-9_.\-]', '_', self.run_id)) if root_dir else None
+        self.tables = OrderedDict()
+        self.__load() if self.path and os.path.isdir(self.path) else None
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def define(self, kind, tags, fields):
+        """ Define
+        :param (str) kind: Measurement kind
+        :param (list) tags: Tag column names
+        :param (list) fields: Value column names
+        :return (MeasurementTable):
+        """
+        table = self.tables.get(kind)
+        if table is not None:
+            if table.tags != list(tags) or table.fields != list(fields):
+                raise ValueError("Measurement kind {0} is already defined with a different schema.".format(kind))
+            return table
+        self.tables[kind] = MeasurementTable(kind, tags, fields)
+        return self.tables[kind]
+
+    def append(self, kind, tags, values, ts=None):
+        """ Append
+        An undefined kind is defined from the (sorted) tag and value names of the first row.
+        :param (str) kind: Measurement kind
+        :param (dict) tags: {<tag>: <value>, ...}; values must be JSON serializable (ex. int, str).
+        :param (dict) values: {<field>: <reading>, ...}; readings are converted by to_float().
+        :param (float) ts: Epoch time; default = now.
+        :return:
+        """
+        table = self.tables.get(kind)
+        table = table if table is not None else self.define(kind, sorted(tags.keys()), sorted(values.keys()))
+        table.append(tags, values, time.time() if ts is None else ts)
+        return
+
+    def extend(self, kind, rows, ts=None):
+        """ Extend
+        :param (str) kind: Measurement kind
+        :param (list) rows: [(<tags dict>, <values dict>), ...]
+        :param (float) ts: Epoch time for all rows; default = now.
+        :return:
+        """
+        ts = time.time() if ts is None else ts
+        for tags, values in rows:
+            self.append(kind, tags, values, ts=ts)
+        return
+
+    def flush(self):
+        """ Flush
+        Persist the uncommitted rows of all tables (no-op for an in-memory store).
+        :return (int): Rows committed
+        """
+        if not self.path:
+            return 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        count = 0
+        for kind, table in self.tables.items():
+            if table.committed == len(table) and os.path.exists(self.__schema_file(kind)):
+                continue
+            for name, column in table.columns.items():
+                self.__append_column(self.__column_file(kind, name), column, table.committed)
+            count += len(table) - table.committed
+            table.committed = len(table)
+            self.__write_schema(table)
+        return count
+
+    def pending(self):
+        """ Pending
+        :return (int): Rows not yet committed by flush()
+        """
+        return sum([len(table) - table.committed for table in self.tables.values()])
+
+    def kinds(self):
+        return list(self.tables.keys())
+
+    def select(self, kind, where=None, since=None):
+        """ Select
+        :param (str) kind: Measurement kind
+        :param (dict) where: {<tag>: <value or list of values>, ...}
+        :param (float) since: Only rows with time >= since.
+        :return (list): Row indices
+        """
+        table = self.__table(kind)
+        indices = range(len(table))
+        for tag, wanted in (where or {}).items():
+            if tag not in table.dictionaries:
+                raise ValueError("Measurement kind {0} has no tag '{1}'.".format(kind, tag))
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            codes = set([table.encode(tag, w, add=False) for w in wanted]) - {None}
+            column = table.columns[tag]
+            indices = [i for i in indices if column[i] in codes]
+        if since is not None:
+            column = table.columns[TIME_COLUMN]
+            indices = [i for i in indices if column[i] >= since]
+        return list(indices)
+
+    def column(self, kind, name, where=None, since=None):
+        """ Column
+        :return (list): Decoded tag values or floats for the selected rows.
+        """
+        table = self.__table(kind)
+        if name not in table.columns:
+            raise ValueError("Measurement kind {0} has no column '{1}'.".format(kind, name))
+        column = table.columns[name]
+        indices = self.select(kind, where=where, since=since)
+        if name in table.dictionaries:
+            return [table.decode(name, column[i]) for i in indices]
+        return [column[i] for i in indices]
+
+    def rows(self, kind, where=None, since=None):
+        """ Rows
+        :return (list): [{<column>: <value>, ...}, ...] for the selected rows.
+        """
+        table = self.__table(kind)
+        rows = []
+        for i in self.select(kind, where=where, since=since):
+            row = OrderedDict([(TIME_COLUMN, table.columns[TIME_COLUMN][i])])
+            row.update([(tag, table.decode(tag, table.columns[tag][i])) for tag in table.tags])
+            row.update([(field, table.columns[field][i]) for field in table.fields])
+            rows.append(row)
+        return rows
+
+    def stats(self, kind, field, group_by=None, where=None, since=None):
+        """ Stats
+        NaN readings are excluded; stdev is the population standard deviation.
+        :param (str) kind: Measurement kind
+        :param (str) field: Value column
+        :param (list) group_by: Tag columns to group by (ex. ['core', 'lane']); None = one group ().
+        :param (dict) where: See select().
+        :param (float) since: See select().
+        :return (OrderedDict): {(<tag value>, ...): Stats, ...} sorted by group.
+        """
+        table = self.__table(kind)
+        if field not in table.fields:
+            raise ValueError("Measurement kind {0} has no value field '{1}'.".format(kind, field))
+        group_by = list(group_by) if group_by else []
+        keys = [table.columns[tag] for tag in group_by]
+        values = table.columns[field]
+        acc = {}
+        for i in self.select(kind, where=where, since=since):
+            v = values[i]
+            if v != v:
+                continue
+            key = tuple([k[i] for k in keys])
+            a = acc.get(key)
+            if a is None:
+                acc[key] = [1, v, v, v, 0.0]
+                continue
+            # Welford running mean/variance
+            a[0] += 1
+            a[1] = v if v < a[1] else a[1]
+            a[2] = v if v > a[2] else a[2]
+            delta = v - a[3]
+            a[3] += delta / a[0]
+            a[4] += delta * (v - a[3])
+        stats = {}
+        for key, a in acc.items():
+            group = tuple([table.decode(tag, code) for tag, code in zip(group_by, key)])
+            stats[group] = Stats(a[0], a[1], a[2], a[3], math.sqrt(a[4] / a[0]))
+        return OrderedDict(sorted(stats.items(), key=lambda x: json.dumps(x[0])))
+
+    def print_stats(self, kind, field, group_by=None, where=None):
+        log.debug("-" * 100)
+        log.debug("{0} {1} by {2}".format(kind, field, group_by))
+        log.debug("{0:<40} {1:>8} {2:>12} {3:>12} {4:>12} {5:>12}".format('Group', 'Count', 'Min', 'Max', 'Mean', 'StDev'))
+        log.debug("-" * 100)
+        for group, s in self.stats(kind, field, group_by=group_by, where=where).items():
+            log.debug("{0:<40} {1:>8} {2:>12.4f} {3:>12.4f} {4:>12.4f} {5:>12.4f}".format(
+                ','.join([str(g) for g in group]), s.count, s.min, s.max, s.mean, s.stdev))
+        log.debug("-" * 100)
+        return
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def __table(self, kind):
+        if kind not in self.tables:
+            raise ValueError("Measurement kind {0} is not defined.".format(kind))
+        return self.tables[kind]
+
+    def __schema_file(self, kind):
+        return os.path.join(self.path, '{0}.json'.format(kind))
+
+    def __column_file(self, kind, name):
+        return os.path.join(self.path, '{0}.{1}.bin'.format(kind, name))
+
+    @staticmethod
+    def __append_column(filename, column, committed):
+        """ (INTERNAL) Append the uncommitted part of a column; any torn data beyond the committed rows is dropped. """
+        with open(filename, 'r+b' if os.path.exists(filename) else 'wb') as fp:
+            fp.seek(committed * column.itemsize)
+            fp.truncate()
+            column[committed:].tofile(fp)
+        return
+
+    def __write_schema(self, table):
+        schema = dict(kind=table.kind, tags=table.tags, fields=table.fields, dictionaries=table.dictionaries,
+                      rows=table.committed, byteorder=sys.byteorder, version=__version__)
+        fd, tmp_file = tempfile.mkstemp(prefix='.schema_', dir=self.path)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(schema, fp)
+        os.rename(tmp_file, self.__schema_file(table.kind))
+        return
+
+    def __load(self):
+        for filename in sorted(os.listdir(self.path)):
+            if not filename.endswith('.json') or filename.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(self.path, filename), 'r') as fp:
+                    schema = json.load(fp)
+                if schema.get('byteorder', sys.byteorder) != sys.byteorder:
+                    raise ValueError("byteorder mismatch")
+                table = MeasurementTable(schema['kind'], schema['tags'], schema['fields'])
+                table.load_dictionaries(schema['dictionaries'])
+                for name, column in table.columns.items():
+                    with open(self.__column_file(table.kind, name), 'rb') as fp:
+                        column.fromfile(fp, schema['rows'])
+                table.committed = schema['rows']
+                self.tables[table.kind] = table
+            except (IOError, OSError, ValueError, KeyError, EOFError) as e:
+                log.warning("Measurement store: {0} not loaded ({1}).".format(filename, e))
+        return
+
+
+def benchmark(rows=200000, root_dir=None):
+    """ Benchmark
+    Synthetic SIF serdes eye sweep (cores x sides x lanes x iterations x Sum/Min/Max).
+    :param (int) rows: Number of rows to ingest.
+    :param (str) root_dir: Directory for the persisted run; default = temp dir (removed after).
+    :return (dict): ingest_rate (rows/sec), flush_secs, load_secs, query_secs (per-lane stats), select_secs
+    """
+    tmp_dir = tempfile.mkdtemp() if not root_dir else None
+    root_dir = root_dir if root_dir else tmp_dir
+    fields = ['Amin', 'AminP', 'AminN', 'Ap', 'An', 'EScan', 'LScan', 'EL']
+    lanes = ['{0}{1}'.format(a, n) for a in 'ACE' for n in range(4)]
+    try:
+        store = MeasurementStore(root_dir, run_id='benchmark')
+        store.define('sif_eye', ['core', 'side', 'lane', 'stat', 'result'], fields)
+        start = time.time()
+        for i in range(rows):
+            tags = {'core': (i // 72) % 8, 'side': 'ew'[(i // 36) % 2], 'lane': lanes[(i // 3) % 12],
+                    'stat': ('Sum', 'Min', 'Max')[i % 3], 'result': 'Pass'}
+            store.append('sif_eye', tags, {f: 170.0 + (i * 7 + n) % 50 for n, f in enumerate(fields)}, ts=start)
+        ingest_secs = time.time() - start
+
+        start = time.time()
+        store.flush()
+        flush_secs = time.time() - start
+
+        start = time.time()
+        store = MeasurementStore(root_dir, run_id='benchmark')
+        load_secs = time.time() - start
+
+        start = time.time()
+        stats = store.stats('sif_eye', 'Amin', group_by=['core', 'lane'], where={'stat': 'Sum'})
+        query_secs = time.time() - start
+
+        start = time.time()
+        store.column('sif_eye', 'Amin', where={'core': 3, 'side': 'e', 'lane': 'C1'})
+        select_secs = time.time() - start
+    finally:
+        shutil.rmtree(tmp_dir) if tmp_dir else None
+
+    return dict(rows=rows, groups=len(stats), ingest_rate=rows / ingest_secs if ingest_secs else 0.0,
+                flush_secs=flush_secs, load_secs=load_secs, query_secs=query_secs, select_secs=select_secs)
+
+
+if __name__ == '__main__':
+    # Use this for standalone benchmarking.
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--rows", dest="rows", default=200000, type=int, action="store",
+                        help="Number of rows to ingest (default 200000).")
+    parser.add_argument("-d", "--dir", dest="root_dir", default=None, action="store",
+                        help="Directory for the persisted run (default is a temp dir).")
+    args = parser.parse_args()
+    results = benchmark(rows=args.rows, root_dir=args.root_dir)
+    print("Rows          : {0}".format(results['rows']))
+    print("Ingest        : {0:.0f} rows/sec".format(results['ingest_rate']))
+    print("Flush         : {0:.4f} secs".format(results['flush_secs']))
+    print("Load          : {0:.4f} secs".format(results['load_secs']))
+    print("Stats (lane)  : {0:.4f} secs ({1} groups)".format(results['query_secs'], results['groups']))
+    print("Select        : {0:.4f} secs".format(results['select_secs']))
@@ -0,0 +1,370 @@
+""" Step Telemetry Module
+========================================================================================================================
+
+Timing telemetry for the Apollo steps (common_utils.apollo_step) and the helper functions (common_utils.func_details).
+
+Each step (and each helper call that exceeds 'min_func_secs') gives one record:
+    wall time, console wait time (time blocked on the UUT console) vs. compute time (wall - console),
+    in-step retries (ex. Cesium service and func_retry retries), attempt number of the step for the UUT,
+    result (return value or exception name), container, UUT serial number, and test area.
+Console time is attributed to every open record of the thread (a step includes the console time of its helpers).
+The console time is measured by:
+    1. Instrumented UUT connections (instrument(uut_conn) times send w/ expectphrase and waitfor),
+    2. console_wait() blocks around other console polling loops (ex. response completion, serdes eye collection).
+Records are appended as JSON lines to '<root_dir>/<YYYYMMDD>/<container>.jsonl' when the outermost record of the
+thread closes.  Telemetry errors are logged and never affect the step.
+
+Report (standalone):
+    python step_telemetry.py -d <root_dir> [-t 20] [-s <baseline file>] [-b <baseline file>] [-r 0.20]
+    - slowest steps (by p95), p50/p95 wall + console per step across runs,
+    - regressions of the p50 or p95 vs. a saved baseline (-b) by more than the ratio (-r).
+
+========================================================================================================================
+"""
+
+# Python
+# ------
+import sys
+import os
+import re
+import math
+import time
+import json
+import glob
+import argparse
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+__title__ = "Step Telemetry Module"
+__version__ = '2.0.0'
+__author__ = ['bborel']
+
+thismodule = sys.modules[__name__]
+log = logging.getLogger(__name__)
+
+DEFAULT_MIN_FUNC_SECS = 0.5
+DEFAULT_REGRESSION_RATIO = 0.20
+DEFAULT_MIN_COUNT = 3
+MAX_MEMORY_RECORDS = 1000
+
+
+class StepTelemetry(object):
+    """ Step Telemetry
+    """
+    def __init__(self, root_dir=None, enabled=True, min_func_secs=DEFAULT_MIN_FUNC_SECS, context_func=None):
+        """
+        :param (str) root_dir: Directory of the JSON lines sink; None = keep records in memory only (see .records).
+        :param (bool) enabled:
+        :param (float) min_func_secs: Helper calls (kind='func') shorter than this are not recorded.
+        :param (func) context_func: Returns {'container': ..., 'uut': ..., 'area': ...} for a record.
+        """
+        self.root_dir = root_dir
+        self.enabled = enabled
+        self.min_func_secs = min_func_secs
+        self.records = deque(maxlen=MAX_MEMORY_RECORDS)
+        self._context_func = context_func
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self._sink_ok = True
+        return
+
+    def __repr__(self):
+        return "{0} v{1} ({2})".format(self.__class__.__name__, __version__, __name__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Public Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    def configure(self, root_dir=None, context_func=None, enabled=None, min_func_secs=None):
+        self.root_dir = root_dir if root_dir is not None else self.root_dir
+        self._context_func = context_func if context_func is not None else self._context_func
+        self.enabled = enabled if enabled is not None else self.enabled
+        self.min_func_secs = min_func_secs if min_func_secs is not None else self.min_func_secs
+        self._sink_ok = True
+        return
+
+    def begin(self, name, kind='step'):
+        """ Begin
+        :param (str) name: Step or function name
+        :param (str) kind: 'step' or 'func'
+        :return (dict): Open record (pass to end()); None if disabled.
+        """
+        if not self.enabled:
+            return None
+        stack = self.__stack
+        try:
+            ctx = stack[0] if stack else (self._context_func() if self._context_func else {})
+        except Exception:
+            ctx = {}
+        record = dict(name=name, kind=kind, ts=time.time(), wall=0.0, console=0.0, compute=0.0, retries=0,
+                      attempt=1, result=None, depth=len(stack), container=ctx.get('container'),
+                      uut=ctx.get('uut'), area=ctx.get('area'))
+        if kind == 'step':
+            with self._lock:
+                key = (record['container'], record['uut'], name)
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                record['attempt'] = self._attempts[key]
+        stack.append(record)
+        return record
+
+    def end(self, record, result=None):
+        """ End
+        :param (dict) record: From begin()
+        :param (obj) result: Step return value or exception
+        :return:
+        """
+        if record is None:
+            return
+        stack = self.__stack
+        while stack and stack[-1] is not record:
+            stack.pop()
+        stack.pop() if stack else None
+        record['wall'] = time.time() - record['ts']
+        record['compute'] = max(0.0, record['wall'] - record['console'])
+        record['error'] = isinstance(result, BaseException)
+        record['result'] = result.__class__.__name__ if record['error'] else str(result)[:40]
+        if record['kind'] == 'step' or record['wall'] >= self.min_func_secs:
+            self.__pending.append(record)
+        if not stack:
+            self.flush()
+        return
+
+    @contextmanager
+    def track(self, name, kind='step'):
+        """ Track (context manager)
+        """
+        record = self.begin(name, kind=kind)
+        try:
+            yield record
+        except BaseException as e:
+            self.end(record, result=e)
+            raise
+        else:
+            self.end(record, result='done')
+
+    @contextmanager
+    def console_wait(self):
+        """ Console Wait (context manager)
+        Time inside is console wait time of all open records of the thread; nested blocks are counted once.
+        """
+        self._local.console_depth = getattr(self._local, 'console_depth', 0) + 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._local.console_depth -= 1
+            if self._local.console_depth == 0:
+                waited = time.time() - start
+                for record in self.__stack:
+                    record['console'] += waited
+
+    def add_retries(self, count=1):
+        """ Add Retries
+        Count in-step retries against the open records of the thread.
+        """
+        for record in self.__stack:
+            record['retries'] += count
+        return
+
+    def instrument(self, uut_conn):
+        """ Instrument
+        Time the blocking console methods (send w/ expectphrase, waitfor) of a UUT connection instance.
+        :param (obj) uut_conn:
+        :return (bool): True if instrumented.
+        """
+        if uut_conn is None or getattr(uut_conn, '_step_telemetry', None) is self:
+            return False
+        try:
+            for method_name in ['send', 'waitfor']:
+                method = getattr(uut_conn, method_name, None)
+                if method:
+                    setattr(uut_conn, method_name, self.__timed(method, blocking_kwarg='expectphrase' if method_name == 'send' else None))
+            uut_conn._step_telemetry = self
+        except (AttributeError, TypeError) as e:
+            log.debug("Step telemetry: cannot instrument {0} ({1}).".format(uut_conn, e))
+            return False
+        return True
+
+    def flush(self):
+        """ Flush
+        :return (int): Records written
+        """
+        pending, self._local.pending = self.__pending, []
+        if not pending:
+            return 0
+        with self._lock:
+            self.records.extend(pending)
+            if not self.root_dir or not self._sink_ok:
+                return 0
+            try:
+                path = self.__sink_file(pending[0].get('container'))
+                with open(path, 'a') as fp:
+                    fp.write(''.join([json.dumps(r, sort_keys=True) + '\n' for r in pending]))
+            except (IOError, OSError, TypeError, ValueError) as e:
+                log.warning("Step telemetry: sink disabled ({0}).".format(e))
+                self._sink_ok = False
+                return 0
+        return len(pending)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Internal Methods
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def __stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @property
+    def __pending(self):
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = []
+        return self._local.pending
+
+    def __timed(self, method, blocking_kwarg=None):
+        def timed_method(*args, **kwargs):
+            if blocking_kwarg and not kwargs.get(blocking_kwarg):
+                return method(*args, **kwargs)
+            with self.console_wait():
+                return method(*args, **kwargs)
+        return timed_method
+
+    def __sink_file(self, container):
+        day_dir = os.path.join(self.root_dir, time.strftime('%Y%m%d'))
+        if not os.path.isdir(day_dir):
+            try:
+                os.makedirs(day_dir)
+            except OSError:
+                pass
+        name = re.sub(r'[^A-Za-z0-9_.\-]', '_', container if container else 'local')
+        return os.path.join(day_dir, '{0}.jsonl'.format(name))
+
+
+# Shared instance for the decorators (configured by common_utils) and the console polling loops.
+DEFAULT = StepTelemetry()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Report
+# ----------------------------------------------------------------------------------------------------------------------
+def load_records(root_dir, kind='step', since=None):
+    """ Load Records
+    :param (str) root_dir: Sink directory (all '<YYYYMMDD>/*.jsonl' files) or a single .jsonl file.
+    :param (str) kind: 'step', 'func', or None for all.
+    :param (float) since: Epoch time; None = all.
+    :return (list): Records
+    """
+    files = [root_dir] if os.path.isfile(root_dir) else sorted(glob.glob(os.path.join(root_dir, '*', '*.jsonl')))
+    records = []
+    for path in files:
+        with open(path, 'r') as fp:
+            for line in fp:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue  # torn line of a crashed writer
+                if (kind is None or r.get('kind') == kind) and (since is None or r.get('ts', 0) >= since):
+                    records.append(r)
+    return records
+
+
+def percentile(values, pct):
+    """ Percentile (nearest rank)
+    :param (list) values:
+    :param (float) pct: 0..100
+    :return (float): None if no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def summarize(records):
+    """ Summarize
+    :param (list) records:
+    :return (dict): {<name>: {'count', 'p50', 'p95', 'max', 'console_p50', 'console_pct', 'retries', 'fails'}, ...}
+    """
+    groups = {}
+    for r in records:
+        groups.setdefault(r['name'], []).append(r)
+    summary = {}
+    for name, rs in groups.items():
+        walls = [r['wall'] for r in rs]
+        total = sum(walls)
+        summary[name] = dict(count=len(rs), p50=percentile(walls, 50), p95=percentile(walls, 95), max=max(walls),
+                             total=total, console_p50=percentile([r['console'] for r in rs], 50),
+                             console_pct=100.0 * sum([r['console'] for r in rs]) / total if total else 0.0,
+                             retries=sum([r.get('retries', 0) for r in rs]),
+                             fails=len([r for r in rs if r.get('error') or r.get('result') in ['FAIL', 'False']]))
+    return summary
+
+
+def regressions(summary, baseline, ratio=DEFAULT_REGRESSION_RATIO, min_count=DEFAULT_MIN_COUNT):
+    """ Regressions
+    :param (dict) summary: From summarize()
+    :param (dict) baseline: Saved summary
+    :param (float) ratio: Allowed increase (0.20 = 20%)
+    :param (int) min_count: Min samples (current and baseline) to compare.
+    :return (list): [(<name>, <stat>, <baseline>, <current>), ...] sorted by the largest increase.
+    """
+    found = []
+    for name, cur in summary.items():
+        base = baseline.get(name)
+        if not base or cur['count'] < min_count or base.get('count', 0) < min_count:
+            continue
+        for stat in ['p50', 'p95']:
+            if base.get(stat) and cur[stat] > base[stat] * (1.0 + ratio):
+                found.append((name, stat, base[stat], cur[stat]))
+    return sorted(found, key=lambda f: f[3] / f[2], reverse=True)
+
+
+def report(root_dir, top=20, baseline_file=None, save_baseline=None, ratio=DEFAULT_REGRESSION_RATIO, since=None):
+    """ Report
+    :return (dict): {'summary': ..., 'regressions': [...], 'lines': [<report text line>, ...]}
+    """
+    summary = summarize(load_records(root_dir, kind='step', since=since))
+    lines = ["{0:<50} {1:>6} {2:>9} {3:>9} {4:>9} {5:>8} {6:>7} {7:>5}".format(
+        'Step', 'Count', 'p50', 'p95', 'Max', 'Console%', 'Retries', 'Fails')]
+    for name, s in sorted(summary.items(), key=lambda i: i[1]['p95'], reverse=True)[:top]:
+        lines.append("{0:<50} {1:>6} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>8.1f} {6:>7} {7:>5}".format(
+            name[-50:], s['count'], s['p50'], s['p95'], s['max'], s['console_pct'], s['retries'], s['fails']))
+    found = []
+    if baseline_file:
+        with open(baseline_file, 'r') as fp:
+            found = regressions(summary, json.load(fp), ratio=ratio)
+        lines.append("Regressions vs {0} (> {1:.0f}%): {2}".format(baseline_file, ratio * 100, len(found)))
+        for name, stat, base, cur in found:
+            lines.append("  {0:<48} {1} {2:>9.2f} --> {3:>9.2f} (+{4:.0f}%)".format(name[-48:], stat, base, cur,
+                                                                                 (cur / base - 1.0) * 100))
+    if save_baseline:
+        with open(save_baseline, 'w') as fp:
+            json.dump(summary, fp, indent=1, sort_keys=True)
+        lines.append("Baseline saved: {0}".format(save_baseline))
+    return dict(summary=summary, regressions=found, lines=lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-d", "--dir", dest="root_dir", required=True, action="store",
+                        help="Telemetry sink directory (or a single .jsonl file).")
+    parser.add_argument("-t", "--top", dest="top", default=20, type=int, action="store",
+                        help="Number of slowest steps to show (default 20).")
+    parser.add_argument("-b", "--baseline", dest="baseline", default=None, action="store",
+                        help="Baseline file to check for regressions.")
+    parser.add_argument("-s", "--save-baseline", dest="save_baseline", default=None, action="store",
+                        help="Save the current summary as a baseline file.")
+    parser.add_argument("-r", "--ratio", dest="ratio", default=DEFAULT_REGRESSION_RATIO, type=float, action="store",
+                        help="Allowed p50/p95 increase vs. the baseline (default 0.20).")
+    parser.add_argument("--days", dest="days", default=None, type=float, action="store",
+                        help="Only records of the last N days.")
+    args = parser.parse_args()
+    since = time.time() - args.days * 86400 if args.days else None
+    results = report(args.root_dir, top=args.top, baseline_file=args.baseline, save_baseline=args.save_baseline,
+                     ratio=args.ratio, since=since)
+    print('\n'.join(results['lines']))
+    sys.exit(1 if results['regressions'] else 0)
@@ -0,0 +1,60 @@
+"""
+---------------------------------------------------------------------
+Fake Cesium backend for apollo.scripts.entsw.libs.utils.tests
+---------------------------------------------------------------------
+Stands in for apollo.libs.cesiumlib: canned lookup responses with configurable latency and injected failures;
+every call is counted per service.
+"""
+# Python Imports
+# --------------
+import time
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ServiceFailure(Exception):
+    pass
+
+
+class FakeCesium(object):
+    def __init__(self, latency=0.0, failures=None):
+        """
+        :param (float) latency: Response time (secs) of every service call.
+        :param (dict) failures: {<service>: <number of calls to fail before succeeding>, ...}
+        """
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def count(self, service):
+        return self.calls.get(service, 0)
+
+    def _service(self, service, response):
+        with self._lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+            fail = self.failures.get(service, 0) > 0
+            if fail:
+                self.failures[service] -= 1
+        time.sleep(self.latency)
+        if fail:
+            raise ServiceFailure("Fake cesium '{0}' failure.".format(service))
+        return response
+
+    def get_genealogy(self, serial_number, product_id, level=1):
+        return self._service('get_genealogy', {'serial_number': serial_number, 'product_id': product_id,
+                                               'level': level, 'children': [{'serial_number': 'FOC0000000{0}'.format(i)}
+                                                                            for i in range(level)]})
+
+    def get_lineid_config(self, major_line_id):
+        return self._service('get_lineid_config', {'major_line_id': major_line_id,
+                                                   'config_data': [{'lineid': str(major_line_id), 'qty': '1',
+                                                                    'prod_name': 'C9300-48UXM-E'}]})
+
+    def get_cmpd(self, **kwargs):
+        return self._service('get_cmpd', dict(kwargs, cmpd_value='FAKE'))
+
+    def generate_serial_number(self, location_prefix):
+        return self._service('generate_serial_number', '{0}{1:08d}'.format(location_prefix, self.count('generate_serial_number')))
@@ -0,0 +1,94 @@
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+from .. import bandwidth_scheduler
+
+__title__ = 'EntSw Bandwidth Scheduler Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestBandwidthScheduler(object):
+
+    def setup_method(self, method):
+        self.shared_dir = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.shared_dir)
+
+    def __scheduler(self, **kwargs):
+        kwargs.setdefault('check_interval', 30.0)
+        return bandwidth_scheduler.BandwidthScheduler(name='network.Station1', shared_dir=self.shared_dir, **kwargs)
+
+    def test_cap_and_wake_on_release(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def __container(n):
+            # Separate scheduler objects (one per container) sharing the station state.
+            scheduler = self.__scheduler(max_tokens=2)
+            with scheduler.token('UUT{0:02d}'.format(n)):
+                with lock:
+                    active.append(n)
+                    peak.append(len(active))
+                time.sleep(0.1)
+                with lock:
+                    active.remove(n)
+
+        start = time.time()
+        threads = [threading.Thread(target=__container, args=(n,)) for n in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # No polling delay (check_interval=30 secs): 3 rounds of 0.1 secs + doorbell latency.
+        assert time.time() - start < 1.5
+        assert max(peak) == 2
+        state = self.__scheduler().get_state()
+        assert not state['holders'] and not state['queue']
+        metrics = self.__scheduler().get_metrics()
+        assert sorted(metrics.keys()) == ['UUT{0:02d}'.format(n) for n in range(6)]
+        assert all([m['count'] == 1 for m in metrics.values()])
+        assert max([m['max'] for m in metrics.values()]) >= 0.1
+
+    def test_area_priority(self):
+        scheduler = self.__scheduler(max_tokens=1, area_priorities={'PCBST': 1, 'SYSFT': 9})
+        assert scheduler.acquire('UUT01', area='SYSFT')
+        order = []
+
+        def __container(name, area):
+            s = self.__scheduler(max_tokens=1, area_priorities={'PCBST': 1, 'SYSFT': 9})
+            s.acquire(name, area=area)
+            order.append(name)
+            s.release(name)
+
+        threads = []
+        for name, area in [('UUT02', 'SYSFT'), ('UUT03', None), ('UUT04', 'PCBST')]:
+            threads.append(threading.Thread(target=__container, args=(name, area)))
+            threads[-1].start()
+            time.sleep(0.05)
+        assert [e['container'] for e in scheduler.get_state()['queue']] == ['UUT04', 'UUT03', 'UUT02']
+        assert scheduler.acquire('UUT01')
+        scheduler.release('UUT01')
+        for t in threads:
+            t.join()
+        assert order == ['UUT04', 'UUT03', 'UUT02']
+
+    def test_timeout_and_reclaim(self):
+        scheduler = self.__scheduler(max_tokens=1, hold_timeout=0.3, check_interval=0.1)
+        assert scheduler.acquire('UUT01')
+        start = time.time()
+        assert not scheduler.acquire('UUT02', timeout=0.15)
+        assert time.time() - start < 0.5
+        assert not scheduler.get_state()['queue']
+        # UUT01 never releases; its token is reclaimed after the hold timeout (on the waiter's next state check).
+        assert scheduler.acquire('UUT02', timeout=2.0)
+        assert list(scheduler.get_state()['holders'].keys()) == ['UUT02']
+        assert not scheduler.release('UUT01')
+        assert scheduler.release('UUT02')
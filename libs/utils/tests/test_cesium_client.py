@@ -0,0 +1,101 @@
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+import pytest
+
+from .. import cesium_client
+from . import fake_cesium
+
+__title__ = 'EntSw Cesium Client Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestCesiumClient(object):
+
+    def setup_method(self, method):
+        self.shared_dir = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.shared_dir)
+
+    def test_backoff_delay(self):
+        assert cesium_client.backoff_delay(1) == 0.0
+        for attempt, delay in [(2, 2.0), (3, 4.0), (4, 8.0), (10, 16.0)]:
+            d = cesium_client.backoff_delay(attempt)
+            assert delay * (1 - cesium_client.BACKOFF_JITTER) <= d <= delay
+
+    def test_ttl_cache(self):
+        cesium = fake_cesium.FakeCesium()
+        client = cesium_client.CesiumClient(shared_dir=self.shared_dir)
+        kwargs = dict(serial_number='FOC12345678', product_id='C9300-48P')
+        g1 = client.call('get_genealogy', cesium.get_genealogy, kwargs=kwargs, ttl=0.3)
+        g1['children'] = []
+        g2 = client.call('get_genealogy', cesium.get_genealogy, kwargs=kwargs, ttl=0.3)
+        assert cesium.count('get_genealogy') == 1
+        assert len(g2['children']) == 1
+        client.call('get_genealogy', cesium.get_genealogy, kwargs=dict(kwargs, level=2), ttl=0.3)
+        assert cesium.count('get_genealogy') == 2
+        time.sleep(0.35)
+        client.call('get_genealogy', cesium.get_genealogy, kwargs=kwargs, ttl=0.3)
+        assert cesium.count('get_genealogy') == 3
+        assert client.get_metrics('get_genealogy')['cache_hits'] == 1
+
+    def test_not_cacheable(self):
+        cesium = fake_cesium.FakeCesium()
+        client = cesium_client.CesiumClient(shared_dir=self.shared_dir)
+        sn1 = client.call('generate_serial_number', cesium.generate_serial_number, args=('FOC',))
+        sn2 = client.call('generate_serial_number', cesium.generate_serial_number, args=('FOC',))
+        assert sn1 != sn2 and cesium.count('generate_serial_number') == 2
+
+    def test_coalescing(self):
+        """ 3 threads x 3 'containers' (separate clients sharing the same dir) --> one backend call. """
+        cesium = fake_cesium.FakeCesium(latency=0.3)
+        clients = [cesium_client.CesiumClient(shared_dir=self.shared_dir) for _ in range(3)]
+        results = []
+
+        def __request(client):
+            results.append(client.call('get_lineid_config', cesium.get_lineid_config, kwargs=dict(major_line_id=1017068799),
+                                       ttl=60))
+
+        threads = [threading.Thread(target=__request, args=(c,)) for c in clients for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert cesium.count('get_lineid_config') == 1
+        assert len(results) == 9 and all([r['major_line_id'] == 1017068799 for r in results])
+        assert sum([c.get_metrics('get_lineid_config')['coalesced'] for c in clients]) == 8
+
+    def test_published_results_private_and_purged(self):
+        cesium = fake_cesium.FakeCesium()
+        client = cesium_client.CesiumClient(shared_dir=os.path.join(self.shared_dir, 'cc'))
+        client.call('get_cmpd', cesium.get_cmpd, kwargs=dict(uut_type='73-1234-01'), ttl=0.2)
+        results = [f for f in os.listdir(client.shared_dir) if f.endswith('.json')]
+        assert len(results) == 1
+        assert stat.S_IMODE(os.stat(client.shared_dir).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(os.path.join(client.shared_dir, results[0])).st_mode) == 0o600
+        assert client.purge() == 0
+        time.sleep(0.25)
+        assert client.purge() == 1
+        assert [f for f in os.listdir(client.shared_dir) if f.endswith('.json')] == []
+
+    def test_retry_and_metrics(self, monkeypatch):
+        monkeypatch.setattr(cesium_client.time, 'sleep', lambda secs: None)
+        cesium = fake_cesium.FakeCesium(failures={'get_cmpd': 2})
+        client = cesium_client.CesiumClient(shared_dir=self.shared_dir)
+        r = client.call('get_cmpd', cesium.get_cmpd, kwargs=dict(uut_type='73-1234-01'), max_attempts=3)
+        assert r['cmpd_value'] == 'FAKE'
+        m = client.get_metrics('get_cmpd')
+        assert m['count'] == 3 and m['errors'] == 2 and m['retries'] == 2
+        assert m['p95'] >= m['p50'] >= 0.0
+        cesium.failures['get_cmpd'] = 5
+        with pytest.raises(fake_cesium.ServiceFailure):
+            client.call('get_cmpd', cesium.get_cmpd, kwargs=dict(uut_type='73-1234-01'), max_attempts=2)
@@ -0,0 +1,189 @@
+import logging
+import time
+import threading
+
+import pytest
+
+from .. import console_utils
+
+__title__ = 'EntSw Console Utility Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class FakeConn(object):
+    """ Simulated UUT connection; the recbuf is filled in the background with the given chunks. """
+    def __init__(self, chunks=None, chunk_delay=0.05):
+        self.recbuf = ''
+        self._chunks = chunks or []
+        self._chunk_delay = chunk_delay
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False, **kwargs):
+        def __fill():
+            for chunk in self._chunks:
+                time.sleep(self._chunk_delay)
+                self.recbuf += chunk
+        self.recbuf = text
+        t = threading.Thread(target=__fill)
+        t.daemon = True
+        t.start()
+
+
+class TestResponseCompletion(object):
+    prompt = r'(?:Stardust> )|(?:[A-Z][\S]*> )'
+
+    def test_prompt_completion(self):
+        conn = FakeConn(chunks=['line1\r\n', 'line2\r\n', 'Shannon48U> '])
+        rc = console_utils.ResponseCompletion(conn, prompt=TestResponseCompletion.prompt, fallback_time=3.0)
+        start = time.time()
+        reason = rc.send('GetSystemStatus\r')
+        elapsed = time.time() - start
+        assert reason == 'prompt'
+        assert elapsed < 1.0
+        assert rc.stats['getsystemstatus']['count'] == 1
+        assert rc.stats['getsystemstatus']['saved'] > 2.0
+
+    def test_quiet_completion(self):
+        conn = FakeConn(chunks=['no prompt here'])
+        profiles = {'dir': console_utils.CompletionProfile(quiet=0.3, settle=0.1, poll=0.05, max_wait=None)}
+        rc = console_utils.ResponseCompletion(conn, prompt=TestResponseCompletion.prompt, fallback_time=3.0,
+                                              profiles=profiles)
+        assert rc.send('dir\r') == 'quiet'
+
+    def test_timeout_completion(self):
+        conn = FakeConn(chunks=['.'] * 40, chunk_delay=0.02)
+        profiles = {'run': console_utils.CompletionProfile(quiet=1.0, settle=0.5, poll=0.05, max_wait=0.4)}
+        rc = console_utils.ResponseCompletion(conn, prompt=TestResponseCompletion.prompt, profiles=profiles)
+        start = time.time()
+        assert rc.send('run SomeTest\r') == 'timeout'
+        assert time.time() - start < 0.8
+
+    def test_fallback(self):
+        conn = FakeConn(chunks=['Shannon48U> '])
+        rc = console_utils.ResponseCompletion(conn, prompt=TestResponseCompletion.prompt, fallback_time=0.3,
+                                              profiles={'AlchemyProgram': None})
+        start = time.time()
+        assert rc.send('AlchemyProgram -eeprom\r') == 'fallback'
+        assert time.time() - start >= 0.3
+        rc.enabled = False
+        assert rc.wait('pwd') == 'fallback'
+
+    def test_cmd_key(self):
+        assert console_utils.ResponseCompletion.get_cmd_key('PortStat -p:1-48\r') == 'portstat'
+        assert console_utils.ResponseCompletion.get_cmd_key('') is None
+
+
+LINE_KILL = '\x15'
+
+
+class EchoConn(object):
+    """ Simulated diag console that echoes the input; blocks larger than 'capacity' are garbled (overrun). """
+    def __init__(self, capacity=1000, echo=True, wrap=80):
+        self.recbuf = ''
+        self.capacity = capacity
+        self.echo = echo
+        self.wrap = wrap
+        self.received = ''
+        self.line_start = 0
+        self.sends = []
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False, **kwargs):
+        self.sends.append(text)
+        if text == '\r':
+            self.line_start = len(self.received)
+            self.recbuf = '\r\nRead > '
+            return
+        if text == LINE_KILL:
+            self.received = self.received[:self.line_start]
+            self.recbuf = ''
+            return
+        received = text if len(text) <= self.capacity else text[:self.capacity]
+        self.received += received
+        if not self.echo:
+            self.recbuf = ''
+            if expectphrase:
+                raise Exception('Timeout waiting for echo')
+            return
+        # Line wrapping inserts whitespace in the echo.
+        self.recbuf = '\r\n'.join([received[i:i + self.wrap] for i in range(0, len(received), self.wrap)])
+        if received != text:
+            raise Exception('Timeout waiting for echo')
+
+
+class TestBlockStreamer(object):
+    profile = console_utils.StreamProfile(min_size=16, max_size=64, echo_timeout=1, legacy_sleep=0.01)
+    data = ''.join(['{0:02X}'.format(i % 256) for i in range(400)])
+
+    def test_grow_and_verify(self):
+        conn = EchoConn(wrap=20)
+        bs = console_utils.BlockStreamer(conn, profile=self.profile, line_kill=LINE_KILL)
+        assert bs.stream(self.data) is True
+        assert conn.received == self.data
+        assert bs.block_size == 64 and bs.echo is True
+        assert bs.stats['overruns'] == 0
+        # 16 + 32 + 64 * 12 (800 chars) vs. 50 fixed blocks
+        assert bs.stats['blocks'] == 14
+        assert conn.sends[-1] == '\r'
+
+    def test_no_growth_without_resend(self):
+        conn = EchoConn()
+        bs = console_utils.BlockStreamer(conn, profile=self.profile)
+        assert bs.stream(self.data) is True
+        # Data that cannot be resent never exceeds the proven safe size (the legacy block size).
+        assert set([len(s) for s in conn.sends[:-1]]) == set([16])
+        assert bs.stats['grows'] == 0
+
+        # Joined data (no line kill possible w/o losing the earlier part of the line) is not grown either.
+        conn = EchoConn()
+        bs = console_utils.BlockStreamer(conn, profile=self.profile, line_kill=LINE_KILL)
+        bs.stream(self.data[:16], join=True)
+        bs.stream(self.data)
+        assert set([len(s) for s in conn.sends[1:-1]]) == set([16])
+        sends = len(conn.sends)
+        bs.stream(self.data)
+        assert max([len(s) for s in conn.sends[sends:]]) == 64
+
+    def test_overrun_restart(self):
+        conn = EchoConn(capacity=40)
+        bs = console_utils.BlockStreamer(conn, profile=self.profile, line_kill=LINE_KILL)
+        assert bs.stream(self.data) is True
+        # The garbled block never stays on the line: killed and the segment resent at the smaller size.
+        assert conn.received == self.data
+        assert (bs.stats['overruns'], bs.stats['restarts']) == (1, 1)
+        assert bs.block_size == 32
+        kill = conn.sends.index(LINE_KILL)
+        assert max([len(s) for s in conn.sends[kill + 1:]]) == 32
+
+    def test_overrun_not_resendable(self):
+        conn = EchoConn(capacity=8)
+        bs = console_utils.BlockStreamer(conn, profile=self.profile)
+        with pytest.raises(console_utils.BlockStreamError):
+            bs.stream(self.data)
+        assert LINE_KILL not in conn.sends
+
+        conn = EchoConn(capacity=8)
+        bs = console_utils.BlockStreamer(conn, profile=self.profile, line_kill=LINE_KILL, max_restarts=2)
+        with pytest.raises(console_utils.BlockStreamError):
+            bs.stream(self.data)
+        # 1st try + 2 restarts; the garbled line is killed each time.
+        assert (conn.sends.count(LINE_KILL), bs.stats['restarts']) == (3, 2)
+
+    def test_no_echo_legacy(self):
+        conn = EchoConn(echo=False)
+        bs = console_utils.BlockStreamer(conn, profile=self.profile)
+        assert bs.stream(self.data, join=True) is None
+        assert bs.echo is False
+        assert conn.received == self.data
+        assert set([len(s) for s in conn.sends]) == set([16])
+
+    def test_segments(self):
+        conn = EchoConn()
+        bs = console_utils.BlockStreamer(conn, profile=self.profile)
+        assert bs.stream(self.data, segments=3, interim_expectphrase='Read >') is True
+        assert conn.sends.count('\r') == 3
+        # Legacy segment boundaries: 800 chars / (16 * 3) = 16 blocks of 16 per segment; remainder in the last.
+        first = conn.sends.index('\r')
+        assert len(''.join(conn.sends[:first])) == 256
+        assert conn.received == self.data
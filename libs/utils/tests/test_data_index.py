@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from .. import data_index
+
+__title__ = 'EntSw Data Index Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ['pid', 'eci', 'tan', 'pn', 'prodarray']
+SFPS = """# pid;eci;tan;pn;prodarray
+SFP-GE-S;131603;800-26525-01;10-2143-01;940
+SFP-GE-L;131604;800-26525-02;10-2143-02;940
+GLC-SX-MMD;;800-26525-03;10-2626-01;941
+sfp-10g-sr;131700;800-30000-01;10-2415-03;
+"""
+
+
+class TestDataIndex(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.root, 'sfps.txt')
+        self.__write(SFPS)
+        self.cache = data_index.DataIndexCache(shared_dir=os.path.join(self.root, 'shared'))
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def __write(self, text):
+        with open(self.data_file, 'w') as fp:
+            fp.write(text)
+
+    def test_same_as_scan(self):
+        index = self.cache.get(self.data_file, COLUMNS)
+        queries = [
+            [{'eci': 131603}],                                  # literal (int)
+            [{'pid': 'SFP-GE-.*'}],                             # prefix
+            [{'pid': 'sfp-.*'}, {'prodarray': '940'}],          # multi-key, case-insensitive
+            [{'tan': '800-265[0-9]+-0[13]'}],                   # regex
+            [{'eci': 'None'}],                                  # empty value
+            [{'pid': 'SFP-GE'}],                                # full match only
+            [{'pid': 'SFP-GE-S'}, {'eci': '131604'}],           # no match
+            [],
+        ]
+        for search_vals in queries:
+            expected = data_index.scan(self.data_file, COLUMNS, search_vals)
+            assert index.lookup(search_vals) == expected, search_vals
+        assert [r['pid'] for r in index.lookup({'prodarray': '940', 'pid': 'SFP-GE-L'})] == ['SFP-GE-L']
+        assert [r['pid'] for r in index.prefix('tan', '800-26525', [{'prodarray': '94.'}])] == ['SFP-GE-S', 'SFP-GE-L', 'GLC-SX-MMD']
+        assert index.values('prodarray') == ['940', '941', 'None']
+        with pytest.raises(KeyError):
+            index.lookup([{'vid': 'V01'}])
+
+    def test_invalidate_and_share(self):
+        assert len(data_index.DataIndexCache(shared_dir=None).get(self.data_file, COLUMNS)) == 4
+        self.cache.get(self.data_file, COLUMNS)
+        self.cache.get(self.data_file, COLUMNS)
+        assert (self.cache.parses, self.cache.loads, self.cache.hits) == (1, 0, 1)
+
+        # Another container on the host: loads the snapshot instead of parsing.
+        other = data_index.DataIndexCache(shared_dir=self.cache.shared_dir)
+        assert other.get(self.data_file, COLUMNS).lookup([{'eci': 131603}])[0]['pid'] == 'SFP-GE-S'
+        assert (other.parses, other.loads) == (0, 1)
+
+        # File changed: re-parsed.
+        self.__write(SFPS + "SFP-GE-Z;131605;800-26525-04;10-2143-04;940\n")
+        assert [r['pid'] for r in self.cache.get(self.data_file, COLUMNS).lookup([{'eci': '13160[35]'}])] == ['SFP-GE-S', 'SFP-GE-Z']
+        assert self.cache.parses == 2
+
+        self.__write(SFPS + "SFP-GE-Z;131605\n")
+        with pytest.raises(ValueError):
+            self.cache.get(self.data_file, COLUMNS)
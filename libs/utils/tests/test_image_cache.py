@@ -0,0 +1,148 @@
+import logging
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+
+from .. import image_cache
+
+__title__ = 'EntSw Image Cache Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class FakeServer(object):
+    """ Remote image server stand-in; counts the fetches per image. """
+    def __init__(self, src_dir, delay=0.1):
+        self.src_dir = src_dir
+        self.delay = delay
+        self.fetches = []
+        self._lock = threading.Lock()
+
+    def fetch(self, src_filepath, tmp_filepath):
+        with self._lock:
+            self.fetches.append(os.path.basename(src_filepath))
+        time.sleep(self.delay)
+        path = os.path.join(self.src_dir, os.path.basename(src_filepath))
+        if not os.path.exists(path):
+            return False
+        shutil.copyfile(path, tmp_filepath)
+        return True
+
+
+class TestImageCache(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.root, 'remote')
+        self.cache_dir = os.path.join(self.root, 'cache')
+        os.makedirs(self.src_dir)
+        self.images = {}
+        for i in range(3):
+            name = 'cat9k_image{0}.bin'.format(i)
+            data = os.urandom(4096 * (i + 1))
+            with open(os.path.join(self.src_dir, name), 'wb') as fp:
+                fp.write(data)
+            self.images[name] = hashlib.md5(data).hexdigest()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def __requests(self, container):
+        return [image_cache.ImageRequest(os.path.join(self.src_dir, name),
+                                         os.path.join(self.root, 'tftpboot', container, name), md5)
+                for name, md5 in sorted(self.images.items())]
+
+    def test_shared_single_download(self):
+        server = FakeServer(self.src_dir, delay=0.2)
+        results = {}
+
+        def __container(n):
+            cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+            results[n] = cache.prefetch(self.__requests('C{0}'.format(n)), fetch=server.fetch, max_workers=3)
+
+        start = time.time()
+        threads = [threading.Thread(target=__container, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert time.time() - start < 3 * 0.2 * 2
+        assert sorted(server.fetches) == sorted(self.images.keys())
+        for n in range(4):
+            assert all([s['result'] for s in results[n].values()])
+            for req in self.__requests('C{0}'.format(n)):
+                assert image_cache.ImageCache.get_md5(req.dst_filepath) == req.md5
+        messages = [s['message'] for r in results.values() for s in r.values()]
+        assert messages.count('FETCHED') == 3 and messages.count('HIT') == 9
+
+    def test_present_and_bad_md5(self):
+        server = FakeServer(self.src_dir, delay=0.0)
+        cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+        req = self.__requests('C0')[0]
+        os.makedirs(os.path.dirname(req.dst_filepath))
+        shutil.copyfile(req.src_filepath, req.dst_filepath)
+        assert cache.get(req.src_filepath, req.dst_filepath, md5=req.md5, fetch=server.fetch)['message'] == 'PRESENT'
+        assert cache.lookup(md5=req.md5)
+        status = cache.get(req.src_filepath, req.dst_filepath + '.2', md5='0' * 32, fetch=server.fetch)
+        assert not status['result'] and status['message'] == 'FAILURE'
+        assert server.fetches == [os.path.basename(req.src_filepath)]
+
+    def test_lru_eviction(self):
+        server = FakeServer(self.src_dir, delay=0.0)
+        cache = image_cache.ImageCache(cache_dir=self.cache_dir, max_bytes=4096 * 5)
+        reqs = self.__requests('C0')
+        for req in reqs:
+            assert cache.get(req.src_filepath, req.dst_filepath, md5=req.md5, fetch=server.fetch)['result']
+            time.sleep(0.01)
+        # 4K + 8K + 12K > 20K --> oldest (image0) evicted
+        assert cache.get_usage() == (2, 4096 * 5)
+        assert not cache.lookup(md5=reqs[0].md5)
+        assert cache.lookup(md5=reqs[2].md5)
+        assert os.path.exists(reqs[0].dst_filepath)
+
+    def test_name_only_source_changed(self):
+        server = FakeServer(self.src_dir, delay=0.0)
+        cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+        name = 'cat9k_image0.bin'
+        src_filepath = os.path.join(self.src_dir, name)
+        dst = os.path.join(self.root, 'tftpboot', 'C{0}', name)
+        assert cache.get(src_filepath, dst.format(0), fetch=server.fetch)['message'] == 'FETCHED'
+        assert cache.get(src_filepath, dst.format(1), fetch=server.fetch)['message'] == 'HIT'
+
+        # Same name, rebuilt image: not served from the cache by name.
+        data = os.urandom(4096)
+        with open(src_filepath, 'wb') as fp:
+            fp.write(data)
+        os.utime(src_filepath, (time.time() + 10, time.time() + 10))
+        assert cache.get(src_filepath, dst.format(2), fetch=server.fetch)['message'] == 'FETCHED'
+        assert image_cache.ImageCache.get_md5(dst.format(2)) == hashlib.md5(data).hexdigest()
+
+        # Unknown source (ex. remote path): a name alone is never trusted.
+        assert cache.get('/remote/' + name, dst.format(3), fetch=server.fetch)['message'] == 'FETCHED'
+        assert server.fetches == [name] * 3
+        assert cache.lookup(md5=hashlib.md5(data).hexdigest()) and not cache.lookup(name=name)
+
+    def test_shared_dst_no_md5(self):
+        # IOS style request: src == dst (remote sourced /tftpboot path), no md5.
+        server = FakeServer(self.src_dir, delay=0.2)
+        name = 'cat9k_image1.bin'
+        dst = os.path.join(self.root, 'tftpboot', name)
+        results = []
+
+        def __container():
+            cache = image_cache.ImageCache(cache_dir=self.cache_dir)
+            results.append(cache.get(dst, dst, md5='', fetch=server.fetch))
+
+        threads = [threading.Thread(target=__container) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert server.fetches == [name]
+        assert sorted([s['message'] for s in results]) == ['FETCHED', 'PRESENT', 'PRESENT']
+        assert image_cache.ImageCache.get_md5(dst) == self.images[name]
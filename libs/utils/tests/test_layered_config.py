@@ -0,0 +1,91 @@
+import logging
+import copy
+from collections import OrderedDict
+
+from .. import layered_config
+
+__title__ = 'EntSw Layered Config Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestLayeredConfig(object):
+
+    def setup_method(self, method):
+        self.family = {
+            'COMMON': {
+                'MODEL_NUM': None,
+                'poe': {'type': None, 'uut_ports': '1-48'},
+                'prod_seq': ['diags', 'traffic'],
+                'process_flow': OrderedDict([('PCBST', {'timeout': 10})]),
+                'asic': {'core_count': 2, 'locations': [{'id': 0}, {'id': 1}]},
+            },
+            'Nyquist24': {
+                'MODEL_NUM': 'C9300-24UX',
+                'poe': {'type': 'UPOE'},
+                'prod_seq': ['ios'],
+                'asic': {'core_count': 1, 'locations': [{'id': 0, 'dmax': 3}]},
+            },
+            'Nyquist48': {
+                'MODEL_NUM': 'C9300-48UN',
+                'poe': {'uut_ports': '1-36'},
+            },
+        }
+        self.original = copy.deepcopy(self.family)
+
+    def __view(self, codename, list_replace=False):
+        view = layered_config.LayeredConfig().new_child(self.family['COMMON'], name='COMMON')
+        return view.new_child(self.family[codename], name=codename, list_replace=list_replace)
+
+    def test_merge(self):
+        view = self.__view('Nyquist24')
+        assert view['MODEL_NUM'] == 'C9300-24UX'
+        assert view['poe']['type'] == 'UPOE' and view['poe']['uut_ports'] == '1-48'
+        assert view['prod_seq'] == ['diags', 'traffic', 'ios']
+        assert view['asic']['locations'] == [{'id': 0}, {'id': 1}, {'id': 0, 'dmax': 3}]
+        assert sorted(view.keys()) == ['MODEL_NUM', 'asic', 'poe', 'process_flow', 'prod_seq']
+        assert len(view) == 5 and 'poe' in view and 'unknown' not in view
+
+        view = self.__view('Nyquist24', list_replace=True)
+        assert view['prod_seq'] == ['ios']
+        assert view['asic']['locations'] == [{'id': 0, 'dmax': 3}]
+
+    def test_provenance(self):
+        view = self.__view('Nyquist24')
+        assert view.provenance('MODEL_NUM') == ['Nyquist24']
+        assert view.provenance('poe') == ['COMMON', 'Nyquist24']
+        assert view.provenance(('poe', 'uut_ports')) == ['COMMON']
+        assert view.provenance(('poe', 'type')) == ['Nyquist24']
+        assert view.provenance('process_flow') == ['COMMON']
+        assert view.provenance(('MODEL_NUM', 'x')) == [] and view.provenance('unknown') == []
+        assert view.provenance_map()['prod_seq'] == ['COMMON', 'Nyquist24']
+
+        override = view.new_child({'MODEL_NUM': 'C9300-24UXB'}, name='override')
+        assert override['MODEL_NUM'] == 'C9300-24UXB' and override.provenance('MODEL_NUM') == ['override']
+        assert view['MODEL_NUM'] == 'C9300-24UX'
+        assert override.layers == ['COMMON', 'Nyquist24', 'override']
+
+    def test_no_contamination(self):
+        uut_config_24 = self.__view('Nyquist24').to_dict()
+        uut_config_24['poe']['type'] = 'POE+'
+        uut_config_24['prod_seq'].append('fst')
+        uut_config_24['process_flow']['PCBST']['timeout'] = 99
+        uut_config_48 = self.__view('Nyquist48', list_replace=True).to_dict()
+        assert self.family == self.original
+        assert uut_config_48['poe'] == {'type': None, 'uut_ports': '1-36'}
+        assert uut_config_48['prod_seq'] == ['diags', 'traffic']
+        assert uut_config_48['process_flow']['PCBST']['timeout'] == 10
+        assert isinstance(uut_config_48['process_flow'], OrderedDict)
+
+    def test_merge_lists(self):
+        merge_lists = layered_config.merge_lists
+        orig = [('a', [1]), ('b', [2])]
+        assert merge_lists(orig, [('b', [3]), ('c', [4])], list_replace=False) == [('a', [1]), ('b', [3]), ('c', [4])]
+        assert orig == [('a', [1]), ('b', [2])]
+        assert merge_lists([('a', 1)], [('a', 1), ('b', 2)], list_replace=False) == [('a', 1), ('b', 2)]
+        assert merge_lists([[1], 2], [2, [3]], list_replace=False) == [[1], 2, [3]]
+        assert merge_lists([1, 2, 3], [4], list_replace=True) == [4]
+        assert merge_lists([1, 2, 3], [], list_replace=True) == [1]
+        assert merge_lists([{'a': 1, 'b': 2}], [{'a': 3}], list_replace=True) == [{'a': 3, 'b': 2}]
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+from .. import lease_registry
+
+__title__ = 'EntSw Lease Registry Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestLeaseRegistry(object):
+
+    def setup_method(self, method):
+        self.now = [1000.0]
+        self.cache = {}
+        self.lock = threading.RLock()
+
+    def __registry(self, **kwargs):
+        # Separate registry objects (one per container) sharing the chassis state via the "cached data".
+        kwargs.setdefault('ttl', 60)
+        return lease_registry.LeaseRegistry('pl_ar_ts_ActiveModular', lock_factory=lambda name: self.lock,
+                                            store=(self.cache.get, self.cache.__setitem__),
+                                            publish_key='pl_ar_ts_ActiveModular', clock=lambda: self.now[0], **kwargs)
+
+    def test_activate_order_and_publish(self):
+        lc1, lc2, sup = self.__registry(), self.__registry(), self.__registry()
+        assert lc1.activate('LC1', card='Linecard')
+        assert sup.activate('SUP1', card='Supervisor')
+        assert lc2.activate('LC2', card='Linecard')
+        assert not lc1.activate('LC1', slot=3)
+        assert sup.members() == ['LC1', 'SUP1', 'LC2']
+        assert self.cache['pl_ar_ts_ActiveModular'] == ['LC1', 'SUP1', 'LC2']
+        assert lc1.leases()['LC1']['info'] == {'card': 'Linecard', 'slot': 3}
+
+        assert lc1.deactivate('LC1')
+        assert not lc1.deactivate('LC1')
+        assert lc2.is_active('LC2') and not lc2.is_active('LC1')
+        assert self.cache['pl_ar_ts_ActiveModular'] == ['SUP1', 'LC2']
+        assert [h['event'] for h in sup.history('LC1')] == ['activate', 'deactivate']
+
+    def test_expiry_and_renew(self):
+        lc1, lc2 = self.__registry(), self.__registry()
+        lc1.activate('LC1')
+        lc2.activate('LC2')
+        self.now[0] += 45
+        assert lc2.renew('LC2')
+        # LC1 aborted w/o cleanup: no renewals; reaped on the next access by any container (no deactivate needed).
+        self.now[0] += 30
+        assert lc2.members() == ['LC2']
+        assert self.cache['pl_ar_ts_ActiveModular'] == ['LC2']
+        assert [h['event'] for h in lc2.history('LC1')] == ['activate', 'expire']
+        assert not lc1.renew('LC1')
+        assert lc2.history()[-1]['event'] == 'renew lost'
+        self.now[0] += 61
+        assert lc2.reap() == ['LC2']
+        assert lc2.members() == [] and self.cache['pl_ar_ts_ActiveModular'] == []
+
+    def test_alive_check_and_order(self):
+        running = set(['LC1', 'LC2'])
+        lc1, lc2 = self.__registry(alive=lambda m: m in running), self.__registry(alive=lambda m: m in running)
+        lc1.activate('LC1')
+        lc2.activate('LC2')
+        # Missed renewals, but the container is still RUNNING: not reaped.
+        self.now[0] += 61
+        assert lc2.members() == ['LC1', 'LC2']
+        assert lc2.history('LC1')[-1]['event'] == 'expire skipped'
+        running.discard('LC1')
+        self.now[0] += 61
+        assert lc2.reap() == ['LC1']
+        assert lc2.members() == ['LC2']
+
+    def test_heartbeat(self):
+        registry = lease_registry.LeaseRegistry('pl_ar_ts_HB', ttl=0.3)
+        alive = [True]
+        registry.activate('LC1')
+        registry.start_heartbeat('LC1', interval=0.05, alive=lambda: alive[0])
+        time.sleep(0.5)
+        assert registry.members() == ['LC1']
+        # Container gone: the heartbeat stops and the lease expires.
+        alive[0] = False
+        time.sleep(0.5)
+        assert registry.members() == []
+        registry.activate('LC2')
+        registry.start_heartbeat('LC2', interval=0.05)
+        assert registry.deactivate('LC2')
+        time.sleep(0.1)
+        assert registry.members() == []
+
+        # A lease lost while alive is re-activated in its original place (primary stays first).
+        registry.activate('LC3')
+        registry.activate('LC4')
+        registry.start_heartbeat('LC3', interval=0.05)
+        registry.start_heartbeat('LC4', interval=0.05)
+        with registry._local_lock:
+            registry._local_state['__lease_pl_ar_ts_HB__']['leases'].pop('LC3')
+        time.sleep(0.2)
+        assert registry.members() == ['LC3', 'LC4']
+        assert registry.deactivate('LC3') and registry.deactivate('LC4')
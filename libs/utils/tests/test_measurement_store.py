@@ -0,0 +1,104 @@
+import logging
+import os
+import math
+import shutil
+import tempfile
+
+from .. import measurement_store
+
+__title__ = 'EntSw Measurement Store Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class TestMeasurementStore(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def __eye_rows(self):
+        rows = []
+        for core in range(2):
+            for lane in ['A0', 'A1']:
+                for n, stat in enumerate(['Sum', 'Max', 'Min']):
+                    rows.append(({'core': core, 'side': 'e', 'lane': lane, 'stat': stat, 'result': 'Pass'},
+                                 {'Amin': '{0}'.format(170.0 + core * 10 + n), 'EL': '89.15%', 'SyncCnt': '(Max)'}))
+        return rows
+
+    def test_to_float(self):
+        assert measurement_store.to_float('172.5') == 172.5
+        assert measurement_store.to_float('89.15%') == 89.15
+        assert measurement_store.to_float(' -0.209 ') == -0.209
+        assert measurement_store.to_float(3) == 3.0
+        assert math.isnan(measurement_store.to_float('(Max)'))
+        assert math.isnan(measurement_store.to_float(None))
+
+    def test_persist_and_query(self):
+        store = measurement_store.MeasurementStore(self.root, run_id='FOC1234|run1')
+        store.extend('sif_eye', self.__eye_rows(), ts=100.0)
+        store.append('temperature', tags={'sensor': 'Exhaust', 'area': 'PCBST'}, values={'temp': 37.0}, ts=101.0)
+        assert store.pending() == 13
+        assert store.flush() == 13
+        assert store.flush() == 0 and store.pending() == 0
+
+        store = measurement_store.MeasurementStore(self.root, run_id='FOC1234|run1')
+        assert store.kinds() == ['sif_eye', 'temperature']
+        assert store.column('sif_eye', 'Amin', where={'core': 1, 'lane': 'A1'}) == [180.0, 181.0, 182.0]
+        assert store.column('sif_eye', 'stat', where={'core': 0, 'lane': 'A0'}) == ['Sum', 'Max', 'Min']
+        assert math.isnan(store.column('sif_eye', 'SyncCnt')[0])
+        stats = store.stats('sif_eye', 'Amin', group_by=['core'], where={'stat': ['Sum', 'Max']})
+        assert list(stats.keys()) == [(0,), (1,)]
+        assert stats[(1,)].count == 4 and stats[(1,)].min == 180.0 and stats[(1,)].max == 181.0
+        assert stats[(1,)].mean == 180.5 and stats[(1,)].stdev == 0.5
+        assert store.stats('temperature', 'temp')[()].mean == 37.0
+        assert store.rows('temperature')[0]['sensor'] == 'Exhaust'
+        assert store.select('sif_eye', where={'lane': 'B9'}) == []
+
+        # Append after reload continues the same columns.
+        store.append('temperature', tags={'sensor': 'Exhaust', 'area': 'PCBST'}, values={'temp': 39.0}, ts=200.0)
+        store.flush()
+        store = measurement_store.MeasurementStore(self.root, run_id='FOC1234|run1')
+        assert store.column('temperature', 'temp') == [37.0, 39.0]
+        assert store.column('temperature', 'temp', since=150.0) == [39.0]
+
+    def test_torn_append(self):
+        store = measurement_store.MeasurementStore(self.root, run_id='run2')
+        store.append('voltage', tags={'rail': '3.3V'}, values={'volt': 3.3007})
+        store.flush()
+        # Simulate a crash after a column append but before the schema update.
+        with open(os.path.join(store.path, 'voltage.volt.bin'), 'ab') as fp:
+            fp.write(b'\x00' * 8)
+        store = measurement_store.MeasurementStore(self.root, run_id='run2')
+        assert store.column('voltage', 'volt') == [3.3007]
+        store.append('voltage', tags={'rail': '1.8V'}, values={'volt': 1.7929})
+        store.flush()
+        store = measurement_store.MeasurementStore(self.root, run_id='run2')
+        assert store.column('voltage', 'volt') == [3.3007, 1.7929]
+        assert store.column('voltage', 'rail') == ['3.3V', '1.8V']
+
+    def test_schema_errors(self):
+        store = measurement_store.MeasurementStore()
+        store.define('voltage', ['rail'], ['volt'])
+        try:
+            store.append('voltage', tags={'rail': '3.3V', 'board': 'FRU'}, values={'volt': 3.3})
+            assert False, "Unknown column must be rejected."
+        except ValueError:
+            pass
+        try:
+            store.define('voltage', ['rail'], ['volt', 'pct'])
+            assert False, "Schema change must be rejected."
+        except ValueError:
+            pass
+        assert store.flush() == 0
+
+    def test_benchmark(self):
+        results = measurement_store.benchmark(rows=3000, root_dir=self.root)
+        log.debug(results)
+        assert results['groups'] == 8 * 12
+        assert results['ingest_rate'] > 0
+        assert os.path.exists(os.path.join(self.root, 'benchmark', 'sif_eye.json'))
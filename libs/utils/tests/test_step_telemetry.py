@@ -0,0 +1,104 @@
+import logging
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from .. import step_telemetry
+
+__title__ = 'EntSw Step Telemetry Unit Tests'
+__author__ = ['bborel']
+__version__ = '2.0.0'
+
+log = logging.getLogger(__name__)
+
+
+class FakeConn(object):
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.sent = []
+
+    def send(self, text, expectphrase=None, timeout=30, regex=False):
+        self.sent.append(text)
+        time.sleep(self.delay) if expectphrase else None
+        return True
+
+    def waitfor(self, expectphrase, timeout=30, regex=False):
+        time.sleep(self.delay)
+        return True
+
+
+class TestStepTelemetry(object):
+
+    def setup_method(self, method):
+        self.root = tempfile.mkdtemp()
+        self.telemetry = step_telemetry.StepTelemetry(
+            root_dir=self.root, min_func_secs=0.01,
+            context_func=lambda: {'container': 'PROD|NYQUIST|UUT01', 'uut': 'FOC12345678', 'area': 'PCBST'})
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.root)
+
+    def test_step_record(self):
+        conn = FakeConn(delay=0.05)
+        assert self.telemetry.instrument(conn)
+        assert not self.telemetry.instrument(conn)
+        with self.telemetry.track('diags_test') as step:
+            conn.send('SysMem\r', expectphrase='> ')
+            conn.send('\r')
+            with self.telemetry.track('helper', kind='func'):
+                conn.waitfor('> ')
+                with self.telemetry.console_wait():
+                    conn.waitfor('> ')  # nested; counted once
+                time.sleep(0.05)
+                self.telemetry.add_retries(2)
+            with self.telemetry.track('quick_helper', kind='func'):
+                pass
+        assert conn.sent == ['SysMem\r', '\r']
+        assert 0.14 <= step['console'] < step['wall'] and step['compute'] >= 0.04
+        assert step['retries'] == 2 and step['attempt'] == 1 and step['result'] == 'done'
+
+        records = step_telemetry.load_records(self.root, kind=None)
+        assert [r['name'] for r in records] == ['helper', 'diags_test']
+        assert records[0]['depth'] == 1 and records[0]['uut'] == 'FOC12345678'
+        assert os.path.exists(os.path.join(self.root, time.strftime('%Y%m%d'), 'PROD_NYQUIST_UUT01.jsonl'))
+
+    def test_failed_step_and_attempts(self):
+        for _ in range(2):
+            try:
+                with self.telemetry.track('program_act2'):
+                    raise ValueError('no chip')
+            except ValueError:
+                pass
+        records = step_telemetry.load_records(self.root)
+        assert [(r['attempt'], r['result'], r['error']) for r in records] == [(1, 'ValueError', True),
+                                                                              (2, 'ValueError', True)]
+        assert step_telemetry.summarize(records)['program_act2']['fails'] == 2
+
+    def test_report_and_regressions(self):
+        day_dir = os.path.join(self.root, '20260101')
+        os.makedirs(day_dir)
+        with open(os.path.join(day_dir, 'UUT01.jsonl'), 'w') as fp:
+            for i in range(20):
+                for name, wall in [('load_ios', 100.0 + i), ('diags_test', 30.0 + i % 5)]:
+                    fp.write(json.dumps(dict(name=name, kind='step', ts=1.0, wall=wall, console=wall * 0.5,
+                                             retries=0, result='PASS')) + '\n')
+            fp.write('{"name": "torn')
+        baseline_file = os.path.join(self.root, 'baseline.json')
+        results = step_telemetry.report(self.root, save_baseline=baseline_file)
+        summary = results['summary']
+        assert summary['load_ios']['count'] == 20
+        assert summary['load_ios']['p50'] == 109.0 and summary['load_ios']['p95'] == 118.0
+        assert summary['diags_test']['console_pct'] == 50.0
+        assert results['lines'][1].startswith('load_ios')
+
+        # Slower diags in a new run.
+        with open(os.path.join(day_dir, 'UUT02.jsonl'), 'w') as fp:
+            for i in range(20):
+                fp.write(json.dumps(dict(name='diags_test', kind='step', ts=2.0, wall=60.0, console=50.0,
+                                         retries=1, result='PASS')) + '\n')
+        results = step_telemetry.report(os.path.join(day_dir, 'UUT02.jsonl'), baseline_file=baseline_file)
+        assert [(r[0], r[1]) for r in results['regressions']] == [('diags_test', 'p50'), ('diags_test', 'p95')]
+        assert step_telemetry.percentile([], 50) is None
+        assert step_telemetry.percentile([1, 2, 3, 4], 50) == 2